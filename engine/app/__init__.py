@@ -1,23 +1,78 @@
+from importlib import import_module
+
+import click
 from flask import Flask
-from config import Config
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
+from app.replica import RoutingSession
+
 
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+login = LoginManager()
+# redirect to login page if user is not logged in
+# login.login_view = "auth.login"
 
+# one blueprint per area, imported when an app is created so that importing
+# the package (models, CLI helpers, benchmarks) stays cheap
+BLUEPRINTS = (
+    'app.auth',
+    'app.records',
+    'app.doctors',
+    'app.events',
+    'app.feed',
+    'app.posts',
+    'app.pictures',
+    'app.sync',
+    'app.messaging',
+    'app.metrics',
+)
 
-app = Flask(__name__)
-app.config['DEBUG'] = True
-app.config.from_object(Config)
 
+def create_app(config=None):
+    """Build an app from ``config`` (a class or object), config.Config by default."""
+    if config is None:
+        from config import Config as config
 
+    app = Flask(__name__)
+    app.config.from_object(config)
 
+    db.init_app(app)
+    login.init_app(app)
+    if click.get_current_context(silent=True) is not None:
+        # only the `flask` CLI (db upgrade, index-audit) needs Flask-Migrate;
+        # it pulls in alembic, which server workers never use
+        from flask_migrate import Migrate
+        Migrate(app, db)
 
-db = SQLAlchemy(app)
-Migrate = Migrate(app, db)
-login = LoginManager(app)
-# redirect to login page if user is not logged in
-# login.login_view = "login"
+    from app import models, errors, principals, serialization, pool_metrics
+    from app import pubsub, notifications, scheduling, timelines, counters, storage, images, http_cache
+    from app import conversations, ratelimit, login_ips, tokens, metrics
+    principals.init_app(app)
+    pool_metrics.init_app(app)
+    serialization.init_app(app)
+    errors.init_app(app)
+    pubsub.init_app(app)
+    notifications.init_app(app)
+    scheduling.init_app(app)
+    timelines.init_app(app)
+    counters.init_app(app)
+    storage.init_app(app)
+    images.init_app(app)
+    http_cache.init_app(app)
+    ratelimit.init_app(app)
+    login_ips.init_app(app)
+    tokens.init_app(app)
+    metrics.init_app(app)
+    for name in BLUEPRINTS:
+        app.register_blueprint(import_module(name).bp)
 
-from app import models, routes
+    from app.index_audit import index_audit_command
+    app.cli.add_command(index_audit_command)
+    app.cli.add_command(notifications.notify_command)
+    app.cli.add_command(counters.reconcile_command)
 
+    if app.config.get('SQL_LOG_PATH'):
+        from app.sqlcount import log_statements
+        with app.app_context():
+            log_statements(db.engine, app.config['SQL_LOG_PATH'])
+    return app
@@ -0,0 +1,402 @@
+import asyncio
+import time
+from functools import wraps
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import StaticPool
+
+try:
+    from quart import Blueprint, Quart, current_app, g, jsonify, request, session
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+except ImportError:  # pragma: no cover - quart and greenlet are optional
+    Quart = None
+
+from app import login_ips, principals, pubsub, ratelimit, records, scheduling, search, serialization, tokens
+from app.db_types import canonical_uuid, is_uuid
+from app.loading import requested_includes
+from app.models import Users, Doctors, Appointments, Documents, Prescriptions, MedicalHistory
+from app.pagination import InvalidCursor, keyset_query, page_rows, page_size
+from app.passwords import PasswordServiceBusy, hash_password_async, needs_rehash, verify_password_async
+from app.ratelimit import RateLimitExceeded, limiter, retry_after_header
+from app.replica import REPLICA
+from app.serialization import requested_fields, serializer_for
+
+
+# Async serving mode. create_async_app() builds a Quart app that serves
+# /register, /login, the read endpoints and the /events stream as
+# coroutines over the same models, through AsyncSession on an async driver
+# (aiomysql for MySQL, aiosqlite for SQLite), so a request waiting on the
+# database, or an idle event stream, costs a suspended coroutine instead of
+# a worker thread. The statements come from the same builders the WSGI
+# routes use (app.principals, app.records, app.search), only executed
+# through the AsyncSession. Serve it with an ASGI
+# server, e.g. `hypercorn asgi:app` from the engine directory; run.py keeps
+# serving the WSGI app.
+
+ASYNC_DRIVERS = {'mysql': 'aiomysql', 'mariadb': 'aiomysql', 'sqlite': 'aiosqlite'}
+
+# background tasks (index rebuilds) the event loop only holds weakly
+_background = set()
+
+
+def async_url(url):
+    """``url`` with its driver swapped for the async one of the same database."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError('No async driver for {}'.format(backend))
+    url = url.set(drivername='{}+{}'.format(backend, ASYNC_DRIVERS[backend]))
+    if backend != 'sqlite' and 'charset' not in url.query:
+        url = url.update_query_dict({'charset': 'utf8mb4'})
+    return url
+
+
+def _engine(url, options):
+    url = async_url(url)
+    if url.get_backend_name() == 'sqlite':
+        # aiosqlite runs each connection on its own thread, pool sizing
+        # doesn't apply; an in-memory database must stay on one connection
+        options = {}
+        if url.database in (None, '', ':memory:'):
+            options = {'poolclass': StaticPool, 'connect_args': {'check_same_thread': False}}
+    return create_async_engine(url, **options)
+
+
+def _session(bind=None):
+    """The request's AsyncSession for ``bind`` (None for the primary)."""
+    sessions = g.setdefault('db_sessions', {})
+    db_session = sessions.get(bind)
+    if db_session is None:
+        makers = current_app.extensions['async_db']
+        maker = makers.get(bind) or makers[None]
+        db_session = sessions[bind] = maker()
+    return db_session
+
+
+async def load_principal(user_id):
+    """principals.load_principal for the async app."""
+    user_id = canonical_uuid(user_id)
+    if user_id is None:
+        return None
+    principal = principals.known_principal(user_id)
+    if principal is None:
+        row = (await _session().execute(principals.principal_statement(user_id))).first()
+        principal = principals.remember_principal(user_id, row)
+        if principal is None:
+            return None
+    g.principal = principal
+    return principal
+
+
+async def _reload_revocations(wait=False):
+    # the async side of tokens.Revocations._refresh: one task reads the
+    # rows through the request's session, the others use what is loaded
+    revocations = tokens.revocations
+    if not revocations.due() or not revocations._reloading.acquire(blocking=wait):
+        return
+    try:
+        revocations.merge((await _session().execute(tokens.revocation_rows())).all())
+    except Exception:
+        current_app.logger.exception('token revocation reload failed')
+        revocations._loaded_at = time.monotonic()
+    finally:
+        revocations._reloading.release()
+
+
+async def token_principal(token):
+    """tokens.token_principal for the async app; raises tokens.InvalidToken."""
+    await _reload_revocations()
+    principal = tokens.claims_principal(tokens.decode(token))
+    g.principal = principal
+    return principal
+
+
+def role_required(*required_roles):
+    def decorator(f):
+        @wraps(f)
+        async def decorated_function(*args, **kwargs):
+            token = tokens.bearer_token(request.headers)
+            if token is not None:
+                try:
+                    principal = await token_principal(token)
+                except tokens.InvalidToken:
+                    return jsonify({'message': 'Invalid token'}), 401
+            elif current_app.config.get('TOKEN_AUTH_ONLY'):
+                return jsonify({'message': 'Token required'}), 401, {'WWW-Authenticate': 'Bearer'}
+            else:
+                # under WSGI `user-id` and `user_id` both arrive as HTTP_USER_ID and
+                # most servers drop the underscore form, so accept either here too
+                user_id = request.headers.get('user_id') or request.headers.get('user-id')
+                principal = await load_principal(user_id) if user_id else None
+            if principal is None:
+                return jsonify({'message': 'User not found'}), 404
+
+            if not principal.is_active or principal.role not in required_roles:
+                return jsonify({'message': 'Permission denied'}), 403
+
+            return await f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+async def _load_index(app, stale):
+    # a fresh doctor index read through its own AsyncSession, swapped in for ``stale``
+    makers = app.extensions['async_db']
+    fresh = None
+    try:
+        async with (makers.get(REPLICA) or makers[None])() as db_session:
+            index = search.DoctorIndex()
+            await db_session.run_sync(lambda sync_session: index.load(search.index_rows(sync_session)))
+            fresh = index
+    finally:
+        search.finish_rebuild(stale, fresh)
+
+
+async def _rebuild_index(app, stale):
+    try:
+        await _load_index(app, stale)
+    except Exception:
+        app.logger.exception('doctor index rebuild failed')
+
+
+async def doctor_index():
+    """search.get_index for the async app."""
+    app = current_app._get_current_object()
+    index = search.doctor_index
+    while index.built_at is None:
+        # the first search of the process waits for the build
+        if search.claim_rebuild(index, app.config):
+            await _load_index(app, index)
+        else:
+            await asyncio.sleep(0.05)
+        index = search.doctor_index
+    if search.claim_rebuild(index, app.config):
+        # keep answering from the current index while a fresh one is built
+        task = asyncio.get_running_loop().create_task(_rebuild_index(app, index))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+    return index
+
+
+def _busy():
+    return jsonify({'message': 'Service busy, try again later'}), 503, {'Retry-After': '1'}
+
+
+def _blueprint():
+    bp = Blueprint('aio', __name__)
+
+    @bp.route('/register', methods=['POST'])
+    async def register():
+        data = await request.get_json() or {}
+        if not data.get('username') or not data.get('password') or not data.get('role'):
+            return jsonify({'message': 'Missing data'}), 400
+        limiter.hit('register_ip', request.remote_addr)
+
+        db_session = _session()
+        taken = await db_session.scalar(select(Users.user_id).where(Users.username == data['username']))
+        if taken is not None:
+            return jsonify({'message': 'Username already taken'}), 400
+
+        new_user = Users(username=data['username'])
+        try:
+            new_user.set_role(data['role'])
+        except ValueError:
+            return jsonify({'message': 'Invalid role'}), 400
+        new_user.password_hash = await hash_password_async(data['password'], current_app.config)
+        db_session.add(new_user)
+        await db_session.commit()
+        return jsonify({'message': 'User created'}), 201
+
+    @bp.route('/login', methods=['POST'])
+    async def login():
+        data = await request.get_json() or {}
+        username = data.get('username')
+        limiter.hit('login_ip', request.remote_addr)
+        limiter.hit('login_username', username)
+        db_session = _session()
+        user = await db_session.scalar(select(Users).where(Users.username == username))
+        config = current_app.config
+        if user is None or not await verify_password_async(user.password_hash, data.get('password', ''), config):
+            return jsonify({'message': 'Invalid credentials'}), 401
+        limiter.refund('login_username', username)
+
+        if needs_rehash(user.password_hash, config):
+            user.password_hash = await hash_password_async(data['password'], config)
+            # the same password, so the user's tokens stay valid
+            tokens.keep_tokens(db_session.sync_session, user.user_id)
+            await db_session.commit()
+        login_ips.recorder.record(user.user_id, request.remote_addr)
+        # the same session keys flask_login writes, so either app accepts the cookie
+        session['_user_id'] = user.user_id
+        session['_fresh'] = True
+        return jsonify({'message': 'Logged in'}), 200
+
+    async def list_records(model):
+        # the same statements as app.records, run through the AsyncSession
+        serializer = serializer_for(model)
+        fields = requested_fields(serializer, request.args)
+        includes = requested_includes(model, request.args.get('include'))
+        db_session = _session(REPLICA)
+        principal = g.principal
+        owner_ids = (await db_session.scalars(records.owner_ids_statement(principal))).all()
+        statement = records.owned_records(records.records_statement(model, serializer, fields, includes),
+                                          model, principal, owner_ids)
+
+        limit = page_size(request.args, current_app.config)
+        try:
+            statement = keyset_query(statement, model, request.args.get('cursor'), limit)
+        except InvalidCursor:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        result = await db_session.execute(statement)
+        rows, next_cursor = page_rows(result.scalars().all() if includes else result.all(), model, limit)
+        return jsonify(records.records_page(rows, next_cursor, serializer, fields, includes)), 200
+
+    @bp.route('/appointments', methods=['GET'])
+    @role_required('patient', 'doctor')
+    async def list_appointments():
+        return await list_records(Appointments)
+
+    @bp.route('/documents', methods=['GET'])
+    @role_required('patient', 'doctor')
+    async def list_documents():
+        return await list_records(Documents)
+
+    @bp.route('/prescriptions', methods=['GET'])
+    @role_required('patient', 'doctor')
+    async def list_prescriptions():
+        return await list_records(Prescriptions)
+
+    @bp.route('/medical-history', methods=['GET'])
+    @role_required('patient', 'doctor')
+    async def list_medical_history():
+        return await list_records(MedicalHistory)
+
+    @bp.route('/doctors/search', methods=['GET'])
+    async def search_doctors():
+        try:
+            arguments = search.search_arguments(request.args)
+        except ValueError:
+            return jsonify({'message': 'Invalid offset'}), 400
+        index = await doctor_index()
+        total, doctor_ids, facet_counts = index.search(limit=page_size(request.args, current_app.config),
+                                                       **arguments)
+
+        serializer = serializer_for(Doctors)
+        fields = requested_fields(serializer, request.args)
+        rows = await _session(REPLICA).execute(search.results_statement(doctor_ids, serializer, fields))
+        items = search.ordered_results(rows, doctor_ids, serializer, fields)
+        return jsonify({'total': total, 'items': items, 'facets': facet_counts}), 200
+
+    @bp.route('/events', methods=['GET'])
+    @role_required('patient', 'doctor')
+    async def events():
+        config = current_app.config
+        user_id = g.principal.user_id
+        subscription = pubsub.broker.subscribe(pubsub.channel_for(user_id), config.get('PUSH_QUEUE_SIZE', 256))
+
+        backlog = []
+        last_event_id = request.headers.get('Last-Event-ID')
+        if last_event_id and is_uuid(last_event_id):
+            db_session = _session()
+            results = [(model, (await db_session.execute(statement)).all())
+                       for model, statement in pubsub.backlog_queries(user_id, last_event_id)]
+            backlog = pubsub.backlog_events(results)
+        for db_session in g.pop('db_sessions', {}).values():
+            await db_session.close()
+
+        keepalive = config.get('PUSH_KEEPALIVE', 15)
+
+        async def stream():
+            try:
+                for item in backlog:
+                    yield pubsub.format_event(item).encode()
+                if pubsub.is_resync(backlog):
+                    return
+                sent = {item.id for item in backlog}
+                while True:
+                    item = await subscription.get_async(keepalive)
+                    if item is not None:
+                        if item.id not in sent:
+                            yield pubsub.format_event(item).encode()
+                    elif subscription.closed:
+                        break
+                    else:
+                        yield b': keepalive\n\n'
+            finally:
+                subscription.close()
+
+        response = current_app.response_class(stream(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        # an idle stream is expected, not a hung request
+        response.timeout = None
+        return response
+
+    return bp
+
+
+def create_async_app(config=None):
+    """The Quart counterpart of create_app(), configured the same way."""
+    if Quart is None:
+        raise RuntimeError('The async app needs quart and sqlalchemy[asyncio], plus aiomysql or aiosqlite')
+    if config is None:
+        from config import Config as config
+
+    app = Quart(__name__)
+    app.config.from_object(config)
+
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    url = app.config.get('ASYNC_DATABASE_URL') or app.config['SQLALCHEMY_DATABASE_URI']
+    engines = {None: _engine(url, options)}
+    replica = app.config.get('SQLALCHEMY_BINDS', {}).get(REPLICA)
+    if replica:
+        replica = dict(replica)
+        engines[REPLICA] = _engine(replica.pop('url'), replica)
+    app.extensions['async_db'] = {key: async_sessionmaker(engine, expire_on_commit=False)
+                                  for key, engine in engines.items()}
+
+    principals.init_app(app)
+    serialization.init_app(app)
+    pubsub.init_app(app)
+    scheduling.init_app(app)
+    ratelimit.init_app(app)
+    tokens.configure(app.config)
+    # login addresses are written from the recorder's thread, so through a
+    # blocking engine of their own
+    recorder_engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], **options)
+    login_ips.init_app(app, recorder_engine)
+    app.register_blueprint(_blueprint())
+
+    @app.before_serving
+    async def load_revocations():
+        # before the first request, so no token is checked against an empty set
+        async with app.app_context():
+            await _reload_revocations(wait=True)
+
+    @app.errorhandler(PasswordServiceBusy)
+    async def password_service_busy(e):
+        return _busy()
+
+    @app.errorhandler(PoolTimeout)
+    async def database_busy(e):
+        return _busy()
+
+    @app.errorhandler(RateLimitExceeded)
+    async def rate_limited(e):
+        return jsonify({'message': 'Too many attempts, try again later'}), 429, retry_after_header(e)
+
+    @app.teardown_appcontext
+    async def close_sessions(exc):
+        for db_session in g.pop('db_sessions', {}).values():
+            await db_session.close()
+
+    @app.after_serving
+    async def dispose_engines():
+        await asyncio.get_running_loop().run_in_executor(None, login_ips.shutdown)
+        recorder_engine.dispose()
+        for engine in engines.values():
+            await engine.dispose()
+
+    return app
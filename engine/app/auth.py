@@ -0,0 +1,98 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_user
+from app import tokens
+from app.login_ips import recorder
+from app.models import db, Users
+from app.passwords import needs_rehash
+from app.ratelimit import limiter
+
+bp = Blueprint('auth', __name__)
+
+
+@bp.route('/register', methods=['POST'])
+def register():
+    data = request.get_json() or {}
+    if not data.get('username') or not data.get('password') or not data.get('role'):
+        return jsonify({'message': 'Missing data'}), 400
+    limiter.hit('register_ip', request.remote_addr)
+    
+    username = data['username'] 
+    password = data['password']
+    role = data['role']
+
+    # Check if the username is already taken
+    if Users.query.filter_by(username=username).first():
+        return jsonify({'message': 'Username already taken'}), 400
+    
+    # Create a new user
+    new_user = Users(username=username)
+    try:
+        new_user.set_role(role)
+    except ValueError:
+        return jsonify({'message': 'Invalid role'}), 400
+    new_user.set_password(password)
+    db.session.add(new_user)
+    db.session.commit()
+    return jsonify({'message': 'User created'}), 201
+
+
+
+def _authenticate(data):
+    """The user ``data`` has the credentials of, or None; rehashes old hashes."""
+    username = data.get('username')
+    # both tokens are taken before anything is hashed; the username's is
+    # given back on success, so its owner is not locked out by logging in
+    limiter.hit('login_ip', request.remote_addr)
+    limiter.hit('login_username', username)
+    user = Users.query.filter_by(username=username).first()
+    if user is None or not user.check_password(data.get('password', '')):
+        return None
+    limiter.refund('login_username', username)
+
+    # upgrade hashes made with an older method or cost on the way in
+    if needs_rehash(user.password_hash):
+        user.set_password(data['password'])
+        # the same password, so the user's tokens stay valid
+        tokens.keep_tokens(db.session, user.user_id)
+        db.session.commit()
+    recorder.record(user.user_id, request.remote_addr)
+    return user
+
+
+@bp.route('/login', methods=['POST'])
+def login():
+    user = _authenticate(request.get_json() or {})
+    if user is None:
+        return jsonify({'message': 'Invalid credentials'}), 401
+    login_user(user)
+    return jsonify({'message': 'Logged in'}), 200
+
+
+@bp.route('/token', methods=['POST'])
+def token():
+    user = _authenticate(request.get_json() or {})
+    if user is None or user.is_active is False:
+        return jsonify({'message': 'Invalid credentials'}), 401
+    return jsonify(tokens.issue(user.user_id, user.role)), 200
+
+
+@bp.route('/token/refresh', methods=['POST'])
+def refresh_token():
+    data = request.get_json() or {}
+    try:
+        issued = tokens.refresh(data.get('refresh_token'))
+    except tokens.InvalidToken:
+        return jsonify({'message': 'Invalid token'}), 401
+    return jsonify(issued), 200
+
+
+@bp.route('/token/revoke', methods=['POST'])
+def revoke_token():
+    """Log a refresh token out, or with "all" every token of its user."""
+    data = request.get_json() or {}
+    try:
+        claims = tokens.decode(data.get('refresh_token'), tokens.REFRESH)
+    except tokens.InvalidToken:
+        return jsonify({'message': 'Invalid token'}), 401
+    tokens.revoke(claims.user_id, None if data.get('all') else claims.token_id)
+    return jsonify({'message': 'Token revoked'}), 200
@@ -0,0 +1,128 @@
+import hashlib
+from datetime import datetime
+from itertools import chain
+
+from sqlalchemy import case, event, literal, or_, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.db_types import new_id, uuid_bytes, uuid_str
+from app.models import Conversations, Messages
+
+
+# One Conversations row per pair of users who have exchanged messages,
+# holding the newest message id and each side's unread count, so the inbox
+# is a range scan over conversations instead of a GROUP BY over messages.
+# The pair is stored smaller id first and the conversation id is a hash of
+# it, so a new message finds its conversation without a lookup: before the
+# flush the conversation is created if missing (INSERT IGNORE) and bumped
+# with one atomic UPDATE per conversation, in the message's transaction.
+
+
+def conversation_key(user_a, user_b):
+    """(conversation_id, user_low_id, user_high_id) of a pair of users."""
+    a, b = uuid_bytes(user_a), uuid_bytes(user_b)
+    low, high = (a, b) if a <= b else (b, a)
+    return uuid_str(hashlib.blake2b(low + high, digest_size=16).digest()), uuid_str(low), uuid_str(high)
+
+
+def _insert_ignore(table):
+    return table.insert().prefix_with('OR IGNORE', dialect='sqlite').prefix_with('IGNORE', dialect='mysql')
+
+
+@event.listens_for(Session, 'before_flush')
+def _thread_messages(session, flush_context, instances):
+    pending = {}
+    for obj in session.new:
+        if not isinstance(obj, Messages) or obj.sender_id is None or obj.receiver_id is None:
+            continue
+        if obj.message_id is None:
+            obj.message_id = new_id()
+        conversation_id, low, high = conversation_key(obj.sender_id, obj.receiver_id)
+        obj.conversation_id = conversation_id
+        entry = pending.get(conversation_id)
+        if entry is None:
+            entry = pending[conversation_id] = {'low': low, 'high': high, 'last': obj.message_id,
+                                                'count': 0, 'unread_low': 0, 'unread_high': 0}
+        entry['last'] = max(entry['last'], obj.message_id)
+        entry['count'] += 1
+        entry['unread_low' if uuid_bytes(obj.receiver_id) == uuid_bytes(low) else 'unread_high'] += 1
+    if not pending:
+        return
+
+    connection = session.connection()
+    table = Conversations.__table__
+    now = datetime.utcnow()
+    connection.execute(_insert_ignore(table), [{
+        'conversation_id': conversation_id, 'user_low_id': entry['low'], 'user_high_id': entry['high'],
+        'message_count': 0, 'unread_low': 0, 'unread_high': 0, 'created_at': now, 'updated_at': now,
+    } for conversation_id, entry in pending.items()])
+    c = table.c
+    for conversation_id, entry in pending.items():
+        last = literal(entry['last'], c.last_message_id.type)
+        newer = or_(c.last_message_id.is_(None), c.last_message_id < last)
+        # MySQL assigns left to right, so last_message_at is set while
+        # last_message_id still holds the old value
+        connection.execute(table.update().where(c.conversation_id == conversation_id).ordered_values(
+            (c.last_message_at, case((newer, now), else_=c.last_message_at)),
+            (c.last_message_id, case((newer, last), else_=c.last_message_id)),
+            (c.message_count, c.message_count + entry['count']),
+            (c.unread_low, c.unread_low + entry['unread_low']),
+            (c.unread_high, c.unread_high + entry['unread_high']),
+            (c.updated_at, now),
+        ))
+
+
+def get_conversation(conversation_id, user_id, session=None):
+    """The conversation if ``user_id`` takes part in it, else None."""
+    session = session or db.session
+    conversation = session.get(Conversations, conversation_id)
+    if conversation is None or user_id not in (conversation.user_low_id, conversation.user_high_id):
+        return None
+    return conversation
+
+
+def unread_count(conversation, user_id):
+    return conversation.unread_low if user_id == conversation.user_low_id else conversation.unread_high
+
+
+def other_user(conversation, user_id):
+    return conversation.user_high_id if user_id == conversation.user_low_id else conversation.user_low_id
+
+
+def inbox(user_id, before=None, limit=20, session=None):
+    """(conversations newest first, next cursor) of ``user_id``; the cursor is a message id."""
+    session = session or db.session
+    pages = []
+    # one index range per side of the pair, merged here
+    for side in (Conversations.user_low_id, Conversations.user_high_id):
+        query = select(Conversations).where(side == user_id, Conversations.last_message_id.isnot(None))
+        if before is not None:
+            query = query.where(Conversations.last_message_id < before)
+        pages.append(session.scalars(query.order_by(Conversations.last_message_id.desc()).limit(limit + 1)).all())
+    rows = sorted(chain(*pages), key=lambda row: row.last_message_id, reverse=True)
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].last_message_id
+    return rows, None
+
+
+def thread(conversation_id, before=None, limit=20, session=None):
+    """(messages newest first, next cursor) of a conversation; the cursor is a message id."""
+    session = session or db.session
+    query = select(Messages).where(Messages.conversation_id == conversation_id, Messages.is_deleted.isnot(True))
+    if before is not None:
+        query = query.where(Messages.message_id < before)
+    rows = session.scalars(query.order_by(Messages.message_id.desc()).limit(limit + 1)).all()
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].message_id
+    return rows, None
+
+
+def mark_read(conversation, user_id, session=None):
+    """Zero ``user_id``'s unread count. Commits."""
+    session = session or db.session
+    column = Conversations.unread_low if user_id == conversation.user_low_id else Conversations.unread_high
+    session.execute(Conversations.__table__.update()
+                    .where(Conversations.conversation_id == conversation.conversation_id)
+                    .values({column.key: 0}))
+    session.commit()
@@ -0,0 +1,259 @@
+import atexit
+import logging
+import threading
+from itertools import chain
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, event, func, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Comment_likes, Comments, Post_likes, Posts
+
+log = logging.getLogger(__name__)
+
+
+# Denormalised counters: Posts.like_count, Posts.comment_count and
+# Comments.like_count. Rows added to or removed from the tables they count
+# (or soft deleted through is_deleted) are turned into +1/-1 deltas at
+# flush. With COUNTER_FLUSH_INTERVAL set the deltas of committed
+# transactions are coalesced in process and written by a background thread,
+# one UPDATE ... SET n = n + delta per counter per interval, so a viral post
+# takes one counter write a second instead of one per like. With it at 0
+# each delta is applied in the transaction that caused it. Deltas pending
+# when a process dies are lost; reconcile() recomputes the counters from
+# the rows (`flask reconcile-counters`).
+
+# counted model -> (counter model, foreign key to it, counter column)
+COUNTED = {
+    Post_likes: (Posts, 'post_id', 'like_count'),
+    Comment_likes: (Comments, 'comment_id', 'like_count'),
+    Comments: (Posts, 'post_id', 'comment_count'),
+}
+
+
+class CounterBuffer(object):
+    """Coalesces counter deltas and writes them out in batches."""
+
+    def __init__(self):
+        self.app = None
+        self.interval = 1.0
+        self.max_pending = 1000
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.added = 0
+        self.flushes = 0
+        self.rows_updated = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('COUNTER_FLUSH_INTERVAL', 1.0)
+        self.max_pending = app.config.get('COUNTER_FLUSH_SIZE', 1000)
+
+    def add(self, deltas):
+        """Queue {(model, column, pk): delta} for the next flush."""
+        with self._lock:
+            pending = self._pending
+            for key, delta in deltas.items():
+                pending[key] = pending.get(key, 0) + delta
+                self.added += abs(delta)
+            full = len(pending) >= self.max_pending
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work, name='counter-flush', daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def pending(self, model, column, pk):
+        """The not yet written delta of one counter in this process."""
+        return self._pending.get((model, column, pk), 0)
+
+    def _work(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception('counter flush failed')
+
+    def flush(self):
+        """Write every pending delta; returns the number of counters updated."""
+        with self._flushing:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            groups = {}
+            for (model, column, pk), delta in pending.items():
+                if delta:
+                    groups.setdefault((model, column), []).append({'pk': pk, 'delta': delta})
+            if not groups or self.app is None:
+                return 0
+            try:
+                with self.app.app_context(), db.engine.begin() as connection:
+                    for (model, column), params in groups.items():
+                        table = model.__table__
+                        counter = table.c[column]
+                        connection.execute(
+                            table.update()
+                            .where(table.c[model.__mapper__.primary_key[0].name] == bindparam('pk'))
+                            .values({column: counter + bindparam('delta')}),
+                            params)
+            except Exception:
+                # put them back for the next attempt
+                self.add({key: delta for key, delta in pending.items() if delta})
+                raise
+            updated = sum(len(params) for params in groups.values())
+            with self._lock:
+                self.flushes += 1
+                self.rows_updated += updated
+            return updated
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'deltas': self.added,
+                'flushes': self.flushes,
+                'rows_updated': self.rows_updated,
+            }
+
+
+buffer = CounterBuffer()
+atexit.register(lambda: buffer.flush() if buffer.app is not None else None)
+
+
+def init_app(app):
+    buffer.init_app(app)
+
+
+def count(model, column, pk, stored):
+    """A counter value with this process's unwritten delta added."""
+    return (stored or 0) + buffer.pending(model, column, pk)
+
+
+def _delta(obj, session):
+    # +1 for a live row appearing, -1 for one going away or soft deleted
+    if obj in session.new:
+        return 0 if obj.is_deleted else 1
+    if obj in session.deleted:
+        return 0 if obj.is_deleted else -1
+    history = inspect(obj).attrs.is_deleted.history
+    if not history.has_changes():
+        return 0
+    was = bool(history.deleted and history.deleted[0])
+    return (1 if was else 0) - (1 if obj.is_deleted else 0)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_counter_deltas(session, flush_context):
+    deltas = {}
+    for obj in chain(session.new, session.dirty, session.deleted):
+        target = COUNTED.get(type(obj))
+        if target is None:
+            continue
+        model, foreign_key, column = target
+        pk = getattr(obj, foreign_key)
+        delta = _delta(obj, session)
+        if delta and pk is not None:
+            key = (model, column, pk)
+            deltas[key] = deltas.get(key, 0) + delta
+    if not deltas:
+        return
+    if buffer.interval:
+        pending = session.info.setdefault('counter_deltas', {})
+        for key, delta in deltas.items():
+            pending[key] = pending.get(key, 0) + delta
+        return
+    # unbuffered: same transaction as the rows being counted
+    connection = session.connection()
+    for (model, column, pk), delta in deltas.items():
+        table = model.__table__
+        connection.execute(table.update()
+                           .where(table.c[model.__mapper__.primary_key[0].name] == pk)
+                           .values({column: table.c[column] + delta}))
+
+
+@event.listens_for(Session, 'after_commit')
+def _buffer_counter_deltas(session):
+    deltas = session.info.pop('counter_deltas', None)
+    if deltas:
+        buffer.add(deltas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_counter_deltas(session):
+    session.info.pop('counter_deltas', None)
+
+
+def like(model, target_id, user_id, session=None):
+    """Add ``user_id``'s like (Post_likes or Comment_likes); False if it was there."""
+    session = session or db.session
+    _, foreign_key, _ = COUNTED[model]
+    session.add(model(**{foreign_key: target_id, 'user_id': user_id}))
+    try:
+        session.commit()
+    except IntegrityError:
+        # the unique (target, user_id) constraint: liked already, maybe by
+        # a concurrent request
+        session.rollback()
+        return False
+    return True
+
+
+def unlike(model, target_id, user_id, session=None):
+    """Remove ``user_id``'s like; False if there was none."""
+    session = session or db.session
+    _, foreign_key, _ = COUNTED[model]
+    row = session.scalar(select(model).where(getattr(model, foreign_key) == target_id,
+                                             model.user_id == user_id))
+    if row is None:
+        return False
+    session.delete(row)
+    session.commit()
+    return True
+
+
+def reconcile(session=None, batch=1000):
+    """Recompute every counter from the counted rows; returns how many were wrong.
+
+    Runs after flushing this process's buffer. Other workers' unflushed
+    deltas still land afterwards, so run it when writes are quiet or
+    accept a drift of one flush interval.
+    """
+    session = session or db.session
+    buffer.flush()
+    fixed = 0
+    for counted, (model, foreign_key, column) in COUNTED.items():
+        pk = model.__mapper__.primary_key[0]
+        link = getattr(counted, foreign_key)
+        actual = select(func.count()).where(link == pk, counted.is_deleted.isnot(True)) \
+            .correlate(model).scalar_subquery()
+        last = None
+        while True:
+            query = select(pk, getattr(model, column), actual).order_by(pk).limit(batch)
+            if last is not None:
+                query = query.where(pk > last)
+            rows = session.execute(query).all()
+            if not rows:
+                break
+            wrong = [{'pk': key, 'value': real} for key, stored, real in rows if stored != real]
+            if wrong:
+                table = model.__table__
+                session.execute(table.update().where(table.c[pk.name] == bindparam('pk'))
+                                .values({column: bindparam('value')}), wrong)
+                fixed += len(wrong)
+            session.commit()
+            last = rows[-1][0]
+    return fixed
+
+
+@click.command('reconcile-counters')
+@with_appcontext
+def reconcile_command():
+    """Recompute like and comment counters from their rows."""
+    click.echo('fixed {} counters'.format(reconcile()))
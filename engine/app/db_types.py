@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy.dialects import mysql
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+
+class BinaryUUID(TypeDecorator):
+    """A UUID stored as 16 raw bytes: BINARY(16) on MySQL, BLOB elsewhere.
+
+    Python code keeps seeing the canonical string form, so ids in JSON,
+    headers and URLs look exactly as they did with String(60) columns.
+    """
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name in ('mysql', 'mariadb'):
+            return dialect.type_descriptor(mysql.BINARY(16))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, uuid.UUID):
+            return value.bytes
+        if isinstance(value, bytes) and len(value) == 16:
+            return value
+        return uuid_bytes(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return uuid_str(value)
+
+    @property
+    def python_type(self):
+        return str
+
+
+def uuid_bytes(value):
+    """The 16 raw bytes of a uuid string."""
+    if isinstance(value, str) and len(value) == 36 and value[8] == value[13] == value[18] == value[23] == '-':
+        # the canonical form new_id() and result rows produce; bulk
+        # inserts bind millions of these
+        try:
+            return bytes.fromhex(value.replace('-', ''))
+        except ValueError:
+            pass
+    return uuid.UUID(str(value)).bytes
+
+
+def uuid_str(raw):
+    """The canonical string form of 16 uuid bytes."""
+    # same result as str(uuid.UUID(bytes=raw)) without building a UUID
+    h = bytes(raw).hex()
+    return '{}-{}-{}-{}-{}'.format(h[:8], h[8:12], h[12:16], h[16:20], h[20:])
+
+
+def is_uuid(value):
+    return canonical_uuid(value) is not None
+
+
+def canonical_uuid(value):
+    """The canonical string form of ``value``, or None when it isn't a uuid.
+
+    uuid.UUID also accepts upper case, braces and missing hyphens; anything
+    keyed or compared by id (caches, self checks) needs the one form rows
+    come back in.
+    """
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7():
+    """A time-ordered UUID (RFC 9562 version 7).
+
+    The first 48 bits are the Unix time in milliseconds, so new rows land at
+    the right-hand end of primary key and foreign key indexes instead of at
+    random pages. Ids made in the same millisecond stay ordered through a
+    12-bit counter seeded at random.
+    """
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1000000
+        if ms > _last_ms:
+            _last_ms = ms
+            _counter = int.from_bytes(os.urandom(2), 'big') & 0x7ff
+        else:
+            ms = _last_ms
+            _counter += 1
+            if _counter > 0xfff:
+                # counter exhausted, borrow the next millisecond
+                _last_ms = ms = ms + 1
+                _counter = 0
+        counter = _counter
+    tail = int.from_bytes(os.urandom(8), 'big') & 0x3fffffffffffffff
+    value = (ms & 0xffffffffffff) << 80 | 0x7 << 76 | counter << 64 | 0x2 << 62 | tail
+    return uuid.UUID(int=value)
+
+
+def new_id():
+    return str(uuid7())
@@ -0,0 +1,111 @@
+from datetime import date, datetime
+from flask import Blueprint, current_app, g, request, jsonify
+from sqlalchemy import select
+from app.db_types import is_uuid
+from app.http_cache import entity_version, validated
+from app.models import db, Doctors, Patients
+from app.pagination import page_size
+from app.replica import use_replica
+from app.role_control import role_required
+from app.scheduling import DoctorNotFound, SlotUnavailable, availability, book, on_grid
+from app.search import get_index, ordered_results, results_statement, search_arguments
+from app.serialization import requested_fields, serializer_for
+
+bp = Blueprint('doctors', __name__, url_prefix='/doctors')
+
+
+@bp.route('/search', methods=['GET'])
+@use_replica
+def search_doctors():
+    try:
+        arguments = search_arguments(request.args)
+    except ValueError:
+        return jsonify({'message': 'Invalid offset'}), 400
+    total, doctor_ids, facet_counts = get_index().search(limit=page_size(), **arguments)
+
+    serializer = serializer_for(Doctors)
+    fields = requested_fields(serializer)
+    rows = db.session.execute(results_statement(doctor_ids, serializer, fields))
+    items = ordered_results(rows, doctor_ids, serializer, fields)
+    return jsonify({'total': total, 'items': items, 'facets': facet_counts}), 200
+
+
+@bp.route('/<doctor_id>', methods=['GET'])
+@use_replica
+@validated(lambda doctor_id: entity_version(Doctors, doctor_id) if is_uuid(doctor_id) else None)
+def get_doctor(doctor_id):
+    serializer = serializer_for(Doctors)
+    fields = requested_fields(serializer)
+    row = db.session.execute(
+        select(*serializer.columns(fields))
+        .where(Doctors.doctor_id == doctor_id, Doctors.is_deleted.is_not(True))).first() \
+        if is_uuid(doctor_id) else None
+    if row is None:
+        return jsonify({'message': 'Doctor not found'}), 404
+    return jsonify(serializer.dump_row(row, fields)), 200
+
+
+def _minutes(value, config):
+    step = config.get('SCHEDULE_SLOT_MINUTES', 30)
+    try:
+        minutes = int(value) if value is not None else step
+    except (TypeError, ValueError):
+        return None
+    if minutes <= 0 or minutes % step or minutes > config.get('SCHEDULE_MAX_MINUTES', 240):
+        return None
+    return minutes
+
+
+@bp.route('/<doctor_id>/availability', methods=['GET'])
+@use_replica
+def doctor_availability(doctor_id):
+    config = current_app.config
+    try:
+        day = date.fromisoformat(request.args.get('date', ''))
+    except ValueError:
+        return jsonify({'message': 'Invalid date'}), 400
+    minutes = _minutes(request.args.get('minutes'), config)
+    if minutes is None:
+        return jsonify({'message': 'Invalid minutes'}), 400
+    if not is_uuid(doctor_id) or db.session.get(Doctors, doctor_id) is None:
+        return jsonify({'message': 'Doctor not found'}), 404
+
+    slots = availability(doctor_id, day, minutes, config)
+    return jsonify({'doctor_id': doctor_id, 'date': day.isoformat(), 'minutes': minutes,
+                    'slots': slots}), 200
+
+
+@bp.route('/<doctor_id>/appointments', methods=['POST'])
+@role_required('patient')
+def book_appointment(doctor_id):
+    config = current_app.config
+    if not is_uuid(doctor_id):
+        return jsonify({'message': 'Doctor not found'}), 404
+    data = request.get_json() or {}
+    if not isinstance(data, dict) or not isinstance(data.get('starts_at'), str):
+        return jsonify({'message': 'Invalid starts_at'}), 400
+    try:
+        starts_at = datetime.fromisoformat(data['starts_at'])
+    except ValueError:
+        return jsonify({'message': 'Invalid starts_at'}), 400
+    minutes = _minutes(data.get('minutes'), config)
+    if minutes is None:
+        return jsonify({'message': 'Invalid minutes'}), 400
+    # only start times that availability would offer
+    if starts_at.tzinfo is not None or not on_grid(starts_at, minutes, config) or starts_at <= datetime.utcnow():
+        return jsonify({'message': 'Invalid starts_at'}), 400
+    appointment_type = data.get('appointment_type', 'in-person')
+    if appointment_type not in ('in-person', 'telemedicine'):
+        return jsonify({'message': 'Invalid appointment_type'}), 400
+
+    patient_id = db.session.scalar(select(Patients.patient_id).where(Patients.user_id == g.principal.user_id))
+    if patient_id is None:
+        return jsonify({'message': 'Patient profile not found'}), 404
+    try:
+        appointment = book(doctor_id, patient_id, starts_at, minutes, config,
+                           appointment_type=appointment_type)
+    except DoctorNotFound:
+        return jsonify({'message': 'Doctor not found'}), 404
+    except SlotUnavailable:
+        return jsonify({'message': 'Slot not available'}), 409
+    return jsonify(appointment.to_dict()), 201
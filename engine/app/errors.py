@@ -0,0 +1,24 @@
+from flask import jsonify
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from app.passwords import PasswordServiceBusy
+from app.ratelimit import RateLimitExceeded, retry_after_header
+
+
+def password_service_busy(e):
+    # the hashing pool is saturated, ask the client to back off
+    return jsonify({'message': 'Service busy, try again later'}), 503, {'Retry-After': '1'}
+
+
+def database_busy(e):
+    # every pooled connection stayed checked out for DB_POOL_TIMEOUT seconds
+    return jsonify({'message': 'Service busy, try again later'}), 503, {'Retry-After': '1'}
+
+
+def rate_limited(e):
+    return jsonify({'message': 'Too many attempts, try again later'}), 429, retry_after_header(e)
+
+
+def init_app(app):
+    app.register_error_handler(PasswordServiceBusy, password_service_busy)
+    app.register_error_handler(PoolTimeout, database_busy)
+    app.register_error_handler(RateLimitExceeded, rate_limited)
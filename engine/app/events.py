@@ -0,0 +1,53 @@
+from flask import Blueprint, Response, current_app, g, request
+from app import pubsub
+from app.db_types import is_uuid
+from app.models import db
+from app.role_control import role_required
+
+bp = Blueprint('events', __name__)
+
+
+def _stream(subscription, backlog, keepalive):
+    for item in backlog:
+        yield pubsub.format_event(item)
+    if pubsub.is_resync(backlog):
+        # the client reconnects from the last id for the next page
+        return
+    # rows committed while the backlog was read arrive both ways
+    sent = {item.id for item in backlog}
+    while True:
+        item = subscription.get(keepalive)
+        if item is not None:
+            if item.id not in sent:
+                yield pubsub.format_event(item)
+        elif subscription.closed:
+            break
+        else:
+            # a comment line keeps proxies from timing out an idle stream
+            yield ': keepalive\n\n'
+
+
+@bp.route('/events', methods=['GET'])
+@role_required('patient', 'doctor')
+def events():
+    """Server-Sent Events stream of the caller's new messages and notifications."""
+    config = current_app.config
+    user_id = g.principal.user_id
+    # subscribe before reading the backlog so nothing lands in between
+    subscription = pubsub.broker.subscribe(pubsub.channel_for(user_id), config.get('PUSH_QUEUE_SIZE', 256))
+
+    backlog = []
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id and is_uuid(last_event_id):
+        results = [(model, db.session.execute(statement).all())
+                   for model, statement in pubsub.backlog_queries(user_id, last_event_id)]
+        backlog = pubsub.backlog_events(results)
+    # the stream can stay open for hours, don't keep a pooled connection for it
+    db.session.close()
+
+    response = Response(_stream(subscription, backlog, config.get('PUSH_KEEPALIVE', 15)),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(subscription.close)
+    return response
@@ -0,0 +1,45 @@
+from flask import Blueprint, current_app, g, jsonify, request
+from sqlalchemy import select
+from app.db_types import canonical_uuid, is_uuid
+from app.models import db, Posts, Users
+from app.pagination import page_size
+from app.role_control import role_required
+from app.serialization import requested_fields, serializer_for
+from app.timelines import feed_page, follow, unfollow
+
+bp = Blueprint('feed', __name__)
+
+
+@bp.route('/feed', methods=['GET'])
+@role_required('patient', 'doctor')
+def feed():
+    cursor = request.args.get('cursor')
+    if cursor is not None and not is_uuid(cursor):
+        return jsonify({'message': 'Invalid cursor'}), 400
+    post_ids, next_cursor = feed_page(g.principal.user_id, current_app.config, cursor, page_size())
+
+    serializer = serializer_for(Posts)
+    fields = requested_fields(serializer)
+    rows = db.session.execute(
+        select(*serializer.columns(fields, extra=(Posts.post_id,)))
+        .where(Posts.post_id.in_(post_ids), Posts.is_deleted.isnot(True)))
+    found = {row.post_id: serializer.dump_row(row, fields) for row in rows}
+    items = [found[post_id] for post_id in post_ids if post_id in found]
+    return jsonify({'items': items, 'next_cursor': next_cursor}), 200
+
+
+@bp.route('/users/<user_id>/follow', methods=['POST', 'DELETE'])
+@role_required('patient', 'doctor')
+def follow_user(user_id):
+    follower_id = g.principal.user_id
+    user_id = canonical_uuid(user_id)
+    if user_id is None or db.session.get(Users, user_id) is None:
+        return jsonify({'message': 'User not found'}), 404
+    if user_id == follower_id:
+        return jsonify({'message': 'Cannot follow yourself'}), 400
+
+    if request.method == 'POST':
+        follow(follower_id, user_id)
+        return jsonify({'message': 'Following'}), 200
+    unfollow(follower_id, user_id)
+    return jsonify({'message': 'Not following'}), 200
@@ -0,0 +1,127 @@
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+from sqlalchemy import func
+
+from app import db
+from app.cache import TTLCache
+
+
+# Validators for JSON GET endpoints. A view decorated with @validated names
+# a cheap version lookup: the row's updated_at for one entity, or
+# max(updated_at) and count() over the rows a list would page through plus
+# max(updated_at) of each relationship it embeds. The weak ETag hashes that
+# version with the endpoint, its query arguments and the caller, so
+# If-None-Match gets a 304 before the view loads or serializes anything.
+# Writes must bump updated_at for this to see them.
+#
+# Only single entities carry Last-Modified and honour If-Modified-Since: a
+# list that lost a row other than its newest keeps the same
+# max(updated_at), so a date can't tell a client the list shrank, while
+# the count in the ETag does.
+#
+# With RESPONSE_CACHE_SIZE set, 200 bodies are also kept in process keyed
+# by that ETag, so a repeat request from a client without the validator
+# skips the view too. A new version is a new key; old entries just age out.
+
+response_cache = TTLCache(maxsize=0)
+
+
+def init_app(app):
+    response_cache.maxsize = app.config.get('RESPONSE_CACHE_SIZE', 0)
+    response_cache.ttl = app.config.get('RESPONSE_CACHE_TTL', 60.0)
+
+
+def entity_version(model, pk, session=None):
+    """(last_modified, state) of one live row, or None if there is no such row."""
+    session = session or db.session
+    column = model.__mapper__.primary_key[0]
+    updated_at = session.query(model.updated_at) \
+        .filter(column == pk, model.is_deleted.is_not(True)).first()
+    return None if updated_at is None else (updated_at[0], (updated_at[0],))
+
+
+def collection_version(query, model, includes=()):
+    """(None, state) of the rows ``query`` selects and the ``includes`` relationships they embed.
+
+    None when an included model has no updated_at to version it by.
+    """
+    columns = [func.max(model.updated_at), func.count()]
+    for name in includes:
+        relationship = getattr(model, name)
+        target = relationship.property.mapper.class_
+        if not hasattr(target, 'updated_at'):
+            return None
+        # many-to-one, so the outer join leaves the count alone. The owned
+        # queries never join a target themselves; an alias would only make
+        # every request compile a new statement
+        query = query.outerjoin(relationship)
+        columns.append(func.max(target.updated_at))
+    return None, tuple(query.with_entities(*columns).one())
+
+
+def _etag(state):
+    principal = g.get('principal')
+    key = '\0'.join((
+        request.endpoint or '',
+        repr(sorted(request.args.items(multi=True))),
+        principal.user_id if principal is not None else '',
+    ) + tuple(value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in state))
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        # If-Modified-Since is ignored when If-None-Match is sent
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    if since is not None and last_modified is not None:
+        return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= since
+    return False
+
+
+def _add_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # stored by the client but revalidated on every use
+    response.cache_control.no_cache = True
+    if g.get('principal') is not None:
+        response.cache_control.private = True
+    return response
+
+
+def validated(version):
+    """Answer conditional GETs from ``version(**view_args)`` before running the view.
+
+    ``version`` returns (last_modified, state), where state is a tuple that
+    changes whenever the response would and last_modified is None for
+    lists, or None to run the view without validators (it will typically
+    404).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            current = version(*args, **kwargs)
+            if current is None:
+                return f(*args, **kwargs)
+            last_modified, state = current
+            etag = _etag(state)
+            if _not_modified(etag, last_modified):
+                return _add_validators(current_app.response_class(status=304), etag, last_modified)
+
+            cached = response_cache.get(etag) if response_cache.maxsize else None
+            if cached is not None:
+                body, mimetype = cached
+                response = current_app.response_class(body, mimetype=mimetype)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response_cache.maxsize and response.status_code == 200:
+                    response_cache.set(etag, (response.get_data(), response.mimetype))
+            if response.status_code != 200:
+                return response
+            return _add_validators(response, etag, last_modified)
+        return decorated_function
+    return decorator
@@ -0,0 +1,263 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from app import storage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+
+
+# Sized derivatives of profile and banner pictures. The original is kept in
+# app.storage under its SHA-256 like any other upload; on upload every
+# IMAGE_SIZES box is rendered in each of IMAGE_FORMATS by a process pool,
+# decoding the original once per upload. Derivatives live in a disk cache
+# under IMAGE_CACHE_ROOT, capped at IMAGE_CACHE_MAX_BYTES and evicted least
+# recently used; an evicted one is rendered again on its next request.
+# Names are derived from the content hash, so a derivative never changes
+# and is served with a strong ETag and a year-long max-age.
+#
+# Without Pillow nothing is rendered and the original is served instead.
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+
+def derivative_name(sha256, size, fmt):
+    return '{}-{}.{}'.format(sha256, size, fmt)
+
+
+def probe(path):
+    """(format, width, height) of the image at ``path``, None if it is not one."""
+    if Image is None:
+        return None
+    try:
+        # reads the header only
+        with Image.open(path) as image:
+            return image.format, image.width, image.height
+    except Exception:
+        return None
+
+
+def render(source, targets, quality=80):
+    """Write the derivatives of ``source``; runs in a pool worker.
+
+    ``targets`` is a list of (path, box, format); returns [(path, bytes)].
+    The original is decoded once, at the largest box's scale where the
+    codec allows it (JPEG draft mode), and each smaller box is shrunk
+    from the previous one.
+    """
+    written = []
+    with Image.open(source) as image:
+        image.draft('RGB', (max(box for _, box, _ in targets),) * 2)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        for box in sorted({box for _, box, _ in targets}, reverse=True):
+            image.thumbnail((box, box), Image.LANCZOS)
+            for path, _, fmt in (target for target in targets if target[1] == box):
+                format_name, _ = FORMATS[fmt]
+                frame = image.convert('RGB') if format_name == 'JPEG' and image.mode == 'RGBA' else image
+                partial = '{}.{}.tmp'.format(path, os.getpid())
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                frame.save(partial, format_name, quality=quality)
+                os.replace(partial, path)
+                written.append((path, os.path.getsize(path)))
+    return written
+
+
+class DerivativeCache(object):
+    """Derivative files on disk, least recently used evicted past ``max_bytes``.
+
+    Recency is tracked per process and seeded from file mtimes, so with
+    several workers each one evicts by what it has served itself.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self._entries = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, name):
+        return os.path.join(self.root, name[:2], name)
+
+    def _load(self):
+        found = []
+        if os.path.isdir(self.root):
+            for directory, _, files in os.walk(self.root):
+                for name in files:
+                    if name.endswith('.tmp'):
+                        continue
+                    stat = os.stat(os.path.join(directory, name))
+                    found.append((stat.st_mtime, name, stat.st_size))
+        found.sort()
+        self._entries = OrderedDict((name, size) for _, name, size in found)
+        self._bytes = sum(size for _, _, size in found)
+
+    def get(self, name):
+        """The path of derivative ``name``, or None if it is not cached."""
+        path = self.path(name)
+        with self._lock:
+            if self._entries is None:
+                self._load()
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return path
+        try:
+            # written by another worker
+            size = os.path.getsize(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        self.add(name, size)
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def add(self, name, size):
+        with self._lock:
+            if self._entries is None:
+                self._load()
+            self._bytes += size - self._entries.get(name, 0)
+            self._entries[name] = size
+            self._entries.move_to_end(name)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old, old_size = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+                try:
+                    os.unlink(self.path(old))
+                except FileNotFoundError:
+                    pass
+
+    def discard(self, name):
+        with self._lock:
+            if self._entries is not None:
+                self._bytes -= self._entries.pop(name, 0)
+        try:
+            os.unlink(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'files': len(self._entries or ()),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+            }
+
+
+class Derivatives(object):
+    """Renders derivatives in a process pool and serves them from the cache."""
+
+    def __init__(self):
+        self.sizes = {'small': 64, 'medium': 256, 'large': 1024}
+        self.formats = ('webp', 'jpeg')
+        self.quality = 80
+        self.workers = 2
+        self.timeout = 10.0
+        self.cache = DerivativeCache('storage/derivatives', 1 << 30)
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.rendered = 0
+        self.failed = 0
+
+    def init_app(self, app):
+        config = app.config
+        self.sizes = dict(config.get('IMAGE_SIZES', self.sizes))
+        self.formats = tuple(config.get('IMAGE_FORMATS', self.formats))
+        self.quality = config.get('IMAGE_QUALITY', 80)
+        self.workers = config.get('IMAGE_WORKERS', 2)
+        self.timeout = config.get('IMAGE_RENDER_TIMEOUT', 10.0)
+        root = config.get('IMAGE_CACHE_ROOT') or os.path.join(config.get('STORAGE_ROOT') or 'storage', 'derivatives')
+        self.cache = DerivativeCache(root, config.get('IMAGE_CACHE_MAX_BYTES', 1 << 30))
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def submit(self, sha256):
+        """Render every size and format of ``sha256``; returns a future or None."""
+        source = storage.backend.local_path(sha256)
+        if not self.available or source is None:
+            return None
+        names = [derivative_name(sha256, size, fmt) for size in self.sizes for fmt in self.formats]
+        with self._lock:
+            future = next((self._pending[name] for name in names if name in self._pending), None)
+            if future is not None:
+                return future
+        targets = [(self.cache.path(derivative_name(sha256, size, fmt)), box, fmt)
+                   for size, box in self.sizes.items() for fmt in self.formats]
+        future = self._executor().submit(render, source, targets, self.quality)
+        with self._lock:
+            for name in names:
+                self._pending[name] = future
+        future.add_done_callback(lambda done: self._finished(names, done))
+        return future
+
+    def _finished(self, names, future):
+        failed = future.exception() is not None
+        if not failed:
+            for path, size in future.result():
+                self.cache.add(os.path.basename(path), size)
+        with self._lock:
+            for name in names:
+                self._pending.pop(name, None)
+            if failed:
+                self.failed += 1
+            else:
+                self.rendered += len(names)
+
+    def get(self, sha256, size, fmt):
+        """The path of a derivative, rendering it first if needed; None if it can't be."""
+        name = derivative_name(sha256, size, fmt)
+        path = self.cache.get(name)
+        if path is not None:
+            return path
+        with self._lock:
+            future = self._pending.get(name)
+        future = future or self.submit(sha256)
+        if future is None:
+            return None
+        try:
+            future.result(self.timeout)
+        except Exception:
+            return None
+        return self.cache.get(name)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.cache.stats(), rendered=self.rendered, failed=self.failed,
+                        pending=len(set(map(id, self._pending.values()))))
+
+
+derivatives = Derivatives()
+
+
+def init_app(app):
+    derivatives.init_app(app)
@@ -0,0 +1,188 @@
+import os
+import re
+import uuid
+from collections import Counter, namedtuple
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app import db
+
+
+# Compares the indexes declared on the models with the predicates the app
+# actually runs (from a statement log, one SQL statement per line as written
+# by SQL_LOG_PATH or the MySQL general log) and proposes an Alembic revision
+# that drops indexes nothing filters or sorts on and adds composite indexes
+# for the equality + range/order patterns that are not covered yet.
+
+IndexInfo = namedtuple('IndexInfo', ['table', 'name', 'columns', 'unique'])
+Audit = namedtuple('Audit', ['drops', 'creates', 'usage'])
+
+_CLAUSE = re.compile(r'\b(WHERE|ON|ORDER BY)\b(.*?)(?=\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|'
+                     r'\bFOR UPDATE\b|\bJOIN\b|\bWHERE\b|\bUNION\b|\)\s*AS\b|$)', re.I)
+_PREDICATE = re.compile(r'\b(\w+)\.(\w+)\s*(=|<=|>=|<|>|!=|\bIN\b|\bLIKE\b|\bBETWEEN\b|\bIS NOT\b|\bIS\b)', re.I)
+_ORDER = re.compile(r'\b(\w+)\.(\w+)', re.I)
+_ALIAS = re.compile(r'^(\w+?)_\d+$')
+_FREE_TEXT = re.compile(r'(_url|_picture|^picture|^bio|^about_me|message|^post|^comment)$')
+
+
+def model_indexes(metadata):
+    indexes = []
+    for table in metadata.sorted_tables:
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            indexes.append(IndexInfo(table.name, index.name,
+                                     tuple(c.name for c in index.columns), bool(index.unique)))
+    return indexes
+
+
+def _table_name(name, tables):
+    if name in tables:
+        return name
+    match = _ALIAS.match(name)
+    if match and match.group(1) in tables:
+        return match.group(1)
+    return None
+
+
+def parse_statement(statement, tables):
+    """Return {table: (equality columns, range/order columns)} for one statement."""
+    patterns = {}
+    for clause, body in _CLAUSE.findall(statement):
+        if clause.upper() == 'ORDER BY':
+            found = [(t, c, 'order') for t, c in _ORDER.findall(body)]
+        else:
+            found = _PREDICATE.findall(body)
+        for table, column, op in found:
+            table = _table_name(table, tables)
+            if table is None or column not in tables[table]:
+                continue
+            eq, rng = patterns.setdefault(table, ([], []))
+            op = op.upper()
+            if op in ('=', 'IN', 'IS'):
+                if column not in eq:
+                    eq.append(column)
+            elif op not in ('!=', 'IS NOT') and column not in rng:
+                rng.append(column)
+    return patterns
+
+
+def read_statements(paths):
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if re.search(r'\b(SELECT|UPDATE|DELETE)\b', line, re.I):
+                    yield line
+
+
+def _covered(columns, indexes):
+    return any(index.columns[:len(columns)] == tuple(columns) for index in indexes)
+
+
+def audit(metadata, statements=(), required=()):
+    tables = {t.name: set(c.name for c in t.columns) for t in metadata.sorted_tables}
+    primary_keys = {t.name: tuple(c.name for c in t.primary_key) for t in metadata.sorted_tables}
+    usage = Counter()
+    patterns = Counter()
+    seen_any = False
+    for statement in statements:
+        seen_any = True
+        for table, (eq, rng) in parse_statement(statement, tables).items():
+            for column in eq + rng:
+                usage[table, column] += 1
+            if eq:
+                patterns[table, tuple(eq + rng[:1])] += 1
+
+    indexes = model_indexes(metadata)
+    drops = []
+    for index in indexes:
+        if index.unique:
+            continue
+        leading = index.columns[0]
+        if seen_any:
+            useless = usage[index.table, leading] == 0
+        else:
+            # no log to go on: only drop indexes on free text and URLs
+            useless = bool(_FREE_TEXT.search(leading))
+        if useless:
+            drops.append(index)
+
+    kept = [index for index in indexes if index not in drops]
+    creates = []
+    candidates = [pattern for pattern, _ in patterns.most_common()] + list(required)
+    for table, columns in candidates:
+        existing = [i for i in kept if i.table == table]
+        if primary_keys[table][:len(columns)] == tuple(columns) or _covered(columns, existing):
+            continue
+        name = 'ix_{}_{}'.format(table, '_'.join(columns))
+        created = IndexInfo(table, name, tuple(columns), False)
+        creates.append(created)
+        kept.append(created)
+    return Audit(drops, creates, usage)
+
+
+def render_revision(result, revision, down_revision, message='index audit'):
+    def block(table, lines):
+        return ("    with op.batch_alter_table('{}', schema=None) as batch_op:\n".format(table)
+                + ''.join('        {}\n'.format(line) for line in lines))
+
+    def grouped(items, render):
+        tables = {}
+        for item in items:
+            tables.setdefault(item.table, []).append(render(item))
+        return '\n'.join(block(table, lines) for table, lines in tables.items())
+
+    def section(*parts):
+        return '\n'.join(part for part in parts if part) or '    pass\n'
+
+    create = lambda i: "batch_op.create_index('{}', {!r}, unique={})".format(i.name, list(i.columns), i.unique)
+    drop = lambda i: "batch_op.drop_index('{}')".format(i.name)
+    upgrade = section(grouped(result.drops, drop), grouped(result.creates, create))
+    downgrade = section(grouped(result.creates, drop), grouped(result.drops, create))
+    return (
+        '"""{message}\n\nRevision ID: {revision}\nRevises: {down}\nCreate Date: {date}\n\n"""\n'
+        'from alembic import op\nimport sqlalchemy as sa\n\n\n'
+        '# revision identifiers, used by Alembic.\n'
+        "revision = '{revision}'\ndown_revision = {down!r}\nbranch_labels = None\ndepends_on = None\n\n\n"
+        'def upgrade():\n{upgrade}\n\ndef downgrade():\n{downgrade}'
+    ).format(message=message, revision=revision, down=down_revision, date=datetime.now(),
+             upgrade=upgrade.rstrip('\n') + '\n', downgrade=downgrade.rstrip('\n') + '\n')
+
+
+def _parse_required(values):
+    required = []
+    for value in values:
+        table, _, columns = value.partition(':')
+        required.append((table, tuple(c.strip() for c in columns.split(',') if c.strip())))
+    return required
+
+
+@click.command('index-audit')
+@click.option('--log', 'logs', multiple=True, type=click.Path(exists=True, dir_okay=False),
+              help='File of logged SQL statements, one per line. Repeatable.')
+@click.option('--require', multiple=True, metavar='TABLE:COL[,COL]',
+              help='Composite index an upcoming query pattern needs. Repeatable.')
+@click.option('--write', is_flag=True, help='Write the revision into the migrations directory.')
+@with_appcontext
+def index_audit_command(logs, require, write):
+    """Report useless and missing indexes and emit an Alembic revision."""
+    from alembic.script import ScriptDirectory
+
+    result = audit(db.metadata, read_statements(logs), _parse_required(require))
+    for index in result.drops:
+        click.echo('drop   {}.{} {}'.format(index.table, index.name, list(index.columns)))
+    for index in result.creates:
+        click.echo('create {}.{} {}'.format(index.table, index.name, list(index.columns)))
+
+    directory = current_app.extensions['migrate'].directory
+    head = ScriptDirectory(directory).get_current_head()
+    revision = uuid.uuid4().hex[:12]
+    source = render_revision(result, revision, head)
+    if write:
+        path = os.path.join(directory, 'versions', '{}_index_audit.py'.format(revision))
+        with open(path, 'w') as f:
+            f.write(source)
+        click.echo('wrote {}'.format(path))
+    else:
+        click.echo(source)
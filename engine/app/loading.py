@@ -0,0 +1,57 @@
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.relationships import RelationshipProperty
+
+from app.models import (Appointments, Certificates, Comment_likes, Comments,
+                        Documents, MedicalHistory, Messages, Notifications,
+                        Post_likes, Posts, Prescriptions, user_IP)
+
+
+# Relationships a list endpoint may embed through ?include=, per model.
+INCLUDES = {
+    Appointments: ('doctor', 'patient'),
+    Documents: ('doctor', 'patient'),
+    Prescriptions: ('doctor', 'patient'),
+    MedicalHistory: ('doctor', 'patient'),
+    Certificates: ('doctor',),
+    Notifications: ('user',),
+    Messages: ('sender', 'receiver'),
+    Posts: ('user',),
+    Post_likes: ('post', 'user'),
+    Comments: ('post', 'user'),
+    Comment_likes: ('comment', 'user'),
+    user_IP: ('user',),
+}
+
+
+def load_with(model, *paths):
+    """Loader options that eager load each dotted relationship path.
+
+    Many-to-one hops are joined into the main SELECT and collections are
+    fetched with one extra SELECT ... IN per hop, so the number of queries
+    depends on the paths requested and never on the number of rows.
+    """
+    options = []
+    for path in paths:
+        option = None
+        current = model
+        for name in path.split('.'):
+            attr = getattr(current, name, None)
+            prop = getattr(attr, 'property', None)
+            if not isinstance(prop, RelationshipProperty):
+                raise ValueError('{} has no relationship {!r}'.format(current.__name__, name))
+            if option is None:
+                option = (selectinload if prop.uselist else joinedload)(attr)
+            elif prop.uselist:
+                option = option.selectinload(attr)
+            else:
+                option = option.joinedload(attr)
+            current = prop.mapper.class_
+        options.append(option)
+    return options
+
+
+def requested_includes(model, include):
+    """Parse an ?include=a,b argument, keeping only what INCLUDES allows."""
+    allowed = INCLUDES.get(model, ())
+    names = [name.strip() for name in (include or '').split(',') if name.strip()]
+    return [name for name in names if name in allowed]
@@ -0,0 +1,158 @@
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import bindparam, select, tuple_
+
+from app import db
+from app.db_types import new_id
+from app.models import user_IP
+
+log = logging.getLogger(__name__)
+
+
+# The addresses each user logs in from, kept in user_ip. A login only
+# queues (user_id, ip) here; a background thread writes the queue every
+# LOGIN_IP_FLUSH_INTERVAL seconds as one SELECT of the pairs already known,
+# one executemany UPDATE of their updated_at and one INSERT of the new
+# ones, so the login response never waits on this write and a burst of
+# logins from the same places costs one statement each per interval.
+# shutdown() writes what is queued and detaches the app; call it before the
+# database goes away. The atexit flush is a last resort: by then the engine
+# may be gone, and the pairs are dropped quietly. Pairs queued when a
+# process dies are lost. An app without Flask-SQLAlchemy (the async app)
+# passes the engine to write through to init_app.
+
+
+class LoginIPRecorder(object):
+    """Coalesces (user_id, ip) sightings and writes them out in batches."""
+
+    def __init__(self):
+        self.app = None
+        self.engine = None
+        self.interval = 1.0
+        self.max_pending = 1000
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.recorded = 0
+        self.flushes = 0
+        self.rows_inserted = 0
+        self.rows_updated = 0
+
+    def init_app(self, app, engine=None):
+        self.app = app
+        self.engine = engine
+        self.interval = app.config.get('LOGIN_IP_FLUSH_INTERVAL', 1.0)
+        self.max_pending = app.config.get('LOGIN_IP_FLUSH_SIZE', 1000)
+
+    def record(self, user_id, ip, seen_at=None):
+        """Queue a login of ``user_id`` from ``ip`` for the next flush."""
+        if user_id is None or not ip:
+            return
+        with self._lock:
+            self._pending[(user_id, ip[:60])] = seen_at or datetime.utcnow()
+            self.recorded += 1
+            full = len(self._pending) >= self.max_pending
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work, name='login-ip-flush', daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def _work(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception('login ip flush failed')
+
+    def flush(self):
+        """Write every pending sighting; returns the number of rows written."""
+        with self._flushing:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending or self.app is None:
+                return 0
+            table = user_IP.__table__
+            c = table.c
+            try:
+                with self._begin() as connection:
+                    known = {}
+                    for user_id, ip, row_id in connection.execute(
+                            select(c.user_id, c.user_ip, c.user_ip_id)
+                            .where(tuple_(c.user_id, c.user_ip).in_(list(pending)))):
+                        known[(user_id, ip)] = row_id
+                    updates = [{'row_id': row_id, 'seen_at': pending[key]} for key, row_id in known.items()]
+                    inserts = [{'user_ip_id': new_id(), 'user_id': user_id, 'user_ip': ip, 'is_active': True,
+                                'is_deleted': False, 'updated_at': seen_at}
+                               for (user_id, ip), seen_at in pending.items() if (user_id, ip) not in known]
+                    if updates:
+                        connection.execute(table.update().where(c.user_ip_id == bindparam('row_id'))
+                                           .values(updated_at=bindparam('seen_at')), updates)
+                    if inserts:
+                        connection.execute(table.insert(), inserts)
+            except Exception:
+                # put them back for the next attempt, unless newer ones came in
+                with self._lock:
+                    for key, seen_at in pending.items():
+                        self._pending.setdefault(key, seen_at)
+                raise
+            with self._lock:
+                self.flushes += 1
+                self.rows_inserted += len(inserts)
+                self.rows_updated += len(updates)
+            return len(inserts) + len(updates)
+
+    @contextmanager
+    def _begin(self):
+        if self.engine is not None:
+            with self.engine.begin() as connection:
+                yield connection
+        else:
+            with self.app.app_context(), db.engine.begin() as connection:
+                yield connection
+
+    def shutdown(self):
+        """Write what is queued and stop writing; recording again needs init_app."""
+        try:
+            self.flush()
+        finally:
+            self.app = None
+
+    def _flush_at_exit(self):
+        if self.app is None:
+            return
+        try:
+            self.flush()
+        except Exception as exc:
+            # the app, the engine or the database file may be torn down already
+            log.info('login ip flush at exit failed, %d sightings dropped: %s', len(self._pending), exc)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'recorded': self.recorded,
+                'flushes': self.flushes,
+                'rows_inserted': self.rows_inserted,
+                'rows_updated': self.rows_updated,
+            }
+
+
+recorder = LoginIPRecorder()
+atexit.register(recorder._flush_at_exit)
+
+
+def init_app(app, engine=None):
+    recorder.init_app(app, engine)
+
+
+def shutdown():
+    recorder.shutdown()
@@ -0,0 +1,82 @@
+from flask import Blueprint, g, jsonify, request
+from sqlalchemy import select
+from app.conversations import get_conversation, inbox, mark_read, other_user, thread, unread_count
+from app.db_types import canonical_uuid, is_uuid
+from app.models import db, Messages, Users
+from app.pagination import page_size
+from app.role_control import role_required
+from app.serialization import requested_fields, serializer_for
+
+bp = Blueprint('messaging', __name__)
+
+
+@bp.route('/messages', methods=['POST'])
+@role_required('patient', 'doctor')
+def send_message():
+    data = request.get_json() or {}
+    receiver_id = canonical_uuid(data.get('receiver_id'))
+    text = data.get('message')
+    if not text or not isinstance(text, str) or len(text) > 255:
+        return jsonify({'message': 'Invalid message'}), 400
+    if receiver_id is None or receiver_id == g.principal.user_id \
+            or db.session.get(Users, receiver_id) is None:
+        return jsonify({'message': 'Receiver not found'}), 404
+
+    message = Messages(sender_id=g.principal.user_id, receiver_id=receiver_id, message=text,
+                       message_type=data.get('message_type', 'text'))
+    db.session.add(message)
+    db.session.commit()
+    return jsonify(message.to_dict()), 201
+
+
+@bp.route('/conversations', methods=['GET'])
+@role_required('patient', 'doctor')
+def list_conversations():
+    user_id = g.principal.user_id
+    cursor = request.args.get('cursor')
+    if cursor is not None and not is_uuid(cursor):
+        return jsonify({'message': 'Invalid cursor'}), 400
+    conversations, next_cursor = inbox(user_id, cursor, page_size())
+
+    serializer = serializer_for(Messages)
+    fields = requested_fields(serializer)
+    rows = db.session.execute(
+        select(*serializer.columns(fields, extra=(Messages.message_id,)))
+        .where(Messages.message_id.in_([c.last_message_id for c in conversations])))
+    last_messages = {row.message_id: serializer.dump_row(row, fields) for row in rows}
+    items = [{
+        'conversation_id': conversation.conversation_id,
+        'user_id': other_user(conversation, user_id),
+        'unread_count': unread_count(conversation, user_id),
+        'message_count': conversation.message_count,
+        'last_message_at': conversation.last_message_at,
+        'last_message': last_messages.get(conversation.last_message_id),
+    } for conversation in conversations]
+    return jsonify({'items': items, 'next_cursor': next_cursor}), 200
+
+
+@bp.route('/conversations/<conversation_id>/messages', methods=['GET'])
+@role_required('patient', 'doctor')
+def list_messages(conversation_id):
+    cursor = request.args.get('cursor')
+    if cursor is not None and not is_uuid(cursor):
+        return jsonify({'message': 'Invalid cursor'}), 400
+    if not is_uuid(conversation_id) or get_conversation(conversation_id, g.principal.user_id) is None:
+        return jsonify({'message': 'Conversation not found'}), 404
+
+    messages, next_cursor = thread(conversation_id, cursor, page_size())
+    serializer = serializer_for(Messages)
+    fields = requested_fields(serializer)
+    items = [serializer.dump(message, fields) for message in messages]
+    return jsonify({'items': items, 'next_cursor': next_cursor}), 200
+
+
+@bp.route('/conversations/<conversation_id>/read', methods=['POST'])
+@role_required('patient', 'doctor')
+def read_conversation(conversation_id):
+    user_id = g.principal.user_id
+    conversation = get_conversation(conversation_id, user_id) if is_uuid(conversation_id) else None
+    if conversation is None:
+        return jsonify({'message': 'Conversation not found'}), 404
+    mark_read(conversation, user_id)
+    return jsonify({'conversation_id': conversation_id, 'unread_count': 0}), 200
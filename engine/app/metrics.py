@@ -0,0 +1,328 @@
+import hmac
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Blueprint, Response, abort, current_app, request
+from sqlalchemy import event
+
+from app import db
+
+log = logging.getLogger(__name__)
+
+
+# Request and SQL instrumentation, exposed in the Prometheus text format at
+# GET /metrics. Every request is timed into a latency histogram per
+# endpoint and method and counted per status; every SQL statement is timed
+# through the engines' cursor events and charged to the endpoint whose
+# request ran it (statements from background threads go to "background"),
+# and statements slower than SLOW_QUERY_SECONDS are logged. A
+# PROFILE_SAMPLE_RATE share of requests run under a profiler (cProfile, or
+# pyinstrument when PROFILER says so and it is installed) and the profile
+# is written to PROFILE_DIR when the request took PROFILE_SLOW_SECONDS or
+# more. The per-request cost is a few dict and lock operations; see
+# benchmarks/bench_metrics.py for the budget. /metrics needs METRICS_TOKEN
+# (or TESTING); a default deployment collects but does not serve.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+BACKGROUND = 'background'
+UNMATCHED = 'unmatched'
+
+try:
+    from pyinstrument import Profiler as Pyinstrument
+except ImportError:  # pragma: no cover - pyinstrument is optional
+    Pyinstrument = None
+
+bp = Blueprint('metrics', __name__)
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def cumulative(self):
+        """[(le, count)] with the counts summed up to each bound, +Inf last."""
+        total = 0
+        rows = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            rows.append((bound, total))
+        return rows
+
+
+class RequestMetrics(object):
+    """Latency, status and SQL totals per endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.latency = {}
+        self.statuses = {}
+        self.statement_counts = {}
+        self.db_statements = {}
+        self.db_seconds = {}
+        self.slow_queries = 0
+        self.profiles = 0
+        self.enabled = False
+        self.slow_query_seconds = 0.5
+        self.sample_rate = 0.0
+        self.slow_seconds = 1.0
+        self.profiler = 'cprofile'
+        self.profile_dir = None
+        self.profile_keep = 100
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get('METRICS_ENABLED', True)
+        if not self.enabled:
+            return
+        self.slow_query_seconds = config.get('SLOW_QUERY_SECONDS', 0.5)
+        self.sample_rate = config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.slow_seconds = config.get('PROFILE_SLOW_SECONDS', 1.0)
+        self.profiler = config.get('PROFILER', 'cprofile')
+        self.profile_dir = os.path.abspath(config.get('PROFILE_DIR') or 'profiles')
+        self.profile_keep = config.get('PROFILE_KEEP', 100)
+        app.before_request(self._start)
+        app.after_request(self._status)
+        app.teardown_request(self._finish)
+        with app.app_context():
+            for engine in db.engines.values():
+                if not event.contains(engine, 'before_cursor_execute', self._before_cursor_execute):
+                    event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                    event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    # -- requests
+
+    def _start(self):
+        state = self._local
+        state.statements = 0
+        state.db_seconds = 0.0
+        state.status = 500
+        state.profiler = None
+        if self.sample_rate and random.random() < self.sample_rate:
+            state.profiler = self._start_profiler()
+        state.start = time.perf_counter()
+
+    def _status(self, response):
+        self._local.status = response.status_code
+        return response
+
+    def _finish(self, exc):
+        state = self._local
+        start = getattr(state, 'start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        state.start = None
+        endpoint = request.endpoint or UNMATCHED
+        status = 500 if exc is not None else state.status
+        with self._lock:
+            key = (endpoint, request.method)
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(elapsed)
+            key = (endpoint, request.method, status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+            histogram = self.statement_counts.get(endpoint)
+            if histogram is None:
+                histogram = self.statement_counts[endpoint] = Histogram(STATEMENT_BUCKETS)
+            histogram.observe(state.statements)
+            if state.statements:
+                self.db_statements[endpoint] = self.db_statements.get(endpoint, 0) + state.statements
+                self.db_seconds[endpoint] = self.db_seconds.get(endpoint, 0.0) + state.db_seconds
+        if state.profiler is not None:
+            profiler, state.profiler = state.profiler, None
+            self._stop_profiler(profiler, endpoint, elapsed)
+
+    # -- SQL
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.sql_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        state = self._local
+        elapsed = time.perf_counter() - state.sql_start
+        if getattr(state, 'start', None) is not None:
+            # added to the totals once, when the request ends
+            state.statements += 1
+            state.db_seconds += elapsed
+            endpoint = None
+        else:
+            endpoint = BACKGROUND
+            with self._lock:
+                self.db_statements[endpoint] = self.db_statements.get(endpoint, 0) + 1
+                self.db_seconds[endpoint] = self.db_seconds.get(endpoint, 0.0) + elapsed
+        if elapsed >= self.slow_query_seconds:
+            with self._lock:
+                self.slow_queries += 1
+            log.warning('slow query (%.3fs, %s): %s', elapsed, endpoint or request.endpoint or UNMATCHED,
+                        statement[:1000])
+
+    # -- profiling
+
+    def _start_profiler(self):
+        try:
+            if self.profiler == 'pyinstrument' and Pyinstrument is not None:
+                profiler = Pyinstrument()
+                profiler.start()
+            else:
+                import cProfile
+                profiler = cProfile.Profile()
+                profiler.enable()
+        except (RuntimeError, ValueError):
+            # another profiler is running on this thread
+            return None
+        return profiler
+
+    def _stop_profiler(self, profiler, endpoint, elapsed):
+        is_pyinstrument = Pyinstrument is not None and isinstance(profiler, Pyinstrument)
+        if is_pyinstrument:
+            profiler.stop()
+        else:
+            profiler.disable()
+        if elapsed < self.slow_seconds:
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = '{}-{}-{}ms'.format(time.strftime('%Y%m%dT%H%M%S'), endpoint.replace('.', '_'), int(elapsed * 1000))
+        try:
+            if is_pyinstrument:
+                with open(os.path.join(self.profile_dir, name + '.html'), 'w') as f:
+                    f.write(profiler.output_html())
+            else:
+                profiler.dump_stats(os.path.join(self.profile_dir, name + '.prof'))
+            self._prune_profiles()
+        except OSError:
+            log.exception('could not write profile %s', name)
+            return
+        with self._lock:
+            self.profiles += 1
+
+    def _prune_profiles(self):
+        paths = sorted(os.path.join(self.profile_dir, name) for name in os.listdir(self.profile_dir))
+        for path in paths[:max(0, len(paths) - self.profile_keep)]:
+            os.remove(path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': sum(self.statuses.values()),
+                'statements': sum(self.db_statements.values()),
+                'db_seconds': round(sum(self.db_seconds.values()), 6),
+                'slow_queries': self.slow_queries,
+                'profiles': self.profiles,
+            }
+
+
+request_metrics = RequestMetrics()
+
+
+def init_app(app):
+    request_metrics.init_app(app)
+
+
+def _component_stats():
+    # imported on use so that importing this module does not pull in every area
+    from app import counters, http_cache, images, login_ips, notifications, pictures, principals, ratelimit, \
+        scheduling, storage, tokens
+    return {
+        'principal_cache': principals.principal_cache.stats(),
+        'schedule_cache': scheduling.schedule_cache.stats(),
+        'response_cache': http_cache.response_cache.stats(),
+        'picture_cache': pictures.known_pictures.stats(),
+        'counter_buffer': counters.buffer.stats(),
+        'notification_dispatcher': notifications.dispatcher.stats(),
+        'image_derivatives': images.derivatives.stats(),
+        'rate_limiter': ratelimit.limiter.stats(),
+        'login_ip_recorder': login_ips.recorder.stats(),
+        'token_revocations': tokens.revocations.stats(),
+        'file_storage': storage.stats(),
+    }
+
+
+def _labels(**labels):
+    return '{' + ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for key, value in labels.items()) + '}'
+
+
+def _bound(value):
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+def _histogram(lines, name, histogram, **labels):
+    for bound, count in histogram.cumulative():
+        lines.append('{}_bucket{} {}'.format(name, _labels(**dict(labels, le=_bound(bound))), count))
+    lines.append('{}_sum{} {}'.format(name, _labels(**labels), histogram.sum))
+    lines.append('{}_count{} {}'.format(name, _labels(**labels), sum(histogram.counts)))
+
+
+def render():
+    """Every metric in the Prometheus text exposition format."""
+    from app import pool_metrics
+
+    m = request_metrics
+    lines = []
+    with m._lock:
+        lines.append('# TYPE http_requests_total counter')
+        for (endpoint, method, status), count in sorted(m.statuses.items()):
+            lines.append('http_requests_total{} {}'.format(_labels(endpoint=endpoint, method=method, status=status),
+                                                           count))
+        lines.append('# TYPE http_request_duration_seconds histogram')
+        for (endpoint, method), histogram in sorted(m.latency.items()):
+            _histogram(lines, 'http_request_duration_seconds', histogram, endpoint=endpoint, method=method)
+        lines.append('# TYPE http_request_db_statements histogram')
+        for endpoint, histogram in sorted(m.statement_counts.items()):
+            _histogram(lines, 'http_request_db_statements', histogram, endpoint=endpoint)
+        lines.append('# TYPE db_statements_total counter')
+        for endpoint, count in sorted(m.db_statements.items()):
+            lines.append('db_statements_total{} {}'.format(_labels(endpoint=endpoint), count))
+        lines.append('# TYPE db_seconds_total counter')
+        for endpoint, seconds in sorted(m.db_seconds.items()):
+            lines.append('db_seconds_total{} {}'.format(_labels(endpoint=endpoint), seconds))
+        lines.append('# TYPE db_slow_queries_total counter')
+        lines.append('db_slow_queries_total {}'.format(m.slow_queries))
+        lines.append('# TYPE profiles_written_total counter')
+        lines.append('profiles_written_total {}'.format(m.profiles))
+
+    lines.append('# TYPE db_pool_wait_seconds histogram')
+    for pool, stats in sorted(pool_metrics.stats().items()):
+        buckets = stats.pop('wait_buckets')
+        total = 0
+        for bound, count in buckets.items():
+            total += count
+            lines.append('db_pool_wait_seconds_bucket{} {}'.format(_labels(pool=pool, le=_bound(bound)), total))
+        lines.append('db_pool_wait_seconds_sum{} {}'.format(_labels(pool=pool), stats['wait_avg'] * total))
+        lines.append('db_pool_wait_seconds_count{} {}'.format(_labels(pool=pool), total))
+        for key, value in sorted(stats.items()):
+            lines.append('db_pool_{}{} {}'.format(key, _labels(pool=pool), value))
+
+    for component, stats in sorted(_component_stats().items()):
+        for key, value in sorted(stats.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append('app_{}_{} {}'.format(component, key, value))
+    return '\n'.join(lines) + '\n'
+
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    config = current_app.config
+    if not config.get('METRICS_ENABLED', True):
+        abort(404)
+    token = config.get('METRICS_TOKEN')
+    if not token:
+        # route and SQL timings are not for the public; only tests read them open
+        if not current_app.testing:
+            abort(404)
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + token):
+        abort(403)
+    return Response(render(), mimetype='text/plain; version=0.0.4')
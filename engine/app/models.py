@@ -1,27 +1,36 @@
 from app import db
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
-import uuid
+from flask_login import UserMixin
+from app.passwords import hash_password, verify_password
 import sqlalchemy as sa
+from app.db_types import BinaryUUID, new_id
+from app.serialization import SerializerMixin
 
 
-class Users(db.Model):
+class Users(UserMixin, SerializerMixin, db.Model):
     __tablename__ = 'users'
-    user_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
+    __serialize_exclude__ = ('password_hash',)
+    user_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
     username = db.Column(db.String(25), index=True, unique=True)
     email = db.Column(db.String(120), index=True, unique=True)
     password_hash = db.Column(db.String(128))
     role = db.Column(sa.Enum('patient', 'doctor'))
+    is_active = db.Column(db.Boolean, default=True)
+    # kept by app.timelines, decides fan-out on write vs merge on read
+    follower_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     last_login = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     doctor = db.relationship('Doctors', backref='user')
     patient = db.relationship('Patients', backref='user')
 
+    def get_id(self):
+        return self.user_id
+
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
     
     def set_role(self, role):
         if role in ['patient', 'doctor']:
@@ -33,450 +42,396 @@ class Users(db.Model):
         return self.role == role
 
     
-    def to_dict(self):
-        return {
-            'user_id': self.user_id,
-            'username': self.username,
-            'email': self.email,
-            'role': self.role,
-            'last_login': self.last_login,
-            'created_at': self.created_at
-        }
-
     def __repr__(self):
         return '<User {}>'.format(self.username)
     
-class Doctors(db.Model):
+class Doctors(SerializerMixin, db.Model):
     __tablename__ = 'doctors'
-    doctor_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
-    first_name = db.Column(db.String(25), index=True)
-    middle_name = db.Column(db.String(25), index=True)
-    last_name = db.Column(db.String(25), index=True)
+    doctor_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    first_name = db.Column(db.String(25))
+    middle_name = db.Column(db.String(25))
+    last_name = db.Column(db.String(25))
     gender = db.Column(sa.Enum('male', 'female'))
     date_of_birth = db.Column(db.DateTime)
     email = db.Column(db.String(120), index=True, unique=True)
     phone = db.Column(db.String(15), index=True, unique=True)
-    specialty = db.Column(db.String(100), index=True)
+    specialty = db.Column(db.String(100))
     license_number = db.Column(db.String(50), index=True)
-    qualification = db.Column(db.String(200), index=True)
-    address = db.Column(db.String(120), index=True)
-    city = db.Column(db.String(25), index=True)
-    state = db.Column(db.String(25), index=True)
-    zip_code = db.Column(db.String(10), index=True)
-    bio = db.Column(db.String(255), index=True)
-    profile_picture = db.Column(db.String(255), index=True)
-    banner_picture = db.Column(db.String(255), index=True)
+    qualification = db.Column(db.String(200))
+    address = db.Column(db.String(120))
+    city = db.Column(db.String(25))
+    state = db.Column(db.String(25))
+    zip_code = db.Column(db.String(10))
+    bio = db.Column(db.String(255))
+    profile_picture = db.Column(db.String(255))
+    banner_picture = db.Column(db.String(255))
     is_active = db.Column(db.Boolean, default=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
-    user_id = db.Column(db.String(60), db.ForeignKey('users.user_id'), nullable=False)
+    user_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'), nullable=False, index=True)
 
-    def to_dict(self):
-        return {
-            'doctor_id': self.doctor_id,
-            'user_id': self.user_id,
-            'first_name': self.first_name,
-            'middle_name': self.middle_name,
-            'last_name': self.last_name,
-            'gender': self.gender,
-            'date_of_birth': self.date_of_birth,
-            'email': self.email,
-            'phone': self.phone,
-            'specialty': self.specialty,
-            'license_number': self.license_number,
-            'qualification': self.qualification,
-            'address': self.address,
-            'city': self.city,
-            'state': self.state,
-            'zip_code': self.zip_code,
-            'bio': self.bio,
-            'profile_picture': self.profile_picture,
-            'banner_picture': self.banner_picture,
-            'is_active': self.is_active,
-            'updated_at': self.updated_at,
-            'is_deleted': self.is_deleted
-        }
-    
     def __repr__(self):
         return '<Doctor {}>'.format(self.first_name)
     
-class Patients(db.Model):
+class Patients(SerializerMixin, db.Model):
     __tablename__ = 'patients'
-    patient_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
-    user_id = db.Column(db.String(60), db.ForeignKey('users.user_id'))
-    first_name = db.Column(db.String(25), index=True)
-    middle_name = db.Column(db.String(25), index=True)
-    last_name = db.Column(db.String(25), index=True)
+    patient_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    first_name = db.Column(db.String(25))
+    middle_name = db.Column(db.String(25))
+    last_name = db.Column(db.String(25))
     gender = db.Column(sa.Enum('male', 'female'))
     email = db.Column(db.String(120), index=True, unique=True)
     phone = db.Column(db.String(15), index=True, unique=True)
-    address = db.Column(db.String(120), index=True)
-    city = db.Column(db.String(25), index=True)
-    state = db.Column(db.String(25), index=True)
-    zip_code = db.Column(db.String(10), index=True)
-    about_me = db.Column(db.String(255), index=True)
-    profile_picture = db.Column(db.String(255), index=True)
-    banner_picture = db.Column(db.String(255), index=True)
+    address = db.Column(db.String(120))
+    city = db.Column(db.String(25))
+    state = db.Column(db.String(25))
+    zip_code = db.Column(db.String(10))
+    about_me = db.Column(db.String(255))
+    profile_picture = db.Column(db.String(255))
+    banner_picture = db.Column(db.String(255))
     is_active = db.Column(db.Boolean, default=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
-    user_id = db.Column(db.String(60), db.ForeignKey('users.user_id'), nullable=False)
-
-    def to_dict(self):
-        return {
-            'patient_id': self.patient_id,
-            'user_id': self.user_id,
-            'first_name': self.first_name,
-            'middle_name': self.middle_name,
-            'last_name': self.last_name,
-            'gender': self.gender,
-            'email': self.email,
-            'phone': self.phone,
-            'address': self.address,
-            'city': self.city,
-            'state': self.state,
-            'zip_code': self.zip_code,
-            'about_me': self.about_me,
-            'profile_picture': self.profile_picture,
-            'banner_picture': self.banner_picture,
-            'is_active': self.is_active,
-            'updated_at': self.updated_at,
-            'is_deleted': self.is_deleted
-        }
+    user_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'), nullable=False, index=True)
 
     
     def __repr__(self):
         return '<Patient {}>'.format(self.first_name)
     
-class Certificates(db.Model):
+class Certificates(SerializerMixin, db.Model):
     __tablename__ = 'certificates'
-    certificate_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
-    doctor_id = db.Column(db.String(60), db.ForeignKey('doctors.doctor_id'))
-    certificate_name = db.Column(db.String(100), index=True)
+    certificate_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    doctor_id = db.Column(BinaryUUID, db.ForeignKey('doctors.doctor_id'))
+    certificate_name = db.Column(db.String(100))
     certificate_number = db.Column(db.String(50), index=True)
     issue_date = db.Column(db.DateTime)
     expiry_date = db.Column(db.DateTime)
     is_active = db.Column(db.Boolean, default=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
-    doctor = db.relationship('Doctors', backref='certificate', lazy='dynamic')
+    doctor = db.relationship('Doctors', backref='certificate')
 
-    def to_dict(self):
-        return {
-            'certificate_id': self.certificate_id,
-            'doctor_id': self.doctor_id,
-            'certificate_name': self.certificate_name,
-            'certificate_number': self.certificate_number,
-            'issue_date': self.issue_date,
-            'expiry_date': self.expiry_date,
-            'is_active': self.is_active,
-            'updated_at': self.updated_at,
-            'is_deleted': self.is_deleted
-        }
-    
     def __repr__(self):
         return '<Certificate {}>'.format(self.certificate_name)
     
-class Appointments(db.Model):
+class Appointments(SerializerMixin, db.Model):
     __tablename__ = 'appointments'
-    appointment_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
-    patient_id = db.Column(db.String(60), db.ForeignKey('patients.patient_id'))
-    doctor_id = db.Column(db.String(60), db.ForeignKey('doctors.doctor_id'))
+    # keyset pagination walks (owner, updated_at, pk) newest first
+    __table_args__ = (
+        db.Index('ix_appointments_patient_id_updated_at', 'patient_id', 'updated_at', 'appointment_id'),
+        db.Index('ix_appointments_doctor_id_updated_at', 'doctor_id', 'updated_at', 'appointment_id'),
+        db.Index('ix_appointments_doctor_id_appointment_date', 'doctor_id', 'appointment_date'),
+        # slot lookups and overlap checks (app.scheduling)
+        db.Index('ix_appointments_doctor_id_starts_at', 'doctor_id', 'starts_at'),
+        # the database's own guard against two bookings of one slot
+        db.Index('ix_appointments_doctor_id_booked_slot', 'doctor_id', 'booked_slot', unique=True),
+    )
+    __serialize_exclude__ = ('booked_slot',)
+    appointment_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    patient_id = db.Column(BinaryUUID, db.ForeignKey('patients.patient_id'))
+    doctor_id = db.Column(BinaryUUID, db.ForeignKey('doctors.doctor_id'))
     appointment_date = db.Column(db.DateTime)
-    appointment_time = db.Column(db.String(10), index=True)
+    appointment_time = db.Column(db.String(10))
+    # the slot as [starts_at, ends_at), derived from the two fields above
+    # when only those are given
+    starts_at = db.Column(db.DateTime)
+    ends_at = db.Column(db.DateTime)
+    # starts_at while the appointment holds its slot, NULL once cancelled or
+    # deleted; unique per doctor (NULLs never clash)
+    booked_slot = db.Column(db.DateTime, db.Computed(
+        "CASE WHEN appointment_status <> 'cancelled' AND COALESCE(is_deleted, 0) = 0 THEN starts_at END"))
     appointment_type = db.Column(sa.Enum('in-person', 'telemedicine'), default='in-person')
     appointment_status = db.Column(sa.Enum('scheduled', 'cancelled', 'completed'), default='scheduled')
     is_active = db.Column(db.Boolean, default=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
-    patient = db.relationship('Patients', backref='appointment', lazy='dynamic')
-    doctor = db.relationship('Doctors', backref='appointment', lazy='dynamic')
+    patient = db.relationship('Patients', backref='appointment')
+    doctor = db.relationship('Doctors', backref='appointment')
 
-    def to_dict(self):
-        return {
-            'appointment_id': self.appointment_id,
-            'patient_id': self.patient_id,
-            'doctor_id': self.doctor_id,
-            'appointment_date': self.appointment_date,
-            'appointment_time': self.appointment_time,
-            'appointment_type': self.appointment_type,
-            'appointment_status': self.appointment_status,
-            'is_active': self.is_active,
-            'updated_at': self.updated_at,
-            'is_deleted': self.is_deleted
-        }
-    
     def __repr__(self):
         return '<Appointment {}>'.format(self.appointment_id)
     
-class Documents(db.Model):
+class Documents(SerializerMixin, db.Model):
     __tablename__ = 'documents'
-    document_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
-    patient_id = db.Column(db.String(60), db.ForeignKey('patients.patient_id'))
-    doctor_id = db.Column(db.String(60), db.ForeignKey('doctors.doctor_id'))
-    document_name = db.Column(db.String(100), index=True)
-    picture = db.Column(db.String(160), index=True)
-    document_type = db.Column(db.String(50), index=True)
-    document_url = db.Column(db.String(255), index=True)
+    # keyset pagination walks (owner, updated_at, pk) newest first
+    __table_args__ = (
+        db.Index('ix_documents_patient_id_updated_at', 'patient_id', 'updated_at', 'document_id'),
+        db.Index('ix_documents_doctor_id_updated_at', 'doctor_id', 'updated_at', 'document_id'),
+        # a file a re-upload replaced is removed once no record refers to it
+        db.Index('ix_documents_file_sha256', 'file_sha256'),
+    )
+    document_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    patient_id = db.Column(BinaryUUID, db.ForeignKey('patients.patient_id'))
+    doctor_id = db.Column(BinaryUUID, db.ForeignKey('doctors.doctor_id'))
+    document_name = db.Column(db.String(100))
+    picture = db.Column(db.String(160))
+    document_type = db.Column(db.String(50))
+    document_url = db.Column(db.String(255))
+    # the uploaded file, stored under its SHA-256 (see app.storage)
+    file_sha256 = db.Column(db.String(64))
+    file_size = db.Column(db.BigInteger)
+    file_type = db.Column(db.String(100))
     is_active = db.Column(db.Boolean, default=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
-    patient = db.relationship('Patients', backref='document', lazy='dynamic')
-    doctor = db.relationship('Doctors', backref='document', lazy='dynamic')
+    patient = db.relationship('Patients', backref='document')
+    doctor = db.relationship('Doctors', backref='document')
 
-    def to_dict(self):
-        return {
-            'document_id': self.document_id,
-            'patient_id': self.patient_id,
-            'doctor_id': self.doctor_id,
-            'document_name': self.document_name,
-            'picture': self.picture,
-            'document_type': self.document_type,
-            'document_url': self.document_url,
-            'is_active': self.is_active,
-            'updated_at': self.updated_at,
-            'is_deleted': self.is_deleted
-        }
-    
     def __repr__(self):
         return '<Document {}>'.format(self.document_name)
     
-class Prescriptions(db.Model):
+class Prescriptions(SerializerMixin, db.Model):
     __tablename__ = 'prescriptions'
-    prescription_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
-    patient_id = db.Column(db.String(60), db.ForeignKey('patients.patient_id'))
-    doctor_id = db.Column(db.String(60), db.ForeignKey('doctors.doctor_id'))
-    prescription_name = db.Column(db.String(100), index=True)
-    prescription_type = db.Column(db.String(50), index=True)
-    prescription_url = db.Column(db.String(255), index=True)
+    # keyset pagination walks (owner, updated_at, pk) newest first
+    __table_args__ = (
+        db.Index('ix_prescriptions_patient_id_updated_at', 'patient_id', 'updated_at', 'prescription_id'),
+        db.Index('ix_prescriptions_doctor_id_updated_at', 'doctor_id', 'updated_at', 'prescription_id'),
+        # a file a re-upload replaced is removed once no record refers to it
+        db.Index('ix_prescriptions_file_sha256', 'file_sha256'),
+    )
+    prescription_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    patient_id = db.Column(BinaryUUID, db.ForeignKey('patients.patient_id'))
+    doctor_id = db.Column(BinaryUUID, db.ForeignKey('doctors.doctor_id'))
+    prescription_name = db.Column(db.String(100))
+    prescription_type = db.Column(db.String(50))
+    prescription_url = db.Column(db.String(255))
+    # the uploaded file, stored under its SHA-256 (see app.storage)
+    file_sha256 = db.Column(db.String(64))
+    file_size = db.Column(db.BigInteger)
+    file_type = db.Column(db.String(100))
     is_active = db.Column(db.Boolean, default=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
-    patient = db.relationship('Patients', backref='prescription', lazy='dynamic')
-    doctor = db.relationship('Doctors', backref='prescription', lazy='dynamic')
+    patient = db.relationship('Patients', backref='prescription')
+    doctor = db.relationship('Doctors', backref='prescription')
 
-    def to_dict(self):
-        return {
-            'prescription_id': self.prescription_id,
-            'patient_id': self.patient_id,
-            'doctor_id': self.doctor_id,
-            'prescription_name': self.prescription_name,
-            'prescription_type': self.prescription_type,
-            'prescription_url': self.prescription_url,
-            'is_active': self.is_active,
-            'updated_at': self.updated_at,
-            'is_deleted': self.is_deleted
-        }
-    
     def __repr__(self):
         return '<Prescription {}>'.format(self.prescription_name)
     
-class MedicalHistory(db.Model):
+class MedicalHistory(SerializerMixin, db.Model):
     __tablename__ = 'medical_history'
-    medical_history_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
-    patient_id = db.Column(db.String(60), db.ForeignKey('patients.patient_id'))
-    doctor_id = db.Column(db.String(60), db.ForeignKey('doctors.doctor_id'))
-    medical_history_name = db.Column(db.String(100), index=True)
-    medical_history_type = db.Column(db.String(50), index=True)
-    medical_history_url = db.Column(db.String(255), index=True)
+    # keyset pagination walks (owner, updated_at, pk) newest first
+    __table_args__ = (
+        db.Index('ix_medical_history_patient_id_updated_at', 'patient_id', 'updated_at', 'medical_history_id'),
+        db.Index('ix_medical_history_doctor_id_updated_at', 'doctor_id', 'updated_at', 'medical_history_id'),
+        # a file a re-upload replaced is removed once no record refers to it
+        db.Index('ix_medical_history_file_sha256', 'file_sha256'),
+    )
+    medical_history_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    patient_id = db.Column(BinaryUUID, db.ForeignKey('patients.patient_id'))
+    doctor_id = db.Column(BinaryUUID, db.ForeignKey('doctors.doctor_id'))
+    medical_history_name = db.Column(db.String(100))
+    medical_history_type = db.Column(db.String(50))
+    medical_history_url = db.Column(db.String(255))
+    # the uploaded file, stored under its SHA-256 (see app.storage)
+    file_sha256 = db.Column(db.String(64))
+    file_size = db.Column(db.BigInteger)
+    file_type = db.Column(db.String(100))
     is_active = db.Column(db.Boolean, default=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
-    patient = db.relationship('Patients', backref='medical_history', lazy='dynamic')
-    doctor = db.relationship('Doctors', backref='medical_history', lazy='dynamic')
+    patient = db.relationship('Patients', backref='medical_history')
+    doctor = db.relationship('Doctors', backref='medical_history')
 
-    def to_dict(self):
-        return {
-            'medical_history_id': self.med,
-            'patient_id': self.patient_id,
-            'doctor_id': self.doctor_id,
-            'medical_history_name': self.medical_history_name,
-            'medical_history_type': self.medical_history_type,
-            'medical_history_url': self.medical_history_url,
-            'is_active': self.is_active,
-            'updated_at': self.updated_at,
-            'is_deleted': self.is_deleted
-        }
-    
     def __repr__(self):
         return '<MedicalHistory {}>'.format(self.medical_history_name)
 
-class Notifications(db.Model):
+class Notifications(SerializerMixin, db.Model):
     __tablename__ = 'notifications'
-    notification_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
-    user_id = db.Column(db.String(60), db.ForeignKey('users.user_id'))
-    notification_type = db.Column(db.String(50), index=True)
-    notification_message = db.Column(db.String(255), index=True)
-    notification_url = db.Column(db.String(255), index=True)
+    __table_args__ = (
+        db.Index('ix_notifications_user_id_notification_id', 'user_id', 'notification_id'),
+        # /sync walks (user, updated_at, pk) oldest first
+        db.Index('ix_notifications_user_id_updated_at', 'user_id', 'updated_at', 'notification_id'),
+        # bulk notify() skips (user, type, url) combinations already stored
+        db.Index('ix_notifications_user_id_type_url', 'user_id', 'notification_type', 'notification_url'),
+    )
+    notification_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    user_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'))
+    notification_type = db.Column(db.String(50))
+    notification_message = db.Column(db.String(255))
+    notification_url = db.Column(db.String(255))
     is_active = db.Column(db.Boolean, default=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
-    user = db.relationship('Users', backref='notification', lazy='dynamic')
+    user = db.relationship('Users', backref='notification')
 
-    def to_dict(self):
-        return {
-            'notification_id': self.notification_id,
-            'user_id': self.user_id,
-            'notification_type': self.notification_type,
-            'notification_message': self.notification_message,
-            'notification_url': self.notification_url,
-            'is_active': self.is_active,
-            'updated_at': self.updated_at,
-            'is_deleted': self.is_deleted
-        }
-    
     def __repr__(self):
         return '<Notification {}>'.format(self.notification_id)
     
-class Messages(db.Model):
+class Messages(SerializerMixin, db.Model):
     __tablename__ = 'messages'
-    message_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
-    sender_id = db.Column(db.String(60), db.ForeignKey('users.user_id'))
-    receiver_id = db.Column(db.String(60), db.ForeignKey('users.user_id'))
-    message = db.Column(db.String(255), index=True)
-    message_type = db.Column(db.String(50), index=True)
+    __table_args__ = (
+        db.Index('ix_messages_receiver_id_updated_at', 'receiver_id', 'updated_at'),
+        # /sync sends a user the messages they sent too
+        db.Index('ix_messages_sender_id_updated_at', 'sender_id', 'updated_at'),
+        db.Index('ix_messages_receiver_id_message_id', 'receiver_id', 'message_id'),
+        # a thread is read newest first by keyset on message_id
+        db.Index('ix_messages_conversation_id_message_id', 'conversation_id', 'message_id'),
+    )
+    message_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    sender_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'))
+    receiver_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'))
+    # set from (sender_id, receiver_id) by app.conversations
+    conversation_id = db.Column(BinaryUUID, db.ForeignKey('conversations.conversation_id'))
+    message = db.Column(db.String(255))
+    message_type = db.Column(db.String(50))
     is_active = db.Column(db.Boolean, default=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
-    sender = db.relationship('Users', backref='message', lazy='dynamic')
-    receiver = db.relationship('Users', backref='message', lazy='dynamic')
+    sender = db.relationship('Users', foreign_keys=[sender_id], backref='message_sent')
+    receiver = db.relationship('Users', foreign_keys=[receiver_id], backref='message_received')
 
-    def to_dict(self):
-        return {
-            'message_id': self.message_id,
-            'sender_id': self.sender_id,
-            'receiver_id': self.receiver_id,
-            'message': self.message,
-            'message_type': self.message_type,
-            'is_active': self.is_active,
-            'updated_at': self.updated_at,
-            'is_deleted': self.is_deleted
-        }
-    
     def __repr__(self):
         return '<Message {}>'.format(self.message_id)
 
-class Posts(db.Model):
+class Conversations(SerializerMixin, db.Model):
+    __tablename__ = 'conversations'
+    # one row per pair of users, smaller id first; the id is derived from
+    # the pair (app.conversations.conversation_key), so it needs no lookup
+    __table_args__ = (
+        db.UniqueConstraint('user_low_id', 'user_high_id', name='uq_conversations_user_low_id_user_high_id'),
+        # the inbox walks each side newest first
+        db.Index('ix_conversations_user_low_id_last_message_id', 'user_low_id', 'last_message_id'),
+        db.Index('ix_conversations_user_high_id_last_message_id', 'user_high_id', 'last_message_id'),
+    )
+    conversation_id = db.Column(BinaryUUID, primary_key=True)
+    user_low_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'), nullable=False)
+    user_high_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'), nullable=False)
+    last_message_id = db.Column(BinaryUUID)
+    last_message_at = db.Column(db.DateTime)
+    message_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    # messages each side has not read yet
+    unread_low = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    unread_high = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return '<Conversation {}>'.format(self.conversation_id)
+
+class Follows(SerializerMixin, db.Model):
+    __tablename__ = 'follows'
+    __table_args__ = (
+        db.UniqueConstraint('follower_id', 'followee_id', name='uq_follows_follower_id_followee_id'),
+        # fan-out reads the followers of a post's author
+        db.Index('ix_follows_followee_id', 'followee_id'),
+    )
+    follow_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    follower_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'), nullable=False)
+    followee_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return '<Follow {} -> {}>'.format(self.follower_id, self.followee_id)
+
+class Posts(SerializerMixin, db.Model):
     __tablename__ = 'posts'
-    post_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
-    user_id = db.Column(db.String(60), db.ForeignKey('users.user_id'))
-    post = db.Column(db.String(255), index=True)
-    post_type = db.Column(db.String(50), index=True)
-    post_url = db.Column(db.String(255), index=True)
+    # an author's posts newest first, for timeline builds and the feed
+    __table_args__ = (
+        db.Index('ix_posts_user_id_post_id', 'user_id', 'post_id'),
+    )
+    post_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    user_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'))
+    post = db.Column(db.String(255))
+    post_type = db.Column(db.String(50))
+    post_url = db.Column(db.String(255))
+    # maintained by app.counters
+    like_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    comment_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     is_active = db.Column(db.Boolean, default=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
-    user = db.relationship('Users', backref='post', lazy='dynamic')
+    user = db.relationship('Users', backref='post')
 
-    def to_dict(self):
-        return {
-            'post_id': self.post_id,
-            'user_id': self.user_id,
-            'post': self.post,
-            'post_type': self.post_type,
-            'post_url': self.post_url,
-            'is_active': self.is_active,
-            'updated_at': self.updated_at,
-            'is_deleted': self.is_deleted
-        }
-    
     def __repr__(self):
         return '<Post {}>'.format(self.post_id)
     
-class Post_likes(db.Model):
+class Post_likes(SerializerMixin, db.Model):
     __tablename__ = 'post_likes'
-    post_like_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
-    post_id = db.Column(db.String(60), db.ForeignKey('posts.post_id'))
-    user_id = db.Column(db.String(60), db.ForeignKey('users.user_id'))
+    __table_args__ = (
+        db.UniqueConstraint('post_id', 'user_id', name='uq_post_likes_post_id_user_id'),
+    )
+    post_like_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    post_id = db.Column(BinaryUUID, db.ForeignKey('posts.post_id'))
+    user_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'))
     is_active = db.Column(db.Boolean, default=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
-    post = db.relationship('Posts', backref='post_like', lazy='dynamic')
-    user = db.relationship('Users', backref='post_like', lazy='dynamic')
+    post = db.relationship('Posts', backref='post_like')
+    user = db.relationship('Users', backref='post_like')
 
-    def to_dict(self):
-        return {
-            'post_like_id': self.post_like_id,
-            'post_id': self.post_id,
-            'user_id': self.user_id,
-            'is_active': self.is_active,
-            'updated_at': self.updated_at,
-            'is_deleted': self.is_deleted
-        }
-    
     def __repr__(self):
         return '<PostLike {}>'.format(self.post_like_id)
     
-class Comments(db.Model):
+class Comments(SerializerMixin, db.Model):
     __tablename__ = 'comments'
-    comment_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
-    post_id = db.Column(db.String(60), db.ForeignKey('posts.post_id'))
-    user_id = db.Column(db.String(60), db.ForeignKey('users.user_id'))
-    comment = db.Column(db.String(255), index=True)
+    comment_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    post_id = db.Column(BinaryUUID, db.ForeignKey('posts.post_id'))
+    user_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'))
+    comment = db.Column(db.String(255))
+    # maintained by app.counters
+    like_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     is_active = db.Column(db.Boolean, default=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
-    post = db.relationship('Posts', backref='comment', lazy='dynamic')
-    user = db.relationship('Users', backref='comment', lazy='dynamic')
+    post = db.relationship('Posts', backref='comment')
+    user = db.relationship('Users', backref='comment')
 
-    def to_dict(self):
-        return {
-            'comment_id': self.comment_id,
-            'post_id': self.post_id,
-            'user_id': self.user_id,
-            'comment': self.comment,
-            'is_active': self.is_active,
-            'updated_at': self.updated_at,
-            'is_deleted': self.is_deleted
-        }
-    
     def __repr__(self):
         return '<Comment {}>'.format(self.comment_id)
 
-class Comment_likes(db.Model):
+class Comment_likes(SerializerMixin, db.Model):
     __tablename__ = 'comment_likes'
-    comment_like_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
-    comment_id = db.Column(db.String(60), db.ForeignKey('comments.comment_id'))
-    user_id = db.Column(db.String(60), db.ForeignKey('users.user_id'))
+    __table_args__ = (
+        db.UniqueConstraint('comment_id', 'user_id', name='uq_comment_likes_comment_id_user_id'),
+    )
+    comment_like_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    comment_id = db.Column(BinaryUUID, db.ForeignKey('comments.comment_id'))
+    user_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'))
     is_active = db.Column(db.Boolean, default=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
-    comment = db.relationship('Comments', backref='comment_like', lazy='dynamic')
-    user = db.relationship('Users', backref='comment_like', lazy='dynamic')
+    comment = db.relationship('Comments', backref='comment_like')
+    user = db.relationship('Users', backref='comment_like')
 
-    def to_dict(self):
-        return {
-            'comment_like_id': self.comment_like_id,
-            'comment_id': self.comment_id,
-            'user_id': self.user_id,
-            'is_active': self.is_active,
-            'updated_at': self.updated_at,
-            'is_deleted': self.is_deleted
-        }
-    
     def __repr__(self):
         return '<CommentLike {}>'.format(self.comment_like_id)
 
-class user_IP(db.Model):
+class user_IP(SerializerMixin, db.Model):
     __tablename__ = 'user_ip'
-    user_ip_id = db.Column(db.String(60), default=lambda: str(uuid.uuid4()), primary_key=True)
-    user_id = db.Column(db.String(60), db.ForeignKey('users.user_id'))
-    user_ip = db.Column(db.String(60), index=True)
+    __table_args__ = (
+        # the login address recorder looks pairs up by (user, address)
+        db.Index('ix_user_ip_user_id_user_ip', 'user_id', 'user_ip'),
+    )
+    user_ip_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    user_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'))
+    user_ip = db.Column(db.String(60))
     is_active = db.Column(db.Boolean, default=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
-    user = db.relationship('Users', backref='user_ip', lazy='dynamic')
+    user = db.relationship('Users', backref='user_ip')
 
-    def to_dict(self):
-        return {
-            'user_ip_id': self.user_ip_id,
-            'user_id': self.user_id,
-            'user_ip': self.user_ip,
-            'is_active': self.is_active,
-            'updated_at': self.updated_at,
-            'is_deleted': self.is_deleted
-        }
-    
     def __repr__(self):
         return '<UserIP {}>'.format(self.user_ip_id)
 
+
+class TokenRevocations(db.Model):
+    __tablename__ = 'token_revocations'
+    # app.tokens keeps the unexpired rows in memory; rows past expires_at
+    # can no longer match a valid token and are pruned
+    __table_args__ = (
+        db.Index('ix_token_revocations_expires_at', 'expires_at'),
+        # a refresh token is used up by inserting its row, once
+        db.Index('ix_token_revocations_token_id', 'token_id', unique=True),
+    )
+    revocation_id = db.Column(BinaryUUID, default=new_id, primary_key=True)
+    user_id = db.Column(BinaryUUID, db.ForeignKey('users.user_id'), nullable=False)
+    # one refresh token, or when null every token of the user issued
+    # before not_before (milliseconds since the epoch)
+    token_id = db.Column(db.String(32))
+    not_before = db.Column(db.BigInteger, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return '<TokenRevocation {}>'.format(self.revocation_id)
@@ -0,0 +1,339 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from itertools import islice
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.db_types import new_id
+from app.models import Appointments, Doctors, Messages, Notifications, Patients, Users
+
+
+# Bulk notifications ("reminder for every patient seen tomorrow"). Recipients
+# are consumed as a stream and written NOTIFY_BATCH_SIZE rows at a time with
+# one executemany INSERT per batch, committed per batch so a broadcast to a
+# million users neither builds a million ORM objects nor holds one long
+# transaction. A user gets at most one notification per (notification_type,
+# notification_url): repeats within the stream and rows already stored are
+# skipped. Committed rows still go out over /events through app.pubsub.
+#
+# notify() runs on the caller's thread; the dispatcher runs jobs one after
+# another on a background thread so a request can hand a broadcast off.
+# With NOTIFY_EVENTS on (it is off by default, every writer of those rows,
+# bulk imports included, would notify), booked appointments and sent
+# messages notify the users they concern through the dispatcher: committed
+# rows are queued, and one job drains everything queued since the last one,
+# so a burst of commits becomes one batched insert instead of a job each.
+
+Notice = namedtuple('Notice', ['user_id', 'notification_type', 'notification_message', 'notification_url'])
+
+
+class DispatchStats(object):
+    __slots__ = ('inserted', 'duplicates', 'batches', 'seconds')
+
+    def __init__(self):
+        self.inserted = 0
+        self.duplicates = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    def add(self, other):
+        self.inserted += other.inserted
+        self.duplicates += other.duplicates
+        self.batches += other.batches
+        self.seconds += other.seconds
+
+    def as_dict(self):
+        return {
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'batches': self.batches,
+            'seconds': round(self.seconds, 3),
+            'rows_per_sec': round(self.inserted / self.seconds) if self.seconds else 0,
+        }
+
+
+def _existing(session, batch):
+    """(user_id, type, url) keys in ``batch`` that are already stored."""
+    groups = {}
+    for user_id, notification_type, _, url in batch:
+        groups.setdefault((notification_type, url), []).append(user_id)
+    found = set()
+    for (notification_type, url), user_ids in groups.items():
+        rows = session.execute(
+            select(Notifications.user_id)
+            .where(Notifications.notification_type == notification_type,
+                   Notifications.notification_url == url,
+                   Notifications.user_id.in_(user_ids)))
+        found.update((user_id, notification_type, url) for user_id, in rows)
+    return found
+
+
+def notify(notices, batch_size=1000, session=None):
+    """Insert ``notices`` (Notice tuples, any iterable) and return DispatchStats."""
+    session = session or db.session
+    stats = DispatchStats()
+    seen = set()
+    notices = iter(notices)
+    start = time.perf_counter()
+    while True:
+        batch = list(islice(notices, batch_size))
+        if not batch:
+            break
+        fresh = []
+        for notice in batch:
+            key = (notice[0], notice[1], notice[3])
+            if key in seen:
+                stats.duplicates += 1
+            else:
+                seen.add(key)
+                fresh.append(notice)
+        stored = _existing(session, fresh)
+        now = datetime.utcnow()
+        rows = [{
+            'notification_id': new_id(),
+            'user_id': user_id,
+            'notification_type': notification_type,
+            'notification_message': message,
+            'notification_url': url,
+            'is_active': True,
+            'updated_at': now,
+            'is_deleted': False,
+        } for user_id, notification_type, message, url in fresh
+            if (user_id, notification_type, url) not in stored]
+        stats.duplicates += len(fresh) - len(rows)
+        if rows:
+            # Core executemany: no identity map, no per-row flush bookkeeping
+            session.execute(insert(Notifications.__table__), rows)
+            # rows bypass the ORM, so queue them for push the way the
+            # after_flush hook in app.pubsub would
+            session.info.setdefault('pending_pushes', []).extend((Notifications, row) for row in rows)
+        session.commit()
+        stats.inserted += len(rows)
+        stats.batches += 1
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def broadcast(user_ids, notification_type, message, url=None, batch_size=1000, session=None):
+    """The same notification for every user in ``user_ids``."""
+    return notify(((user_id, notification_type, message, url) for user_id in user_ids),
+                  batch_size, session)
+
+
+def _user_ids(statement, session=None, chunk=5000):
+    # keyset chunks rather than one streaming cursor: notify() commits
+    # between batches on the same session, which would close the cursor
+    session = session or db.session
+    last = None
+    while True:
+        page = statement.order_by(statement.selected_columns[0]).limit(chunk)
+        if last is not None:
+            page = page.where(statement.selected_columns[0] > last)
+        user_ids = session.execute(page).scalars().all()
+        yield from user_ids
+        if len(user_ids) < chunk:
+            return
+        last = user_ids[-1]
+
+
+def role_recipients(role, session=None):
+    """user_ids of every active user with ``role``."""
+    return _user_ids(select(Users.user_id).where(Users.role == role, Users.is_active.isnot(False)),
+                     session)
+
+
+def appointment_recipients(day, session=None):
+    """user_ids of patients with a scheduled appointment on ``day``."""
+    start = datetime(day.year, day.month, day.day)
+    return _user_ids(
+        select(Patients.user_id).distinct()
+        .join(Appointments, Appointments.patient_id == Patients.patient_id)
+        .where(Appointments.appointment_date >= start,
+               Appointments.appointment_date < start + timedelta(days=1),
+               Appointments.appointment_status == 'scheduled',
+               Appointments.is_deleted.isnot(True)),
+        session)
+
+
+class Job(object):
+    def __init__(self, make_notices):
+        self.make_notices = make_notices
+        self.stats = None
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self.stats
+
+
+class Dispatcher(object):
+    """Runs notify() jobs one at a time on a background thread."""
+
+    def __init__(self):
+        self.app = None
+        self.batch_size = 1000
+        self.events = False
+        self._queue = queue.Queue(100)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pending = []
+        self._draining = False
+        self.totals = DispatchStats()
+        self.jobs = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get('NOTIFY_BATCH_SIZE', 1000)
+        self.events = app.config.get('NOTIFY_EVENTS', False)
+        self._queue.maxsize = app.config.get('NOTIFY_QUEUE_SIZE', 100)
+
+    def submit(self, make_notices):
+        """Queue a job; ``make_notices()`` is called on the worker, inside an
+        app context, and returns the Notice iterable. Raises queue.Full when
+        NOTIFY_QUEUE_SIZE jobs are already waiting."""
+        job = Job(make_notices)
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work, name='notify-dispatcher', daemon=True)
+                self._thread.start()
+        self._queue.put_nowait(job)
+        return job
+
+    def enqueue(self, events):
+        """Queue committed row events (see _collect_events) for the next drain job."""
+        with self._lock:
+            self._pending.extend(events)
+            if self._draining:
+                return
+            self._draining = True
+        try:
+            self.submit(self._drain)
+        except queue.Full:
+            with self._lock:
+                self.dropped += len(self._pending)
+                del self._pending[:]
+                self._draining = False
+            self.app.logger.warning('notification queue full, dropped event notifications')
+
+    def _drain(self):
+        with self._lock:
+            events, self._pending = self._pending, []
+            self._draining = False
+        return event_notices(events)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self.app.app_context():
+                try:
+                    job.stats = notify(job.make_notices(), self.batch_size)
+                except Exception as exc:
+                    db.session.rollback()
+                    job.error = exc
+                    self.app.logger.exception('notification dispatch failed')
+                finally:
+                    db.session.remove()
+            with self._lock:
+                self.jobs += 1
+                if job.error is None:
+                    self.totals.add(job.stats)
+                else:
+                    self.failed += 1
+            job.done.set()
+
+    def stats(self):
+        with self._lock:
+            stats = self.totals.as_dict()
+            stats.update(jobs=self.jobs, failed=self.failed, dropped=self.dropped,
+                         queued=self._queue.qsize(), pending=len(self._pending))
+            return stats
+
+
+dispatcher = Dispatcher()
+
+
+def init_app(app):
+    dispatcher.init_app(app)
+
+
+def event_notices(events, session=None):
+    """Notices for queued ('appointment', ...) and ('message', ...) events."""
+    session = session or db.session
+    appointments = [e for e in events if e[0] == 'appointment']
+    users = {}
+    for model, key, index in ((Doctors, Doctors.doctor_id, 2), (Patients, Patients.patient_id, 3)):
+        ids = {e[index] for e in appointments}
+        if ids:
+            users.update(session.execute(select(key, model.user_id).where(key.in_(ids))).all())
+    for e in events:
+        if e[0] == 'appointment':
+            _, appointment_id, doctor_id, patient_id, starts_at = e
+            url = '/appointments/{}'.format(appointment_id)
+            when = starts_at.strftime('%Y-%m-%d %H:%M') if starts_at else ''
+            if users.get(doctor_id):
+                yield Notice(users[doctor_id], 'appointment_booked', 'New appointment on ' + when, url)
+            if users.get(patient_id):
+                yield Notice(users[patient_id], 'appointment_confirmed', 'Appointment confirmed for ' + when, url)
+        else:
+            _, message_id, receiver_id, conversation_id = e
+            yield Notice(receiver_id, 'message', 'You have a new message',
+                         '/conversations/{}/messages#{}'.format(conversation_id, message_id))
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_events(session, flush_context):
+    if not dispatcher.events or dispatcher.app is None:
+        return
+    events = None
+    for obj in session.new:
+        if isinstance(obj, Appointments):
+            item = ('appointment', obj.appointment_id, obj.doctor_id, obj.patient_id, obj.starts_at)
+        elif isinstance(obj, Messages):
+            item = ('message', obj.message_id, obj.receiver_id, obj.conversation_id)
+        else:
+            continue
+        if events is None:
+            events = session.info.setdefault('pending_notices', [])
+        events.append(item)
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_events(session):
+    events = session.info.pop('pending_notices', None)
+    if events:
+        dispatcher.enqueue(events)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_events(session):
+    session.info.pop('pending_notices', None)
+
+
+@click.command('notify')
+@click.option('--role', type=click.Choice(['patient', 'doctor']), help='Every active user with this role.')
+@click.option('--appointments-on', type=click.DateTime(['%Y-%m-%d']),
+              help='Patients with a scheduled appointment that day.')
+@click.option('--type', 'notification_type', required=True)
+@click.option('--message', required=True)
+@click.option('--url', default=None)
+@with_appcontext
+def notify_command(role, appointments_on, notification_type, message, url):
+    """Send one notification to a group of users."""
+    if (role is None) == (appointments_on is None):
+        raise click.UsageError('give exactly one of --role or --appointments-on')
+    if role is not None:
+        recipients = role_recipients(role)
+    else:
+        recipients = appointment_recipients(appointments_on)
+    stats = broadcast(recipients, notification_type, message, url, dispatcher.batch_size)
+    click.echo(' '.join('{}={}'.format(k, v) for k, v in stats.as_dict().items()))
@@ -0,0 +1,79 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import current_app, request
+from sqlalchemy import and_, or_
+from sqlalchemy.types import TypeDecorator
+
+
+# Keyset pagination over (updated_at, primary key), newest first. The cursor
+# is the position of the last row on the previous page, so every page is a
+# range scan on an index instead of an OFFSET that reads and discards rows.
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(updated_at, pk):
+    raw = json.dumps([updated_at.isoformat(), pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        updated_at, pk = json.loads(raw)
+        return datetime.fromisoformat(updated_at), pk
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def page_size(args=None, config=None):
+    """The ?limit= of the current request (or of ``args``), clamped to the config."""
+    args = request.args if args is None else args
+    config = current_app.config if config is None else config
+    default = config.get('PAGE_SIZE_DEFAULT', 20)
+    maximum = config.get('PAGE_SIZE_MAX', 100)
+    try:
+        limit = int(args.get('limit', default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+def keyset_query(query, model, cursor=None, limit=20):
+    """Restrict ``query`` (a Query or a select()) to the page after ``cursor``.
+
+    One row more than ``limit`` is fetched so page_rows can tell whether
+    there is a next page.
+    """
+    pk = model.__mapper__.primary_key[0]
+    updated_at = model.updated_at
+    if cursor:
+        after_updated_at, after_pk = decode_cursor(cursor)
+        if isinstance(pk.type, TypeDecorator):
+            # reject a tampered key here rather than as a database error
+            try:
+                pk.type.process_bind_param(after_pk, None)
+            except (ValueError, TypeError, AttributeError):
+                raise InvalidCursor('Invalid cursor')
+        # the leading <= keeps the predicate a plain index range scan
+        query = query.filter(and_(updated_at <= after_updated_at,
+                                  or_(updated_at < after_updated_at, pk < after_pk)))
+    return query.order_by(updated_at.desc(), pk.desc()).limit(limit + 1)
+
+
+def page_rows(rows, model, limit):
+    """Return (rows, next_cursor) for the rows a keyset_query fetched."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.updated_at, getattr(last, model.__mapper__.primary_key[0].key))
+    return rows, next_cursor
+
+
+def keyset_page(query, model, cursor=None, limit=20):
+    """Return (rows, next_cursor) for one page of ``query``."""
+    return page_rows(keyset_query(query, model, cursor, limit).all(), model, limit)
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from functools import lru_cache
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+# Password hashing is deliberately slow, so it runs in a bounded process pool
+# instead of on the request thread. When more than PASSWORD_HASH_QUEUE_DEPTH
+# hashes are in flight new requests are rejected straight away with
+# PasswordServiceBusy (turned into a 503 by the routes) rather than queueing.
+
+class PasswordServiceBusy(Exception):
+    pass
+
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def _settings(config=None):
+    # the async app (app.aio) passes its config, Flask views use current_app
+    if config is None:
+        config = current_app.config
+    return (config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+            config.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1),
+            config.get('PASSWORD_HASH_QUEUE_DEPTH', 64),
+            config.get('PASSWORD_HASH_TIMEOUT', 10.0))
+
+
+def _get_pool(workers, queue_depth):
+    global _executor, _slots
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _slots = threading.BoundedSemaphore(queue_depth)
+                _executor = ProcessPoolExecutor(max_workers=workers)
+    return _executor, _slots
+
+
+def _submit(fn, args, workers, queue_depth):
+    executor, slots = _get_pool(workers, queue_depth)
+    if not slots.acquire(blocking=False):
+        raise PasswordServiceBusy()
+    try:
+        future = executor.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def _run(fn, *args):
+    method, workers, queue_depth, timeout = _settings()
+    if not workers:
+        # PASSWORD_HASH_WORKERS=0 hashes inline, handy for the shell and tests
+        return fn(*args)
+
+    future = _submit(fn, args, workers, queue_depth)
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        future.cancel()
+        raise PasswordServiceBusy()
+
+
+async def _run_async(config, fn, *args):
+    method, workers, queue_depth, timeout = _settings(config)
+    if not workers:
+        return fn(*args)
+
+    future = _submit(fn, args, workers, queue_depth)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        future.cancel()
+        raise PasswordServiceBusy()
+
+
+def hash_password(password):
+    method = _settings()[0]
+    return _run(generate_password_hash, password, method)
+
+
+def verify_password(password_hash, password):
+    if not password_hash:
+        return False
+    return _run(check_password_hash, password_hash, password)
+
+
+async def hash_password_async(password, config):
+    return await _run_async(config, generate_password_hash, password, _settings(config)[0])
+
+
+async def verify_password_async(password_hash, password, config):
+    if not password_hash:
+        return False
+    return await _run_async(config, check_password_hash, password_hash, password)
+
+
+@lru_cache(maxsize=8)
+def _hash_prefix(method):
+    # werkzeug expands short methods ('scrypt', 'pbkdf2') to their full
+    # parameter string, so hash once to learn what a current hash starts with
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def needs_rehash(password_hash, config=None):
+    method = _settings(config)[0]
+    return password_hash.split('$', 1)[0] != _hash_prefix(method)
+
+
+def shutdown():
+    global _executor, _slots
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+        _executor = None
+        _slots = None
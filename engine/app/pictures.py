@@ -0,0 +1,112 @@
+import re
+
+from flask import Blueprint, current_app, g, jsonify, request, send_file
+from sqlalchemy import or_, select
+
+from app import storage
+from app.cache import TTLCache
+from app.images import FORMATS, derivative_name, derivatives, probe
+from app.models import db, Doctors, Patients
+from app.role_control import role_required
+
+bp = Blueprint('pictures', __name__, url_prefix='/pictures')
+
+KINDS = ('profile', 'banner')
+SHA256 = re.compile(r'^[0-9a-f]{64}$')
+# a year; derivative names change with the content
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# digests known to be someone's picture, so other stored files (documents
+# share the same storage) are never served from here
+known_pictures = TTLCache(maxsize=10000, ttl=300.0)
+
+
+def picture_url(sha256):
+    return '/pictures/{}'.format(sha256)
+
+
+def _is_picture(sha256):
+    if known_pictures.get(sha256):
+        return True
+    url = picture_url(sha256)
+    for model in (Doctors, Patients):
+        found = db.session.scalar(select(model.user_id).where(
+            or_(model.profile_picture == url, model.banner_picture == url)).limit(1))
+        if found is not None:
+            known_pictures.set(sha256, True)
+            return True
+    return False
+
+
+@bp.route('/<kind>', methods=['PUT'])
+@role_required('patient', 'doctor')
+def upload_picture(kind):
+    if kind not in KINDS:
+        return jsonify({'message': 'Unknown picture'}), 404
+    model = Doctors if g.principal.role == 'doctor' else Patients
+    profile = model.query.filter_by(user_id=g.principal.user_id).first()
+    if profile is None:
+        return jsonify({'message': 'Profile not found'}), 404
+    limit = current_app.config.get('STORAGE_MAX_UPLOAD')
+    if limit is not None and (request.content_length or 0) > limit:
+        return jsonify({'message': 'File too large'}), 413
+
+    try:
+        stored = storage.save(request.stream)
+    except storage.UploadTooLarge:
+        return jsonify({'message': 'File too large'}), 413
+    source = storage.backend.local_path(stored.sha256)
+    if not stored.size or (derivatives.available and source is not None and probe(source) is None):
+        return jsonify({'message': 'Not an image'}), 400
+
+    url = picture_url(stored.sha256)
+    setattr(profile, kind + '_picture', url)
+    db.session.commit()
+    known_pictures.set(stored.sha256, True)
+    # render every size now so the first list showing it is a cache hit
+    derivatives.submit(stored.sha256)
+    return jsonify({'url': url, 'sizes': {size: '{}?size={}'.format(url, size) for size in derivatives.sizes}}), 200
+
+
+def _format():
+    fmt = request.args.get('format')
+    if fmt:
+        return fmt
+    # WebP for clients that say they take it, the next format otherwise
+    if 'image/webp' in request.headers.get('Accept', '') and 'webp' in derivatives.formats:
+        return 'webp'
+    return next((fmt for fmt in derivatives.formats if fmt != 'webp'), derivatives.formats[0])
+
+
+@bp.route('/<sha256>', methods=['GET'])
+def get_picture(sha256):
+    if not SHA256.match(sha256):
+        return jsonify({'message': 'Picture not found'}), 404
+    size = request.args.get('size', 'medium')
+    fmt = _format()
+    if size not in derivatives.sizes or fmt not in derivatives.formats:
+        return jsonify({'message': 'Unknown size or format'}), 400
+
+    name = derivative_name(sha256, size, fmt)
+    # only pictures are ever rendered, so a cached derivative needs no lookup
+    path = derivatives.cache.get(name)
+    if path is None:
+        if not _is_picture(sha256):
+            return jsonify({'message': 'Picture not found'}), 404
+        path = derivatives.get(sha256, size, fmt)
+    if path is None:
+        if derivatives.available or not storage.backend.exists(sha256):
+            return jsonify({'message': 'Picture not available'}), 503, {'Retry-After': '1'}
+        # no Pillow: the original, revalidated like any other file
+        response = send_file(storage.backend.local_path(sha256) or storage.backend.open(sha256),
+                             mimetype='application/octet-stream', conditional=True, etag=sha256)
+        response.cache_control.public = True
+        return response
+
+    response = send_file(path, mimetype=FORMATS[fmt][1], conditional=True, etag=name,
+                         max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    if 'format' not in request.args:
+        response.vary.add('Accept')
+    return response
@@ -0,0 +1,126 @@
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+from app import db
+
+
+# Connection pool metrics per engine (the default bind and the replica).
+# Pool events count checkouts, checkins, new and invalidated connections and
+# track how many are in use. The events fire once a connection has been
+# handed out, so the wait for one is timed around Pool.connect instead and
+# kept as a histogram, along with how often the wait ran into pool_timeout.
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolMetrics(object):
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.engine = None
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.wait_buckets[bisect_left(WAIT_BUCKETS, seconds)] += 1
+
+    def instrument(self, engine):
+        self.engine = engine
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+        # dispose() swaps in a new pool; the listeners carry over, the timer doesn't
+        event.listen(engine, 'engine_disposed', lambda engine: self._time_waits(engine.pool))
+        self._time_waits(engine.pool)
+
+    def _time_waits(self, pool):
+        connect = pool.connect
+
+        def timed_connect():
+            start = time.perf_counter()
+            try:
+                return connect()
+            except PoolTimeout:
+                with self._lock:
+                    self.timeouts += 1
+                raise
+            finally:
+                self.record_wait(time.perf_counter() - start)
+
+        pool.connect = timed_connect
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+            self.in_use = max(0, self.in_use - 1)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            waits = sum(self.wait_buckets)
+            stats = {
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'timeouts': self.timeouts,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'wait_avg': self.wait_total / waits if waits else 0.0,
+                'wait_max': self.wait_max,
+                'wait_buckets': dict(zip(WAIT_BUCKETS + (float('inf'),), self.wait_buckets)),
+            }
+        pool = self.engine.pool if self.engine is not None else None
+        if hasattr(pool, 'overflow'):
+            stats.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+        return stats
+
+
+pool_metrics = {}
+
+
+def instrument(engine, name):
+    metrics = pool_metrics.get(name)
+    if metrics is None or metrics.engine is not engine:
+        metrics = pool_metrics[name] = PoolMetrics(name)
+        metrics.instrument(engine)
+    return metrics
+
+
+def stats():
+    return {name: metrics.stats() for name, metrics in pool_metrics.items()}
+
+
+def init_app(app):
+    with app.app_context():
+        for key, engine in db.engines.items():
+            instrument(engine, key or 'default')
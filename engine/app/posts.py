@@ -0,0 +1,40 @@
+from flask import Blueprint, g, jsonify, request
+from sqlalchemy import select
+from app.counters import count, like, unlike
+from app.db_types import is_uuid
+from app.models import db, Comment_likes, Comments, Post_likes, Posts
+from app.role_control import role_required
+
+bp = Blueprint('posts', __name__)
+
+
+def _toggle_like(model, like_model, target_id):
+    pk = model.__mapper__.primary_key[0]
+    stored = db.session.execute(
+        select(model.like_count).where(pk == target_id, model.is_deleted.isnot(True))).first() \
+        if is_uuid(target_id) else None
+    if stored is None:
+        return jsonify({'message': 'Not found'}), 404
+
+    # both directions are idempotent: liking twice or unliking something
+    # not liked changes nothing and still answers 200
+    if request.method == 'POST':
+        like(like_model, target_id, g.principal.user_id)
+        liked = True
+    else:
+        unlike(like_model, target_id, g.principal.user_id)
+        liked = False
+    stored = db.session.scalar(select(model.like_count).where(pk == target_id))
+    return jsonify({'liked': liked, 'like_count': count(model, 'like_count', target_id, stored)}), 200
+
+
+@bp.route('/posts/<post_id>/like', methods=['POST', 'DELETE'])
+@role_required('patient', 'doctor')
+def like_post(post_id):
+    return _toggle_like(Posts, Post_likes, post_id)
+
+
+@bp.route('/comments/<comment_id>/like', methods=['POST', 'DELETE'])
+@role_required('patient', 'doctor')
+def like_comment(comment_id):
+    return _toggle_like(Comments, Comment_likes, comment_id)
@@ -0,0 +1,92 @@
+from collections import namedtuple
+
+from flask import g, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+from app import db
+from app.cache import TTLCache
+from app.db_types import canonical_uuid
+from app.models import Users
+
+
+# What role_required needs to know about the caller. Resolved at most once per
+# request (kept on flask.g) and cached per process for PRINCIPAL_CACHE_TTL
+# seconds so protected endpoints don't hit the users table on every call.
+Principal = namedtuple('Principal', ['user_id', 'role', 'is_active'])
+
+principal_cache = TTLCache()
+
+
+def init_app(app):
+    principal_cache.maxsize = app.config.get('PRINCIPAL_CACHE_SIZE', 10000)
+    principal_cache.ttl = app.config.get('PRINCIPAL_CACHE_TTL', 30.0)
+
+
+def known_principal(user_id):
+    """The request's or the cache's principal for a canonical ``user_id``, without a query."""
+    principal = g.get('principal')
+    if principal is not None and principal.user_id == user_id:
+        return principal
+    return principal_cache.get(user_id)
+
+
+def principal_statement(user_id):
+    return select(Users.user_id, Users.role, Users.is_active).where(Users.user_id == user_id)
+
+
+def remember_principal(user_id, row):
+    """The Principal of a principal_statement row, cached; None when there was no row."""
+    if row is None:
+        return None
+    principal = Principal(row.user_id, row.role, row.is_active is not False)
+    principal_cache.set(user_id, principal)
+    return principal
+
+
+def load_principal(user_id):
+    # the cache and its invalidation hooks key on the canonical form
+    user_id = canonical_uuid(user_id)
+    if user_id is None:
+        return None
+    principal = known_principal(user_id)
+    if principal is None:
+        principal = remember_principal(user_id, db.session.execute(principal_statement(user_id)).first())
+        if principal is None:
+            return None
+    g.principal = principal
+    return principal
+
+
+def invalidate_principal(user_id):
+    principal_cache.invalidate(user_id)
+    if has_app_context() and g.get('principal') is not None and g.principal.user_id == user_id:
+        g.pop('principal')
+
+
+@event.listens_for(Users.role, 'set')
+@event.listens_for(Users.is_active, 'set')
+def _principal_changed(target, value, oldvalue, initiator):
+    # Users.set_role and deactivation drop the entry straight away; the
+    # commit hook below catches anything re-cached before the write lands
+    if target.user_id is not None:
+        invalidate_principal(target.user_id)
+
+
+@event.listens_for(Users, 'after_update')
+@event.listens_for(Users, 'after_delete')
+def _mark_stale(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('stale_principals', set()).add(target.user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for user_id in session.info.pop('stale_principals', ()):
+        invalidate_principal(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stale(session):
+    session.info.pop('stale_principals', None)
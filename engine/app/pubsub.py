@@ -0,0 +1,276 @@
+import asyncio
+import json
+import threading
+from collections import deque, namedtuple
+from importlib import import_module
+
+from sqlalchemy import event, or_, select
+from sqlalchemy.orm import Session
+
+from app.models import Messages, Notifications
+from app.serialization import JSONProvider, orjson, serializer_for
+
+
+# Push delivery of new Messages and Notifications rows. Rows flushed in a
+# session are snapshotted, and once the transaction commits each one is
+# encoded once and published on the channel of every user it concerns
+# ("user:<user_id>"). Connected clients (the /events streams) hold a
+# Subscription with a bounded queue; a client that falls PUSH_QUEUE_SIZE
+# events behind is disconnected rather than buffered without limit, and
+# catches up from the database with Last-Event-ID when it reconnects. A
+# backlog longer than BACKLOG_LIMIT is sent a page at a time: the page ends
+# with a "resync" event and the stream closes, so the client reconnects
+# from the last id it got and receives the next page.
+#
+# The broker is pluggable through PUSH_BROKER. InMemoryBroker fans out
+# within one process, which covers a single worker and tests; several
+# workers need a broker that shares events between them.
+
+Event = namedtuple('Event', ['id', 'type', 'data'])
+
+BACKLOG_LIMIT = 500
+RESYNC = 'resync'
+
+
+def channel_for(user_id):
+    return 'user:{}'.format(user_id)
+
+
+def format_event(event):
+    """``event`` as a Server-Sent Events frame."""
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(event.id, event.type, event.data)
+
+
+def _encode(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=JSONProvider.default).decode()
+    return json.dumps(data, default=JSONProvider.default, separators=(',', ':'))
+
+
+class Subscription(object):
+    """One client's queue of pending events on one channel."""
+
+    __slots__ = ('broker', 'channel', 'maxsize', 'closed', 'overflowed', '_queue', '_cond', '_waiter')
+
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.maxsize = maxsize
+        self.closed = False
+        self.overflowed = False
+        self._queue = deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._waiter = None
+
+    def put(self, event):
+        """Queue ``event``; False once the subscription is closed."""
+        with self._cond:
+            if self.closed:
+                return False
+            if len(self._queue) >= self.maxsize:
+                # the client isn't keeping up, cut it loose instead of buffering
+                self.closed = self.overflowed = True
+            else:
+                self._queue.append(event)
+            self._cond.notify()
+            waiter = self._waiter
+        if waiter is not None:
+            loop, ready = waiter
+            loop.call_soon_threadsafe(ready.set)
+        return not self.closed
+
+    def get(self, timeout=None):
+        """The next event, or None after ``timeout`` seconds or once closed."""
+        with self._cond:
+            if not self._queue and not self.closed:
+                self._cond.wait(timeout)
+            return self._queue.popleft() if self._queue else None
+
+    async def get_async(self, timeout=None):
+        ready = asyncio.Event()
+        with self._cond:
+            if self._queue or self.closed:
+                return self._queue.popleft() if self._queue else None
+            self._waiter = (asyncio.get_running_loop(), ready)
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        with self._cond:
+            self._waiter = None
+            return self._queue.popleft() if self._queue else None
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+        self.broker.unsubscribe(self)
+
+
+class Broker(object):
+    """Where published events go and subscriptions come from."""
+
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def subscribe(self, channel, maxsize=256):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class InMemoryBroker(Broker):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscriptions = tuple(self._channels.get(channel, ()))
+            self.published += 1
+        delivered = 0
+        for subscription in subscriptions:
+            if subscription.put(event):
+                delivered += 1
+            elif subscription.overflowed:
+                self.unsubscribe(subscription)
+                with self._lock:
+                    self.overflows += 1
+        with self._lock:
+            self.delivered += delivered
+        return delivered
+
+    def subscribe(self, channel, maxsize=256):
+        subscription = Subscription(self, channel, maxsize)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._channels.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._channels[subscription.channel]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'channels': len(self._channels),
+                'subscriptions': sum(len(s) for s in self._channels.values()),
+                'published': self.published,
+                'delivered': self.delivered,
+                'overflows': self.overflows,
+            }
+
+
+broker = InMemoryBroker()
+
+
+def init_app(app):
+    global broker
+    path = app.config.get('PUSH_BROKER')
+    if path:
+        module, _, name = path.partition(':')
+        broker = getattr(import_module(module), name)()
+
+
+# what gets pushed, and to whom
+_SOURCES = {
+    Messages: ('message', lambda row: (row['receiver_id'], row['sender_id'])),
+    Notifications: ('notification', lambda row: (row['user_id'],)),
+}
+
+
+def _event(model, row):
+    event_type, _ = _SOURCES[model]
+    return Event(row[model.__mapper__.primary_key[0].key], event_type, _encode(row))
+
+
+def publish_row(model, row):
+    event = _event(model, row)
+    for user_id in set(_SOURCES[model][1](row)):
+        if user_id is not None:
+            broker.publish(channel_for(user_id), event)
+
+
+def backlog_queries(user_id, after, limit=BACKLOG_LIMIT):
+    """(model, statement) pairs for the events a reconnecting client missed.
+
+    Ids are time-ordered uuid7 values, so one Last-Event-ID orders both
+    tables. They select what publish_row fans out to the user: messages
+    they received or sent, and their notifications.
+    """
+    messages = serializer_for(Messages)
+    notifications = serializer_for(Notifications)
+    return [
+        (Messages, select(*messages.columns())
+         .where(or_(Messages.receiver_id == user_id, Messages.sender_id == user_id), Messages.message_id > after)
+         .order_by(Messages.message_id).limit(limit)),
+        (Notifications, select(*notifications.columns())
+         .where(Notifications.user_id == user_id, Notifications.notification_id > after)
+         .order_by(Notifications.notification_id).limit(limit)),
+    ]
+
+
+def backlog_events(results, limit=BACKLOG_LIMIT):
+    """Merge the rows of each backlog query into one list of events by id.
+
+    When a query came back full there may be more rows after it, so the
+    list stops at the lowest id every query is complete up to and ends
+    with a RESYNC event carrying that id; see is_resync.
+    """
+    events = []
+    complete_to = None
+    for model, rows in results:
+        serializer = serializer_for(model)
+        dumped = [_event(model, serializer.dump_row(row)) for row in rows]
+        if len(dumped) >= limit:
+            last = max(e.id for e in dumped)
+            complete_to = last if complete_to is None else min(complete_to, last)
+        events.extend(dumped)
+    events.sort(key=lambda e: e.id)
+    if complete_to is not None:
+        events = [e for e in events if e.id <= complete_to]
+    if len(events) > limit:
+        del events[limit:]
+        complete_to = events[-1].id
+    if complete_to is not None:
+        events.append(Event(complete_to, RESYNC, _encode({'last_event_id': complete_to})))
+    return events
+
+
+def is_resync(backlog):
+    """Whether ``backlog`` is one page of a longer one and the stream should close after it."""
+    return bool(backlog) and backlog[-1].type == RESYNC
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_pushes(session, flush_context):
+    pushes = None
+    for obj in session.new:
+        model = type(obj)
+        if model in _SOURCES:
+            if pushes is None:
+                pushes = session.info.setdefault('pending_pushes', [])
+            # snapshot now, the instance is expired once the commit finishes
+            pushes.append((model, obj.to_dict()))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_pushes(session):
+    for model, row in session.info.pop('pending_pushes', ()):
+        publish_row(model, row)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pushes(session):
+    session.info.pop('pending_pushes', None)
@@ -0,0 +1,187 @@
+import math
+import threading
+import time
+from importlib import import_module
+
+
+# Token buckets for the endpoints that do expensive work for anonymous
+# callers. A rule is "N/S": a bucket of N tokens refilled evenly over S
+# seconds, so N requests in a burst and N per S seconds sustained. /login
+# spends one token of the caller's IP bucket and one of the username's
+# bucket per attempt before the password is hashed, so a credential-stuffing
+# run costs us a dict lookup per request once it is over the limit instead
+# of a scrypt. The username's token is refunded when the password is right,
+# so only failures count against its owner; taking it up front means
+# concurrent guesses can't all slip in on the same last token.
+#
+# The store is pluggable through RATELIMIT_STORE ("module:Class"); the
+# default keeps buckets in this process, sharded over several locks, so
+# with N workers the effective limits are up to N times higher.
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after):
+        super(RateLimitExceeded, self).__init__(retry_after)
+        self.retry_after = retry_after
+
+
+def parse_rate(value):
+    """(capacity, seconds) from "N/S", or None for an empty or "0" rule."""
+    if not value:
+        return None
+    count, _, seconds = str(value).partition('/')
+    capacity, per = int(count), float(seconds or 1)
+    if capacity <= 0 or per <= 0:
+        return None
+    return capacity, per
+
+
+class RateLimitStore(object):
+    """Where token buckets live."""
+
+    def take(self, key, capacity, per, cost=1):
+        """Take ``cost`` tokens; 0 if they were there, else seconds until they will be."""
+        raise NotImplementedError
+
+    def peek(self, key, capacity, per, cost=1):
+        """What take() would return, without taking anything."""
+        raise NotImplementedError
+
+    def refund(self, key, capacity, per, cost=1):
+        """Give back ``cost`` tokens take() took, up to ``capacity``."""
+        raise NotImplementedError
+
+    def reset(self, key):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class MemoryStore(RateLimitStore):
+    def __init__(self, shards=16, max_keys=100000):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self._max_per_shard = max(1, max_keys // shards)
+        self.evictions = 0
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _tokens(self, bucket, capacity, per, now):
+        if bucket is None:
+            return capacity
+        tokens, stamp = bucket
+        return min(capacity, tokens + (now - stamp) * capacity / per)
+
+    def _prune(self, buckets, now):
+        # drop buckets that have refilled (they equal a missing one), then
+        # the oldest if that was not enough
+        full = [key for key, (tokens, stamp, capacity, per) in buckets.items()
+                if tokens + (now - stamp) * capacity / per >= capacity]
+        for key in full:
+            del buckets[key]
+        while len(buckets) >= self._max_per_shard:
+            del buckets[next(iter(buckets))]
+            self.evictions += 1
+
+    def take(self, key, capacity, per, cost=1):
+        now = time.monotonic()
+        buckets, lock = self._shard(key)
+        with lock:
+            bucket = buckets.get(key)
+            tokens = self._tokens(bucket and bucket[:2], capacity, per, now)
+            if tokens < cost:
+                return (cost - tokens) * per / capacity
+            if bucket is None and len(buckets) >= self._max_per_shard:
+                self._prune(buckets, now)
+            buckets[key] = (tokens - cost, now, capacity, per)
+            return 0
+
+    def peek(self, key, capacity, per, cost=1):
+        now = time.monotonic()
+        buckets, lock = self._shard(key)
+        with lock:
+            bucket = buckets.get(key)
+            tokens = self._tokens(bucket and bucket[:2], capacity, per, now)
+        return 0 if tokens >= cost else (cost - tokens) * per / capacity
+
+    def refund(self, key, capacity, per, cost=1):
+        now = time.monotonic()
+        buckets, lock = self._shard(key)
+        with lock:
+            bucket = buckets.get(key)
+            # a missing bucket is full already
+            if bucket is not None:
+                buckets[key] = (min(capacity, self._tokens(bucket[:2], capacity, per, now) + cost), now,
+                                capacity, per)
+
+    def reset(self, key):
+        buckets, lock = self._shard(key)
+        with lock:
+            buckets.pop(key, None)
+
+    def stats(self):
+        return {'buckets': sum(len(buckets) for buckets, _ in self._shards), 'evictions': self.evictions}
+
+
+class Limiter(object):
+    """Named rules over a RateLimitStore."""
+
+    def __init__(self):
+        self.store = MemoryStore()
+        self.rules = {}
+        self.enabled = True
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    def init_app(self, app):
+        config = app.config
+        path = config.get('RATELIMIT_STORE')
+        if path:
+            module, _, name = path.partition(':')
+            self.store = getattr(import_module(module), name)()
+        self.enabled = config.get('RATELIMIT_ENABLED', True)
+        self.rules = {
+            'login_ip': parse_rate(config.get('RATELIMIT_LOGIN_IP', '20/60')),
+            'login_username': parse_rate(config.get('RATELIMIT_LOGIN_USERNAME', '5/300')),
+            'register_ip': parse_rate(config.get('RATELIMIT_REGISTER_IP', '10/3600')),
+        }
+
+    def _count(self, retry_after):
+        with self._lock:
+            if retry_after:
+                self.rejected += 1
+            else:
+                self.allowed += 1
+
+    def hit(self, rule, key):
+        """Spend a token of ``rule`` for ``key``; raises RateLimitExceeded if there is none."""
+        limit = self.rules.get(rule)
+        if not self.enabled or limit is None or key is None:
+            return
+        retry_after = self.store.take('{}:{}'.format(rule, key), *limit)
+        self._count(retry_after)
+        if retry_after:
+            raise RateLimitExceeded(retry_after)
+
+    def refund(self, rule, key):
+        """Give back the token hit() spent (e.g. for a login that succeeded)."""
+        limit = self.rules.get(rule)
+        if self.enabled and limit is not None and key is not None:
+            self.store.refund('{}:{}'.format(rule, key), *limit)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.store.stats(), allowed=self.allowed, rejected=self.rejected)
+
+
+limiter = Limiter()
+
+
+def init_app(app):
+    limiter.init_app(app)
+
+
+def retry_after_header(e):
+    return {'Retry-After': str(max(1, int(math.ceil(e.retry_after))))}
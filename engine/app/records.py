@@ -0,0 +1,222 @@
+from flask import Blueprint, current_app, request, jsonify, g, send_file
+from sqlalchemy import select
+from app import storage
+from app.db_types import is_uuid
+from app.http_cache import collection_version, validated
+from app.role_control import role_required
+from app.models import db, Doctors, Patients, Appointments, Documents, Prescriptions, MedicalHistory
+from app.loading import load_with, requested_includes
+from app.pagination import InvalidCursor, keyset_query, page_rows, page_size
+from app.replica import use_replica
+from app.serialization import requested_fields, serializer_for
+
+bp = Blueprint('records', __name__)
+
+
+def owner_ids_statement(principal):
+    """The patient or doctor ids whose records ``principal`` lists."""
+    if principal.role == 'patient':
+        return select(Patients.patient_id).where(Patients.user_id == principal.user_id)
+    return select(Doctors.doctor_id).where(Doctors.user_id == principal.user_id)
+
+
+def owned_records(query, model, principal, owner_ids):
+    """``query`` (a Query or a select()) limited to the live rows of ``owner_ids``."""
+    # patients and doctors only ever list their own records
+    owner_column = model.patient_id if principal.role == 'patient' else model.doctor_id
+    # a single owner compares with = so the (owner, updated_at, pk) index
+    # also provides the ordering; IN over several owners needs a sort
+    if len(owner_ids) == 1:
+        query = query.where(owner_column == owner_ids[0])
+    else:
+        query = query.where(owner_column.in_(owner_ids))
+    return query.where(model.is_deleted.is_not(True))
+
+
+def records_statement(model, serializer, fields, includes):
+    """select() of what a records page reads: instances to embed ``includes`` in, or plain columns."""
+    if includes:
+        return select(model).options(*load_with(model, *includes))
+    # nothing to embed, so skip ORM instances and serialize plain rows
+    pk = model.__mapper__.primary_key[0]
+    return select(*serializer.columns(fields, extra=(model.updated_at, pk)))
+
+
+def records_page(rows, next_cursor, serializer, fields, includes):
+    """The JSON body of a records page read through records_statement."""
+    if not includes:
+        return {'items': [serializer.dump_row(row, fields) for row in rows], 'next_cursor': next_cursor}
+    items = []
+    for row in rows:
+        item = serializer.dump(row, fields)
+        for name in includes:
+            related = getattr(row, name)
+            item[name] = related.to_dict() if related is not None else None
+        items.append(item)
+    return {'items': items, 'next_cursor': next_cursor}
+
+
+def _owner_ids():
+    # the validators and the page both need them
+    owner_ids = g.get('owner_ids')
+    if owner_ids is None:
+        owner_ids = g.owner_ids = db.session.scalars(owner_ids_statement(g.principal)).all()
+    return owner_ids
+
+
+def _owned_records(model):
+    return owned_records(model.query, model, g.principal, _owner_ids())
+
+
+def _list_records(model):
+    serializer = serializer_for(model)
+    fields = requested_fields(serializer)
+    includes = requested_includes(model, request.args.get('include'))
+    statement = owned_records(records_statement(model, serializer, fields, includes), model,
+                              g.principal, _owner_ids())
+    limit = page_size()
+    try:
+        statement = keyset_query(statement, model, request.args.get('cursor'), limit)
+    except InvalidCursor:
+        return jsonify({'message': 'Invalid cursor'}), 400
+    result = db.session.execute(statement)
+    rows, next_cursor = page_rows(result.scalars().all() if includes else result.all(), model, limit)
+    return jsonify(records_page(rows, next_cursor, serializer, fields, includes)), 200
+
+
+def _records_version(model):
+    includes = requested_includes(model, request.args.get('include'))
+    return collection_version(_owned_records(model), model, includes)
+
+
+@bp.route('/appointments', methods=['GET'])
+@role_required('patient', 'doctor')
+@use_replica
+@validated(lambda: _records_version(Appointments))
+def list_appointments():
+    return _list_records(Appointments)
+
+
+@bp.route('/documents', methods=['GET'])
+@role_required('patient', 'doctor')
+@use_replica
+@validated(lambda: _records_version(Documents))
+def list_documents():
+    return _list_records(Documents)
+
+
+@bp.route('/prescriptions', methods=['GET'])
+@role_required('patient', 'doctor')
+@use_replica
+@validated(lambda: _records_version(Prescriptions))
+def list_prescriptions():
+    return _list_records(Prescriptions)
+
+
+@bp.route('/medical-history', methods=['GET'])
+@role_required('patient', 'doctor')
+@use_replica
+@validated(lambda: _records_version(MedicalHistory))
+def list_medical_history():
+    return _list_records(MedicalHistory)
+
+
+# the column each record type keeps its download path in
+URL_COLUMNS = {
+    Documents: 'document_url',
+    Prescriptions: 'prescription_url',
+    MedicalHistory: 'medical_history_url',
+}
+
+
+# types served inline; anything else the uploader claims is stored and
+# served as an application/octet-stream attachment, so an HTML or SVG
+# upload can't run script on the app's origin
+INLINE_TYPES = frozenset([
+    'application/pdf', 'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'text/plain',
+])
+
+
+def _owned_record(model, record_id):
+    if not is_uuid(record_id):
+        return None
+    pk = model.__mapper__.primary_key[0]
+    return _owned_records(model).filter(pk == record_id).first()
+
+
+def _file_referenced(sha256):
+    """Whether any record, deleted ones included, still points at ``sha256``."""
+    return any(db.session.scalar(select(model.file_sha256).where(model.file_sha256 == sha256).limit(1))
+               is not None for model in URL_COLUMNS)
+
+
+def _upload_file(model, record_id):
+    record = _owned_record(model, record_id)
+    if record is None:
+        return jsonify({'message': 'Record not found'}), 404
+    limit = current_app.config.get('STORAGE_MAX_UPLOAD')
+    if limit is not None and (request.content_length or 0) > limit:
+        return jsonify({'message': 'File too large'}), 413
+
+    # read from the socket a chunk at a time, never the whole body at once
+    try:
+        stored = storage.save(request.stream)
+    except storage.UploadTooLarge:
+        return jsonify({'message': 'File too large'}), 413
+    if not stored.size:
+        return jsonify({'message': 'Empty file'}), 400
+
+    replaced = record.file_sha256
+    record.file_sha256 = stored.sha256
+    record.file_size = stored.size
+    record.file_type = request.mimetype if request.mimetype in INLINE_TYPES else 'application/octet-stream'
+    setattr(record, URL_COLUMNS[model], request.path)
+    db.session.commit()
+    if replaced is not None and replaced != stored.sha256 and not _file_referenced(replaced):
+        storage.remove(replaced)
+    # whether the bytes were stored already stays out of the response: it
+    # would tell the uploader that someone else has uploaded the same file
+    return jsonify({'sha256': stored.sha256, 'size': stored.size, 'type': record.file_type}), 200
+
+
+def _download_file(model, record_id):
+    record = _owned_record(model, record_id)
+    if record is None or record.file_sha256 is None:
+        return jsonify({'message': 'File not found'}), 404
+    backend = storage.backend
+    # a path lets the server use wsgi.file_wrapper (sendfile) or X-Sendfile;
+    # conditional=True answers Range with 206 and If-None-Match with 304
+    source = backend.local_path(record.file_sha256) or backend.open(record.file_sha256)
+    # rows stored before INLINE_TYPES existed may carry any client type
+    inline = record.file_type in INLINE_TYPES
+    response = send_file(source, mimetype=record.file_type if inline else 'application/octet-stream',
+                         as_attachment=not inline, download_name=record.file_sha256, conditional=True,
+                         etag=record.file_sha256, last_modified=record.updated_at)
+    response.cache_control.private = True
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Content-Security-Policy'] = "default-src 'none'; sandbox"
+    return response
+
+
+@bp.route('/documents/<document_id>/file', methods=['PUT', 'GET'])
+@role_required('patient', 'doctor')
+def document_file(document_id):
+    if request.method == 'PUT':
+        return _upload_file(Documents, document_id)
+    return _download_file(Documents, document_id)
+
+
+@bp.route('/prescriptions/<prescription_id>/file', methods=['PUT', 'GET'])
+@role_required('patient', 'doctor')
+def prescription_file(prescription_id):
+    if request.method == 'PUT':
+        return _upload_file(Prescriptions, prescription_id)
+    return _download_file(Prescriptions, prescription_id)
+
+
+@bp.route('/medical-history/<medical_history_id>/file', methods=['PUT', 'GET'])
+@role_required('patient', 'doctor')
+def medical_history_file(medical_history_id):
+    if request.method == 'PUT':
+        return _upload_file(MedicalHistory, medical_history_id)
+    return _download_file(MedicalHistory, medical_history_id)
@@ -0,0 +1,35 @@
+from functools import wraps
+
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+
+# Read replica routing. When SQLALCHEMY_BINDS has a 'replica' engine, views
+# wrapped in use_replica send their SELECTs to it; flushes and INSERT,
+# UPDATE and DELETE statements always go to the primary. Replicas lag, so
+# only endpoints that can show slightly stale rows should opt in.
+
+REPLICA = 'replica'
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get('use_replica') and not self._flushing \
+                and not isinstance(clause, UpdateBase):
+            replica = self._db.engines.get(REPLICA)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_replica(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        session = current_app.extensions['sqlalchemy'].session
+        session.info['use_replica'] = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            session.info.pop('use_replica', None)
+    return decorated_function
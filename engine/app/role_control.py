@@ -1,24 +1,29 @@
 from functools import wraps
-from flask import request, jsonify
-from .models import Users
+from flask import current_app, request, jsonify
+from .principals import load_principal
+from .tokens import InvalidToken, bearer_token, token_principal
 
-def role_required(required_role):
+def role_required(*required_roles):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            user_id = request.headers.get('user_id')
-            user = Users.query.get(user_id)
-            if user.role != required_role:
-                return jsonify({'message': 'Permission denied'}), 403
-            
-            user = Users.query.get(user_id)
-            if not user:
+            token = bearer_token(request.headers)
+            if token is not None:
+                try:
+                    principal = token_principal(token)
+                except InvalidToken:
+                    return jsonify({'message': 'Invalid token'}), 401
+            elif current_app.config.get('TOKEN_AUTH_ONLY'):
+                return jsonify({'message': 'Token required'}), 401, {'WWW-Authenticate': 'Bearer'}
+            else:
+                user_id = request.headers.get('user_id')
+                principal = load_principal(user_id) if user_id else None
+            if principal is None:
                 return jsonify({'message': 'User not found'}), 404
             
-            if user.role != required_role:
+            if not principal.is_active or principal.role not in required_roles:
                 return jsonify({'message': 'Permission denied'}), 403
             
             return f(*args, **kwargs)
         return decorated_function
     return decorator
-            
@@ -0,0 +1,243 @@
+from bisect import bisect_left
+from datetime import datetime, time, timedelta
+from itertools import chain
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from app.cache import TTLCache
+from app.models import Appointments, Doctors
+
+
+# Appointment slots. An appointment occupies [starts_at, ends_at); both are
+# filled from appointment_date/appointment_time when older code only sets
+# those. Availability and conflict checks go through a per-doctor
+# DoctorSchedule: the doctor's upcoming intervals in sorted arrays, so a
+# conflict test is one bisect and a day's free slots cost O(k log n),
+# however much history the doctor has. Schedules are cached per process
+# and dropped when an appointment of that doctor is committed; booking
+# re-checks against the database under a lock on the doctor row, so a stale
+# cache can only hide a free slot, never double-book one. A unique index on
+# (doctor_id, booked_slot) backs that up for bookings of the same start.
+
+TIME_FORMATS = ('%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p', '%I %p', '%I%p', '%H%M')
+
+schedule_cache = TTLCache(maxsize=1000, ttl=60.0)
+
+
+class SlotUnavailable(Exception):
+    """The requested interval overlaps another appointment of the doctor."""
+
+
+class DoctorNotFound(Exception):
+    pass
+
+
+def init_app(app):
+    schedule_cache.maxsize = app.config.get('SCHEDULE_CACHE_SIZE', 1000)
+    schedule_cache.ttl = app.config.get('SCHEDULE_CACHE_TTL', 60.0)
+
+
+def _settings(config):
+    return (
+        time.fromisoformat(config.get('SCHEDULE_DAY_START', '09:00')),
+        time.fromisoformat(config.get('SCHEDULE_DAY_END', '17:00')),
+        config.get('SCHEDULE_SLOT_MINUTES', 30),
+        config.get('SCHEDULE_MAX_MINUTES', 240),
+    )
+
+
+def parse_time(value):
+    """A ``time`` from the free-form appointment_time strings, or None."""
+    if not value:
+        return None
+    text = value.strip().upper()
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).time()
+        except ValueError:
+            pass
+    return None
+
+
+def slot_bounds(appointment_date, appointment_time, minutes=30):
+    """(starts_at, ends_at) for a legacy date + time pair, or (None, None)."""
+    if appointment_date is None:
+        return None, None
+    parsed = parse_time(appointment_time)
+    starts_at = datetime.combine(appointment_date.date(), parsed) if parsed else appointment_date
+    return starts_at, starts_at + timedelta(minutes=minutes)
+
+
+@event.listens_for(Appointments, 'before_insert')
+@event.listens_for(Appointments, 'before_update')
+def _normalize_slot(mapper, connection, target):
+    state = inspect(target)
+    moved = state.attrs.appointment_date.history.has_changes() or \
+        state.attrs.appointment_time.history.has_changes()
+    if target.starts_at is None or (moved and not state.attrs.starts_at.history.has_changes()):
+        target.starts_at, target.ends_at = slot_bounds(target.appointment_date, target.appointment_time)
+    elif target.ends_at is None:
+        target.ends_at = target.starts_at + timedelta(minutes=30)
+
+
+def on_grid(starts_at, minutes, config):
+    """True if [starts_at, +minutes) is a slot availability could offer."""
+    day_start, day_end, step, _ = _settings(config)
+    opens = datetime.combine(starts_at.date(), day_start)
+    offset = starts_at - opens
+    return (offset >= timedelta(0) and not offset % timedelta(minutes=step)
+            and starts_at + timedelta(minutes=minutes) <= datetime.combine(starts_at.date(), day_end))
+
+
+class DoctorSchedule(object):
+    """A doctor's booked intervals, sorted by start.
+
+    ``max_ends[i]`` is the latest end among the first i + 1 intervals, which
+    keeps the bisects correct even if old data holds overlapping bookings.
+    """
+
+    __slots__ = ('starts', 'ends', 'max_ends', 'since')
+
+    def __init__(self, intervals, since=None):
+        intervals = sorted(intervals)
+        self.starts = [start for start, _ in intervals]
+        self.ends = [end for _, end in intervals]
+        self.max_ends = []
+        latest = None
+        for end in self.ends:
+            latest = end if latest is None or end > latest else latest
+            self.max_ends.append(latest)
+        self.since = since
+
+    def __len__(self):
+        return len(self.starts)
+
+    def conflicts(self, start, end):
+        """True if [start, end) overlaps a booked interval."""
+        i = bisect_left(self.starts, end)
+        return i > 0 and self.max_ends[i - 1] > start
+
+    def free_slots(self, day, minutes, config):
+        """Start times on ``day`` where a ``minutes`` long appointment fits."""
+        day_start, day_end, step, _ = _settings(config)
+        closes = datetime.combine(day, day_end)
+        length = timedelta(minutes=minutes)
+        slots = []
+        slot = datetime.combine(day, day_start)
+        while slot + length <= closes:
+            if not self.conflicts(slot, slot + length):
+                slots.append(slot)
+            slot += timedelta(minutes=step)
+        return slots
+
+
+def _blocking(doctor_id):
+    return (Appointments.doctor_id == doctor_id,
+            Appointments.starts_at.isnot(None),
+            Appointments.appointment_status != 'cancelled',
+            Appointments.is_deleted.isnot(True))
+
+
+def load_schedule(doctor_id, session=None, since=None):
+    """Build a doctor's schedule from the database, from ``since`` onwards."""
+    session = session or db.session
+    if since is None:
+        # bookings never last a day, so nothing older can touch today
+        since = datetime.combine(datetime.utcnow().date(), time()) - timedelta(days=1)
+    rows = session.execute(
+        select(Appointments.starts_at, Appointments.ends_at)
+        .where(*_blocking(doctor_id), Appointments.starts_at >= since))
+    return DoctorSchedule(((start, end) for start, end in rows), since)
+
+
+def get_schedule(doctor_id, session=None):
+    schedule = schedule_cache.get(doctor_id)
+    if schedule is None:
+        schedule = load_schedule(doctor_id, session)
+        schedule_cache.set(doctor_id, schedule)
+    return schedule
+
+
+def availability(doctor_id, day, minutes, config, session=None):
+    """Free slot start times for ``doctor_id`` on ``day``, none in the past."""
+    slots = get_schedule(doctor_id, session).free_slots(day, minutes, config)
+    now = datetime.utcnow()
+    return [slot for slot in slots if slot > now]
+
+
+def book(doctor_id, patient_id, starts_at, minutes, config, session=None, **fields):
+    """Insert and commit an appointment, or raise SlotUnavailable.
+
+    The doctor row is locked (SELECT ... FOR UPDATE) as the first statement
+    of the transaction and the clash check is a locking read, so two
+    bookings for one doctor are serialised and the second sees the first.
+    A transaction already open on ``session`` is committed beforehand; the
+    booking's own commit would have included its changes anyway.
+    """
+    session = session or db.session
+    _, _, _, max_minutes = _settings(config)
+    ends_at = starts_at + timedelta(minutes=minutes)
+    schedule = schedule_cache.get(doctor_id)
+    if schedule is not None and schedule.conflicts(starts_at, ends_at):
+        raise SlotUnavailable()
+
+    # under REPEATABLE READ an earlier read in the transaction pins the
+    # snapshot, and a booking committed while this one waited for the lock
+    # would not be in it
+    session.commit()
+    locked = session.execute(
+        select(Doctors.doctor_id).where(Doctors.doctor_id == doctor_id).with_for_update()).first()
+    if locked is None:
+        session.rollback()
+        raise DoctorNotFound()
+    # the (doctor_id, starts_at) index bounds this to a few rows: anything
+    # starting more than max_minutes earlier has ended already
+    clash = session.execute(
+        select(Appointments.appointment_id)
+        .where(*_blocking(doctor_id),
+               Appointments.starts_at > starts_at - timedelta(minutes=max_minutes),
+               Appointments.starts_at < ends_at,
+               Appointments.ends_at > starts_at)
+        .limit(1).with_for_update()).first()
+    if clash is not None:
+        session.rollback()
+        raise SlotUnavailable()
+
+    appointment = Appointments(doctor_id=doctor_id, patient_id=patient_id,
+                               appointment_date=starts_at, appointment_time=starts_at.strftime('%H:%M'),
+                               starts_at=starts_at, ends_at=ends_at, **fields)
+    session.add(appointment)
+    try:
+        session.commit()
+    except IntegrityError:
+        # ix_appointments_doctor_id_booked_slot: a database without row
+        # locks (SQLite) let a second booking of the slot through the check
+        session.rollback()
+        raise SlotUnavailable()
+    return appointment
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_schedule_changes(session, flush_context):
+    changed = None
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Appointments):
+            if changed is None:
+                changed = session.info.setdefault('stale_schedules', set())
+            history = inspect(obj).attrs.doctor_id.history
+            changed.update(doctor_id for doctor_id in (obj.doctor_id,) + tuple(history.deleted or ())
+                           if doctor_id is not None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_schedules(session):
+    for doctor_id in session.info.pop('stale_schedules', ()):
+        schedule_cache.invalidate(doctor_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_schedule_changes(session):
+    session.info.pop('stale_schedules', None)
@@ -0,0 +1,306 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Doctors
+
+
+# In-process inverted index over Doctors for /doctors/search. Facets map a
+# normalised value to the set of doctor ids having it; names and zip codes
+# live in sorted (token, doctor_id) lists so a prefix is a bisect plus a
+# short forward scan. Committed inserts, updates and deletes are applied
+# incrementally, and the whole index is rebuilt in the background once it is
+# older than DOCTOR_INDEX_MAX_AGE so writes made by other workers show up.
+
+FACETS = ('specialty', 'city', 'state', 'gender', 'is_active')
+NAMES = ('first_name', 'middle_name', 'last_name')
+INDEXED = ('doctor_id',) + FACETS + NAMES + ('zip_code', 'is_deleted')
+
+
+def _norm(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower()
+
+
+class PrefixIndex(object):
+    def __init__(self):
+        self._entries = []
+
+    def add(self, token, key):
+        insort(self._entries, (token, key))
+
+    def remove(self, token, key):
+        i = bisect_left(self._entries, (token, key))
+        if i < len(self._entries) and self._entries[i] == (token, key):
+            del self._entries[i]
+
+    def extend(self, entries):
+        self._entries.extend(entries)
+        self._entries.sort()
+
+    def match(self, prefix):
+        entries = self._entries
+        start = bisect_left(entries, (prefix,))
+        end = bisect_left(entries, (prefix + '\uffff',), start)
+        return {key for _, key in entries[start:end]}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DoctorIndex(object):
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs = {}
+        self._facets = {field: {} for field in FACETS}
+        self._names = PrefixIndex()
+        self._zips = PrefixIndex()
+        self.built_at = None
+        self._rebuilding = False
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, doc, _bulk=None):
+        doctor_id = doc['doctor_id']
+        with self._lock:
+            self.remove(doctor_id)
+            if doc.get('is_deleted'):
+                return
+            names = tuple(token for field in NAMES
+                          for token in (_norm(doc.get(field)) or '').split())
+            zip_code = _norm(doc.get('zip_code'))
+            facets = tuple(_norm(doc.get(field)) for field in FACETS)
+            sort_key = (_norm(doc.get('last_name')) or '', _norm(doc.get('first_name')) or '', doctor_id)
+            self._docs[doctor_id] = (facets, names, zip_code, sort_key)
+            for field, value in zip(FACETS, facets):
+                if value is not None:
+                    self._facets[field].setdefault(value, set()).add(doctor_id)
+            if _bulk is not None:
+                # load() sorts everything once at the end instead
+                _bulk[0].extend((token, doctor_id) for token in names)
+                if zip_code:
+                    _bulk[1].append((zip_code, doctor_id))
+                return
+            for token in names:
+                self._names.add(token, doctor_id)
+            if zip_code:
+                self._zips.add(zip_code, doctor_id)
+
+    def remove(self, doctor_id):
+        with self._lock:
+            entry = self._docs.pop(doctor_id, None)
+            if entry is None:
+                return
+            facets, names, zip_code, _ = entry
+            for field, value in zip(FACETS, facets):
+                ids = self._facets[field].get(value)
+                if ids is not None:
+                    ids.discard(doctor_id)
+                    if not ids:
+                        del self._facets[field][value]
+            for token in names:
+                self._names.remove(token, doctor_id)
+            if zip_code:
+                self._zips.remove(zip_code, doctor_id)
+
+    def search(self, q=None, zip_code=None, filters=None, limit=20, offset=0, facets=()):
+        """Return (total, doctor_ids, facet_counts) for a query.
+
+        ``q`` terms are prefix matched against first/middle/last names and
+        all have to match; ``zip_code`` is a prefix; ``filters`` maps facet
+        fields to exact values.
+        """
+        with self._lock:
+            candidates = []
+            for field, value in (filters or {}).items():
+                candidates.append(self._facets[field].get(_norm(value), set()))
+            for term in (_norm(q) or '').split():
+                candidates.append(self._names.match(term))
+            if zip_code:
+                candidates.append(self._zips.match(_norm(zip_code)))
+
+            if candidates:
+                candidates.sort(key=len)
+                matches = candidates[0].intersection(*candidates[1:])
+            else:
+                matches = self._docs.keys()
+
+            docs = self._docs
+            page = heapq.nsmallest(offset + limit, matches, key=lambda i: docs[i][3])[offset:]
+            counts = {}
+            for field in facets:
+                position = FACETS.index(field)
+                field_counts = counts[field] = {}
+                for doctor_id in matches:
+                    value = docs[doctor_id][0][position]
+                    field_counts[value] = field_counts.get(value, 0) + 1
+            return len(matches), page, counts
+
+    def load(self, rows):
+        with self._lock:
+            names, zips = [], []
+            for row in rows:
+                self.add(row, _bulk=(names, zips))
+            self._names.extend(names)
+            self._zips.extend(zips)
+            self.built_at = time.monotonic()
+
+
+doctor_index = DoctorIndex()
+_build_lock = threading.Lock()
+# changes committed while a background rebuild runs, replayed onto the
+# fresh index before it replaces the live one (guarded by _build_lock)
+_missed = []
+
+
+def index_rows(session=None):
+    session = session or db.session
+    columns = [getattr(Doctors, name) for name in INDEXED]
+    result = session.execute(select(*columns).execution_options(yield_per=5000))
+    for row in result.mappings():
+        yield row
+
+
+def _apply(index, changes):
+    for doctor_id, doc in changes.items():
+        if doc is None:
+            index.remove(doctor_id)
+        else:
+            index.add(doc)
+
+
+def claim_rebuild(index, config):
+    """True when the caller should build a fresh index to replace ``index``.
+
+    That is when ``index`` was never built or is older than
+    DOCTOR_INDEX_MAX_AGE and nobody else is building one. The caller loads
+    a new DoctorIndex and hands it, or None if loading failed, to
+    finish_rebuild.
+    """
+    if index._rebuilding:
+        return False
+    if index.built_at is not None:
+        max_age = config.get('DOCTOR_INDEX_MAX_AGE', 300)
+        if not max_age or time.monotonic() - index.built_at <= max_age:
+            return False
+    with _build_lock:
+        if index._rebuilding or index is not doctor_index:
+            return False
+        index._rebuilding = True
+    return True
+
+
+def finish_rebuild(stale, fresh=None):
+    """Swap ``fresh`` in for ``stale`` after replaying the commits it may have missed."""
+    global doctor_index
+    with _build_lock:
+        if fresh is not None and doctor_index is stale:
+            for changes in _missed:
+                _apply(fresh, changes)
+            doctor_index = fresh
+        del _missed[:]
+        stale._rebuilding = False
+
+
+def _rebuild(app, stale):
+    fresh = None
+    try:
+        with app.app_context():
+            index = DoctorIndex()
+            try:
+                index.load(index_rows())
+            finally:
+                db.session.remove()
+            fresh = index
+    finally:
+        finish_rebuild(stale, fresh)
+
+
+def get_index():
+    """The doctor index, built on first use and refreshed when stale."""
+    index = doctor_index
+    if index.built_at is None:
+        with _build_lock:
+            if doctor_index.built_at is None:
+                doctor_index.load(index_rows())
+        return doctor_index
+
+    if claim_rebuild(index, current_app.config):
+        # keep answering from the current index while a fresh one is built
+        threading.Thread(target=_rebuild, args=(current_app._get_current_object(), index),
+                         daemon=True).start()
+    return index
+
+
+def search_arguments(args):
+    """DoctorIndex.search keyword arguments, but limit, from a query string.
+
+    Raises ValueError for an offset that isn't a number.
+    """
+    filters = {field: args[field] for field in ('specialty', 'city', 'state', 'gender') if args.get(field)}
+    if args.get('active'):
+        filters['is_active'] = args['active'].lower() in ('1', 'true', 'yes')
+    return {
+        'q': args.get('q'),
+        'zip_code': args.get('zip_code'),
+        'filters': filters,
+        'offset': max(0, int(args.get('offset', 0))),
+        'facets': [field for field in args.get('facets', '').split(',') if field in FACETS],
+    }
+
+
+def results_statement(doctor_ids, serializer, fields):
+    """select() of the ``fields`` of the doctors a search found."""
+    return select(*serializer.columns(fields, extra=(Doctors.doctor_id,))) \
+        .where(Doctors.doctor_id.in_(doctor_ids))
+
+
+def ordered_results(rows, doctor_ids, serializer, fields):
+    """results_statement rows in the index's order, skipping rows deleted since."""
+    found = {row.doctor_id: serializer.dump_row(row, fields) for row in rows}
+    return [found[doctor_id] for doctor_id in doctor_ids if doctor_id in found]
+
+
+def reset():
+    global doctor_index
+    doctor_index = DoctorIndex()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_doctor_changes(session, flush_context):
+    changes = session.info.setdefault('doctor_index_changes', {})
+    for obj in session.new.union(session.dirty):
+        if isinstance(obj, Doctors):
+            # snapshot now, the instance is expired once the commit finishes
+            changes[obj.doctor_id] = {name: getattr(obj, name) for name in INDEXED}
+    for obj in session.deleted:
+        if isinstance(obj, Doctors):
+            changes[obj.doctor_id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_doctor_changes(session):
+    changes = session.info.pop('doctor_index_changes', None)
+    if not changes or (doctor_index.built_at is None and not doctor_index._rebuilding):
+        return
+    with _build_lock:
+        index = doctor_index
+        if index._rebuilding:
+            # the rebuild may have read the rows before this commit
+            _missed.append(changes)
+        _apply(index, changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_doctor_changes(session):
+    session.info.pop('doctor_index_changes', None)
@@ -0,0 +1,121 @@
+from datetime import date, datetime, time
+from operator import attrgetter
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import inspect
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+# One Serializer is built per model from its column metadata the first time
+# it is needed. It pulls the column values out in a single attrgetter call and
+# leaves datetimes alone; the JSON provider below renders them as ISO 8601.
+
+class Serializer(object):
+    def __init__(self, model):
+        exclude = set(getattr(model, '__serialize_exclude__', ()))
+        attrs = [attr for attr in inspect(model).column_attrs if attr.key not in exclude]
+        self.model = model
+        self.fields = tuple(attr.key for attr in attrs)
+        self._columns = {attr.key: getattr(model, attr.key) for attr in attrs}
+        self._plans = {}
+
+    def _plan(self, fields):
+        plan = self._plans.get(fields)
+        if plan is None:
+            names = self.fields if fields is None else fields
+            getter = attrgetter(*names)
+            if len(names) == 1:
+                single = getter
+                getter = lambda obj: (single(obj),)
+            plan = self._plans[fields] = (names, getter)
+        return plan
+
+    def only(self, fields):
+        """Normalise a field selection; unknown names are dropped."""
+        wanted = set(fields or ())
+        if not wanted:
+            return None
+        selected = tuple(name for name in self.fields if name in wanted)
+        return selected or None
+
+    def columns(self, fields=None, extra=()):
+        """Columns to SELECT for ``fields``, followed by any ``extra`` ones."""
+        names = self.fields if fields is None else fields
+        columns = [self._columns[name] for name in names]
+        columns.extend(column for column in extra if column.key not in names)
+        return columns
+
+    def dump(self, obj, fields=None):
+        names, getter = self._plan(fields)
+        return dict(zip(names, getter(obj)))
+
+    def dump_row(self, row, fields=None):
+        # rows come from SELECT self.columns(fields, ...), so the first
+        # len(names) values line up with names and any extras are ignored
+        names = self.fields if fields is None else fields
+        return dict(zip(names, row))
+
+
+_serializers = {}
+
+
+def serializer_for(model):
+    serializer = _serializers.get(model)
+    if serializer is None:
+        serializer = _serializers[model] = Serializer(model)
+    return serializer
+
+
+class SerializerMixin(object):
+    __serialize_exclude__ = ()
+
+    def to_dict(self, fields=None):
+        return serializer_for(type(self)).dump(self, fields)
+
+
+def requested_fields(serializer, args=None):
+    """The ?fields=a,b selection for the current request, or None for all."""
+    fields = (request.args if args is None else args).get('fields')
+    if not fields:
+        return None
+    return serializer.only(name.strip() for name in fields.split(','))
+
+
+class JSONProvider(DefaultJSONProvider):
+    sort_keys = False
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (datetime, date, time)):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+
+class OrjsonProvider(JSONProvider):
+    def _options(self):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self._app.debug and self.compact is not True:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._options())
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    app.json = OrjsonProvider(app) if orjson is not None else JSONProvider(app)
@@ -0,0 +1,43 @@
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+class QueryCounter(object):
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries(engine):
+    """Record every statement ``engine`` executes inside the block."""
+    counter = QueryCounter()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter.statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def log_statements(engine, path):
+    """Append every statement ``engine`` runs to ``path``, one per line.
+
+    The file is what ``flask index-audit --log`` reads.
+    """
+    lock = threading.Lock()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        line = ' '.join(statement.split())
+        with lock, open(path, 'a') as f:
+            f.write(line + '\n')
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
@@ -0,0 +1,182 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from importlib import import_module
+
+
+# File contents for Documents, Prescriptions and MedicalHistory. Uploads are
+# read from the request stream STORAGE_CHUNK_SIZE bytes at a time, hashed
+# as they go and spooled to a temporary file, so memory stays flat whatever
+# the file size. Files are stored under their SHA-256, which makes the same
+# scan uploaded twice (or attached to several records) one stored file.
+# A file a re-upload replaced is removed once no record refers to it, unless
+# it was committed in the last STORAGE_REMOVE_GRACE seconds: an upload of the
+# same bytes may be about to point a record at it.
+#
+# The backend is pluggable through STORAGE_BACKEND ("module:Class", built
+# with the app config). LocalStorage keeps files on disk and hands their
+# paths to send_file, so downloads go out through the server's
+# wsgi.file_wrapper (sendfile) or X-Sendfile when USE_X_SENDFILE is on.
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class StoredFile(object):
+    __slots__ = ('sha256', 'size', 'deduplicated')
+
+    def __init__(self, sha256, size, deduplicated):
+        self.sha256 = sha256
+        self.size = size
+        self.deduplicated = deduplicated
+
+
+class Storage(object):
+    """Where file contents live, keyed by SHA-256 hex digest."""
+
+    def spool(self):
+        """A writable binary file for an upload in progress."""
+        raise NotImplementedError
+
+    def commit(self, spooled, sha256):
+        """Keep ``spooled`` as ``sha256``; returns False if it was stored already.
+
+        Committing a file that is stored already counts as storing it again
+        for remove().
+        """
+        raise NotImplementedError
+
+    def discard(self, spooled):
+        raise NotImplementedError
+
+    def exists(self, sha256):
+        raise NotImplementedError
+
+    def remove(self, sha256, grace):
+        """Delete ``sha256`` unless it was committed in the last ``grace`` seconds; True if deleted."""
+        raise NotImplementedError
+
+    def open(self, sha256):
+        """A readable, seekable binary file."""
+        raise NotImplementedError
+
+    def local_path(self, sha256):
+        """A filesystem path to serve from, or None if the backend has none."""
+        return None
+
+
+class LocalStorage(Storage):
+    def __init__(self, config):
+        self.root = os.path.abspath(config.get('STORAGE_ROOT') or 'storage')
+        self._tmp = os.path.join(self.root, 'tmp')
+
+    def _path(self, sha256):
+        # two levels of fan-out keep directories small
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def spool(self):
+        # same filesystem as the final location, so commit is a rename
+        os.makedirs(self._tmp, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=self._tmp, delete=False)
+
+    def commit(self, spooled, sha256):
+        spooled.close()
+        path = self._path(sha256)
+        if os.path.exists(path):
+            os.unlink(spooled.name)
+            os.utime(path)
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(spooled.name, path)
+        return True
+
+    def discard(self, spooled):
+        spooled.close()
+        try:
+            os.unlink(spooled.name)
+        except FileNotFoundError:
+            pass
+
+    def exists(self, sha256):
+        return os.path.exists(self._path(sha256))
+
+    def remove(self, sha256, grace):
+        path = self._path(sha256)
+        try:
+            if time.time() - os.path.getmtime(path) < grace:
+                return False
+            os.unlink(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def open(self, sha256):
+        return open(self._path(sha256), 'rb')
+
+    def local_path(self, sha256):
+        return self._path(sha256)
+
+
+backend = None
+chunk_size = 1 << 20
+max_size = None
+remove_grace = 300
+_lock = threading.Lock()
+_counts = {'stored': 0, 'deduplicated': 0, 'removed': 0}
+
+
+def init_app(app):
+    global backend, chunk_size, max_size, remove_grace
+    config = app.config
+    path = config.get('STORAGE_BACKEND')
+    if path:
+        module, _, name = path.partition(':')
+        backend = getattr(import_module(module), name)(config)
+    else:
+        backend = LocalStorage(config)
+    chunk_size = config.get('STORAGE_CHUNK_SIZE', 1 << 20)
+    max_size = config.get('STORAGE_MAX_UPLOAD')
+    remove_grace = config.get('STORAGE_REMOVE_GRACE', 300)
+
+
+def save(stream, storage=None):
+    """Copy ``stream`` into storage chunk by chunk; returns a StoredFile."""
+    storage = storage or backend
+    digest = hashlib.sha256()
+    size = 0
+    spooled = storage.spool()
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise UploadTooLarge()
+            digest.update(chunk)
+            spooled.write(chunk)
+    except BaseException:
+        storage.discard(spooled)
+        raise
+    sha256 = digest.hexdigest()
+    stored = StoredFile(sha256, size, not storage.commit(spooled, sha256))
+    with _lock:
+        _counts['deduplicated' if stored.deduplicated else 'stored'] += 1
+    return stored
+
+
+def remove(sha256, storage=None):
+    """Delete a file no record refers to any more; True if it was deleted."""
+    removed = (storage or backend).remove(sha256, remove_grace)
+    if removed:
+        with _lock:
+            _counts['removed'] += 1
+    return removed
+
+
+def stats():
+    with _lock:
+        return dict(_counts)
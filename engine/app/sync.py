@@ -0,0 +1,143 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+from flask import Blueprint, current_app, g, jsonify, request
+from sqlalchemy import and_, or_, select
+from sqlalchemy.types import TypeDecorator
+
+from app.models import (db, Appointments, Doctors, Documents, MedicalHistory, Messages, Notifications,
+                        Patients, Prescriptions)
+from app.pagination import InvalidCursor
+from app.role_control import role_required
+from app.serialization import serializer_for
+
+bp = Blueprint('sync', __name__)
+
+
+# Incremental sync. GET /sync returns the caller's rows changed since the
+# token of the previous call, per table and oldest first, walking the
+# (owner, updated_at, pk) indexes; without a token it starts from the
+# beginning. Live rows come back in full under "upserts", soft deleted ones
+# as ids under "deleted". The token holds an (updated_at, pk) position per
+# table and "has_more" says whether another call would return more now.
+#
+# updated_at is stamped by the application before the transaction commits,
+# so a slow transaction can commit a row older than rows already synced.
+# The token therefore never moves past now - SYNC_SAFETY_LAG seconds once
+# a table is caught up; rows in that window are sent again and clients
+# apply upserts idempotently.
+#
+# Messages belong to both ends, so they are read once by sender and once by
+# receiver, each walking its own (user, updated_at) index, and the two pages
+# are merged; a single OR would have to sort every matching row.
+
+# table -> (model, owner column for patients, owner column for doctors)
+TABLES = {
+    'appointments': (Appointments, 'patient_id', 'doctor_id'),
+    'documents': (Documents, 'patient_id', 'doctor_id'),
+    'prescriptions': (Prescriptions, 'patient_id', 'doctor_id'),
+    'medical_history': (MedicalHistory, 'patient_id', 'doctor_id'),
+}
+# tables scoped by the user rather than by the profile: (model, user columns)
+USER_TABLES = {
+    'notifications': (Notifications, ('user_id',)),
+    'messages': (Messages, ('sender_id', 'receiver_id')),
+}
+PROFILES = {'patient': ('patients', Patients), 'doctor': ('doctors', Doctors)}
+
+
+def encode_token(positions):
+    raw = json.dumps({table: [updated_at.isoformat(), pk] for table, (updated_at, pk) in positions.items()},
+                     separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return {table: (datetime.fromisoformat(updated_at), pk) for table, (updated_at, pk) in raw.items()}
+    except (ValueError, TypeError, AttributeError):
+        raise InvalidCursor('Invalid sync token')
+
+
+def _after(model, position):
+    pk = model.__mapper__.primary_key[0]
+    updated_at, after_pk = position
+    if after_pk is None:
+        return model.updated_at >= updated_at
+    if isinstance(pk.type, TypeDecorator):
+        try:
+            pk.type.process_bind_param(after_pk, None)
+        except (ValueError, TypeError, AttributeError):
+            raise InvalidCursor('Invalid sync token')
+    # the leading >= keeps the predicate a plain index range scan
+    return and_(model.updated_at >= updated_at, or_(model.updated_at > updated_at, pk > after_pk))
+
+
+def _sources(principal, session):
+    """(table name, model, filters) of everything ``principal`` syncs; a row is theirs if any filter matches."""
+    name, profile = PROFILES[principal.role]
+    owner_ids = session.scalars(select(profile.__mapper__.primary_key[0])
+                                .where(profile.user_id == principal.user_id)).all()
+    sources = [(name, profile, [profile.user_id == principal.user_id])]
+    for table, (model, patient_column, doctor_column) in TABLES.items():
+        column = getattr(model, patient_column if principal.role == 'patient' else doctor_column)
+        sources.append((table, model, [column == owner_ids[0] if len(owner_ids) == 1 else column.in_(owner_ids)]))
+    for table, (model, columns) in USER_TABLES.items():
+        sources.append((table, model, [getattr(model, column) == principal.user_id for column in columns]))
+    return sources
+
+
+def changes(principal, positions, limit, safety_lag, session=None):
+    """(changes per table, new positions, has_more) after ``positions``."""
+    session = session or db.session
+    horizon = datetime.utcnow() - timedelta(seconds=safety_lag)
+    result = {}
+    more = False
+    positions = dict(positions)
+    for table, model, filters in _sources(principal, session):
+        pk = model.__mapper__.primary_key[0]
+        query = select(model).where(model.updated_at.isnot(None))
+        if table in positions:
+            query = query.where(_after(model, positions[table]))
+        query = query.order_by(model.updated_at, pk).limit(limit + 1)
+        if len(filters) == 1:
+            rows = session.scalars(query.where(filters[0])).all()
+        else:
+            found = {}
+            for owned in filters:
+                for row in session.scalars(query.where(owned)):
+                    found[getattr(row, pk.key)] = row
+            rows = sorted(found.values(), key=lambda row: (row.updated_at, getattr(row, pk.key)))
+        full = len(rows) > limit
+        rows = rows[:limit]
+        serializer = serializer_for(model)
+        upserts = [serializer.dump(row) for row in rows if not row.is_deleted]
+        deleted = [getattr(row, pk.key) for row in rows if row.is_deleted]
+        if upserts or deleted:
+            result[table] = {'upserts': upserts, 'deleted': deleted}
+        if rows:
+            last = rows[-1]
+            positions[table] = (last.updated_at, getattr(last, pk.key))
+        if full:
+            more = True
+        elif table not in positions or positions[table][0] > horizon:
+            # caught up: resume from the horizon so late commits are seen
+            positions[table] = (horizon, None)
+    return result, positions, more
+
+
+@bp.route('/sync', methods=['GET'])
+@role_required('patient', 'doctor')
+def sync():
+    config = current_app.config
+    since = request.args.get('since')
+    try:
+        positions = decode_token(since) if since else {}
+        limit = min(max(1, int(request.args.get('limit', config.get('SYNC_PAGE_SIZE', 500)))),
+                    config.get('SYNC_PAGE_SIZE', 500))
+        result, positions, more = changes(g.principal, positions, limit, config.get('SYNC_SAFETY_LAG', 5))
+    except (InvalidCursor, ValueError):
+        return jsonify({'message': 'Invalid sync token'}), 400
+    return jsonify({'changes': result, 'next': encode_token(positions), 'has_more': more}), 200
@@ -0,0 +1,351 @@
+import queue
+import threading
+import time
+from importlib import import_module
+from itertools import chain
+
+from sqlalchemy import event, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from app.db_types import uuid_bytes, uuid_str
+from app.models import Follows, Posts, Users
+
+
+# Home timelines for /feed. Each user's timeline is the newest
+# FEED_TIMELINE_SIZE post ids of the accounts they follow (and their own),
+# materialised when first read and then kept current by fanning each new
+# post out to the timelines of the author's followers. Authors with more
+# than FEED_FANOUT_LIMIT followers are not fanned out; a reader's timeline
+# remembers which of their followees are that big and merges their recent
+# posts in on read. Post ids are time-ordered uuid7 values, so "newest
+# first" is plain id order everywhere. Deleted posts stay in timelines and
+# are dropped when the page is loaded.
+#
+# Fan-out runs on a background thread after the post commits. The store is
+# pluggable through FEED_STORE; the default keeps timelines in this process,
+# so with several workers each one sees other workers' posts once its copy
+# is rebuilt after FEED_TIMELINE_MAX_AGE seconds.
+
+ID_SIZE = 16
+
+
+class Timeline(object):
+    """Post ids newest first, packed 16 bytes each in one bytearray."""
+
+    __slots__ = ('_ids', 'size', 'celebrities', 'built_at')
+
+    def __init__(self, post_ids=(), size=800, celebrities=()):
+        self._ids = bytearray(b''.join(uuid_bytes(post_id) for post_id in post_ids[:size]))
+        self.size = size
+        self.celebrities = tuple(celebrities)
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._ids) // ID_SIZE
+
+    def _position(self, raw):
+        # first slot holding an id older than ``raw``
+        ids = self._ids
+        lo, hi = 0, len(ids) // ID_SIZE
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ids[mid * ID_SIZE:(mid + 1) * ID_SIZE] > raw:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def push(self, post_id):
+        raw = uuid_bytes(post_id)
+        ids = self._ids
+        if not ids or raw > ids[:ID_SIZE]:
+            i = 0
+        else:
+            i = self._position(raw)
+            if ids[i * ID_SIZE:(i + 1) * ID_SIZE] == raw:
+                return
+        if i >= self.size:
+            return
+        ids[i * ID_SIZE:i * ID_SIZE] = raw
+        del ids[self.size * ID_SIZE:]
+
+    def page(self, before=None, limit=20):
+        """Up to ``limit`` ids older than ``before`` (a post id), newest first."""
+        i = 0 if before is None else self._position(uuid_bytes(before))
+        ids = self._ids
+        return [uuid_str(ids[j * ID_SIZE:(j + 1) * ID_SIZE])
+                for j in range(i, min(i + limit, len(ids) // ID_SIZE))]
+
+
+class TimelineStore(object):
+    """Where materialised timelines live."""
+
+    def get(self, user_id):
+        raise NotImplementedError
+
+    def set(self, user_id, timeline):
+        raise NotImplementedError
+
+    def push(self, user_ids, post_id):
+        """Add ``post_id`` to the timelines of ``user_ids`` that exist; returns how many."""
+        raise NotImplementedError
+
+    def discard(self, user_id):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class InMemoryTimelineStore(TimelineStore):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timelines = {}
+        self.writes = 0
+
+    def get(self, user_id):
+        return self._timelines.get(user_id)
+
+    def set(self, user_id, timeline):
+        with self._lock:
+            self._timelines[user_id] = timeline
+
+    def push(self, user_ids, post_id):
+        written = 0
+        with self._lock:
+            timelines = self._timelines
+            for user_id in user_ids:
+                timeline = timelines.get(user_id)
+                if timeline is not None:
+                    timeline.push(post_id)
+                    written += 1
+            self.writes += written
+        return written
+
+    def discard(self, user_id):
+        with self._lock:
+            self._timelines.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._timelines.clear()
+
+    def stats(self):
+        with self._lock:
+            timelines = list(self._timelines.values())
+            return {
+                'timelines': len(timelines),
+                'entries': sum(len(t) for t in timelines),
+                'bytes': sum(len(t._ids) for t in timelines),
+                'writes': self.writes,
+            }
+
+
+store = InMemoryTimelineStore()
+
+
+def _settings(config):
+    return (config.get('FEED_TIMELINE_SIZE', 800), config.get('FEED_FANOUT_LIMIT', 10000),
+            config.get('FEED_TIMELINE_MAX_AGE', 300))
+
+
+def _visible(query):
+    return query.where(Posts.is_deleted.isnot(True))
+
+
+def build_timeline(user_id, config, session=None):
+    """Materialise ``user_id``'s timeline from the database (fan-out on read)."""
+    session = session or db.session
+    size, fanout_limit, _ = _settings(config)
+    followees = session.execute(
+        select(Follows.followee_id, Users.follower_count)
+        .join(Users, Users.user_id == Follows.followee_id)
+        .where(Follows.follower_id == user_id)).all()
+    celebrities = [followee for followee, count in followees if count > fanout_limit]
+    authors = [followee for followee, count in followees if count <= fanout_limit]
+    authors.append(user_id)
+    # the newest `size` posts across everyone followed
+    post_ids = session.scalars(
+        _visible(select(Posts.post_id).where(Posts.user_id.in_(authors)))
+        .order_by(Posts.post_id.desc()).limit(size)).all()
+    return Timeline(post_ids, size, celebrities)
+
+
+def get_timeline(user_id, config, session=None):
+    _, _, max_age = _settings(config)
+    timeline = store.get(user_id)
+    if timeline is None or (max_age and time.monotonic() - timeline.built_at > max_age):
+        timeline = build_timeline(user_id, config, session)
+        store.set(user_id, timeline)
+    return timeline
+
+
+def feed_page(user_id, config, before=None, limit=20, session=None):
+    """(post ids, next cursor) of ``user_id``'s feed, newest first."""
+    session = session or db.session
+    timeline = get_timeline(user_id, config, session)
+    post_ids = timeline.page(before, limit + 1)
+    if timeline.celebrities:
+        # big accounts are merged in on read instead of fanned out
+        query = _visible(select(Posts.post_id).where(Posts.user_id.in_(timeline.celebrities)))
+        if before is not None:
+            query = query.where(Posts.post_id < before)
+        recent = session.scalars(query.order_by(Posts.post_id.desc()).limit(limit + 1)).all()
+        post_ids = sorted(set(post_ids).union(recent), reverse=True)[:limit + 1]
+    if len(post_ids) > limit:
+        return post_ids[:limit], post_ids[limit - 1]
+    return post_ids, None
+
+
+def follow(follower_id, followee_id, session=None):
+    """Follow ``followee_id``; False if already following. Commits."""
+    session = session or db.session
+    exists = session.scalar(select(Follows.follow_id).where(
+        Follows.follower_id == follower_id, Follows.followee_id == followee_id))
+    if exists is not None:
+        return False
+    session.add(Follows(follower_id=follower_id, followee_id=followee_id))
+    try:
+        session.execute(update(Users).where(Users.user_id == followee_id)
+                        .values(follower_count=Users.follower_count + 1))
+        session.commit()
+    except IntegrityError:
+        # a concurrent follow of the same pair got in between the check
+        # and the insert
+        session.rollback()
+        return False
+    return True
+
+
+def unfollow(follower_id, followee_id, session=None):
+    """Stop following ``followee_id``; False if not following. Commits."""
+    session = session or db.session
+    follow_row = session.scalar(select(Follows).where(
+        Follows.follower_id == follower_id, Follows.followee_id == followee_id))
+    if follow_row is None:
+        return False
+    session.delete(follow_row)
+    session.execute(update(Users).where(Users.user_id == followee_id)
+                    .values(follower_count=Users.follower_count - 1))
+    session.commit()
+    return True
+
+
+class Fanout(object):
+    """Pushes committed posts to follower timelines on a background thread."""
+
+    def __init__(self):
+        self.app = None
+        self._queue = queue.Queue(10000)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.posts = 0
+        self.skipped = 0
+        self.writes = 0
+        self.dropped = 0
+
+    def init_app(self, app):
+        self.app = app
+        self._queue.maxsize = app.config.get('FEED_QUEUE_SIZE', 10000)
+
+    def submit(self, post_id, author_id):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work, name='feed-fanout', daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((post_id, author_id))
+        except queue.Full:
+            # followers pick the post up when their timeline is rebuilt
+            with self._lock:
+                self.dropped += 1
+
+    def join(self):
+        """Wait until every submitted post has been fanned out."""
+        self._queue.join()
+
+    def _work(self):
+        while True:
+            post_id, author_id = self._queue.get()
+            try:
+                with self.app.app_context():
+                    try:
+                        self.fan_out(post_id, author_id)
+                    except Exception:
+                        self.app.logger.exception('feed fan-out failed')
+                    finally:
+                        db.session.remove()
+            finally:
+                self._queue.task_done()
+
+    def fan_out(self, post_id, author_id, session=None):
+        session = session or db.session
+        _, fanout_limit, _ = _settings(self.app.config)
+        written = store.push((author_id,), post_id)
+        count = session.scalar(select(Users.follower_count).where(Users.user_id == author_id)) or 0
+        if count > fanout_limit:
+            with self._lock:
+                self.posts += 1
+                self.skipped += 1
+            return written
+        followers = session.execute(
+            select(Follows.follower_id).where(Follows.followee_id == author_id)
+            .execution_options(yield_per=5000))
+        for chunk in followers.partitions():
+            written += store.push((follower_id for follower_id, in chunk), post_id)
+        with self._lock:
+            self.posts += 1
+            self.writes += written
+        return written
+
+    def stats(self):
+        with self._lock:
+            return {
+                'posts': self.posts,
+                'celebrity_posts': self.skipped,
+                'timeline_writes': self.writes,
+                'writes_per_post': round(self.writes / self.posts, 2) if self.posts else 0.0,
+                'dropped': self.dropped,
+                'queued': self._queue.qsize(),
+            }
+
+
+fanout = Fanout()
+
+
+def init_app(app):
+    global store
+    path = app.config.get('FEED_STORE')
+    if path:
+        module, _, name = path.partition(':')
+        store = getattr(import_module(module), name)()
+    fanout.init_app(app)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_feed_changes(session, flush_context):
+    for obj in session.new:
+        if isinstance(obj, Posts):
+            session.info.setdefault('new_posts', []).append((obj.post_id, obj.user_id))
+    for obj in chain(session.new, session.deleted):
+        if isinstance(obj, Follows):
+            # the follower's timeline changes shape, rebuild it on next read
+            session.info.setdefault('stale_timelines', set()).add(obj.follower_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_feed_changes(session):
+    for user_id in session.info.pop('stale_timelines', ()):
+        store.discard(user_id)
+    posts = session.info.pop('new_posts', ())
+    if fanout.app is not None:
+        for post_id, author_id in posts:
+            fanout.submit(post_id, author_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_feed_changes(session):
+    session.info.pop('new_posts', None)
+    session.info.pop('stale_timelines', None)
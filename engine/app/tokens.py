@@ -0,0 +1,390 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import g
+from flask_login import UserMixin
+from sqlalchemy import delete, event, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db, login
+from app.models import TokenRevocations, Users
+from app.principals import Principal, load_principal
+
+log = logging.getLogger(__name__)
+
+
+# Signed bearer tokens. POST /token trades a password for a short-lived
+# access token carrying the user id and role and a long-lived refresh
+# token; role_required accepts "Authorization: Bearer <access token>" and
+# takes the caller from it after an HMAC check, with no session or users
+# lookup. A token is "<key id>.<payload>.<signature>" with the payload as
+# compact JSON, so keys rotate by putting the new one first in TOKEN_KEYS
+# and dropping the old one after TOKEN_REFRESH_TTL.
+#
+# Revocations (logout, refresh token reuse, and any change to a user's
+# role, active flag or password, but not a rehash of the same password)
+# are rows in token_revocations, written in the transaction that causes
+# them. A refresh uses its token up by inserting that token's row, and
+# token_id is unique, so of two concurrent uses of one refresh token only
+# one commits; the other is taken as reuse of a stolen token and revokes
+# every token of the user. Each process holds the unexpired ones
+# in memory, applies its own at commit and reloads the rest every
+# TOKEN_REVOCATION_REFRESH seconds, so a revocation made by another worker
+# takes up to that long to be seen. Rows only need to outlive the tokens
+# they revoke, so the set stays as small as the revocations of one refresh
+# token lifetime.
+
+ACCESS = 'a'
+REFRESH = 'r'
+# user fields an issued token depends on
+TOKEN_FIELDS = ('role', 'is_active', 'password_hash')
+
+Claims = namedtuple('Claims', ['user_id', 'role', 'kind', 'issued_at', 'expires_at', 'token_id'])
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class Keyring(object):
+    """HMAC keys by id; the first one signs, all of them verify."""
+
+    def __init__(self, keys):
+        if not keys:
+            raise ValueError('at least one token key is needed')
+        self.signing_kid = keys[0][0]
+        self.keys = {kid: secret for kid, secret in keys}
+
+    @classmethod
+    def from_config(cls, config):
+        """From TOKEN_KEYS ("id:secret,id:secret"), else one key derived from SECRET_KEY, else None."""
+        value = config.get('TOKEN_KEYS')
+        if value:
+            keys = [item.strip().split(':', 1) for item in value.split(',') if item.strip()]
+            return cls([(kid, secret.encode()) for kid, secret in keys])
+        if config.get('SECRET_KEY'):
+            secret = hmac.new(config['SECRET_KEY'].encode(), b'app.tokens', hashlib.sha256).digest()
+            return cls([('0', secret)])
+        return None
+
+    def _mac(self, kid, body):
+        return _b64encode(hmac.new(self.keys[kid], body.encode(), hashlib.sha256).digest())
+
+    def sign(self, payload):
+        body = self.signing_kid + '.' + _b64encode(payload)
+        return body + '.' + self._mac(self.signing_kid, body)
+
+    def verify(self, token):
+        """The payload bytes of ``token``; raises InvalidToken."""
+        try:
+            kid, payload, signature = token.split('.')
+        except (AttributeError, ValueError):
+            raise InvalidToken('malformed token')
+        if kid not in self.keys:
+            raise InvalidToken('unknown key')
+        if not hmac.compare_digest(self._mac(kid, kid + '.' + payload), signature):
+            raise InvalidToken('bad signature')
+        try:
+            return _b64decode(payload)
+        except ValueError:
+            raise InvalidToken('malformed token')
+
+
+class Revocations(object):
+    """The unexpired token_revocations rows, in memory."""
+
+    def __init__(self):
+        self.app = None
+        self.interval = 5.0
+        # user_id -> (not_before ms, expires epoch s); token_id -> expires
+        self._users = {}
+        self._tokens = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._reloading = threading.Lock()
+        self.reloads = 0
+        self.rejected = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('TOKEN_REVOCATION_REFRESH', 5.0)
+
+    def due(self):
+        loaded_at = self._loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at >= self.interval
+
+    def add(self, user_id, token_id, not_before, expires):
+        with self._lock:
+            self._add(user_id, token_id, not_before, expires)
+
+    def _add(self, user_id, token_id, not_before, expires):
+        if token_id:
+            self._tokens[token_id] = max(expires, self._tokens.get(token_id, 0))
+            return
+        current = self._users.get(user_id)
+        if current is None or current[0] < not_before:
+            self._users[user_id] = (not_before, max(expires, current[1] if current else 0))
+
+    def reload(self):
+        """Merge in every unexpired row from the database and forget expired entries."""
+        with self.app.app_context(), db.engine.connect() as connection:
+            rows = connection.execute(revocation_rows()).all()
+        self.merge(rows)
+
+    def merge(self, rows):
+        """Merge in the rows of revocation_rows(), however they were read."""
+        epoch = time.time()
+        with self._lock:
+            # revocations are never undone, so merging (rather than
+            # replacing) keeps ones committed here during the query
+            for user_id, token_id, not_before, expires_at in rows:
+                self._add(user_id, token_id, not_before, _epoch(expires_at))
+            self._users = {key: value for key, value in self._users.items() if value[1] > epoch}
+            self._tokens = {key: value for key, value in self._tokens.items() if value > epoch}
+            self._loaded_at = time.monotonic()
+            self.reloads += 1
+
+    def _refresh(self):
+        if not self.due():
+            return
+        # one thread reloads, the others carry on with what is loaded
+        if not self._reloading.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            self.reload()
+        except Exception:
+            log.exception('token revocation reload failed')
+            self._loaded_at = time.monotonic()
+        finally:
+            self._reloading.release()
+
+    def is_revoked(self, claims):
+        if self.app is not None:
+            self._refresh()
+        revoked = (claims.token_id is not None and claims.token_id in self._tokens) \
+            or claims.issued_at < self._users.get(claims.user_id, (0, 0))[0]
+        if revoked:
+            self.rejected += 1
+        return revoked
+
+    def stats(self):
+        with self._lock:
+            return {'users': len(self._users), 'tokens': len(self._tokens), 'reloads': self.reloads,
+                    'rejected': self.rejected}
+
+
+keyring = None
+access_ttl = 900
+refresh_ttl = 14 * 24 * 3600
+revocations = Revocations()
+
+
+def configure(config):
+    """Keys and lifetimes from ``config``; the async app, which reloads revocations itself, stops here."""
+    global keyring, access_ttl, refresh_ttl
+    keyring = Keyring.from_config(config)
+    access_ttl = config.get('TOKEN_ACCESS_TTL', 900)
+    refresh_ttl = config.get('TOKEN_REFRESH_TTL', 14 * 24 * 3600)
+    revocations.interval = config.get('TOKEN_REVOCATION_REFRESH', 5.0)
+
+
+def init_app(app):
+    configure(app.config)
+    revocations.init_app(app)
+
+
+def revocation_rows():
+    """The statement Revocations.merge() takes the rows of."""
+    c = TokenRevocations.__table__.c
+    return select(c.user_id, c.token_id, c.not_before, c.expires_at).where(c.expires_at > datetime.utcnow())
+
+
+def _epoch(when):
+    return (when - datetime(1970, 1, 1)).total_seconds()
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _encode(user_id, role, kind, ttl, token_id=None):
+    issued_at = _now_ms()
+    payload = {'u': user_id, 'r': role, 'k': kind, 'iat': issued_at, 'exp': issued_at // 1000 + int(ttl)}
+    if token_id is not None:
+        payload['j'] = token_id
+    return keyring.sign(json.dumps(payload, separators=(',', ':')).encode())
+
+
+def issue(user_id, role):
+    """A fresh access and refresh token for ``user_id``."""
+    if keyring is None:
+        raise RuntimeError('Token auth needs SECRET_KEY or TOKEN_KEYS')
+    return {
+        'access_token': _encode(user_id, role, ACCESS, access_ttl),
+        'refresh_token': _encode(user_id, role, REFRESH, refresh_ttl, uuid.uuid4().hex),
+        'token_type': 'Bearer',
+        'expires_in': int(access_ttl),
+    }
+
+
+def decode(token, kind=ACCESS):
+    """The Claims of a valid, unexpired, unrevoked ``token`` of ``kind``; raises InvalidToken."""
+    if keyring is None:
+        raise InvalidToken('token auth is not configured')
+    try:
+        payload = json.loads(keyring.verify(token))
+        claims = Claims(payload['u'], payload['r'], payload['k'], payload['iat'], payload['exp'], payload.get('j'))
+    except (ValueError, KeyError, TypeError):
+        raise InvalidToken('malformed token')
+    if claims.kind != kind:
+        raise InvalidToken('wrong token type')
+    if claims.expires_at <= time.time():
+        raise InvalidToken('expired token')
+    if revocations.is_revoked(claims):
+        raise InvalidToken('revoked token')
+    return claims
+
+
+def claims_principal(claims):
+    # tokens are only issued to active users and deactivation revokes them
+    return Principal(claims.user_id, claims.role, True)
+
+
+def token_principal(token):
+    """The caller an access token speaks for; raises InvalidToken."""
+    principal = claims_principal(decode(token))
+    g.principal = principal
+    return principal
+
+
+def bearer_token(headers):
+    authorization = headers.get('Authorization', '')
+    if authorization[:7].lower() == 'bearer ':
+        return authorization[7:].strip()
+    return None
+
+
+def revoke(user_id, token_id=None, session=None):
+    """Revoke one refresh token of ``user_id``, or all their tokens. Commits.
+
+    False when ``token_id`` was revoked already, by this or another process.
+    """
+    session = session or db.session
+    now = datetime.utcnow()
+    session.execute(delete(TokenRevocations).where(TokenRevocations.expires_at <= now))
+    session.add(TokenRevocations(user_id=user_id, token_id=token_id, not_before=_now_ms(),
+                                 expires_at=now + timedelta(seconds=refresh_ttl)))
+    try:
+        session.commit()
+    except IntegrityError:
+        # token_id is unique: someone else used this token up first
+        session.rollback()
+        if token_id is None:
+            raise
+        return False
+    return True
+
+
+def refresh(token, session=None):
+    """New tokens for a refresh token, which is used up; raises InvalidToken."""
+    claims = decode(token, REFRESH)
+    # the one lookup a token holder pays per access token lifetime: the
+    # role may have changed and the user may be gone
+    principal = load_principal(claims.user_id)
+    if principal is None or not principal.is_active:
+        raise InvalidToken('unknown user')
+    if not revoke(claims.user_id, claims.token_id, session):
+        # used twice: one of the two holders stole it, so neither keeps access
+        revoke(claims.user_id, None, session)
+        raise InvalidToken('reused refresh token')
+    return issue(principal.user_id, principal.role)
+
+
+def keep_tokens(session, user_id):
+    """Mark the next flush's password_hash change of ``user_id`` as a rehash of the same password."""
+    session.info.setdefault('password_rehashes', set()).add(user_id)
+
+
+@event.listens_for(Session, 'before_flush')
+def _revoke_changed_users(session, flush_context, instances):
+    now = datetime.utcnow()
+    rehashed = session.info.pop('password_rehashes', ())
+    for obj in session.dirty:
+        if not isinstance(obj, Users) or obj.user_id is None:
+            continue
+        state = inspect(obj)
+        fields = TOKEN_FIELDS if obj.user_id not in rehashed else \
+            tuple(name for name in TOKEN_FIELDS if name != 'password_hash')
+        if any(state.attrs[name].history.has_changes() for name in fields):
+            session.add(TokenRevocations(user_id=obj.user_id, not_before=_now_ms(),
+                                         expires_at=now + timedelta(seconds=refresh_ttl)))
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_revocations(session, flush_context):
+    for obj in session.new:
+        if isinstance(obj, TokenRevocations):
+            session.info.setdefault('token_revocations', []).append(
+                (obj.user_id, obj.token_id, obj.not_before, _epoch(obj.expires_at)))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_revocations(session):
+    for revocation in session.info.pop('token_revocations', ()):
+        revocations.add(*revocation)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_revocations(session):
+    session.info.pop('token_revocations', None)
+    session.info.pop('password_rehashes', None)
+
+
+class PrincipalUser(UserMixin):
+    """flask_login's current_user, backed by a Principal rather than a Users row."""
+
+    def __init__(self, principal):
+        self.principal = principal
+        self.user_id = principal.user_id
+        self.role = principal.role
+
+    def get_id(self):
+        return self.user_id
+
+    @property
+    def is_active(self):
+        return self.principal.is_active
+
+
+@login.user_loader
+def _load_user(user_id):
+    principal = load_principal(user_id)
+    return PrincipalUser(principal) if principal is not None else None
+
+
+@login.request_loader
+def _load_user_from_request(request):
+    token = bearer_token(request.headers)
+    if token is None:
+        return None
+    try:
+        return PrincipalUser(token_principal(token))
+    except InvalidToken:
+        return None
@@ -0,0 +1,4 @@
+from app.aio import create_async_app
+
+# ASGI entry point, e.g. `hypercorn asgi:app` or `uvicorn asgi:app`
+app = create_async_app()
@@ -0,0 +1,129 @@
+"""Requests/sec and p99 of the WSGI app (run.py) vs the ASGI app (asgi.py).
+
+Seeds a SQLite file, starts each server in its own process and drives
+GET /appointments from CLIENTS concurrent connections for DURATION seconds.
+The ASGI side needs quart, sqlalchemy[asyncio], aiosqlite and hypercorn.
+Run from the engine directory:
+
+    python -m benchmarks.bench_async_serving
+"""
+import asyncio
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import ENGINE_DIR, make_app, percentile, report, scale
+
+SERVERS = {
+    'wsgi_run_py': ['-c', 'from run import app; app.run(port={port}, threaded=True)'],
+    'asgi_hypercorn': ['-m', 'hypercorn', 'asgi:app', '--bind', '127.0.0.1:{port}', '--backlog', '4096'],
+}
+
+
+def _seed(url, appointments):
+    from app import db
+    from app.models import Users, Patients, Doctors, Appointments
+
+    # seed rows, not bookings: nothing to notify anyone about
+    app = make_app(SQLALCHEMY_DATABASE_URI=url, NOTIFY_EVENTS=False)
+    with app.app_context():
+        db.create_all()
+        patient_user = Users(username='patient', role='patient')
+        doctor_user = Users(username='doctor', role='doctor')
+        db.session.add_all([patient_user, doctor_user])
+        db.session.flush()
+        patient = Patients(user_id=patient_user.user_id)
+        doctor = Doctors(user_id=doctor_user.user_id)
+        db.session.add_all([patient, doctor])
+        db.session.flush()
+        db.session.add_all(Appointments(patient_id=patient.patient_id, doctor_id=doctor.doctor_id)
+                           for _ in range(appointments))
+        db.session.commit()
+        return patient_user.user_id
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server on port {} did not start'.format(port))
+
+
+async def _client(port, request, deadline, latencies, errors):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            await writer.drain()
+            status = (await reader.readline()).split(b' ', 2)[1]
+            await reader.read()
+            writer.close()
+        except (OSError, IndexError, asyncio.IncompleteReadError):
+            errors.append(time.perf_counter() - start)
+            continue
+        if status == b'200':
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(time.perf_counter() - start)
+
+
+async def _load(port, user_id, clients, duration):
+    request = ('GET /appointments?limit=20 HTTP/1.1\r\nHost: localhost\r\nuser-id: {}\r\n'
+               'Connection: close\r\n\r\n').format(user_id).encode()
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(port, request, deadline, latencies, errors) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    return {
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'ok': len(latencies),
+        'errors': len(errors),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def run(clients=1000, duration=None, appointments=200):
+    duration = duration or max(2, scale(20))
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    # every client holds a socket, and so does the server on the other end
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, clients * 4)), hard))
+
+    results = {'clients': clients, 'duration_s': duration}
+    with tempfile.TemporaryDirectory() as tmp:
+        url = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        user_id = _seed(url, appointments)
+        env = dict(os.environ, DATABASE_URL=url, PASSWORD_HASH_WORKERS='0')
+        for name, args in SERVERS.items():
+            port = _free_port()
+            command = [sys.executable] + [arg.format(port=port) for arg in args]
+            server = subprocess.Popen(command, cwd=ENGINE_DIR, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                _wait_for(port)
+                asyncio.run(_load(port, user_id, 10, 1))  # warm up caches and pools
+                results[name] = asyncio.run(_load(port, user_id, clients, duration))
+            finally:
+                server.terminate()
+                server.wait()
+    return results
+
+
+if __name__ == '__main__':
+    report('async_serving', run())
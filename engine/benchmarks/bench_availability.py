@@ -0,0 +1,143 @@
+"""Availability lookups for a doctor with a long appointment history.
+
+Seeds one doctor with HISTORY past appointments and UPCOMING ones over the
+next weeks, then times a day's free slots three ways: the cached
+DoctorSchedule, a cache miss (schedule rebuilt from the (doctor_id,
+starts_at) index), and the scan this replaces, which loads every
+appointment of the doctor and parses appointment_time. Also times the
+booking path. Run from the engine directory:
+
+    python -m benchmarks.bench_availability
+"""
+import os
+import random
+import tempfile
+from datetime import date, datetime, timedelta
+
+from benchmarks.common import Timer, make_app, percentile, report, scale
+
+
+def seed(db, history, upcoming, batch=50000):
+    from app.db_types import new_id
+    from app.models import Users, Patients, Doctors, Appointments
+
+    patient_user = Users(username='bench-patient', role='patient')
+    doctor_user = Users(username='bench-doctor', role='doctor')
+    db.session.add_all([patient_user, doctor_user])
+    db.session.flush()
+    patient = Patients(user_id=patient_user.user_id)
+    doctor = Doctors(user_id=doctor_user.user_id)
+    db.session.add_all([patient, doctor])
+    db.session.commit()
+
+    rng = random.Random(5)
+    today = datetime.combine(date.today(), datetime.min.time())
+    # 16 half-hour slots a day from 09:00
+    when = [today - timedelta(days=1 + i // 16, minutes=-(540 + 30 * (i % 16))) for i in range(history)]
+    when += [today + timedelta(days=1 + i // 8, minutes=540 + 60 * (i % 8)) for i in range(upcoming)]
+    for offset in range(0, len(when), batch):
+        rows = []
+        for start in when[offset:offset + batch]:
+            rows.append({
+                'appointment_id': new_id(), 'patient_id': patient.patient_id, 'doctor_id': doctor.doctor_id,
+                'appointment_date': start.replace(hour=0, minute=0),
+                'appointment_time': start.strftime('%I:%M %p') if rng.random() < 0.5 else start.strftime('%H:%M'),
+                'starts_at': start, 'ends_at': start + timedelta(minutes=30),
+                'appointment_status': 'completed' if start < today else 'scheduled',
+                'is_active': True, 'is_deleted': False, 'updated_at': start,
+            })
+        db.session.execute(Appointments.__table__.insert(), rows)
+    db.session.commit()
+    return doctor.doctor_id, patient.patient_id
+
+
+def scan_availability(db, doctor_id, day, config):
+    """The lookup without slot columns: every appointment, parsed in Python."""
+    from app.models import Appointments
+    from app.scheduling import _settings, parse_time
+
+    day_start, day_end, step, _ = _settings(config)
+    busy = []
+    for appointment_date, appointment_time, status in db.session.query(
+            Appointments.appointment_date, Appointments.appointment_time, Appointments.appointment_status) \
+            .filter(Appointments.doctor_id == doctor_id):
+        parsed = parse_time(appointment_time)
+        if status == 'cancelled' or appointment_date is None or parsed is None:
+            continue
+        start = datetime.combine(appointment_date.date(), parsed)
+        busy.append((start, start + timedelta(minutes=30)))
+    slots = []
+    slot = datetime.combine(day, day_start)
+    while slot + timedelta(minutes=step) <= datetime.combine(day, day_end):
+        end = slot + timedelta(minutes=step)
+        if not any(s < end and e > slot for s, e in busy):
+            slots.append(slot)
+        slot = end
+    return slots
+
+
+def _time(fn, samples):
+    timings = []
+    for _ in range(samples):
+        with Timer() as t:
+            fn()
+        timings.append(t.elapsed)
+    return {'p50_ms': round(percentile(timings, 50) * 1000, 3),
+            'p99_ms': round(percentile(timings, 99) * 1000, 3)}
+
+
+def run(history=None, upcoming=None, samples=50):
+    from app import db
+    from app.scheduling import SlotUnavailable, availability, book, get_schedule, schedule_cache
+
+    history = history or scale(50000)
+    upcoming = upcoming or max(8, scale(400))
+    results = {'history': history, 'upcoming': upcoming}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'bench.db'))
+        config = app.config
+        with app.app_context():
+            db.create_all()
+            with Timer() as t:
+                doctor_id, patient_id = seed(db, history, upcoming)
+            results['seed_seconds'] = round(t.elapsed, 2)
+            day = date.today() + timedelta(days=2)
+
+            assert availability(doctor_id, day, 30, config) == scan_availability(db, doctor_id, day, config)
+            results['scan'] = _time(lambda: scan_availability(db, doctor_id, day, config), max(3, samples // 10))
+
+            def cold():
+                schedule_cache.clear()
+                availability(doctor_id, day, 30, config)
+            results['cache_miss'] = _time(cold, samples)
+            results['cached'] = _time(lambda: availability(doctor_id, day, 30, config), samples * 10)
+
+            schedule = get_schedule(doctor_id)
+            probe = datetime.combine(day, datetime.min.time()) + timedelta(hours=9)
+            checks = 100000
+            with Timer() as t:
+                for i in range(checks):
+                    schedule.conflicts(probe, probe + timedelta(minutes=30))
+            results['conflict_checks_per_sec'] = round(checks / t.elapsed)
+
+            # upcoming appointments start on the hour, so :30 slots are free
+            slots = [datetime.combine(date.today() + timedelta(days=d), datetime.min.time()) + timedelta(hours=13, minutes=30)
+                     for d in range(3, 3 + samples)]
+            timings, rejected = [], 0
+            for starts_at in slots + slots[:10]:
+                with Timer() as t:
+                    try:
+                        book(doctor_id, patient_id, starts_at, 30, config)
+                    except SlotUnavailable:
+                        rejected += 1
+                timings.append(t.elapsed)
+            results['booking'] = {'p50_ms': round(percentile(timings, 50) * 1000, 3),
+                                  'p99_ms': round(percentile(timings, 99) * 1000, 3),
+                                  'double_bookings_rejected': rejected}
+            db.session.remove()
+    results['speedup_cached_vs_scan'] = round(results['scan']['p50_ms'] / results['cached']['p50_ms'])
+    return results
+
+
+if __name__ == '__main__':
+    report('availability', run())
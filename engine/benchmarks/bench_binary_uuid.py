@@ -0,0 +1,121 @@
+"""Storage and join cost of String(60) uuid4 keys vs BINARY(16) uuid7 keys.
+
+Builds the same users/doctors/patients/appointments dataset on the schema
+before and after the binary uuid revisions and reports database and index
+size, insert rate and the latency of the doctor -> appointments -> patient
+-> user join. Run from the engine directory:
+
+    python -m benchmarks.bench_binary_uuid
+"""
+import os
+import random
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from benchmarks.common import Timer, migrate, percentile, report, scale
+
+STRING = '9db10bde4be3'
+BINARY = 'c7d3e8f1a6b2'
+
+JOIN = sa.text(
+    'SELECT a.appointment_id, a.appointment_date, p.first_name, u.email '
+    'FROM appointments a JOIN patients p ON p.patient_id = a.patient_id '
+    'JOIN users u ON u.user_id = p.user_id '
+    'WHERE a.doctor_id = :doctor_id ORDER BY a.appointment_date')
+
+
+def _dataset(make_id, doctors, patients, appointments):
+    rng = random.Random(7)
+    start = datetime(2024, 1, 1)
+    users, doctor_rows, patient_rows, appointment_rows = [], [], [], []
+    for i in range(doctors + patients):
+        users.append({'user_id': make_id(), 'username': 'user%d' % i, 'email': 'user%d@x.org' % i,
+                      'password_hash': 'x', 'role': 'doctor' if i < doctors else 'patient',
+                      'is_active': True})
+    for i, user in enumerate(users[:doctors]):
+        doctor_rows.append({'doctor_id': make_id(), 'user_id': user['user_id'],
+                            'first_name': 'doc%d' % i, 'updated_at': start, 'is_deleted': False})
+    for i, user in enumerate(users[doctors:]):
+        patient_rows.append({'patient_id': make_id(), 'user_id': user['user_id'],
+                             'first_name': 'pat%d' % i, 'updated_at': start, 'is_deleted': False})
+    for i in range(appointments):
+        when = start + timedelta(minutes=15 * i)
+        appointment_rows.append({'appointment_id': make_id(),
+                                 'doctor_id': rng.choice(doctor_rows)['doctor_id'],
+                                 'patient_id': rng.choice(patient_rows)['patient_id'],
+                                 'appointment_date': when, 'updated_at': when, 'is_deleted': False})
+    return [('users', users), ('doctors', doctor_rows), ('patients', patient_rows),
+            ('appointments', appointment_rows)]
+
+
+def _index_bytes(conn):
+    try:
+        rows = conn.execute(sa.text(
+            "SELECT name, SUM(pgsize) FROM dbstat WHERE name IN "
+            "(SELECT name FROM sqlite_master WHERE type = 'index') GROUP BY name")).fetchall()
+    except sa.exc.OperationalError:
+        return None  # SQLite built without SQLITE_ENABLE_DBSTAT_VTAB
+    return sum(size for _, size in rows)
+
+
+def _measure(revision, make_id, doctors, patients, appointments, lookups, batch=1000):
+    data = _dataset(make_id, doctors, patients, appointments)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        engine = sa.create_engine('sqlite:///' + path)
+        migrate(engine, revision)
+        metadata = sa.MetaData()
+        inserted = 0
+        with Timer() as insert:
+            for name, rows in data:
+                table = sa.Table(name, metadata, autoload_with=engine)
+                for start in range(0, len(rows), batch):
+                    with engine.begin() as conn:
+                        conn.execute(table.insert(), rows[start:start + batch])
+                inserted += len(rows)
+        with engine.connect() as conn:
+            conn.exec_driver_sql('VACUUM')
+            index_bytes = _index_bytes(conn)
+        size = os.path.getsize(path)
+
+        doctor_ids = [row['doctor_id'] for row in data[1][1]]
+        rng = random.Random(11)
+        samples = []
+        with engine.connect() as conn:
+            for _ in range(lookups):
+                doctor_id = rng.choice(doctor_ids)
+                with Timer() as t:
+                    conn.execute(JOIN, {'doctor_id': doctor_id}).fetchall()
+                samples.append(t.elapsed)
+        engine.dispose()
+    return {
+        'db_bytes': size,
+        'index_bytes': index_bytes,
+        'insert_rows_per_sec': round(inserted / insert.elapsed),
+        'join_p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'join_p95_ms': round(percentile(samples, 95) * 1000, 3),
+    }
+
+
+def run(doctors=None, patients=None, appointments=None, lookups=2000):
+    from app.db_types import uuid7
+
+    doctors = doctors or scale(2000)
+    patients = patients or scale(50000)
+    appointments = appointments or scale(500000)
+    string = _measure(STRING, lambda: str(uuid.uuid4()), doctors, patients, appointments, lookups)
+    binary = _measure(BINARY, lambda: uuid7().bytes, doctors, patients, appointments, lookups)
+    results = {'doctors': doctors, 'patients': patients, 'appointments': appointments,
+               'string_uuid4': string, 'binary_uuid7': binary,
+               'db_size_ratio': round(binary['db_bytes'] / string['db_bytes'], 3),
+               'join_p50_speedup': round(string['join_p50_ms'] / max(binary['join_p50_ms'], 1e-6), 2)}
+    if string['index_bytes'] and binary['index_bytes']:
+        results['index_size_ratio'] = round(binary['index_bytes'] / string['index_bytes'], 3)
+    return results
+
+
+if __name__ == '__main__':
+    report('binary_uuid', run())
@@ -0,0 +1,85 @@
+"""Bulk notification inserts through app.notifications vs one ORM add per row.
+
+Seeds USERS users and sends TYPES broadcasts to all of them (USERS * TYPES
+notifications, 1M by default) with notify(), then repeats one broadcast to
+time the dedupe path, and runs one broadcast through the background
+dispatcher. The ORM baselines add ORM_ROWS Notifications one at a time with
+db.session.add, committing each row (the pattern the routes use) or every
+BATCH_SIZE rows; committing every row is slow enough that ORM_ROWS
+defaults to 20k and the comparison is by rate. Run from the engine directory:
+
+    python -m benchmarks.bench_bulk_notifications
+"""
+import os
+import tempfile
+
+from benchmarks.common import Timer, make_app, report, scale
+
+
+def seed_users(db, users, batch=50000):
+    from app.db_types import new_id
+    from app.models import Users
+
+    for offset in range(0, users, batch):
+        db.session.execute(Users.__table__.insert(), [{
+            'user_id': new_id(), 'username': 'user%d' % i, 'role': 'patient', 'is_active': True,
+        } for i in range(offset, min(offset + batch, users))])
+    db.session.commit()
+
+
+def run(users=None, types=10, orm_rows=None, batch_size=1000):
+    from app import db
+    from app.models import Notifications
+    from app.notifications import broadcast, dispatcher, role_recipients
+
+    users = users or scale(100000)
+    orm_rows = orm_rows or scale(20000)
+    results = {'users': users, 'broadcasts': types, 'batch_size': batch_size}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'bench.db'),
+                       NOTIFY_BATCH_SIZE=batch_size)
+        with app.app_context():
+            db.create_all()
+            seed_users(db, users)
+            user_ids = list(role_recipients('patient'))
+
+            with Timer() as t:
+                totals = [broadcast(user_ids, 'reminder-%d' % n, 'Your appointment is tomorrow',
+                                    '/appointments/%d' % n, batch_size) for n in range(types)]
+            inserted = sum(s.inserted for s in totals)
+            results['bulk'] = {'rows': inserted, 'seconds': round(t.elapsed, 2),
+                               'rows_per_sec': round(inserted / t.elapsed)}
+
+            with Timer() as t:
+                again = broadcast(user_ids, 'reminder-0', 'Your appointment is tomorrow',
+                                  '/appointments/0', batch_size)
+            results['dedupe'] = {'rows_checked': users, 'duplicates': again.duplicates,
+                                 'inserted': again.inserted, 'seconds': round(t.elapsed, 2)}
+
+            job = dispatcher.submit(lambda: ((user_id, 'dispatched', 'Hello', None)
+                                             for user_id in role_recipients('patient')))
+            job.wait()
+            results['dispatcher'] = dispatcher.stats()
+
+            for name, commit_every in (('orm_per_row', 1), ('orm_batched', batch_size)):
+                db.session.query(Notifications).delete()
+                db.session.commit()
+                with Timer() as t:
+                    for i in range(orm_rows):
+                        db.session.add(Notifications(user_id=user_ids[i % users], notification_type=name,
+                                                     notification_message='Your appointment is tomorrow',
+                                                     notification_url='/appointments/orm'))
+                        if (i + 1) % commit_every == 0:
+                            db.session.commit()
+                    db.session.commit()
+                results[name] = {'rows': orm_rows, 'seconds': round(t.elapsed, 2),
+                                 'rows_per_sec': round(orm_rows / t.elapsed)}
+            db.session.remove()
+    results['speedup'] = {name: round(results['bulk']['rows_per_sec'] / results[name]['rows_per_sec'], 1)
+                          for name in ('orm_per_row', 'orm_batched')}
+    return results
+
+
+if __name__ == '__main__':
+    report('bulk_notifications', run())
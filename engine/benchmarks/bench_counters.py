@@ -0,0 +1,99 @@
+"""A viral post: like throughput with counters updated per like vs buffered.
+
+LIKES distinct users like one post through app.counters.like(), first with
+COUNTER_FLUSH_INTERVAL=0 (UPDATE posts in every liking transaction), then
+with the coalescing buffer. Reports likes/sec, the number of UPDATEs the
+posts table took and whether the counter matches COUNT(*) afterwards. Also
+times reading the counts of a page of PAGE posts from the columns against
+COUNT(*) over post_likes. Run from the engine directory:
+
+    python -m benchmarks.bench_counters
+"""
+import os
+import tempfile
+
+from benchmarks.common import Timer, make_app, report, scale
+
+
+def seed(db, users, posts, batch=50000):
+    from app.db_types import new_id
+    from app.models import Posts, Users
+
+    user_ids = [new_id() for _ in range(users)]
+    for offset in range(0, users, batch):
+        db.session.execute(Users.__table__.insert(), [{
+            'user_id': user_id, 'username': 'user%d' % (offset + i), 'role': 'patient', 'is_active': True,
+        } for i, user_id in enumerate(user_ids[offset:offset + batch])])
+    post_ids = [new_id() for _ in range(posts)]
+    db.session.execute(Posts.__table__.insert(), [{
+        'post_id': post_id, 'user_id': user_ids[0], 'is_active': True, 'is_deleted': False,
+    } for post_id in post_ids])
+    db.session.commit()
+    return user_ids, post_ids
+
+
+def _likes(app, user_ids, post_id):
+    from app import db
+    from app.counters import buffer, like
+    from app.models import Post_likes, Posts
+    from app.sqlcount import count_queries
+
+    with app.app_context():
+        with count_queries(db.engine) as queries, Timer() as t:
+            for user_id in user_ids:
+                like(Post_likes, post_id, user_id)
+            # a repeat like must not count twice
+            like(Post_likes, post_id, user_ids[0])
+            buffer.flush()
+        updates = sum(1 for s in queries.statements if s.startswith('UPDATE posts'))
+        stored = db.session.get(Posts, post_id).like_count
+        actual = db.session.query(Post_likes).filter_by(post_id=post_id).count()
+        db.session.remove()
+    return {'likes_per_sec': round(len(user_ids) / t.elapsed), 'counter_updates': updates,
+            'like_count': stored, 'count_star': actual, 'consistent': stored == actual}
+
+
+def run(likes=None, page=20):
+    from app import db
+    from app.counters import buffer
+    from app.models import Post_likes, Posts
+    from sqlalchemy import func, select
+
+    likes = likes or scale(10000)
+    results = {'likes': likes}
+    with tempfile.TemporaryDirectory() as tmp:
+        url = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        app = make_app(SQLALCHEMY_DATABASE_URI=url, COUNTER_FLUSH_INTERVAL=0)
+        with app.app_context():
+            db.create_all()
+            user_ids, post_ids = seed(db, likes, page + 1)
+            db.session.remove()
+        results['per_like_update'] = _likes(app, user_ids, post_ids[0])
+
+        app = make_app(SQLALCHEMY_DATABASE_URI=url, COUNTER_FLUSH_INTERVAL=1.0)
+        results['buffered'] = _likes(app, user_ids, post_ids[1])
+        results['buffered']['flushes'] = buffer.stats()['flushes']
+
+        with app.app_context():
+            # spread some likes over the page
+            db.session.execute(Post_likes.__table__.insert(), [{
+                'post_like_id': '%08x-0000-7000-8000-%012x' % (i, j), 'post_id': post_ids[2 + i],
+                'user_id': user_id, 'is_deleted': False,
+            } for i in range(page - 1) for j, user_id in enumerate(user_ids[:200])])
+            db.session.commit()
+            ids = post_ids[:page]
+            with Timer() as t:
+                for _ in range(100):
+                    db.session.execute(select(Posts.post_id, Posts.like_count).where(Posts.post_id.in_(ids))).all()
+            results['page_counts_column_ms'] = round(t.elapsed * 10, 3)
+            with Timer() as t:
+                for _ in range(100):
+                    db.session.execute(select(Post_likes.post_id, func.count())
+                                       .where(Post_likes.post_id.in_(ids)).group_by(Post_likes.post_id)).all()
+            results['page_counts_count_star_ms'] = round(t.elapsed * 10, 3)
+            db.session.remove()
+    return results
+
+
+if __name__ == '__main__':
+    report('counters', run())
@@ -0,0 +1,79 @@
+"""Doctor search index build time and query latency at 100k doctors.
+
+Run from the engine directory: python -m benchmarks.bench_doctor_search
+"""
+import random
+import uuid
+
+from benchmarks.common import Timer, percentile, report, scale
+
+SPECIALTIES = ['Cardiology', 'Dermatology', 'Neurology', 'Oncology', 'Pediatrics',
+               'Psychiatry', 'Radiology', 'Surgery', 'Urology', 'Family Medicine']
+CITIES = [('New York', 'NY', '100'), ('Boston', 'MA', '021'), ('Chicago', 'IL', '606'),
+          ('Houston', 'TX', '770'), ('Seattle', 'WA', '981'), ('Miami', 'FL', '331')]
+FIRST = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda',
+         'Ahmed', 'Fatima', 'Wei', 'Mei', 'Carlos', 'Sofia', 'Ivan', 'Olga']
+LAST = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+        'Smithson', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Wilson', 'Anderson']
+
+
+def synthetic_doctors(n, seed=7):
+    rng = random.Random(seed)
+    for _ in range(n):
+        city, state, zip_prefix = rng.choice(CITIES)
+        yield {
+            'doctor_id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'first_name': rng.choice(FIRST),
+            'middle_name': None,
+            'last_name': rng.choice(LAST) + ('' if rng.random() < 0.7 else str(rng.randint(1, 999))),
+            'specialty': rng.choice(SPECIALTIES),
+            'city': city,
+            'state': state,
+            'zip_code': zip_prefix + '%02d' % rng.randint(0, 99),
+            'gender': rng.choice(['male', 'female']),
+            'is_active': rng.random() < 0.95,
+            'is_deleted': False,
+        }
+
+
+QUERIES = {
+    'cardiologist_near_10001_named_smi': dict(q='smi', zip_code='10001', filters={'specialty': 'cardiology'}),
+    'name_prefix_only': dict(q='smi'),
+    'facets_only': dict(filters={'specialty': 'neurology', 'state': 'wa', 'is_active': True}),
+    'with_facet_counts': dict(filters={'state': 'ny'}, facets=('specialty', 'gender')),
+    'match_all': dict(),
+}
+
+
+def run(doctors=None, samples=200):
+    from app.search import DoctorIndex
+
+    doctors = doctors or scale(100000)
+    docs = list(synthetic_doctors(doctors))
+    index = DoctorIndex()
+    with Timer() as t:
+        index.load(docs)
+    results = {'doctors': doctors, 'build_seconds': round(t.elapsed, 2), 'queries': {}}
+
+    for name, kwargs in QUERIES.items():
+        timings = []
+        for _ in range(samples):
+            with Timer() as t:
+                total, _, _ = index.search(limit=20, **kwargs)
+            timings.append(t.elapsed * 1000)
+        results['queries'][name] = {'matches': total,
+                                    'p50_ms': round(percentile(timings, 50), 3),
+                                    'p99_ms': round(percentile(timings, 99), 3)}
+
+    timings = []
+    for doc in docs[:samples]:
+        doc = dict(doc, last_name='Renamed', city='Boston')
+        with Timer() as t:
+            index.add(doc)
+        timings.append(t.elapsed * 1000)
+    results['incremental_update_p50_ms'] = round(percentile(timings, 50), 3)
+    return results
+
+
+if __name__ == '__main__':
+    report('doctor_search', run())
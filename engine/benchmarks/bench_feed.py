@@ -0,0 +1,125 @@
+"""/feed read latency and fan-out write amplification.
+
+Seeds USERS users who each follow FOLLOWS random accounts, CELEBRITIES
+accounts followed by a tenth of everyone (above FEED_FANOUT_LIMIT, so
+merged on read), and POSTS existing posts. Materialises the timelines of
+ACTIVE users, writes NEW_POSTS posts through the ORM and reports timeline
+writes per post, then times GET /feed from warm timelines against
+building each feed from the follow graph on every request. Run from the
+engine directory:
+
+    python -m benchmarks.bench_feed
+"""
+import os
+import random
+import tempfile
+
+from benchmarks.common import Timer, make_app, percentile, report, scale
+
+
+def seed(db, users, follows, celebrities, posts, batch=50000):
+    from app.db_types import new_id
+    from app.models import Follows, Posts, Users
+
+    rng = random.Random(11)
+    user_ids = [new_id() for _ in range(users)]
+    stars = user_ids[:celebrities]
+    fans = max(1, users // 10)
+    counts = dict.fromkeys(user_ids, 0)
+    edges = set()
+    for i, follower in enumerate(user_ids):
+        for followee in rng.sample(user_ids, follows):
+            if followee != follower:
+                edges.add((follower, followee))
+        if i < fans * celebrities:
+            edges.add((follower, stars[i % celebrities]))
+    edges.discard(None)
+    for _, followee in edges:
+        counts[followee] += 1
+
+    for offset in range(0, users, batch):
+        db.session.execute(Users.__table__.insert(), [{
+            'user_id': user_id, 'username': 'user%d' % (offset + i), 'role': 'patient',
+            'is_active': True, 'follower_count': counts[user_id],
+        } for i, user_id in enumerate(user_ids[offset:offset + batch])])
+    edges = list(edges)
+    for offset in range(0, len(edges), batch):
+        db.session.execute(Follows.__table__.insert(), [{
+            'follow_id': new_id(), 'follower_id': follower, 'followee_id': followee,
+        } for follower, followee in edges[offset:offset + batch]])
+    for offset in range(0, posts, batch):
+        db.session.execute(Posts.__table__.insert(), [{
+            'post_id': new_id(), 'user_id': rng.choice(user_ids), 'post': 'post %d' % i,
+            'is_active': True, 'is_deleted': False,
+        } for i in range(offset, min(offset + batch, posts))])
+    db.session.commit()
+    return user_ids, len(edges)
+
+
+def run(users=None, follows=20, celebrities=5, posts=None, active=None, new_posts=None, samples=200):
+    from app import db
+    from app.models import Posts
+    from app.timelines import build_timeline, fanout, get_timeline, store
+
+    users = users or scale(100000)
+    posts = posts or scale(200000)
+    active = active or max(1, users // 5)
+    new_posts = new_posts or scale(2000)
+    follows = min(follows, users - 1)
+    results = {'users': users, 'follows_per_user': follows, 'celebrities': celebrities,
+               'active_timelines': active}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'bench.db'),
+                       FEED_FANOUT_LIMIT=max(1, users // 20), FEED_TIMELINE_MAX_AGE=0)
+        config = app.config
+        with app.app_context():
+            db.create_all()
+            with Timer() as t:
+                user_ids, edges = seed(db, users, follows, celebrities, posts)
+            results['follow_edges'] = edges
+            results['seed_seconds'] = round(t.elapsed, 2)
+
+            rng = random.Random(13)
+            readers = rng.sample(user_ids, active)
+            with Timer() as t:
+                for user_id in readers:
+                    get_timeline(user_id, config)
+            results['materialise_ms_per_timeline'] = round(t.elapsed / active * 1000, 3)
+
+            with Timer() as t:
+                for i in range(new_posts):
+                    db.session.add(Posts(user_id=rng.choice(user_ids), post='new %d' % i))
+                    db.session.commit()
+                fanout.join()
+            results['write'] = dict(fanout.stats(), posts_per_sec=round(new_posts / t.elapsed))
+            results['store'] = store.stats()
+            results['store']['bytes_per_timeline'] = round(results['store']['bytes'] / max(1, results['store']['timelines']))
+
+        client = app.test_client()
+        sample = rng.sample(readers, min(samples, active))
+        for name in ('warm', 'fan_out_on_read'):
+            timings = []
+            for user_id in sample:
+                if name == 'fan_out_on_read':
+                    store.discard(user_id)
+                with Timer() as t:
+                    response = client.get('/feed', headers={'user-id': user_id})
+                timings.append(t.elapsed)
+                assert response.status_code == 200
+            results[name] = {'p50_ms': round(percentile(timings, 50) * 1000, 3),
+                             'p99_ms': round(percentile(timings, 99) * 1000, 3)}
+
+        with app.app_context():
+            timings = []
+            for user_id in sample[:20]:
+                with Timer() as t:
+                    build_timeline(user_id, config)
+                timings.append(t.elapsed)
+            results['build_timeline_p50_ms'] = round(percentile(timings, 50) * 1000, 3)
+            db.session.remove()
+    return results
+
+
+if __name__ == '__main__':
+    report('feed', run())
@@ -0,0 +1,113 @@
+"""Repeated profile and document list fetches with and without validators.
+
+Seeds DOCTORS doctor profiles and a patient with DOCUMENTS documents, then
+fetches REQUESTS random profiles and the first /documents page three ways:
+unconditionally, revalidating with If-None-Match (a 304 once the client
+holds the ETag), and unconditionally with RESPONSE_CACHE_SIZE on. Reports
+latency and the response bytes sent per request. Run from the engine
+directory:
+
+    python -m benchmarks.bench_http_cache
+"""
+import os
+import random
+import tempfile
+
+from benchmarks.common import Timer, make_app, percentile, report, scale
+
+
+def seed(db, doctors, documents, batch=10000):
+    from app.db_types import new_id
+    from app.models import Doctors, Documents, Patients, Users
+
+    doctor_ids = []
+    for offset in range(0, doctors, batch):
+        users = [new_id() for _ in range(offset, min(offset + batch, doctors))]
+        db.session.execute(Users.__table__.insert(), [{
+            'user_id': user_id, 'username': 'doctor%d' % (offset + i), 'role': 'doctor', 'is_active': True,
+        } for i, user_id in enumerate(users)])
+        rows = [{
+            'doctor_id': new_id(), 'user_id': user_id, 'first_name': 'First%d' % (offset + i),
+            'last_name': 'Last%d' % (offset + i), 'specialty': 'cardiology', 'city': 'Springfield',
+            'qualification': 'MD, board certified in internal medicine and cardiology',
+            'bio': 'Practising for %d years. ' % (i % 40) * 6, 'is_active': True, 'is_deleted': False,
+        } for i, user_id in enumerate(users)]
+        db.session.execute(Doctors.__table__.insert(), rows)
+        doctor_ids.extend(row['doctor_id'] for row in rows)
+    user = Users(username='patient', role='patient', is_active=True)
+    db.session.add(user)
+    db.session.flush()
+    patient = Patients(user_id=user.user_id)
+    db.session.add(patient)
+    db.session.flush()
+    db.session.execute(Documents.__table__.insert(), [{
+        'document_id': new_id(), 'patient_id': patient.patient_id, 'doctor_id': doctor_ids[i % len(doctor_ids)],
+        'document_name': 'Lab report %d' % i, 'document_type': 'lab',
+        'document_url': '/documents/%d/file' % i, 'is_active': True, 'is_deleted': False,
+    } for i in range(documents)])
+    db.session.commit()
+    return doctor_ids, user.user_id
+
+
+def _fetch(client, paths, headers, etags=None):
+    timings = []
+    sent = 0
+    statuses = set()
+    for path in paths:
+        request_headers = dict(headers)
+        if etags is not None and path in etags:
+            request_headers['If-None-Match'] = etags[path]
+        with Timer() as t:
+            response = client.get(path, headers=request_headers)
+        timings.append(t.elapsed)
+        statuses.add(response.status_code)
+        sent += len(response.get_data()) + sum(len(k) + len(v) + 4 for k, v in response.headers.items())
+        if etags is not None:
+            etags[path] = response.headers['ETag']
+    return {'p50_ms': round(percentile(timings, 50) * 1000, 3), 'p99_ms': round(percentile(timings, 99) * 1000, 3),
+            'bytes_per_request': round(sent / len(paths)), 'statuses': sorted(statuses)}
+
+
+def run(doctors=None, documents=500, requests=None, hot=100):
+    from app import db
+
+    doctors = doctors or scale(20000)
+    requests = requests or scale(5000)
+    results = {'doctors': doctors, 'documents_per_patient': documents, 'requests': requests, 'distinct_profiles': hot}
+    with tempfile.TemporaryDirectory() as tmp:
+        url = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        app = make_app(SQLALCHEMY_DATABASE_URI=url)
+        with app.app_context():
+            db.create_all()
+            doctor_ids, patient_user = seed(db, doctors, documents)
+            db.session.remove()
+
+        rng = random.Random(5)
+        hot_ids = rng.sample(doctor_ids, min(hot, doctors))
+        profiles = ['/doctors/%s' % rng.choice(hot_ids) for _ in range(requests)]
+        lists = ['/documents'] * max(1, requests // 10)
+        patient = {'user-id': patient_user}
+
+        client = app.test_client()
+        results['profile'] = {'full': _fetch(client, profiles, {})}
+        etags = {}
+        _fetch(client, set(profiles), {}, etags)
+        results['profile']['if_none_match'] = _fetch(client, profiles, {}, etags)
+        results['documents'] = {'full': _fetch(client, lists, patient)}
+        etags = {}
+        _fetch(client, lists[:1], patient, etags)
+        results['documents']['if_none_match'] = _fetch(client, lists, patient, etags)
+
+        cached = make_app(SQLALCHEMY_DATABASE_URI=url, RESPONSE_CACHE_SIZE=10000).test_client()
+        results['profile']['response_cache'] = _fetch(cached, profiles, {})
+        results['documents']['response_cache'] = _fetch(cached, lists, patient)
+
+        for name in ('profile', 'documents'):
+            full = results[name]['full']['bytes_per_request']
+            results[name]['bandwidth_saved_pct'] = round(
+                100 * (1 - results[name]['if_none_match']['bytes_per_request'] / full), 1)
+    return results
+
+
+if __name__ == '__main__':
+    report('http_cache', run())
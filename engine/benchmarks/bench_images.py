@@ -0,0 +1,129 @@
+"""Picture derivative throughput and cache hit latency.
+
+Makes IMAGES distinct WIDTH x HEIGHT JPEG photos and renders every
+IMAGE_SIZES box in every IMAGE_FORMATS for each: one image at a time per
+derivative with a full decode (what resizing on request does), in process
+with app.images.render (one draft-mode decode per image), and through the
+IMAGE_WORKERS process pool. Then times GET /pictures/<sha>?size=small from
+the disk cache, a 304 revalidation, and a request for an evicted
+derivative. Needs Pillow. Run from the engine directory:
+
+    python -m benchmarks.bench_images
+"""
+import io
+import os
+import tempfile
+
+from benchmarks.common import Timer, make_app, percentile, report, scale
+
+
+def _photo(seed, width, height):
+    from PIL import Image
+
+    image = Image.effect_mandelbrot((width, height), (-2.0 + seed * 0.01, -1.0, 1.0, 1.0), 60)
+    buf = io.BytesIO()
+    Image.merge('RGB', (image, image.rotate(180), image.transpose(Image.FLIP_LEFT_RIGHT))) \
+        .save(buf, 'JPEG', quality=90)
+    return buf.getvalue()
+
+
+def _full_decode(source, targets, quality):
+    from PIL import Image
+    from app.images import FORMATS
+
+    for path, box, fmt in targets:
+        with Image.open(source) as image:
+            image = image.convert('RGB')
+            image.thumbnail((box, box), Image.LANCZOS)
+            image.save(path, FORMATS[fmt][0], quality=quality)
+
+
+def _timings(client, path, samples, headers=None):
+    timings = []
+    for _ in range(samples):
+        with Timer() as t:
+            response = client.get(path, headers=headers)
+        timings.append(t.elapsed)
+    return response, {'p50_ms': round(percentile(timings, 50) * 1000, 3),
+                      'p99_ms': round(percentile(timings, 99) * 1000, 3)}
+
+
+def run(images=None, width=3000, height=2000, samples=500):
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return {'skipped': 'Pillow is not installed'}
+    from app import db, storage
+    from app.images import derivative_name, derivatives, render
+    from app.models import Doctors, Users
+
+    images = images or scale(100)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'bench.db'),
+                       STORAGE_ROOT=os.path.join(tmp, 'files'))
+        per_image = len(derivatives.sizes) * len(derivatives.formats)
+        results = {'images': images, 'source': '%dx%d' % (width, height), 'derivatives_per_image': per_image,
+                   'workers': derivatives.workers, 'cpus': os.cpu_count()}
+
+        sources = []
+        for i in range(images):
+            stored = storage.save(io.BytesIO(_photo(i, width, height)))
+            sources.append(stored.sha256)
+        results['source_kb'] = round(stored.size / 1024)
+
+        def targets(sha256, where):
+            return [(os.path.join(where, derivative_name(sha256, size, fmt)), box, fmt)
+                    for size, box in derivatives.sizes.items() for fmt in derivatives.formats]
+
+        scratch = os.path.join(tmp, 'scratch')
+        os.makedirs(scratch)
+        sample = sources[:max(1, images // 10)]
+        with Timer() as t:
+            for sha256 in sample:
+                _full_decode(storage.backend.local_path(sha256), targets(sha256, scratch), derivatives.quality)
+        results['full_decode_per_derivative'] = {
+            'derivatives_per_sec': round(len(sample) * per_image / t.elapsed, 1)}
+        with Timer() as t:
+            for sha256 in sample:
+                render(storage.backend.local_path(sha256), targets(sha256, scratch), derivatives.quality)
+        results['render_inline'] = {'derivatives_per_sec': round(len(sample) * per_image / t.elapsed, 1)}
+
+        with Timer() as t:
+            futures = [derivatives.submit(sha256) for sha256 in sources]
+            for future in futures:
+                future.result()
+        results['render_pool'] = {'derivatives_per_sec': round(images * per_image / t.elapsed, 1),
+                                  'ms_per_image': round(t.elapsed / images * 1000, 1)}
+
+        with app.app_context():
+            db.create_all()
+            user = Users(username='doctor', role='doctor', is_active=True)
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Doctors(user_id=user.user_id, profile_picture='/pictures/' + sources[0]))
+            db.session.commit()
+            db.session.remove()
+
+        client = app.test_client()
+        path = '/pictures/%s?size=small&format=webp' % sources[0]
+        response, results['cache_hit'] = _timings(client, path, samples)
+        results['cache_hit']['bytes'] = len(response.data)
+        etag = response.headers['ETag']
+        response, results['not_modified'] = _timings(client, path, samples, {'If-None-Match': etag})
+        assert response.status_code == 304
+
+        misses = []
+        name = derivative_name(sources[0], 'small', 'webp')
+        for _ in range(min(20, samples)):
+            derivatives.cache.discard(name)
+            with Timer() as t:
+                response = client.get(path)
+            assert response.status_code == 200
+            misses.append(t.elapsed)
+        results['evicted'] = {'p50_ms': round(percentile(misses, 50) * 1000, 3)}
+        results['cache'] = derivatives.stats()
+    return results
+
+
+if __name__ == '__main__':
+    report('images', run())
@@ -0,0 +1,136 @@
+"""Inbox and thread latency for a doctor with 200k messages.
+
+Seeds a doctor who exchanges MESSAGES messages with PATIENTS patients
+(conversations and their counters built as app.conversations keeps them),
+then times the first and a deep page of GET /conversations against the
+same inbox computed from messages with a GROUP BY over both directions,
+the first page of a thread, and sending messages through the ORM (which
+maintains the conversation in the same transaction). Run from the engine
+directory:
+
+    python -m benchmarks.bench_inbox
+"""
+import os
+import random
+import tempfile
+from datetime import datetime
+
+from benchmarks.common import Timer, make_app, percentile, report, scale
+
+GROUP_BY_INBOX = '''
+SELECT other_id, MAX(message_id) AS last_message_id, COUNT(*) AS messages
+FROM (
+    SELECT receiver_id AS other_id, message_id FROM messages WHERE sender_id = :user_id
+    UNION ALL
+    SELECT sender_id AS other_id, message_id FROM messages WHERE receiver_id = :user_id
+) AS mine
+GROUP BY other_id ORDER BY last_message_id DESC LIMIT :limit
+'''
+
+
+def seed(db, messages, patients, batch=50000):
+    from app.conversations import conversation_key
+    from app.db_types import new_id
+    from app.models import Conversations, Messages, Users
+
+    rng = random.Random(17)
+    doctor = new_id()
+    patient_ids = [new_id() for _ in range(patients)]
+    db.session.execute(Users.__table__.insert(), [{
+        'user_id': user_id, 'username': 'user%d' % i, 'role': 'doctor' if i == 0 else 'patient', 'is_active': True,
+    } for i, user_id in enumerate([doctor] + patient_ids)])
+    # a few busy patients write most of the messages
+    weights = [1.0 / (i + 1) for i in range(patients)]
+    conversations = {}
+    now = datetime.utcnow()
+    rows = []
+    for _ in range(messages):
+        patient = rng.choices(patient_ids, weights)[0]
+        sender, receiver = (patient, doctor) if rng.random() < 0.6 else (doctor, patient)
+        conversation_id, low, high = conversation_key(sender, receiver)
+        message_id = new_id()
+        rows.append({'message_id': message_id, 'sender_id': sender, 'receiver_id': receiver,
+                     'conversation_id': conversation_id, 'message': 'Question about my prescription',
+                     'message_type': 'text', 'is_active': True, 'is_deleted': False, 'updated_at': now})
+        entry = conversations.setdefault(conversation_id, {
+            'conversation_id': conversation_id, 'user_low_id': low, 'user_high_id': high, 'message_count': 0,
+            'unread_low': 0, 'unread_high': 0, 'created_at': now, 'updated_at': now, 'last_message_at': now})
+        entry['last_message_id'] = message_id
+        entry['message_count'] += 1
+        entry['unread_low' if receiver == low else 'unread_high'] += rng.random() < 0.05
+    db.session.execute(Conversations.__table__.insert(), list(conversations.values()))
+    for offset in range(0, len(rows), batch):
+        db.session.execute(Messages.__table__.insert(), rows[offset:offset + batch])
+    db.session.commit()
+    return doctor, patient_ids
+
+
+def _timed(fn, samples):
+    timings = []
+    for _ in range(samples):
+        with Timer() as t:
+            result = fn()
+        timings.append(t.elapsed)
+    return result, {'p50_ms': round(percentile(timings, 50) * 1000, 3),
+                    'p99_ms': round(percentile(timings, 99) * 1000, 3)}
+
+
+def run(messages=None, patients=None, samples=50, sends=None):
+    from app import db
+    from app.models import Messages
+    from sqlalchemy import text
+
+    messages = messages or scale(200000)
+    patients = patients or max(2, scale(2000))
+    sends = sends or scale(2000)
+    results = {'messages': messages, 'patients': patients}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            with Timer() as t:
+                doctor, patient_ids = seed(db, messages, patients)
+            results['seed_seconds'] = round(t.elapsed, 1)
+            db.session.remove()
+
+        client = app.test_client()
+        headers = {'user-id': doctor}
+        page, results['inbox_first_page'] = _timed(
+            lambda: client.get('/conversations?limit=20', headers=headers).json, samples)
+        # page 11, or the last page when a small BENCH_SCALE has fewer;
+        # ``cursor`` fetches page ``number``
+        cursor, number = page['next_cursor'], 2
+        while cursor is not None and number < 11:
+            following = client.get('/conversations?limit=20&cursor=' + cursor, headers=headers).json['next_cursor']
+            if following is None:
+                break
+            cursor, number = following, number + 1
+        if cursor is not None:
+            _, results['inbox_page_%d' % number] = _timed(
+                lambda: client.get('/conversations?limit=20&cursor=' + cursor, headers=headers), samples)
+        conversation_id = page['items'][0]['conversation_id']
+        _, results['thread_first_page'] = _timed(
+            lambda: client.get('/conversations/%s/messages?limit=50' % conversation_id, headers=headers), samples)
+
+        with app.app_context():
+            _, results['group_by_inbox'] = _timed(
+                lambda: db.session.execute(text(GROUP_BY_INBOX), {
+                    'user_id': Messages.__table__.c.sender_id.type.process_bind_param(doctor, None),
+                    'limit': 20}).all(), max(1, samples // 10))
+
+            rng = random.Random(23)
+            with Timer() as t:
+                for i in range(sends):
+                    db.session.add(Messages(sender_id=rng.choice(patient_ids), receiver_id=doctor,
+                                            message='follow-up %d' % i, message_type='text'))
+                    db.session.commit()
+            results['send_per_sec'] = round(sends / t.elapsed)
+            db.session.remove()
+        first = client.get('/conversations?limit=1', headers=headers).json['items'][0]
+        results['inbox_head_after_sends'] = {'unread_count': first['unread_count'],
+                                             'last_message': first['last_message']['message']}
+    return results
+
+
+if __name__ == '__main__':
+    report('inbox', run())
@@ -0,0 +1,86 @@
+"""Insert throughput before and after the index audit revision on SQLite.
+
+Run from the engine directory: python -m benchmarks.bench_index_audit
+"""
+import os
+import random
+import string
+import tempfile
+import uuid
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from benchmarks.common import Timer, migrate, report, scale
+
+BEFORE = '8f2a6d1c5b7e'
+AFTER = '9db10bde4be3'
+
+
+def _text(rng, n):
+    return ''.join(rng.choice(string.ascii_letters + ' ') for _ in range(n))
+
+
+def _rows(table, n, rng):
+    now = datetime(2024, 1, 1)
+    for i in range(n):
+        row = {'is_active': True, 'is_deleted': False, 'updated_at': now}
+        if table == 'doctors':
+            row.update(doctor_id=str(uuid.uuid4()), user_id=str(uuid.uuid4()),
+                       first_name=_text(rng, 8), last_name=_text(rng, 10), email='d%d@x.org' % i,
+                       phone='%010d' % i, specialty=_text(rng, 12), city=_text(rng, 8),
+                       state='NY', zip_code='%05d' % rng.randint(0, 99999), bio=_text(rng, 200),
+                       address=_text(rng, 40), qualification=_text(rng, 60),
+                       profile_picture='https://cdn.example.org/' + _text(rng, 60),
+                       banner_picture='https://cdn.example.org/' + _text(rng, 60))
+        elif table == 'patients':
+            row.update(patient_id=str(uuid.uuid4()), user_id=str(uuid.uuid4()),
+                       first_name=_text(rng, 8), last_name=_text(rng, 10), email='p%d@x.org' % i,
+                       phone='%010d' % i, city=_text(rng, 8), about_me=_text(rng, 200),
+                       address=_text(rng, 40), profile_picture='https://cdn.example.org/' + _text(rng, 60))
+        elif table == 'messages':
+            row.update(message_id=str(uuid.uuid4()), sender_id=str(uuid.uuid4()),
+                       receiver_id=str(uuid.uuid4()), message=_text(rng, 200), message_type='text')
+        elif table == 'notifications':
+            row.update(notification_id=str(uuid.uuid4()), user_id=str(uuid.uuid4()),
+                       notification_type='reminder', notification_message=_text(rng, 200),
+                       notification_url='https://app.example.org/' + _text(rng, 60))
+        elif table == 'posts':
+            row.update(post_id=str(uuid.uuid4()), user_id=str(uuid.uuid4()), post=_text(rng, 200),
+                       post_type='text', post_url='https://app.example.org/' + _text(rng, 60))
+        yield row
+
+
+def _throughput(revision, table, n, batch=500):
+    rng = random.Random(42)
+    rows = list(_rows(table, n, rng))
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = sa.create_engine('sqlite:///' + os.path.join(tmp, 'bench.db'))
+        migrate(engine, revision)
+        target = sa.Table(table, sa.MetaData(), autoload_with=engine)
+        with Timer() as t:
+            for start in range(0, n, batch):
+                with engine.begin() as conn:
+                    conn.execute(target.insert(), rows[start:start + batch])
+        with engine.connect() as conn:
+            indexes = len(sa.inspect(conn).get_indexes(table))
+        engine.dispose()
+    return round(n / t.elapsed), indexes
+
+
+def run(rows=None):
+    rows = rows or scale(50000)
+    results = {'rows_per_table': rows, 'tables': {}}
+    for table in ('doctors', 'patients', 'messages', 'notifications', 'posts'):
+        before, before_indexes = _throughput(BEFORE, table, rows)
+        after, after_indexes = _throughput(AFTER, table, rows)
+        results['tables'][table] = {
+            'indexes_before': before_indexes, 'indexes_after': after_indexes,
+            'rows_per_sec_before': before, 'rows_per_sec_after': after,
+            'speedup': round(after / before, 2),
+        }
+    return results
+
+
+if __name__ == '__main__':
+    report('index_audit', run())
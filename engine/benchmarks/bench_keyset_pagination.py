@@ -0,0 +1,91 @@
+"""Per-page latency of /appointments deep into a large result set, keyset vs OFFSET.
+
+Run from the engine directory: python -m benchmarks.bench_keyset_pagination
+"""
+import uuid
+from datetime import datetime, timedelta
+
+from benchmarks.common import Timer, make_app, percentile, report, scale
+
+
+def seed(db, appointments, batch=50000):
+    from app.models import Users, Patients, Doctors, Appointments
+
+    patient_user = Users(username='bench-patient', role='patient')
+    doctor_user = Users(username='bench-doctor', role='doctor')
+    db.session.add_all([patient_user, doctor_user])
+    db.session.flush()
+    patient = Patients(user_id=patient_user.user_id, first_name='Pat')
+    doctor = Doctors(user_id=doctor_user.user_id, first_name='Doc')
+    db.session.add_all([patient, doctor])
+    db.session.commit()
+
+    start = datetime(2020, 1, 1)
+    table = Appointments.__table__
+    for offset in range(0, appointments, batch):
+        db.session.execute(table.insert(), [{
+            'appointment_id': str(uuid.uuid4()),
+            'patient_id': patient.patient_id,
+            'doctor_id': doctor.doctor_id,
+            'appointment_date': start + timedelta(minutes=i),
+            'appointment_time': '09:00',
+            'is_active': True,
+            'is_deleted': False,
+            'updated_at': start + timedelta(seconds=i),
+        } for i in range(offset, min(offset + batch, appointments))])
+    db.session.commit()
+    return patient_user.user_id, patient.patient_id
+
+
+def run(appointments=None, page=20, samples=20):
+    from app import db
+    from app.models import Appointments
+    from app.pagination import encode_cursor
+
+    appointments = appointments or scale(1000000)
+    app = make_app()
+    client = app.test_client()
+    results = {'appointments': appointments, 'page_size': page, 'depths': {}}
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        with Timer() as t:
+            user_id, patient_id = seed(db, appointments)
+        results['seed_seconds'] = round(t.elapsed, 2)
+
+        ordered = Appointments.query.filter_by(patient_id=patient_id) \
+            .order_by(Appointments.updated_at.desc(), Appointments.appointment_id.desc())
+        depths = [d for d in (0, 1000, 10000, 100000, 500000, appointments - page)
+                  if 0 <= d <= appointments - page]
+        for depth in sorted(set(depths)):
+            cursor = None
+            if depth:
+                last = ordered.offset(depth - 1).first()
+                cursor = encode_cursor(last.updated_at, last.appointment_id)
+
+            keyset = []
+            for _ in range(samples):
+                with Timer() as t:
+                    response = client.get('/appointments', query_string={
+                        'limit': page, 'cursor': cursor or ''}, headers={'user_id': user_id})
+                assert response.status_code == 200, response.get_data(as_text=True)
+                keyset.append(t.elapsed * 1000)
+
+            offset = []
+            for _ in range(samples):
+                with Timer() as t:
+                    ordered.offset(depth).limit(page).all()
+                offset.append(t.elapsed * 1000)
+                db.session.expire_all()
+
+            results['depths'][depth] = {
+                'keyset_endpoint_p50_ms': round(percentile(keyset, 50), 3),
+                'keyset_endpoint_p99_ms': round(percentile(keyset, 99), 3),
+                'offset_query_p50_ms': round(percentile(offset, 50), 3),
+            }
+    return results
+
+
+if __name__ == '__main__':
+    report('keyset_pagination', run())
@@ -0,0 +1,98 @@
+"""CPU spent on a credential-stuffing run against /login, with and without rate limits.
+
+Seeds USERS accounts sharing one scrypt hash, then replays ATTEMPTS wrong
+passwords for TARGETS of those usernames from ATTACKERS addresses,
+interleaved with one good login every LEGIT_EVERY attempts by a user from
+their own address (half of them users being attacked). Hashing runs inline
+(PASSWORD_HASH_WORKERS=0), so the process CPU time is the cost of the run.
+Reports responses by status, CPU seconds, hashes avoided and how the good
+logins fared, for RATELIMIT_ENABLED off and on. Run from the engine
+directory:
+
+    python -m benchmarks.bench_login_throttle
+"""
+import os
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.common import Timer, make_app, percentile, report, scale
+
+
+def seed(db, users):
+    from werkzeug.security import generate_password_hash
+
+    from app.db_types import new_id
+    from app.models import Users
+
+    password_hash = generate_password_hash('correct horse', method='scrypt')
+    db.session.execute(Users.__table__.insert(), [{
+        'user_id': new_id(), 'username': 'user%d' % i, 'role': 'patient', 'is_active': True,
+        'password_hash': password_hash,
+    } for i in range(users)])
+    db.session.commit()
+
+
+def _attack(enabled, attempts, attackers, targets, users, legit_every):
+    from app import db
+    from app.login_ips import recorder
+    from app.ratelimit import MemoryStore, limiter
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'bench.db'),
+                       PASSWORD_HASH_WORKERS=0, RATELIMIT_ENABLED=enabled, RATELIMIT_STORE=None)
+        with app.app_context():
+            db.create_all()
+            seed(db, users)
+            db.session.remove()
+        # fresh buckets for each run
+        limiter.store = MemoryStore()
+        client = app.test_client()
+
+        statuses = Counter()
+        legit = Counter()
+        legit_ms = []
+        cpu = time.process_time()
+        with Timer() as t:
+            for i in range(attempts):
+                response = client.post('/login', json={'username': 'user%d' % (i % targets), 'password': 'guess%d' % i},
+                                       environ_base={'REMOTE_ADDR': '203.0.113.%d' % (i % attackers)})
+                statuses[response.status_code] += 1
+                if i % legit_every == 0:
+                    # alternate between an attacked user and one who is not
+                    turn = i // legit_every
+                    n = targets + turn % (users - targets) if turn % 2 else turn % targets
+                    with Timer() as good:
+                        response = client.post('/login', json={'username': 'user%d' % n, 'password': 'correct horse'},
+                                               environ_base={'REMOTE_ADDR': '198.51.100.%d' % (n % 250)})
+                    legit_ms.append(good.elapsed * 1000)
+                    legit[('attacked' if n < targets else 'other', response.status_code)] += 1
+        cpu = time.process_time() - cpu
+        # before the temporary database goes away
+        recorder.shutdown()
+        # every 401 for a user that exists cost one scrypt verify
+        return {
+            'seconds': round(t.elapsed, 2),
+            'cpu_seconds': round(cpu, 2),
+            'attack_statuses': dict(statuses),
+            'hashes_for_attack': statuses[401],
+            'cpu_ms_per_attempt': round(cpu * 1000 / (attempts + len(legit_ms)), 2),
+            'legit_logins': {'%s_%d' % key: count for key, count in sorted(legit.items())},
+            'legit_p50_ms': round(percentile(legit_ms, 50), 1),
+            'limiter': limiter.stats(),
+            'login_ips': recorder.stats(),
+        }
+
+
+def run(attempts=None, attackers=5, targets=20, users=200, legit_every=20):
+    attempts = attempts or scale(400)
+    results = {'attempts': attempts, 'attackers': attackers, 'targets': targets, 'users': users}
+    results['unlimited'] = _attack(False, attempts, attackers, targets, users, legit_every)
+    results['limited'] = _attack(True, attempts, attackers, targets, users, legit_every)
+    results['cpu_saved_pct'] = round(
+        100.0 * (1 - results['limited']['cpu_seconds'] / results['unlimited']['cpu_seconds']), 1)
+    return results
+
+
+if __name__ == '__main__':
+    report('login_throttle', run())
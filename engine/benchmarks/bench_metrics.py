@@ -0,0 +1,133 @@
+"""Overhead of the request and SQL instrumentation in app.metrics.
+
+Serves two endpoints through the test client with METRICS_ENABLED off and
+on: one that returns straight away and one that runs STATEMENTS small
+queries. Rounds alternate between the two apps and the fastest round of
+each is kept, so the difference is the instrumentation rather than noise.
+Also times a request's before, after and teardown hooks on their own and
+a statement against engines with no cursor listeners, no-op ones and
+ours, and checks both against BUDGET_US. Run from the engine directory:
+
+    python -m benchmarks.bench_metrics
+"""
+import os
+import tempfile
+
+from benchmarks.common import Timer, make_app, report, scale
+
+# what instrumentation may add to a request, and to each statement in it;
+# most of the statement share is SQLAlchemy dispatching cursor events at all
+BUDGET_US = {'request': 25.0, 'statement': 25.0}
+
+
+def _app(path, enabled, statements):
+    from sqlalchemy import text
+
+    from app import db
+
+    app = make_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + path, METRICS_ENABLED=enabled, METRICS_TOKEN='bench')
+
+    @app.route('/bench/ping', endpoint='bench_ping')
+    def ping():
+        return 'ok'
+
+    @app.route('/bench/query', endpoint='bench_query')
+    def query():
+        for _ in range(statements):
+            db.session.execute(text('SELECT 1')).scalar()
+        return 'ok'
+
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def _rate(client, url, requests):
+    with Timer() as t:
+        for _ in range(requests):
+            client.get(url)
+    return t.elapsed / requests
+
+
+def _request_hooks_cost(app, samples):
+    from app.metrics import request_metrics
+
+    with app.test_request_context('/bench/ping'):
+        response = app.response_class('ok')
+        with Timer() as t:
+            for _ in range(samples):
+                request_metrics._start()
+                request_metrics._status(response)
+                request_metrics._finish(None)
+    return t.elapsed / samples
+
+
+def _statement_cost(samples, rounds):
+    """Seconds added per statement by SQLAlchemy's cursor event dispatch alone, and with our listeners."""
+    from sqlalchemy import create_engine, event, text
+
+    from app.metrics import request_metrics
+
+    listeners = {
+        'plain': None,
+        'dispatch': (lambda *args: None, lambda *args: None),
+        'instrumented': (request_metrics._before_cursor_execute, request_metrics._after_cursor_execute),
+    }
+    connections = {}
+    for label, pair in listeners.items():
+        engine = create_engine('sqlite://')
+        if pair is not None:
+            event.listen(engine, 'before_cursor_execute', pair[0])
+            event.listen(engine, 'after_cursor_execute', pair[1])
+        connections[label] = engine.connect()
+    best = {}
+    # alternate, keeping each side's fastest round
+    for _ in range(rounds):
+        for label, connection in connections.items():
+            with Timer() as t:
+                for _ in range(samples):
+                    connection.execute(text('SELECT 1')).scalar()
+            best[label] = min(best.get(label, t.elapsed), t.elapsed)
+    for connection in connections.values():
+        connection.close()
+    return ((best['dispatch'] - best['plain']) / samples, (best['instrumented'] - best['plain']) / samples)
+
+def run(requests=None, rounds=5, statements=5):
+    requests = requests or scale(3000)
+    results = {'requests_per_round': requests, 'rounds': rounds, 'statements': statements, 'budget_us': BUDGET_US}
+    with tempfile.TemporaryDirectory() as tmp:
+        apps = {'off': _app(os.path.join(tmp, 'off.db'), False, statements),
+                'on': _app(os.path.join(tmp, 'on.db'), True, statements)}
+        clients = {label: app.test_client() for label, app in apps.items()}
+        for url in ('/bench/ping', '/bench/query'):
+            best = {}
+            for _ in range(rounds):
+                for label, client in clients.items():
+                    seconds = _rate(client, url, requests)
+                    best[label] = min(best.get(label, seconds), seconds)
+            results[url] = {
+                'off_us': round(best['off'] * 1e6, 1),
+                'on_us': round(best['on'] * 1e6, 1),
+                'overhead_us': round((best['on'] - best['off']) * 1e6, 1),
+                'overhead_pct': round(100.0 * (best['on'] - best['off']) / best['off'], 1),
+            }
+        dispatch, statement = _statement_cost(scale(10000), rounds)
+        hooks = results['hooks'] = {
+            'request_us': round(_request_hooks_cost(apps['on'], scale(20000)) * 1e6, 2),
+            'statement_us': round(statement * 1e6, 2),
+            # of which SQLAlchemy's event dispatch, whatever the listener does
+            'statement_dispatch_us': round(dispatch * 1e6, 2),
+        }
+        results['within_budget'] = hooks['request_us'] <= BUDGET_US['request'] \
+            and hooks['statement_us'] <= BUDGET_US['statement']
+        client = clients['on']
+        results['metrics_bytes'] = len(client.get('/metrics', headers={'Authorization': 'Bearer bench'}).get_data())
+        with Timer() as t:
+            for _ in range(100):
+                client.get('/metrics', headers={'Authorization': 'Bearer bench'})
+        results['metrics_render_ms'] = round(t.elapsed * 10, 2)
+    return results
+
+
+if __name__ == '__main__':
+    report('metrics', run())
@@ -0,0 +1,100 @@
+"""Connection pool behaviour when requests outnumber connections.
+
+Each simulated request checks out a connection and runs a query that holds
+it for QUERY_MS, from more threads than the pool can serve at once. The
+scenarios compare an unbounded queue (requests wait as long as it takes)
+with a bounded pool_timeout (excess requests fail fast and get a 503) and
+with the overflow headroom of the default configuration. Run from the
+engine directory:
+
+    python -m benchmarks.bench_pool_exhaustion
+"""
+import os
+import tempfile
+import threading
+import time
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+from benchmarks.common import Timer, percentile, report, scale
+
+QUERY_MS = 20
+
+SCENARIOS = {
+    'queue_unbounded': dict(pool_size=5, max_overflow=0, pool_timeout=30),
+    'fail_fast': dict(pool_size=5, max_overflow=0, pool_timeout=0.05),
+    'default_overflow': dict(pool_size=10, max_overflow=20, pool_timeout=5),
+}
+
+
+def _engine(path, options):
+    engine = sa.create_engine('sqlite:///' + path, pool_pre_ping=True, **options)
+
+    @event.listens_for(engine, 'connect')
+    def _register_sleep(dbapi_connection, connection_record):
+        # stands in for a slow query that keeps the connection busy
+        dbapi_connection.create_function('sleep_ms', 1, lambda ms: time.sleep(ms / 1000.0))
+
+    return engine
+
+
+def _scenario(path, options, threads, requests_per_thread):
+    from app.pool_metrics import PoolMetrics
+
+    engine = _engine(path, options)
+    metrics = PoolMetrics('bench')
+    metrics.instrument(engine)
+    latencies, failures = [], []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(requests_per_thread):
+            start = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(sa.text('SELECT sleep_ms(:ms)'), {'ms': QUERY_MS})
+            except PoolTimeout:
+                with lock:
+                    failures.append(time.perf_counter() - start)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    with Timer() as t:
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    stats = metrics.stats()
+    engine.dispose()
+    return {
+        'options': options,
+        'ok': len(latencies),
+        'rejected_503': len(failures),
+        'ok_per_sec': round(len(latencies) / t.elapsed),
+        'ok_p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'ok_p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'rejected_p99_ms': round(percentile(failures, 99) * 1000, 1),
+        'peak_in_use': stats['peak_in_use'],
+        'pool_timeouts': stats['timeouts'],
+        'wait_avg_ms': round(stats['wait_avg'] * 1000, 2),
+        'wait_max_ms': round(stats['wait_max'] * 1000, 2),
+    }
+
+
+def run(threads=64, requests_per_thread=None):
+    requests_per_thread = requests_per_thread or scale(20)
+    results = {'threads': threads, 'requests_per_thread': requests_per_thread,
+               'query_ms': QUERY_MS, 'scenarios': {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        for name, options in SCENARIOS.items():
+            results['scenarios'][name] = _scenario(path, options, threads, requests_per_thread)
+    return results
+
+
+if __name__ == '__main__':
+    report('pool_exhaustion', run())
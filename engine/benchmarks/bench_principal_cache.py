@@ -0,0 +1,57 @@
+"""Throughput of a role_required endpoint with and without the principal cache.
+
+Run from the engine directory: python -m benchmarks.bench_principal_cache
+"""
+from benchmarks.common import Timer, make_app, report, scale
+
+
+def _setup(app, users):
+    from app import db
+    from app.models import Users
+    from app.role_control import role_required
+
+    if 'bench_protected' not in app.view_functions:
+        @app.route('/bench/protected', endpoint='bench_protected')
+        @role_required('doctor')
+        def protected():
+            return 'ok'
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        ids = []
+        for i in range(users):
+            user = Users(username='doctor%d' % i, role='doctor')
+            db.session.add(user)
+            ids.append(user)
+        db.session.commit()
+        return [u.user_id for u in ids]
+
+
+def run(requests=None, users=50):
+    from app.principals import principal_cache
+
+    requests = requests or scale(20000)
+    app = make_app()
+    user_ids = _setup(app, users)
+    client = app.test_client()
+    results = {'requests': requests, 'distinct_users': users}
+
+    for label, ttl in (('uncached', 0), ('cached', 30.0)):
+        principal_cache.clear()
+        principal_cache.hits = principal_cache.misses = 0
+        principal_cache.ttl = ttl
+        with Timer() as t:
+            for i in range(requests):
+                response = client.get('/bench/protected',
+                                      headers={'user_id': user_ids[i % users]})
+                assert response.status_code == 200
+        results[label] = {
+            'requests_per_sec': round(requests / t.elapsed, 1),
+            'cache': principal_cache.stats(),
+        }
+    return results
+
+
+if __name__ == '__main__':
+    report('principal_cache', run())
@@ -0,0 +1,131 @@
+"""Push fan-out throughput and the memory an idle /events connection costs.
+
+Delivery: SUBSCRIBERS async consumers (how the ASGI app serves /events)
+spread over CHANNELS users drain events published from another thread;
+reports events delivered per second. Idle memory: Python heap per bare
+subscription and per waiting coroutine (ASGI), and resident memory per
+waiting thread (what a WSGI worker spends per open stream). Run from the
+engine directory:
+
+    python -m benchmarks.bench_push
+"""
+import asyncio
+import gc
+import os
+import random
+import threading
+import tracemalloc
+
+from benchmarks.common import Timer, report, scale
+
+
+def _rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _delivery(subscribers, channels, events):
+    from app.pubsub import Event, InMemoryBroker
+
+    broker = InMemoryBroker()
+    received = [0]
+    expected = [0]
+
+    async def consume(subscription, done):
+        while not subscription.closed:
+            item = await subscription.get_async(1.0)
+            if item is not None:
+                received[0] += 1
+                if received[0] == expected[0]:
+                    done.set()
+
+    async def main():
+        done = asyncio.Event()
+        subs = [broker.subscribe('user:%d' % (i % channels), maxsize=events) for i in range(subscribers)]
+        tasks = [asyncio.ensure_future(consume(s, done)) for s in subs]
+        rng = random.Random(3)
+        payload = '{"message":"%s"}' % ('x' * 200)
+        expected[0] = events * (subscribers // channels)
+
+        def publish():
+            for i in range(events):
+                broker.publish('user:%d' % rng.randrange(channels), Event(str(i), 'message', payload))
+
+        await asyncio.sleep(0)
+        with Timer() as t:
+            publisher = threading.Thread(target=publish)
+            publisher.start()
+            await asyncio.wait_for(done.wait(), 300)
+        publisher.join()
+        for s in subs:
+            s.close()
+        await asyncio.gather(*tasks)
+        return t.elapsed
+
+    elapsed = asyncio.run(main())
+    return {'subscribers': subscribers, 'channels': channels, 'events_published': events,
+            'events_delivered': received[0], 'delivered_per_sec': round(received[0] / elapsed)}
+
+
+def _idle_async(connections):
+    from app.pubsub import InMemoryBroker
+
+    broker = InMemoryBroker()
+
+    async def main():
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        subs = [broker.subscribe('user:%d' % i) for i in range(connections)]
+        bare = tracemalloc.take_snapshot()
+        tasks = [asyncio.ensure_future(s.get_async(3600)) for s in subs]
+        await asyncio.sleep(0.1)
+        waiting = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        for s in subs:
+            s.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        size = lambda after, base: sum(s.size_diff for s in after.compare_to(base, 'filename'))
+        return size(bare, before) / connections, size(waiting, before) / connections
+
+    per_subscription, per_coroutine = asyncio.run(main())
+    return {'connections': connections, 'bytes_per_subscription': round(per_subscription),
+            'bytes_per_async_connection': round(per_coroutine)}
+
+
+def _idle_threads(connections):
+    from app.pubsub import InMemoryBroker
+
+    broker = InMemoryBroker()
+    threading.stack_size(256 * 1024)
+    gc.collect()
+    before = _rss()
+    subs = [broker.subscribe('user:%d' % i) for i in range(connections)]
+    threads = [threading.Thread(target=s.get, args=(3600,), daemon=True) for s in subs]
+    for t in threads:
+        t.start()
+    after = _rss()
+    for s in subs:
+        s.close()
+    for t in threads:
+        t.join()
+    threading.stack_size(0)
+    return {'connections': connections, 'rss_bytes_per_thread_connection': round((after - before) / connections)}
+
+
+def run(subscribers=None, channels=None, events=None, idle=None):
+    subscribers = subscribers or scale(10000)
+    channels = channels or max(1, subscribers // 2)
+    events = events or scale(100000)
+    idle = idle or scale(10000)
+    return {
+        'delivery': _delivery(subscribers, channels, events),
+        'idle_async': _idle_async(idle),
+        'idle_threads': _idle_threads(min(idle, 2000)),
+    }
+
+
+if __name__ == '__main__':
+    report('push', run())
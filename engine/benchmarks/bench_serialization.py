@@ -0,0 +1,109 @@
+"""Serializing Doctors rows: hand-written to_dict + stdlib JSON versus the
+generated serializer over Core rows + orjson.
+
+Run from the engine directory: python -m benchmarks.bench_serialization
+"""
+import uuid
+from datetime import datetime
+
+from benchmarks.common import Timer, make_app, report, scale
+
+
+def legacy_to_dict(doctor):
+    # the per-model dict the models used to build by hand
+    return {
+        'doctor_id': doctor.doctor_id,
+        'user_id': doctor.user_id,
+        'first_name': doctor.first_name,
+        'middle_name': doctor.middle_name,
+        'last_name': doctor.last_name,
+        'gender': doctor.gender,
+        'date_of_birth': doctor.date_of_birth,
+        'email': doctor.email,
+        'phone': doctor.phone,
+        'specialty': doctor.specialty,
+        'license_number': doctor.license_number,
+        'qualification': doctor.qualification,
+        'address': doctor.address,
+        'city': doctor.city,
+        'state': doctor.state,
+        'zip_code': doctor.zip_code,
+        'bio': doctor.bio,
+        'profile_picture': doctor.profile_picture,
+        'banner_picture': doctor.banner_picture,
+        'is_active': doctor.is_active,
+        'updated_at': doctor.updated_at,
+        'is_deleted': doctor.is_deleted
+    }
+
+
+def seed(db, doctors):
+    from app.models import Doctors
+
+    db.drop_all()
+    db.create_all()
+    db.session.execute(Doctors.__table__.insert(), [{
+        'doctor_id': str(uuid.uuid4()),
+        'user_id': str(uuid.uuid4()),
+        'first_name': 'First%d' % i,
+        'last_name': 'Last%d' % i,
+        'gender': 'female' if i % 2 else 'male',
+        'date_of_birth': datetime(1970, 1, 1),
+        'email': 'doctor%d@example.com' % i,
+        'phone': '555%07d' % i,
+        'specialty': 'cardiology',
+        'city': 'New York',
+        'state': 'NY',
+        'zip_code': '10001',
+        'bio': 'Board certified physician number %d' % i,
+        'is_active': True,
+        'is_deleted': False,
+        'updated_at': datetime(2024, 1, 1),
+    } for i in range(doctors)])
+    db.session.commit()
+
+
+def run(doctors=None, repeat=5):
+    from flask.json.provider import DefaultJSONProvider
+    from app import db
+    from app.models import Doctors
+    from app.serialization import serializer_for
+
+    doctors = doctors or scale(10000)
+    app = make_app()
+    stdlib = DefaultJSONProvider(app)
+    stdlib.compact = app.json.compact = True
+    results = {'doctors': doctors, 'json_backend': type(app.json).__name__}
+
+    with app.app_context():
+        seed(db, doctors)
+        serializer = serializer_for(Doctors)
+
+        def legacy():
+            db.session.expunge_all()
+            return stdlib.dumps([legacy_to_dict(d) for d in Doctors.query.all()])
+
+        def orm_serializer():
+            db.session.expunge_all()
+            return app.json.dumps([d.to_dict() for d in Doctors.query.all()])
+
+        def core_rows():
+            rows = db.session.execute(db.select(*serializer.columns()))
+            return app.json.dumps([serializer.dump_row(row) for row in rows])
+
+        for label, fn in (('legacy_orm_to_dict_stdlib_json', legacy),
+                          ('orm_serializer', orm_serializer),
+                          ('core_rows_serializer', core_rows)):
+            best = None
+            for _ in range(repeat):
+                with Timer() as t:
+                    payload = fn()
+                best = t.elapsed if best is None else min(best, t.elapsed)
+            results[label] = {'best_ms': round(best * 1000, 2),
+                              'rows_per_sec': round(doctors / best),
+                              'bytes': len(payload)}
+    return results
+
+
+if __name__ == '__main__':
+    report('serialization', run())
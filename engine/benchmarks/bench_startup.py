@@ -0,0 +1,89 @@
+"""Worker startup cost: importing the package and building an app.
+
+Runs each stage in a fresh interpreter under ``python -X importtime`` and
+reports the median wall time, the summed import time and the heaviest
+top-level packages. Run from the engine directory:
+
+    python -m benchmarks.bench_startup
+
+Wall times move with whatever else the machine is doing, so each stage is
+compared with a reference measured in the same rounds: importing the
+third-party packages the app is built on. Exits non-zero when a stage's
+median ratio to the reference goes over its budget
+(STARTUP_BUDGET_IMPORT_RATIO and STARTUP_BUDGET_CREATE_APP_RATIO override
+them).
+"""
+import os
+import subprocess
+import sys
+import time
+from statistics import median
+
+from benchmarks.common import ENGINE_DIR, report
+
+# what any worker pays before the app's own code runs
+REFERENCE = 'import flask_sqlalchemy, flask_login'
+# stage -> (code, budget as a multiple of the reference's wall time)
+STAGES = {
+    'import': ('import app', 1.3),
+    'create_app': ('from app import create_app; create_app()', 1.8),
+}
+
+
+def _importtime(code):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ENGINE_DIR,
+                            capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+
+    packages = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        self_us = int(self_us)
+        total += self_us
+        top = name.strip().split('.')[0]
+        packages[top] = packages.get(top, 0) + self_us
+    return wall, total, packages
+
+
+def run(repeat=5, top=10):
+    walls = {stage: [] for stage in STAGES}
+    ratios = {stage: [] for stage in STAGES}
+    totals = {stage: [] for stage in STAGES}
+    heaviest = {}
+    reference = []
+    # the stages take turns, so a burst of load slows down a round's
+    # reference and stages alike
+    for _ in range(repeat):
+        reference_wall, _, _ = _importtime(REFERENCE)
+        reference.append(reference_wall)
+        for stage, (code, _) in STAGES.items():
+            wall, total, packages = _importtime(code)
+            walls[stage].append(wall)
+            ratios[stage].append(wall / reference_wall)
+            totals[stage].append(total)
+            heaviest[stage] = packages
+
+    results = {'reference': {'code': REFERENCE, 'wall_ms': round(median(reference) * 1000, 1)}}
+    for stage, (code, default_budget) in STAGES.items():
+        budget = float(os.getenv('STARTUP_BUDGET_%s_RATIO' % stage.upper(), default_budget))
+        ratio = median(ratios[stage])
+        results[stage] = {
+            'wall_ms': round(median(walls[stage]) * 1000, 1),
+            'import_ms': round(median(totals[stage]) / 1000, 1),
+            'ratio': round(ratio, 2),
+            'budget_ratio': budget,
+            'ok': ratio <= budget,
+            'heaviest_packages_ms': {name: round(us / 1000, 1) for name, us in
+                                     sorted(heaviest[stage].items(), key=lambda item: -item[1])[:top]},
+        }
+    return results
+
+
+if __name__ == '__main__':
+    results = run()
+    report('startup', results)
+    sys.exit(0 if all(results[stage]['ok'] for stage in STAGES) else 1)
@@ -0,0 +1,123 @@
+"""Incremental /sync against a full dump for a patient with years of records.
+
+Seeds one patient with RECORDS rows in each of appointments, documents,
+prescriptions and medical history (plus notifications) spread over YEARS
+years, among OTHERS other patients' rows. Times a full sync (paging /sync
+from no token until has_more is false), then changes CHANGED rows through
+the ORM, soft deleting a few, and times the incremental /sync from the
+last token. Reports response bytes and latency for both. Run from the
+engine directory:
+
+    python -m benchmarks.bench_sync
+"""
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import Timer, make_app, report, scale
+
+
+def seed(db, records, others, years, batch=20000):
+    from app.db_types import new_id
+    from app.models import Appointments, Documents, MedicalHistory, Notifications, Patients, Prescriptions, Users
+
+    rng = random.Random(3)
+    now = datetime.utcnow()
+    span = years * 365 * 24 * 3600
+
+    def when():
+        return now - timedelta(seconds=rng.randrange(60, span))
+
+    user_id = new_id()
+    db.session.execute(Users.__table__.insert(), [{'user_id': user_id, 'username': 'patient', 'role': 'patient',
+                                                   'is_active': True}])
+    patient_ids = [new_id() for _ in range(max(1, others // records) + 1)]
+    db.session.execute(Patients.__table__.insert(), [{
+        'patient_id': patient_id, 'user_id': user_id if i == 0 else new_id(), 'first_name': 'P%d' % i,
+        'is_active': True, 'is_deleted': False, 'updated_at': when(),
+    } for i, patient_id in enumerate(patient_ids)])
+    tables = (
+        (Appointments, 'appointment_id', {'appointment_type': 'in-person', 'appointment_status': 'completed',
+                                          'appointment_notes': 'Follow-up visit, blood pressure stable.'}),
+        (Documents, 'document_id', {'document_name': 'Lab report', 'document_type': 'lab',
+                                    'document_url': '/documents/x/file'}),
+        (Prescriptions, 'prescription_id', {'prescription_name': 'Lisinopril 10mg', 'prescription_type': 'oral'}),
+        (MedicalHistory, 'medical_history_id', {'medical_history_name': 'Hypertension',
+                                                'medical_history_type': 'chronic'}),
+    )
+    mine = {}
+    for model, pk, values in tables:
+        rows = [dict(values, **{pk: new_id(), 'patient_id': patient_ids[0 if i < records else 1 + i % (len(patient_ids) - 1)],
+                                'is_active': True, 'is_deleted': False, 'updated_at': when()})
+                for i in range(records + others)]
+        for offset in range(0, len(rows), batch):
+            db.session.execute(model.__table__.insert(), rows[offset:offset + batch])
+        mine[model] = [row[pk] for row in rows[:records]]
+    db.session.execute(Notifications.__table__.insert(), [{
+        'notification_id': new_id(), 'user_id': user_id, 'notification_type': 'appointment',
+        'notification_message': 'Your appointment is tomorrow', 'is_active': True, 'is_deleted': False,
+        'updated_at': when(),
+    } for _ in range(records)])
+    db.session.commit()
+    return user_id, mine
+
+
+def _sync(client, headers, token=None):
+    calls = 0
+    sent = 0
+    rows = 0
+    with Timer() as t:
+        while True:
+            response = client.get('/sync' + ('?since=' + token if token else ''), headers=headers)
+            body = response.get_data()
+            calls += 1
+            sent += len(body)
+            result = json.loads(body)
+            rows += sum(len(c['upserts']) + len(c['deleted']) for c in result['changes'].values())
+            token = result['next']
+            if not result['has_more']:
+                break
+    return token, {'calls': calls, 'rows': rows, 'bytes': sent, 'ms': round(t.elapsed * 1000, 2)}
+
+
+def run(records=None, others=None, years=5, changed=20):
+    from app import db
+    from app.models import Documents, Prescriptions
+
+    records = records or scale(5000)
+    others = others if others is not None else scale(50000)
+    results = {'records_per_table': records, 'other_patients_rows_per_table': others, 'years': years,
+               'changed': changed}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'bench.db'), SYNC_SAFETY_LAG=1)
+        with app.app_context():
+            db.create_all()
+            user_id, mine = seed(db, records, others, years)
+            db.session.remove()
+        client = app.test_client()
+        headers = {'user-id': user_id}
+
+        token, results['full'] = _sync(client, headers)
+        # past the safety lag, so only real changes come back
+        time.sleep(1.1)
+        token, results['empty_incremental'] = _sync(client, headers, token)
+
+        with app.app_context():
+            rng = random.Random(9)
+            for document_id in rng.sample(mine[Documents], changed):
+                db.session.get(Documents, document_id).document_name = 'Lab report (amended)'
+            for prescription_id in rng.sample(mine[Prescriptions], max(1, changed // 4)):
+                db.session.get(Prescriptions, prescription_id).is_deleted = True
+            db.session.commit()
+            db.session.remove()
+        _, results['incremental'] = _sync(client, headers, token)
+        results['incremental_bytes_pct_of_full'] = round(
+            100.0 * results['incremental']['bytes'] / results['full']['bytes'], 3)
+    return results
+
+
+if __name__ == '__main__':
+    report('sync', run())
@@ -0,0 +1,103 @@
+"""Per-request cost of role_required: user_id header against the DB, against the principal cache, and bearer tokens.
+
+Seeds USERS doctors and an empty protected endpoint, then sends REQUESTS
+requests spread over them three ways: the user_id header with the
+principal cache off (one users lookup per request), the same with the
+cache on, and "Authorization: Bearer" access tokens from POST /token.
+Reports requests per second, SQL statements per request and the time
+spent inside role_required alone (resolving the caller) per call. Run
+from the engine directory:
+
+    python -m benchmarks.bench_token_auth
+"""
+import os
+import tempfile
+
+from benchmarks.common import Timer, make_app, percentile, report, scale
+
+
+def _setup(app, users):
+    from werkzeug.security import generate_password_hash
+
+    from app import db
+    from app.db_types import new_id
+    from app.models import Users
+    from app.role_control import role_required
+
+    @app.route('/bench/protected', endpoint='bench_protected')
+    @role_required('doctor')
+    def protected():
+        return 'ok'
+
+    password_hash = generate_password_hash('secret', method='pbkdf2:sha256:1000')
+    with app.app_context():
+        db.create_all()
+        user_ids = [new_id() for _ in range(users)]
+        db.session.execute(Users.__table__.insert(), [{
+            'user_id': user_id, 'username': 'doctor%d' % i, 'role': 'doctor', 'is_active': True,
+            'password_hash': password_hash,
+        } for i, user_id in enumerate(user_ids)])
+        db.session.commit()
+        db.session.remove()
+    return user_ids
+
+
+def _resolve_cost(app, headers, samples):
+    # role_required's own work, without the test client around it
+    from flask import request
+
+    from app.principals import load_principal
+    from app.tokens import bearer_token, token_principal
+
+    timings = []
+    for i in range(samples):
+        with app.test_request_context('/bench/protected', headers=headers[i % len(headers)]):
+            with Timer() as t:
+                token = bearer_token(request.headers)
+                principal = token_principal(token) if token else load_principal(request.headers.get('user_id'))
+            assert principal is not None
+            timings.append(t.elapsed)
+    return {'p50_us': round(percentile(timings, 50) * 1e6, 1), 'p99_us': round(percentile(timings, 99) * 1e6, 1)}
+
+
+def run(requests=None, users=50):
+    from app import db, login_ips
+    from app.principals import principal_cache
+    from app.sqlcount import count_queries
+
+    requests = requests or scale(10000)
+    results = {'requests': requests, 'users': users}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'bench.db'),
+                       PASSWORD_HASH_WORKERS=0, RATELIMIT_ENABLED=False)
+        user_ids = _setup(app, users)
+        client = app.test_client()
+        access_tokens = [client.post('/token', json={'username': 'doctor%d' % i, 'password': 'secret'})
+                         .json['access_token'] for i in range(users)]
+        results['token_bytes'] = len(access_tokens[0])
+
+        modes = (
+            ('header_db', 0, [{'user_id': user_id} for user_id in user_ids]),
+            ('header_cached', 30.0, [{'user_id': user_id} for user_id in user_ids]),
+            ('bearer_token', 0, [{'Authorization': 'Bearer ' + token} for token in access_tokens]),
+        )
+        for label, ttl, headers in modes:
+            principal_cache.clear()
+            principal_cache.ttl = ttl
+            with app.app_context():
+                with count_queries(db.engine) as queries, Timer() as t:
+                    for i in range(requests):
+                        response = client.get('/bench/protected', headers=headers[i % users])
+                        assert response.status_code == 200
+                results[label] = {
+                    'requests_per_sec': round(requests / t.elapsed, 1),
+                    'queries_per_request': round(queries.count / float(requests), 3),
+                    'resolve': _resolve_cost(app, headers, min(requests, 2000)),
+                }
+        principal_cache.ttl = app.config['PRINCIPAL_CACHE_TTL']
+        login_ips.shutdown()
+    return results
+
+
+if __name__ == '__main__':
+    report('token_auth', run())
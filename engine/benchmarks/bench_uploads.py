@@ -0,0 +1,197 @@
+"""Server memory while streaming large uploads and downloads.
+
+Starts the app in a threaded server subprocess, then PUTs UPLOADS files of
+SIZE bytes (2 GiB by default) to /documents/<id>/file at the same time,
+each with different content, and uploads the first one again to a second
+record to show it stored once. Reports the server's peak RSS (VmHWM) next
+to the bytes it took in, download throughput with a Range request, and
+for comparison the peak RSS of one BUFFERED byte upload read with
+request.get_data(). Needs about UPLOADS * SIZE of free disk. Run from the
+engine directory:
+
+    python -m benchmarks.bench_uploads
+"""
+import http.client
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import ENGINE_DIR, Timer, make_app, report, scale
+
+SERVER = '''
+import sys
+from flask import request
+from werkzeug.serving import make_server
+from app import create_app
+
+app = create_app()
+# the whole body in memory, what a naive upload handler does
+app.add_url_rule('/buffered', 'buffered', lambda: str(len(request.get_data())), methods=['PUT'])
+make_server('127.0.0.1', int(sys.argv[1]), app, threaded=True).serve_forever()
+'''
+
+BLOCK = 1 << 20
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _peak_rss(pid):
+    with open('/proc/%d/status' % pid) as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _body(seed, size):
+    # the same content for the same seed without holding more than a block
+    block = bytearray(random.Random(seed).randbytes(BLOCK))
+    sent = 0
+    while sent < size:
+        block[:16] = seed.to_bytes(8, 'big') + sent.to_bytes(8, 'big')
+        chunk = bytes(block[:min(BLOCK, size - sent)])
+        sent += len(chunk)
+        yield chunk
+
+
+def _put(port, path, headers, seed, size, out):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+    conn.request('PUT', path, body=_body(seed, size),
+                  headers=dict(headers, **{'Content-Length': str(size), 'Content-Type': 'application/pdf'}))
+    response = conn.getresponse()
+    out.append((response.status, response.read()))
+    conn.close()
+
+
+def _wait(port, process, seconds=30):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('server exited with %s' % process.returncode)
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def seed(db, records):
+    from app.models import Documents, Patients, Users
+
+    user = Users(username='uploader', role='patient', is_active=True)
+    db.session.add(user)
+    db.session.flush()
+    patient = Patients(user_id=user.user_id)
+    db.session.add(patient)
+    db.session.flush()
+    documents = [Documents(patient_id=patient.patient_id, document_name='scan %d' % i) for i in range(records)]
+    db.session.add_all(documents)
+    db.session.commit()
+    return user.user_id, [document.document_id for document in documents]
+
+
+def _server(env):
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, '-c', SERVER, str(port)], cwd=ENGINE_DIR,
+                               env=env, stderr=subprocess.DEVNULL)
+    _wait(port, process)
+    return port, process
+
+
+def run(size=None, uploads=4, buffered=None):
+    from app import db
+
+    size = size or scale(2 << 30)
+    buffered = buffered or min(size, scale(256 << 20))
+    results = {'uploads': uploads, 'bytes_per_upload': size}
+    with tempfile.TemporaryDirectory() as tmp:
+        url = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        app = make_app(SQLALCHEMY_DATABASE_URI=url)
+        with app.app_context():
+            db.create_all()
+            user_id, document_ids = seed(db, uploads + 1)
+            db.session.remove()
+        headers = {'user-id': user_id}
+        env = dict(os.environ, DATABASE_URL=url, STORAGE_ROOT=os.path.join(tmp, 'files'),
+                   SECRET_KEY='benchmark')
+
+        port, process = _server(env)
+        try:
+            idle = _peak_rss(process.pid)
+            out = []
+            threads = [threading.Thread(target=_put, args=(port, '/documents/%s/file' % document_id,
+                                                           headers, i, size, out))
+                       for i, document_id in enumerate(document_ids[:uploads])]
+            with Timer() as t:
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            assert all(status == 200 for status, _ in out), out
+            peak = _peak_rss(process.pid)
+            results['streaming'] = {
+                'seconds': round(t.elapsed, 2),
+                'mb_per_sec': round(uploads * size / t.elapsed / 1e6, 1),
+                'idle_rss_mb': round(idle / 1e6, 1),
+                'peak_rss_mb': round(peak / 1e6, 1),
+                'peak_rss_growth_mb': round((peak - idle) / 1e6, 1),
+                'bytes_received_mb': round(uploads * size / 1e6, 1),
+            }
+
+            # the same content again is stored once
+            out = []
+            _put(port, '/documents/%s/file' % document_ids[-1], headers, 0, size, out)
+            stored = sum(len(files) for root, _, files in os.walk(os.path.join(tmp, 'files'))
+                         if not root.endswith('tmp'))
+            results['files_stored'] = stored
+            # the response doesn't say, so count: one file per distinct content
+            results['repeat_upload_deduplicated'] = stored == uploads
+
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+            path = '/documents/%s/file' % document_ids[0]
+            with Timer() as t:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                received = 0
+                while True:
+                    chunk = response.read(BLOCK)
+                    if not chunk:
+                        break
+                    received += len(chunk)
+            assert received == size
+            conn.request('GET', path, headers=dict(headers, Range='bytes=1000-1999'))
+            response = conn.getresponse()
+            results['download'] = {'mb_per_sec': round(size / t.elapsed / 1e6, 1),
+                                   'range_status': response.status, 'range_bytes': len(response.read()),
+                                   'peak_rss_mb': round(_peak_rss(process.pid) / 1e6, 1)}
+            conn.close()
+        finally:
+            process.terminate()
+            process.wait()
+
+        port, process = _server(env)
+        try:
+            idle = _peak_rss(process.pid)
+            out = []
+            _put(port, '/buffered', headers, 99, buffered, out)
+            peak = _peak_rss(process.pid)
+            results['buffered'] = {'bytes': buffered, 'peak_rss_mb': round(peak / 1e6, 1),
+                                   'peak_rss_growth_mb': round((peak - idle) / 1e6, 1)}
+        finally:
+            process.terminate()
+            process.wait()
+    return results
+
+
+if __name__ == '__main__':
+    report('uploads', run())
@@ -0,0 +1,117 @@
+"""Fail unless two interleaved bookings of one slot end in exactly one appointment.
+
+Two threads, each with its own session, book the same doctor's slot through
+app.scheduling.book after reading the patient row first, as the endpoint
+does. A before_flush hook holds each booking after its clash check until
+the other has passed its own (or ROW_LOCK_WAIT seconds went by, which is
+what happens when the doctor row lock serialises them), so on a database
+without row locks both checks see a free slot and only
+ix_appointments_doctor_id_booked_slot stands between them and a double
+booking. Run from the engine directory:
+
+    python -m benchmarks.check_booking_race
+    python -m benchmarks.check_booking_race --database-url mysql+pymysql://root@localhost/ehealth_check
+
+Exits non-zero unless one booking succeeded and the other got
+SlotUnavailable.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from benchmarks.common import make_app, report
+
+ROW_LOCK_WAIT = 2.0
+
+
+def seed(db):
+    from app.models import Doctors, Patients, Users
+
+    db.drop_all()
+    db.create_all()
+    doctor_user = Users(username='doctor', role='doctor')
+    users = [Users(username='patient%d' % i, role='patient') for i in range(2)]
+    db.session.add_all([doctor_user] + users)
+    db.session.flush()
+    doctor = Doctors(user_id=doctor_user.user_id)
+    db.session.add_all([doctor] + [Patients(user_id=user.user_id) for user in users])
+    db.session.commit()
+    return doctor.doctor_id, [user.user_id for user in users]
+
+
+def run(database_url=None):
+    from app import db
+    from app.models import Appointments, Patients
+    from app.scheduling import SlotUnavailable, book
+    from config import engine_options
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = database_url or 'sqlite:///' + os.path.join(tmp, 'check.db')
+        app = make_app(SQLALCHEMY_DATABASE_URI=url, SQLALCHEMY_ENGINE_OPTIONS=engine_options(url))
+        with app.app_context():
+            doctor_id, user_ids = seed(db)
+        starts_at = (datetime.utcnow() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+        checked = threading.Barrier(2)
+        outcomes = {}
+
+        def hold_after_check(session, flush_context, instances):
+            if any(isinstance(obj, Appointments) for obj in session.new):
+                try:
+                    checked.wait(ROW_LOCK_WAIT)
+                except threading.BrokenBarrierError:
+                    pass
+
+        def attempt(user_id):
+            with app.app_context():
+                try:
+                    # the read that pins a REPEATABLE READ snapshot in the endpoint
+                    patient_id = db.session.scalar(select(Patients.patient_id).where(Patients.user_id == user_id))
+                    book(doctor_id, patient_id, starts_at, 30, app.config)
+                    outcomes[user_id] = 'booked'
+                except SlotUnavailable:
+                    outcomes[user_id] = 'unavailable'
+                except Exception as exc:
+                    outcomes[user_id] = repr(exc)
+                finally:
+                    db.session.remove()
+
+        event.listen(Session, 'before_flush', hold_after_check)
+        try:
+            threads = [threading.Thread(target=attempt, args=(user_id,)) for user_id in user_ids]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            event.remove(Session, 'before_flush', hold_after_check)
+
+        with app.app_context():
+            stored = db.session.scalar(
+                select(db.func.count()).select_from(Appointments)
+                .where(Appointments.doctor_id == doctor_id, Appointments.starts_at == starts_at))
+            if database_url:
+                db.drop_all()
+            db.session.remove()
+            db.engine.dispose()
+    results = sorted(outcomes.values())
+    return {'database': url.split(':')[0], 'outcomes': results, 'stored': stored,
+            'ok': results == ['booked', 'unavailable'] and stored == 1}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='an empty database to use instead of a temporary SQLite file')
+    args = parser.parse_args(argv)
+    results = run(args.database_url)
+    report('booking_race', results)
+    return 0 if results['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
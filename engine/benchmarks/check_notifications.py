@@ -0,0 +1,74 @@
+"""Fail unless booking an appointment and sending a message notify their users.
+
+With NOTIFY_EVENTS on (it is off by default), books an appointment through
+POST /doctors/<id>/appointments and sends a message through POST
+/messages, then waits for the background dispatcher to store the
+notifications. Run from the engine directory:
+
+    python -m benchmarks.check_notifications
+
+Exits non-zero when a notification is missing after TIMEOUT seconds.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import make_app, report
+
+TIMEOUT = 5.0
+
+
+def seed(db):
+    from app.models import Doctors, Patients, Users
+
+    db.create_all()
+    doctor_user = Users(username='doctor', role='doctor')
+    patient_user = Users(username='patient', role='patient')
+    db.session.add_all([doctor_user, patient_user])
+    db.session.flush()
+    doctor = Doctors(user_id=doctor_user.user_id)
+    db.session.add_all([doctor, Patients(user_id=patient_user.user_id)])
+    db.session.commit()
+    return doctor.doctor_id, doctor_user.user_id, patient_user.user_id
+
+
+def stored(db, expected):
+    from app.models import Notifications
+
+    rows = db.session.execute(db.select(Notifications.user_id, Notifications.notification_type)).all()
+    db.session.remove()
+    return {(user_id, notification_type) for user_id, notification_type in rows} >= expected
+
+
+def run():
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'check.db'), NOTIFY_EVENTS=True)
+        from app import db
+        from app.notifications import dispatcher
+
+        with app.app_context():
+            doctor_id, doctor_user_id, patient_user_id = seed(db)
+        client = app.test_client()
+        starts_at = (datetime.utcnow() + timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+        booked = client.post('/doctors/%s/appointments' % doctor_id, headers={'user_id': patient_user_id},
+                             json={'starts_at': starts_at.isoformat()})
+        sent = client.post('/messages', headers={'user_id': patient_user_id},
+                           json={'receiver_id': doctor_user_id, 'message': 'hello'})
+        expected = {(doctor_user_id, 'appointment_booked'), (patient_user_id, 'appointment_confirmed'),
+                    (doctor_user_id, 'message')}
+        deadline = time.monotonic() + TIMEOUT
+        with app.app_context():
+            ok = stored(db, expected)
+            while not ok and time.monotonic() < deadline:
+                time.sleep(0.05)
+                ok = stored(db, expected)
+        return {'booked': booked.status_code, 'sent': sent.status_code, 'dispatcher': dispatcher.stats(),
+                'ok': booked.status_code == 201 and sent.status_code == 201 and ok}
+
+
+if __name__ == '__main__':
+    results = run()
+    report('notifications', results)
+    sys.exit(0 if results['ok'] else 1)
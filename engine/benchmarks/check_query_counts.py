@@ -0,0 +1,78 @@
+"""Fail if the number of SQL statements an endpoint runs grows with the rows it returns.
+
+Run from the engine directory: python -m benchmarks.check_query_counts
+Exits non-zero when any endpoint's statement count differs between a small
+and a large page.
+"""
+import sys
+
+from benchmarks.common import make_app, report
+
+ENDPOINTS = (
+    '/appointments?include=doctor,patient',
+    '/documents?include=doctor,patient',
+    '/prescriptions?include=doctor,patient',
+    '/medical-history?include=doctor,patient',
+)
+
+
+def seed(db, rows):
+    from app.models import (Users, Patients, Doctors, Appointments, Documents,
+                            Prescriptions, MedicalHistory)
+
+    db.drop_all()
+    db.create_all()
+    patient_user = Users(username='patient', role='patient')
+    db.session.add(patient_user)
+    db.session.flush()
+    patient = Patients(user_id=patient_user.user_id)
+    db.session.add(patient)
+    db.session.flush()
+    for i in range(rows):
+        # a different doctor per row is the worst case for lazy loading
+        doctor_user = Users(username='doctor%d' % i, role='doctor')
+        db.session.add(doctor_user)
+        db.session.flush()
+        doctor = Doctors(user_id=doctor_user.user_id)
+        db.session.add(doctor)
+        db.session.flush()
+        for model in (Appointments, Documents, Prescriptions, MedicalHistory):
+            db.session.add(model(patient_id=patient.patient_id, doctor_id=doctor.doctor_id))
+    db.session.commit()
+    return patient_user.user_id
+
+
+def statement_counts(app, rows):
+    from app import db
+    from app.sqlcount import count_queries
+
+    client = app.test_client()
+    with app.app_context():
+        user_id = seed(db, rows)
+        engine = db.engine
+    counts = {}
+    for url in ENDPOINTS:
+        # warm the principal cache so only the endpoint's own queries count
+        client.get(url, headers={'user_id': user_id})
+        with count_queries(engine) as counter:
+            response = client.get(url + '&limit=%d' % rows, headers={'user_id': user_id})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        assert len(response.get_json()['items']) == rows
+        counts[url] = counter.count
+    return counts
+
+
+def run(small=2, large=50):
+    # the seeded appointments would otherwise queue notification inserts
+    # that run, and get counted, while the endpoints are measured
+    app = make_app(NOTIFY_EVENTS=False)
+    before = statement_counts(app, small)
+    after = statement_counts(app, large)
+    return {url: {'rows_%d' % small: before[url], 'rows_%d' % large: after[url],
+                  'ok': before[url] == after[url]} for url in ENDPOINTS}
+
+
+if __name__ == '__main__':
+    results = run()
+    report('query_counts', results)
+    sys.exit(0 if all(r['ok'] for r in results.values()) else 1)
@@ -0,0 +1,85 @@
+"""Fail unless /sync hands a user the messages they sent as well as received.
+
+Seeds three users exchanging messages, then pages /sync for one of them
+with a small limit, so sent and received messages are merged across pages,
+and compares the message ids that came back with the ones they sent or
+received. Run from the engine directory:
+
+    python -m benchmarks.check_sync
+
+Exits non-zero when a message is missing, another user's message leaks in
+or one is sent twice within the full sync.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from benchmarks.common import make_app, report
+
+MESSAGES = 12
+PAGE = 3
+
+
+def seed(db):
+    from app.models import Messages, Patients, Users
+
+    users = [Users(username='user%d' % i, role='patient') for i in range(3)]
+    db.session.add_all(users)
+    db.session.flush()
+    db.session.add_all([Patients(user_id=user.user_id) for user in users])
+    me, friend, stranger = [user.user_id for user in users]
+    start = datetime.utcnow() - timedelta(hours=1)
+    # alternate directions, and give some pairs the same updated_at so the
+    # merge has to order on the id as well
+    pairs = [(me, friend), (friend, me), (friend, stranger), (stranger, me), (me, stranger)]
+    messages = [Messages(sender_id=sender, receiver_id=receiver, message='m%d' % i,
+                         updated_at=start + timedelta(seconds=i // 2))
+                for i, (sender, receiver) in enumerate(pairs[i % len(pairs)] for i in range(MESSAGES))]
+    db.session.add_all(messages)
+    db.session.commit()
+    expected = {message.message_id for message in messages if me in (message.sender_id, message.receiver_id)}
+    return me, expected
+
+
+def run():
+    from app import db
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tmp, 'check.db'),
+                       SYNC_PAGE_SIZE=PAGE, SYNC_SAFETY_LAG=0, RATELIMIT_ENABLED=False)
+        with app.app_context():
+            db.create_all()
+            me, expected = seed(db)
+            db.session.remove()
+        client = app.test_client()
+        received = []
+        since = None
+        for calls in range(1, MESSAGES + 10):
+            response = client.get('/sync', query_string={'since': since} if since else {},
+                                  headers={'user-id': me})
+            body = response.get_json()
+            received += [message['message_id'] for message in body['changes'].get('messages', {}).get('upserts', [])]
+            since = body['next']
+            if not body['has_more']:
+                break
+    return {
+        'messages': MESSAGES,
+        'expected': len(expected),
+        'received': len(received),
+        'calls': calls,
+        'missing': len(expected - set(received)),
+        'foreign': len(set(received) - expected),
+        'repeated': len(received) - len(set(received)),
+        'ok': set(received) == expected and len(received) == len(expected),
+    }
+
+
+def main():
+    results = run()
+    report('sync_messages', results)
+    return 0 if results['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
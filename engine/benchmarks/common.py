@@ -0,0 +1,61 @@
+import json
+import os
+import sys
+import time
+
+# benchmarks run against a throwaway SQLite database unless told otherwise
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def scale(n):
+    """Scale a default dataset size by BENCH_SCALE (e.g. 0.01 for a smoke run)."""
+    return max(1, int(n * float(os.getenv('BENCH_SCALE', 1))))
+
+
+def make_app(**config):
+    """A fresh app from config.Config with ``config`` overriding it."""
+    from app import create_app
+    from config import Config
+    return create_app(type('BenchmarkConfig', (Config,), config))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Timer(object):
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def report(name, results):
+    print(json.dumps({'benchmark': name, 'results': results}, indent=2, default=str))
+
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS_DIR = os.path.join(ENGINE_DIR, 'migrations')
+
+
+def migrate(engine, revision='head'):
+    """Run the Alembic revisions from base up to ``revision`` against ``engine``."""
+    from alembic.operations import Operations
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    script = ScriptDirectory(MIGRATIONS_DIR)
+    revisions = list(script.walk_revisions('base', revision))
+    with engine.begin() as conn:
+        context = MigrationContext.configure(conn, opts={'render_as_batch': True})
+        with Operations.context(context):
+            for rev in reversed(revisions):
+                rev.module.upgrade()
@@ -0,0 +1,261 @@
+"""Synthetic data for benchmarks: users, doctors, patients and their records, messages, posts and follows.
+
+generate() bulk inserts through Core executemany in batches, so a full
+dataset takes seconds, and everything (ids included) comes from one seeded
+RNG and a fixed clock, so the same seed and scale always give the same
+rows. SIZES are the row counts at scale 1; BENCH_SCALE or --scale multiply
+them. From the engine directory, into SQLite or a local MySQL:
+
+    python -m benchmarks.datagen --database-url sqlite:///bench.db --create
+    python -m benchmarks.datagen --database-url mysql+pymysql://root@localhost/ehealth --scale 0.1
+"""
+import argparse
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from benchmarks.bench_doctor_search import CITIES, FIRST, LAST, SPECIALTIES
+from benchmarks.common import Timer, make_app, report, scale
+
+SIZES = {
+    'doctors': 2000,
+    'patients': 20000,
+    'appointments': 100000,
+    'documents': 40000,
+    'prescriptions': 40000,
+    'messages': 100000,
+    'posts': 20000,
+    'follows': 60000,
+}
+MESSAGES_PER_CONVERSATION = 8
+# every generated user has this password
+PASSWORD = 'benchmark-password'
+# "now" for the generated rows, so dates do not depend on the day it runs
+ANCHOR = datetime(2026, 1, 1)
+
+DOCUMENTS = ['Lab report', 'Blood panel', 'X-ray', 'MRI scan', 'Referral letter', 'Discharge summary']
+DRUGS = ['Lisinopril 10mg', 'Metformin 500mg', 'Atorvastatin 20mg', 'Amoxicillin 250mg', 'Levothyroxine 50mcg']
+NOTES = ['Follow-up visit', 'Annual check-up', 'Blood pressure review', 'New symptoms', 'Test results']
+MESSAGES = ['Question about my prescription', 'Can we move the appointment?', 'Results are in',
+            'Please bring your previous reports', 'Thank you, doctor']
+
+
+class Ids(object):
+    """uuid7-shaped ids from an RNG and a clock ticking 1ms per id, so they stay time ordered."""
+
+    def __init__(self, rng, start):
+        self.rng = rng
+        self.ms = int((start - datetime(1970, 1, 1)).total_seconds() * 1000)
+
+    def __call__(self):
+        self.ms += 1
+        value = self.ms << 80 | 0x7 << 76 | self.rng.getrandbits(12) << 64 | 0x2 << 62 | self.rng.getrandbits(62)
+        return str(uuid.UUID(int=value))
+
+
+class Dataset(object):
+    """What generate() made: row counts and the ids scenarios pick callers from.
+
+    ``usernames`` holds active users only, ``inactive`` the user ids that
+    cannot sign in or call the API.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.inactive = set()
+        self.doctor_users = []
+        self.patient_users = []
+        self.doctor_ids = []
+        self.patient_ids = []
+        self.usernames = []
+        self.password = PASSWORD
+        self.seconds = 0.0
+
+    def summary(self):
+        return dict(self.counts, seconds=round(self.seconds, 2))
+
+
+def sizes(factor=None):
+    """SIZES scaled by ``factor``, or by BENCH_SCALE when it is None."""
+    if factor is None:
+        return {name: scale(count) for name, count in SIZES.items()}
+    return {name: max(1, int(count * factor)) for name, count in SIZES.items()}
+
+
+def _insert(connection, model, rows, batch):
+    table = model.__table__
+    for offset in range(0, len(rows), batch):
+        connection.execute(table.insert(), rows[offset:offset + batch])
+
+
+def generate(engine, factor=None, seed=1, batch=5000, password_hash=None):
+    """Fill the (empty, created) schema behind ``engine``; returns a Dataset."""
+    from sqlalchemy import bindparam
+    from werkzeug.security import generate_password_hash
+
+    from app.conversations import conversation_key
+    from app.models import (Appointments, Conversations, Doctors, Documents, Follows, Messages, Patients, Posts,
+                            Prescriptions, Users)
+
+    counts = sizes(factor)
+    rng = random.Random(seed)
+    new_id = Ids(rng, ANCHOR - timedelta(days=3 * 365))
+    data = Dataset()
+    password_hash = password_hash or generate_password_hash(PASSWORD, method='scrypt')
+
+    def when(days=3 * 365):
+        return ANCHOR - timedelta(seconds=rng.randrange(60, days * 24 * 3600))
+
+    with Timer() as t, engine.begin() as connection:
+        users, doctors, patients = [], [], []
+        for i in range(counts['doctors'] + counts['patients']):
+            is_doctor = i < counts['doctors']
+            user_id = new_id()
+            username = ('dr' if is_doctor else 'pt') + '%06d' % i
+            is_active = rng.random() < 0.98
+            users.append({'user_id': user_id, 'username': username, 'email': username + '@example.com',
+                          'password_hash': password_hash, 'role': 'doctor' if is_doctor else 'patient',
+                          'is_active': is_active, 'follower_count': 0, 'created_at': when()})
+            city, state, zip_prefix = rng.choice(CITIES)
+            person = {'user_id': user_id, 'first_name': rng.choice(FIRST), 'last_name': rng.choice(LAST),
+                      'gender': rng.choice(['male', 'female']), 'city': city, 'state': state,
+                      'zip_code': zip_prefix + '%02d' % rng.randint(0, 99), 'is_active': True,
+                      'is_deleted': False, 'updated_at': when()}
+            if is_doctor:
+                person.update(doctor_id=new_id(), specialty=rng.choice(SPECIALTIES),
+                              license_number='LIC%07d' % i)
+                doctors.append(person)
+                data.doctor_users.append(user_id)
+                data.doctor_ids.append(person['doctor_id'])
+            else:
+                person['patient_id'] = new_id()
+                patients.append(person)
+                data.patient_users.append(user_id)
+                data.patient_ids.append(person['patient_id'])
+            if is_active:
+                data.usernames.append(username)
+            else:
+                data.inactive.add(user_id)
+        _insert(connection, Users, users, batch)
+        _insert(connection, Doctors, doctors, batch)
+        _insert(connection, Patients, patients, batch)
+
+        # a few busy doctors see most patients
+        cum_weights = list(accumulate(1.0 / (i + 1) ** 0.5 for i in range(len(data.doctor_ids))))
+
+        def doctor():
+            return rng.choices(data.doctor_ids, cum_weights=cum_weights)[0]
+
+        rows = []
+        booked = set()
+        for _ in range(counts['appointments']):
+            starts_at = when(4 * 365).replace(minute=rng.choice([0, 30]), second=0, microsecond=0) \
+                + timedelta(days=365)
+            row = {'appointment_id': new_id(), 'patient_id': rng.choice(data.patient_ids),
+                   'doctor_id': doctor(), 'appointment_date': starts_at,
+                   'appointment_time': starts_at.strftime('%H:%M'), 'starts_at': starts_at,
+                   'ends_at': starts_at + timedelta(minutes=30),
+                   'appointment_notes': rng.choice(NOTES),
+                   'appointment_type': rng.choice(['in-person', 'telemedicine']),
+                   'appointment_status': 'completed' if starts_at < ANCHOR else
+                   rng.choice(['scheduled', 'scheduled', 'cancelled']),
+                   'is_active': True, 'is_deleted': False, 'updated_at': min(starts_at, ANCHOR)}
+            if row['appointment_status'] != 'cancelled':
+                # a slot holds one booking (ix_appointments_doctor_id_booked_slot);
+                # a repeat draw becomes a cancelled one
+                slot = (row['doctor_id'], starts_at)
+                if slot in booked:
+                    row['appointment_status'] = 'cancelled'
+                booked.add(slot)
+            rows.append(row)
+        _insert(connection, Appointments, rows, batch)
+
+        for model, pk, count, values in (
+                (Documents, 'document_id', counts['documents'],
+                 lambda: {'document_name': rng.choice(DOCUMENTS), 'document_type': 'lab'}),
+                (Prescriptions, 'prescription_id', counts['prescriptions'],
+                 lambda: {'prescription_name': rng.choice(DRUGS), 'prescription_type': 'oral'})):
+            _insert(connection, model, [dict(values(), **{
+                pk: new_id(), 'patient_id': rng.choice(data.patient_ids), 'doctor_id': doctor(),
+                'is_active': True, 'is_deleted': False, 'updated_at': when()}) for _ in range(count)], batch)
+
+        # messages between patients and their doctors, with the
+        # conversations app.conversations would have kept for them
+        doctor_users = dict(zip(data.doctor_ids, data.doctor_users))
+        # about MESSAGES_PER_CONVERSATION messages per patient and doctor pair
+        pairs = [(rng.choice(data.patient_users), doctor_users[doctor()])
+                 for _ in range(max(1, counts['messages'] // MESSAGES_PER_CONVERSATION))]
+        conversations = {}
+        rows = []
+        for _ in range(counts['messages']):
+            patient, other = rng.choice(pairs)
+            sender, receiver = (patient, other) if rng.random() < 0.6 else (other, patient)
+            conversation_id, low, high = conversation_key(sender, receiver)
+            message_id = new_id()
+            sent_at = when(365)
+            rows.append({'message_id': message_id, 'sender_id': sender, 'receiver_id': receiver,
+                         'conversation_id': conversation_id, 'message': rng.choice(MESSAGES),
+                         'message_type': 'text', 'is_active': True, 'is_deleted': False, 'updated_at': sent_at})
+            entry = conversations.setdefault(conversation_id, {
+                'conversation_id': conversation_id, 'user_low_id': low, 'user_high_id': high,
+                'message_count': 0, 'unread_low': 0, 'unread_high': 0, 'created_at': sent_at,
+                'updated_at': sent_at, 'last_message_at': sent_at, 'last_message_id': message_id})
+            if message_id > entry['last_message_id']:
+                entry.update(last_message_id=message_id, last_message_at=sent_at)
+            entry['message_count'] += 1
+            entry['unread_low' if receiver == low else 'unread_high'] += rng.random() < 0.1
+        _insert(connection, Conversations, list(conversations.values()), batch)
+        _insert(connection, Messages, rows, batch)
+        counts['conversations'] = len(conversations)
+
+        everyone = data.doctor_users + data.patient_users
+        _insert(connection, Posts, [{
+            'post_id': new_id(), 'user_id': rng.choice(data.doctor_users) if rng.random() < 0.7
+            else rng.choice(everyone), 'post': 'Health tip #%d' % i, 'post_type': 'text', 'like_count': 0,
+            'comment_count': 0, 'is_active': True, 'is_deleted': False, 'updated_at': when(365),
+        } for i in range(counts['posts'])], batch)
+
+        # patients follow doctors, unique pairs
+        pairs = set()
+        for _ in range(counts['follows']):
+            pairs.add((rng.choice(data.patient_users), doctor_users[doctor()]))
+        follower_counts = {}
+        for _, followee in pairs:
+            follower_counts[followee] = follower_counts.get(followee, 0) + 1
+        _insert(connection, Follows, [{'follow_id': new_id(), 'follower_id': follower, 'followee_id': followee,
+                                       'created_at': when()} for follower, followee in sorted(pairs)], batch)
+        counts['follows'] = len(pairs)
+        users_table = Users.__table__
+        connection.execute(users_table.update().where(users_table.c.user_id == bindparam('uid'))
+                           .values(follower_count=bindparam('n')),
+                           [{'uid': user_id, 'n': n} for user_id, n in follower_counts.items()])
+
+    data.counts = counts
+    data.seconds = t.elapsed
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--scale', type=float, help='multiplies SIZES (default BENCH_SCALE or 1)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--create', action='store_true', help='create the tables first')
+    args = parser.parse_args(argv)
+
+    from app import db
+    from config import engine_options
+
+    app = make_app(SQLALCHEMY_DATABASE_URI=args.database_url,
+                   SQLALCHEMY_ENGINE_OPTIONS=engine_options(args.database_url))
+    with app.app_context():
+        if args.create:
+            db.create_all()
+        data = generate(db.engine, args.scale, args.seed)
+    report('datagen', data.summary())
+
+
+if __name__ == '__main__':
+    main()
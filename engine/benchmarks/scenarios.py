@@ -0,0 +1,80 @@
+"""Scripted user flows for benchmarks.suite, run against a datagen Dataset.
+
+Each scenario is one step of a flow a real client performs, built from the
+same requests the app's clients send: it gets a test client, the Dataset
+and a seeded RNG and returns the response, which must have the expected
+status. ITERATIONS is how often the suite repeats a scenario at scale 1;
+register and login pay for a password hash each, so they run fewer times.
+"""
+from collections import namedtuple
+
+Scenario = namedtuple('Scenario', ['name', 'iterations', 'status', 'run'])
+
+
+def _user_headers(user_id):
+    return {'user-id': user_id}
+
+
+def _caller(data, rng, users, first=None):
+    # an active user among the first ``first`` of ``users`` (all of them by default)
+    while True:
+        user_id = users[rng.randrange(min(first or len(users), len(users)))]
+        if user_id not in data.inactive:
+            return user_id
+
+
+def register(client, data, rng, i):
+    return client.post('/register', json={'username': 'new%d-%d' % (rng.getrandbits(24), i),
+                                          'password': data.password, 'role': 'patient'})
+
+
+def login(client, data, rng, i):
+    return client.post('/login', json={'username': rng.choice(data.usernames), 'password': data.password})
+
+
+def patient_appointments(client, data, rng, i):
+    return client.get('/appointments?limit=20', headers=_user_headers(_caller(data, rng, data.patient_users)))
+
+
+def doctor_appointments(client, data, rng, i):
+    # the busiest doctors, the ones the generator skews appointments to
+    return client.get('/appointments?limit=20&include=patient',
+                      headers=_user_headers(_caller(data, rng, data.doctor_users, 20)))
+
+
+def patient_documents(client, data, rng, i):
+    return client.get('/documents?limit=20', headers=_user_headers(_caller(data, rng, data.patient_users)))
+
+
+SEARCHES = ('q=smi', 'specialty=cardiology', 'q=jo&state=ny', 'specialty=neurology&facets=city,gender',
+            'zip_code=10001&q=ga', '')
+
+
+def search_doctors(client, data, rng, i):
+    return client.get('/doctors/search?limit=20&' + rng.choice(SEARCHES))
+
+
+def doctor_profile(client, data, rng, i):
+    return client.get('/doctors/' + rng.choice(data.doctor_ids))
+
+
+def inbox(client, data, rng, i):
+    return client.get('/conversations?limit=20',
+                      headers=_user_headers(_caller(data, rng, data.doctor_users, 20)))
+
+
+def feed(client, data, rng, i):
+    return client.get('/feed?limit=20', headers=_user_headers(_caller(data, rng, data.patient_users)))
+
+
+SCENARIOS = (
+    Scenario('register', 20, 201, register),
+    Scenario('login', 20, 200, login),
+    Scenario('patient_appointments', 500, 200, patient_appointments),
+    Scenario('doctor_appointments', 500, 200, doctor_appointments),
+    Scenario('patient_documents', 500, 200, patient_documents),
+    Scenario('search_doctors', 500, 200, search_doctors),
+    Scenario('doctor_profile', 500, 200, doctor_profile),
+    Scenario('inbox', 500, 200, inbox),
+    Scenario('feed', 500, 200, feed),
+)
@@ -0,0 +1,323 @@
+"""The benchmark suite: generated data, scripted scenarios, results compared with a baseline.
+
+Generates a dataset with benchmarks.datagen, then runs every scenario in
+benchmarks.scenarios through the test client and records, per scenario,
+operations per second, p50/p95/p99 latency, SQL statements per operation
+and unexpected statuses, each the median of --rounds rounds. Every
+scenario gets its own copy of the dataset and a fresh app with empty
+in-process caches, so results do not depend on which scenarios ran
+before it. Results are written as JSON (--output) and compared with a
+stored baseline (benchmarks/baseline.json by default): more statements
+per operation or more unexpected statuses are regressions and the exit
+status is 1; a latency or throughput more than --threshold worse is only
+reported as a slowdown, since timings move with the machine's load. A
+baseline generated from other data (database, scale, seed or dataset
+sizes) measured another workload: nothing is compared and the exit status
+is 2. --save-baseline stores this run as the new baseline; its meta.commit is
+the tree it was measured on ("-dirty" for uncommitted changes), so a
+baseline saved before committing names the parent of the commit that
+ships it. Timings only compare between runs on the same machine,
+database and scale, which the results record. Run from the engine directory:
+
+    python -m benchmarks.suite
+    python -m benchmarks.suite --scale 0.1 --only login,inbox --output results.json
+    python -m benchmarks.suite --database-url mysql+pymysql://root@localhost/ehealth_bench
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import event
+
+from benchmarks.common import ENGINE_DIR, Timer, make_app, percentile
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# compared metric -> True when higher is better; p99 is reported but at a
+# few hundred operations it is one or two samples, too noisy to compare
+METRICS = {'ops_per_sec': True, 'p50_ms': False, 'p95_ms': False}
+# timing changes smaller than this are noise whatever the percentage
+MIN_DELTA_MS = 0.2
+# statements per operation are exact for a given dataset and request
+# sequence; the margin only absorbs rounding
+MIN_QUERY_DELTA = 0.05
+# what the generated data depends on; a baseline that differs in any of
+# them measured another workload, and its statement counts don't apply
+DATA_CONDITIONS = ('database', 'scale', 'seed', 'dataset')
+# the caches must not expire on the clock mid-scenario, or a slower machine
+# would run more statements than a fast one; a day outlasts any run
+CACHE_TTL = 24 * 3600.0
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=ENGINE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _statements(engine):
+    # statements run by this thread; the batched background writers (login
+    # addresses, counters) flush on their own clock and would make the
+    # count differ between runs
+    counted = []
+    thread = threading.get_ident()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            counted.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    return counted, lambda: event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def _round(client, engine, scenario, data, seed, iterations):
+    # every round and every run of the suite sends the same requests
+    rng = random.Random('%s:%s' % (scenario.name, seed))
+    timings = []
+    statuses = Counter()
+    statements, stop = _statements(engine)
+    try:
+        with Timer() as total:
+            for i in range(iterations):
+                with Timer() as t:
+                    response = scenario.run(client, data, rng, i)
+                timings.append(t.elapsed * 1000)
+                statuses[response.status_code] += 1
+    finally:
+        stop()
+    return {
+        'ops': iterations,
+        'errors': iterations - statuses[scenario.status],
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'ops_per_sec': round(iterations / total.elapsed, 1),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'queries_per_op': round(len(statements) / float(iterations), 2),
+    }
+
+
+def _median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2.0
+
+
+def run_scenario(app, engine, scenario, data, factor, seed, rounds=5):
+    """Median results of ``rounds`` rounds of ``scenario.iterations`` (scaled) runs."""
+    client = app.test_client()
+    iterations = max(5, int(scenario.iterations * min(1.0, factor * 10)))
+    # one untimed run warms caches and the search index
+    scenario.run(client, data, random.Random(seed), -1)
+    all_rounds = [_round(client, engine, scenario, data, '%d:%d' % (seed, n), iterations)
+                  for n in range(rounds)]
+    # a single round can be slowed down by the rest of the machine, the
+    # median of each metric is what a rerun reproduces
+    results = {metric: round(_median([r[metric] for r in all_rounds]), 3)
+               for metric in ('ops_per_sec', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_op')}
+    statuses = Counter()
+    for r in all_rounds:
+        statuses.update(r['statuses'])
+    results.update(ops=iterations * rounds, errors=sum(r['errors'] for r in all_rounds),
+                   statuses=dict(sorted(statuses.items())), rounds=rounds)
+    return results
+
+
+def _reset_state():
+    # the process-wide caches and indexes outlive an app; each scenario
+    # starts from the same empty state
+    from app import http_cache, pictures, principals, scheduling, search, timelines
+
+    for cache in (principals.principal_cache, scheduling.schedule_cache, http_cache.response_cache,
+                  pictures.known_pictures):
+        cache.clear()
+    timelines.store.clear()
+    search.reset()
+
+
+def _scenario_app(url, tmp):
+    from config import engine_options
+
+    # the rate limits would turn the login and register loops into 429s;
+    # notifications are written by a background thread on its own clock
+    return make_app(SQLALCHEMY_DATABASE_URI=url, SQLALCHEMY_ENGINE_OPTIONS=engine_options(url),
+                    RATELIMIT_ENABLED=False, METRICS_ENABLED=False, NOTIFY_EVENTS=False,
+                    STORAGE_ROOT=os.path.join(tmp, 'storage'), PRINCIPAL_CACHE_TTL=CACHE_TTL,
+                    SCHEDULE_CACHE_TTL=CACHE_TTL, RESPONSE_CACHE_TTL=CACHE_TTL,
+                    DOCTOR_INDEX_MAX_AGE=0, FEED_TIMELINE_MAX_AGE=0)
+
+
+def run(factor=0.1, seed=1, database_url=None, only=None, rounds=5):
+    """Generate data at ``factor`` of datagen.SIZES and run the scenarios; returns the results."""
+    from sqlalchemy import __version__ as sqlalchemy_version
+    from sqlalchemy.engine import make_url
+
+    from app import db, login_ips
+    from benchmarks import datagen
+    from benchmarks.scenarios import SCENARIOS
+
+    scenarios = [s for s in SCENARIOS if not only or s.name in only]
+    with tempfile.TemporaryDirectory() as tmp:
+        generated = os.path.join(tmp, 'generated.db')
+        url = database_url or 'sqlite:///' + os.path.join(tmp, 'bench.db')
+
+        def generate(target):
+            app = _scenario_app(target, tmp)
+            with app.app_context():
+                db.drop_all()
+                db.create_all()
+                dataset = datagen.generate(db.engine, factor, seed)
+                db.session.remove()
+                db.engine.dispose()
+            return dataset
+
+        # a SQLite dataset is generated once and copied for each scenario;
+        # another database is regenerated, from the same seed, every time
+        data = generate(database_url or 'sqlite:///' + generated)
+        results = {
+            'meta': {
+                'commit': _commit(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'database': make_url(url).get_backend_name(),
+                'scale': factor,
+                'seed': seed,
+                'python': platform.python_version(),
+                'sqlalchemy': sqlalchemy_version,
+                'machine': '%s %s, %d cpu' % (platform.system(), platform.machine(), os.cpu_count() or 1),
+            },
+            'dataset': data.summary(),
+            'scenarios': {},
+        }
+        for n, scenario in enumerate(scenarios):
+            if database_url is None:
+                shutil.copyfile(generated, os.path.join(tmp, 'bench.db'))
+            elif n:
+                data = generate(database_url)
+            _reset_state()
+            app = _scenario_app(url, tmp)
+            with app.app_context():
+                results['scenarios'][scenario.name] = run_scenario(app, db.engine, scenario, data, factor,
+                                                                   seed, rounds)
+                # the logins' addresses, before the database goes away
+                login_ips.shutdown()
+                db.session.remove()
+                if database_url:
+                    db.drop_all()
+                db.engine.dispose()
+    return results
+
+
+def compare(results, baseline):
+    """[regression] of ``results`` against ``baseline``: more statements per operation or more errors."""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        if current['queries_per_op'] - before.get('queries_per_op', current['queries_per_op']) >= MIN_QUERY_DELTA:
+            regressions.append({'scenario': name, 'metric': 'queries_per_op', 'baseline': before['queries_per_op'],
+                                'current': current['queries_per_op'], 'change_pct': None})
+        if current['errors'] > before.get('errors', 0):
+            regressions.append({'scenario': name, 'metric': 'errors', 'baseline': before.get('errors', 0),
+                                'current': current['errors'], 'change_pct': None})
+    return regressions
+
+
+def slowdowns(results, baseline, threshold=0.5):
+    """[slowdown] of ``results`` against ``baseline``: timings more than ``threshold`` worse."""
+    found = []
+    for name, current in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = before.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / float(old)
+            worse = -change if higher_is_better else change
+            if worse > threshold and (higher_is_better or new - old >= MIN_DELTA_MS):
+                found.append({'scenario': name, 'metric': metric, 'baseline': old, 'current': new,
+                              'change_pct': round(change * 100, 1)})
+    return found
+
+
+def _sizes(results):
+    return {table: rows for table, rows in results.get('dataset', {}).items() if table != 'seconds'}
+
+
+def _mismatches(results, baseline):
+    """{condition: (baseline, current)} of what differs between the two runs."""
+    keys = ('database', 'scale', 'seed', 'machine')
+    found = {key: (baseline.get('meta', {}).get(key), results['meta'].get(key)) for key in keys
+             if baseline.get('meta', {}).get(key) != results['meta'].get(key)}
+    if _sizes(baseline) != _sizes(results):
+        found['dataset'] = (_sizes(baseline), _sizes(results))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=float(os.getenv('BENCH_SCALE', 0.1)),
+                        help='share of datagen.SIZES to generate (default BENCH_SCALE or 0.1)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=5, help='rounds per scenario, the median is kept')
+    parser.add_argument('--database-url', help='an empty database to use instead of a temporary SQLite file')
+    parser.add_argument('--only', help='comma separated scenario names')
+    parser.add_argument('--output', help='write the results here as JSON')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=float(os.getenv('BENCH_THRESHOLD', 0.5)),
+                        help='slowdown reported, 0.5 = 50%% (default BENCH_THRESHOLD or 0.5)')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.scale, args.seed, args.database_url, args.only and set(args.only.split(',')),
+                  args.rounds)
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        mismatched = _mismatches(results, baseline)
+        comparable = not any(key in mismatched for key in DATA_CONDITIONS)
+        results['baseline'] = {'commit': baseline['meta'].get('commit'), 'time': baseline['meta'].get('time'),
+                               'mismatched': mismatched, 'comparable': comparable}
+        if comparable:
+            results['regressions'] = compare(results, baseline)
+            results['slowdowns'] = slowdowns(results, baseline, args.threshold)
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    print(text)
+    for path in filter(None, (args.output, args.baseline if args.save_baseline else None)):
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+    if baseline is not None and not results['baseline']['comparable']:
+        print('baseline not comparable, it was generated from other data; nothing compared: %s'
+              % {key: value for key, value in results['baseline']['mismatched'].items() if key in DATA_CONDITIONS},
+              file=sys.stderr)
+        return 2
+    if baseline is not None and results['baseline']['mismatched']:
+        print('baseline was recorded under different conditions, timings may not compare: %s'
+              % results['baseline']['mismatched'], file=sys.stderr)
+    for r in results.get('slowdowns', ()):
+        print('SLOWER %(scenario)s %(metric)s: %(baseline)s -> %(current)s (%(change_pct)s%%)' % r, file=sys.stderr)
+    if results.get('regressions'):
+        for r in results['regressions']:
+            print('REGRESSION %(scenario)s %(metric)s: %(baseline)s -> %(current)s' % r, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,9 +2,188 @@ import os
 from dotenv import load_dotenv
 
 load_dotenv()
+
+
+def _flag(name, default):
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+def engine_options(url):
+    """SQLALCHEMY_ENGINE_OPTIONS for ``url``, tuned from DB_POOL_* variables."""
+    # check connections before use so ones the server dropped while idle
+    # are replaced instead of failing the request
+    options = {"pool_pre_ping": _flag("DB_POOL_PRE_PING", True)}
+    if url and url.startswith("sqlite") and (url.endswith("://") or ":memory:" in url):
+        # in-memory SQLite shares one connection, there is no pool to size
+        return options
+    options.update(
+        # connections kept open, and extra ones allowed during bursts
+        pool_size=int(os.getenv("DB_POOL_SIZE", 10)),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 20)),
+        # seconds before a connection is replaced, keep below MySQL's wait_timeout
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        # seconds a request waits for a free connection before a 503
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", 5)),
+    )
+    return options
+
+
 class Config(object):
     SECRET_KEY = os.getenv("SECRET_KEY")
+
+    # off unless asked for; debug also pretty-prints every JSON response
+    DEBUG = _flag("FLASK_DEBUG", False)
     
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL")
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    # the async app (app.aio) derives its URL from DATABASE_URL, swapping in
+    # aiomysql or aiosqlite, unless this is set
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+    # optional read replica, list and search endpoints read from it when set
+    SQLALCHEMY_BINDS = {}
+    if os.getenv("DATABASE_REPLICA_URL"):
+        SQLALCHEMY_BINDS["replica"] = dict(engine_options(os.getenv("DATABASE_REPLICA_URL")),
+                                           url=os.getenv("DATABASE_REPLICA_URL"))
+
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # werkzeug hash method, e.g. "scrypt" or "pbkdf2:sha256:600000"
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+    # size of the hashing process pool, 0 hashes on the request thread
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+    # hashes allowed in flight before requests get a 503
+    PASSWORD_HASH_QUEUE_DEPTH = int(os.getenv("PASSWORD_HASH_QUEUE_DEPTH", 64))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 10))
+
+    # process-local cache of user_id -> (role, is_active) used by role_required
+    PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))
+    PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", 30))
+
+    # page sizes for the cursor paginated list endpoints
+    PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", 20))
+    PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", 100))
+
+    # seconds before the in-process doctor search index is rebuilt from the
+    # database, picking up writes made by other workers (0 disables)
+    DOCTOR_INDEX_MAX_AGE = int(os.getenv("DOCTOR_INDEX_MAX_AGE", 300))
+
+    # push delivery over /events: events buffered per connection before a
+    # slow client is dropped, seconds between keepalives, and the broker
+    # class as "module:Class" (default in-process, one worker only)
+    PUSH_QUEUE_SIZE = int(os.getenv("PUSH_QUEUE_SIZE", 256))
+    PUSH_KEEPALIVE = float(os.getenv("PUSH_KEEPALIVE", 15))
+    PUSH_BROKER = os.getenv("PUSH_BROKER")
+
+    # bulk notifications (app.notifications): rows per INSERT/commit,
+    # broadcasts the background dispatcher queues before refusing more, and
+    # whether booked appointments and sent messages notify their users
+    # (opt-in: it applies to every insert of those rows, imports included)
+    NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", 1000))
+    NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", 100))
+    NOTIFY_EVENTS = _flag("NOTIFY_EVENTS", False)
+
+    # appointment slots: opening hours, slot grid and longest booking in
+    # minutes, and the per-process cache of doctor schedules
+    SCHEDULE_DAY_START = os.getenv("SCHEDULE_DAY_START", "09:00")
+    SCHEDULE_DAY_END = os.getenv("SCHEDULE_DAY_END", "17:00")
+    SCHEDULE_SLOT_MINUTES = int(os.getenv("SCHEDULE_SLOT_MINUTES", 30))
+    SCHEDULE_MAX_MINUTES = int(os.getenv("SCHEDULE_MAX_MINUTES", 240))
+    SCHEDULE_CACHE_SIZE = int(os.getenv("SCHEDULE_CACHE_SIZE", 1000))
+    SCHEDULE_CACHE_TTL = float(os.getenv("SCHEDULE_CACHE_TTL", 60))
+
+    # /feed timelines: post ids kept per user, followers above which an
+    # author's posts are merged in on read instead of fanned out, seconds
+    # before a timeline is rebuilt, posts waiting for fan-out before new
+    # ones are left to the rebuild, and the store as "module:Class"
+    FEED_TIMELINE_SIZE = int(os.getenv("FEED_TIMELINE_SIZE", 800))
+    FEED_FANOUT_LIMIT = int(os.getenv("FEED_FANOUT_LIMIT", 10000))
+    FEED_TIMELINE_MAX_AGE = int(os.getenv("FEED_TIMELINE_MAX_AGE", 300))
+    FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", 10000))
+    FEED_STORE = os.getenv("FEED_STORE")
+
+    # like and comment counters: seconds between batched counter writes
+    # (0 updates them in the liking transaction) and the number of distinct
+    # counters pending that triggers an early write
+    COUNTER_FLUSH_INTERVAL = float(os.getenv("COUNTER_FLUSH_INTERVAL", 1))
+    COUNTER_FLUSH_SIZE = int(os.getenv("COUNTER_FLUSH_SIZE", 1000))
+
+    # uploaded files: "module:Class" of the storage backend (local disk
+    # under STORAGE_ROOT by default), bytes read from the request per chunk
+    # and the largest upload accepted (unset for no limit); a file a
+    # re-upload replaced is kept if it was stored in the last
+    # STORAGE_REMOVE_GRACE seconds
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND")
+    STORAGE_ROOT = os.getenv("STORAGE_ROOT", "storage")
+    STORAGE_CHUNK_SIZE = int(os.getenv("STORAGE_CHUNK_SIZE", 1 << 20))
+    STORAGE_MAX_UPLOAD = int(os.getenv("STORAGE_MAX_UPLOAD")) if os.getenv("STORAGE_MAX_UPLOAD") else None
+    STORAGE_REMOVE_GRACE = float(os.getenv("STORAGE_REMOVE_GRACE", 300))
+    # serve files with X-Sendfile so the front proxy sends them itself
+    USE_X_SENDFILE = _flag("USE_X_SENDFILE", False)
+
+    # profile and banner picture derivatives: the box (px) of each size,
+    # the formats rendered, encoder quality, render processes, seconds a
+    # request waits for a missing derivative, and the on-disk cache
+    # (STORAGE_ROOT/derivatives unless set) with its size cap in bytes
+    IMAGE_SIZES = {"small": 64, "medium": 256, "large": 1024}
+    IMAGE_FORMATS = ("webp", "jpeg")
+    IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 80))
+    IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+    IMAGE_RENDER_TIMEOUT = float(os.getenv("IMAGE_RENDER_TIMEOUT", 10))
+    IMAGE_CACHE_ROOT = os.getenv("IMAGE_CACHE_ROOT")
+    IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 1 << 30))
+
+    # GET responses kept in process keyed by their ETag (0 turns it off),
+    # and seconds before an entry is dropped
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 0))
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 60))
+
+    # /sync: most rows returned per table per call, and seconds behind now
+    # a caught-up token stays so rows from slow transactions are not missed
+    SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", 500))
+    SYNC_SAFETY_LAG = float(os.getenv("SYNC_SAFETY_LAG", 5))
+
+    # token buckets for /login and /register as "count/seconds" ("" turns a
+    # rule off): attempts per client address, failed logins per username,
+    # registrations per address. Buckets live in each process unless
+    # RATELIMIT_STORE ("module:Class") names a shared store. Behind a proxy
+    # the address is the proxy's unless the app is wrapped in ProxyFix
+    RATELIMIT_ENABLED = _flag("RATELIMIT_ENABLED", True)
+    RATELIMIT_STORE = os.getenv("RATELIMIT_STORE")
+    RATELIMIT_LOGIN_IP = os.getenv("RATELIMIT_LOGIN_IP", "20/60")
+    RATELIMIT_LOGIN_USERNAME = os.getenv("RATELIMIT_LOGIN_USERNAME", "5/300")
+    RATELIMIT_REGISTER_IP = os.getenv("RATELIMIT_REGISTER_IP", "10/3600")
+
+    # login addresses are written to user_ip in the background every this
+    # many seconds, or sooner once this many are queued
+    LOGIN_IP_FLUSH_INTERVAL = float(os.getenv("LOGIN_IP_FLUSH_INTERVAL", 1))
+    LOGIN_IP_FLUSH_SIZE = int(os.getenv("LOGIN_IP_FLUSH_SIZE", 1000))
+
+    # bearer tokens from POST /token: signing keys as "id:secret,..." with
+    # the signing one first (derived from SECRET_KEY when unset), seconds an
+    # access and a refresh token live, seconds between reloads of the
+    # revocation list, and whether role_required ignores the user_id header
+    TOKEN_KEYS = os.getenv("TOKEN_KEYS")
+    TOKEN_ACCESS_TTL = int(os.getenv("TOKEN_ACCESS_TTL", 900))
+    TOKEN_REFRESH_TTL = int(os.getenv("TOKEN_REFRESH_TTL", 14 * 24 * 3600))
+    TOKEN_REVOCATION_REFRESH = float(os.getenv("TOKEN_REVOCATION_REFRESH", 5))
+    TOKEN_AUTH_ONLY = _flag("TOKEN_AUTH_ONLY", False)
+
+    # request and SQL instrumentation served at /metrics (Prometheus text)
+    # behind "Authorization: Bearer <METRICS_TOKEN>"; without a token the
+    # endpoint is a 404 except under TESTING. Statements slower than
+    # SLOW_QUERY_SECONDS are logged
+    METRICS_ENABLED = _flag("METRICS_ENABLED", True)
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", 0.5))
+
+    # share of requests run under a profiler ("cprofile" or "pyinstrument"),
+    # whose profile is kept in PROFILE_DIR if the request took at least
+    # PROFILE_SLOW_SECONDS; the newest PROFILE_KEEP are kept
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_SLOW_SECONDS = float(os.getenv("PROFILE_SLOW_SECONDS", 1))
+    PROFILER = os.getenv("PROFILER", "cprofile")
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+    PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 100))
 
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    # when set every SQL statement is appended here for `flask index-audit`
+    SQL_LOG_PATH = os.getenv("SQL_LOG_PATH")
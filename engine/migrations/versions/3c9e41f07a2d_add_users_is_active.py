@@ -0,0 +1,26 @@
+"""add users is_active
+
+Revision ID: 3c9e41f07a2d
+Revises: 150676a23451
+Create Date: 2026-10-18 09:12:44.103517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9e41f07a2d'
+down_revision = '150676a23451'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('is_active', sa.Boolean(), nullable=True, server_default=sa.true()))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('is_active')
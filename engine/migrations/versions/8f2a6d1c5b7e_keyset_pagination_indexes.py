@@ -0,0 +1,52 @@
+"""keyset pagination indexes
+
+Revision ID: 8f2a6d1c5b7e
+Revises: 3c9e41f07a2d
+Create Date: 2026-10-18 10:02:31.557120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2a6d1c5b7e'
+down_revision = '3c9e41f07a2d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.create_index('ix_appointments_patient_id_updated_at', ['patient_id', 'updated_at', 'appointment_id'], unique=False)
+        batch_op.create_index('ix_appointments_doctor_id_updated_at', ['doctor_id', 'updated_at', 'appointment_id'], unique=False)
+
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.create_index('ix_documents_patient_id_updated_at', ['patient_id', 'updated_at', 'document_id'], unique=False)
+        batch_op.create_index('ix_documents_doctor_id_updated_at', ['doctor_id', 'updated_at', 'document_id'], unique=False)
+
+    with op.batch_alter_table('prescriptions', schema=None) as batch_op:
+        batch_op.create_index('ix_prescriptions_patient_id_updated_at', ['patient_id', 'updated_at', 'prescription_id'], unique=False)
+        batch_op.create_index('ix_prescriptions_doctor_id_updated_at', ['doctor_id', 'updated_at', 'prescription_id'], unique=False)
+
+    with op.batch_alter_table('medical_history', schema=None) as batch_op:
+        batch_op.create_index('ix_medical_history_patient_id_updated_at', ['patient_id', 'updated_at', 'medical_history_id'], unique=False)
+        batch_op.create_index('ix_medical_history_doctor_id_updated_at', ['doctor_id', 'updated_at', 'medical_history_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('medical_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_medical_history_doctor_id_updated_at')
+        batch_op.drop_index('ix_medical_history_patient_id_updated_at')
+
+    with op.batch_alter_table('prescriptions', schema=None) as batch_op:
+        batch_op.drop_index('ix_prescriptions_doctor_id_updated_at')
+        batch_op.drop_index('ix_prescriptions_patient_id_updated_at')
+
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.drop_index('ix_documents_doctor_id_updated_at')
+        batch_op.drop_index('ix_documents_patient_id_updated_at')
+
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointments_doctor_id_updated_at')
+        batch_op.drop_index('ix_appointments_patient_id_updated_at')
@@ -0,0 +1,180 @@
+"""drop unused indexes, add composite indexes from index audit
+
+Revision ID: 9db10bde4be3
+Revises: 8f2a6d1c5b7e
+Create Date: 2026-10-18 13:39:31.658885
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9db10bde4be3'
+down_revision = '8f2a6d1c5b7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('doctors', schema=None) as batch_op:
+        batch_op.drop_index('ix_doctors_address')
+        batch_op.drop_index('ix_doctors_banner_picture')
+        batch_op.drop_index('ix_doctors_bio')
+        batch_op.drop_index('ix_doctors_city')
+        batch_op.drop_index('ix_doctors_first_name')
+        batch_op.drop_index('ix_doctors_last_name')
+        batch_op.drop_index('ix_doctors_middle_name')
+        batch_op.drop_index('ix_doctors_profile_picture')
+        batch_op.drop_index('ix_doctors_qualification')
+        batch_op.drop_index('ix_doctors_specialty')
+        batch_op.drop_index('ix_doctors_state')
+        batch_op.drop_index('ix_doctors_zip_code')
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_message')
+        batch_op.drop_index('ix_messages_message_type')
+
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_notification_message')
+        batch_op.drop_index('ix_notifications_notification_type')
+        batch_op.drop_index('ix_notifications_notification_url')
+
+    with op.batch_alter_table('patients', schema=None) as batch_op:
+        batch_op.drop_index('ix_patients_about_me')
+        batch_op.drop_index('ix_patients_address')
+        batch_op.drop_index('ix_patients_banner_picture')
+        batch_op.drop_index('ix_patients_city')
+        batch_op.drop_index('ix_patients_first_name')
+        batch_op.drop_index('ix_patients_last_name')
+        batch_op.drop_index('ix_patients_middle_name')
+        batch_op.drop_index('ix_patients_profile_picture')
+        batch_op.drop_index('ix_patients_state')
+        batch_op.drop_index('ix_patients_zip_code')
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_post')
+        batch_op.drop_index('ix_posts_post_type')
+        batch_op.drop_index('ix_posts_post_url')
+
+    with op.batch_alter_table('user_ip', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_ip_user_ip')
+
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointments_appointment_time')
+
+    with op.batch_alter_table('certificates', schema=None) as batch_op:
+        batch_op.drop_index('ix_certificates_certificate_name')
+
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_index('ix_comments_comment')
+
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.drop_index('ix_documents_document_name')
+        batch_op.drop_index('ix_documents_document_type')
+        batch_op.drop_index('ix_documents_document_url')
+        batch_op.drop_index('ix_documents_picture')
+
+    with op.batch_alter_table('medical_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_medical_history_medical_history_name')
+        batch_op.drop_index('ix_medical_history_medical_history_type')
+        batch_op.drop_index('ix_medical_history_medical_history_url')
+
+    with op.batch_alter_table('prescriptions', schema=None) as batch_op:
+        batch_op.drop_index('ix_prescriptions_prescription_name')
+        batch_op.drop_index('ix_prescriptions_prescription_type')
+        batch_op.drop_index('ix_prescriptions_prescription_url')
+
+    with op.batch_alter_table('patients', schema=None) as batch_op:
+        batch_op.create_index('ix_patients_user_id', ['user_id'], unique=False)
+
+    with op.batch_alter_table('doctors', schema=None) as batch_op:
+        batch_op.create_index('ix_doctors_user_id', ['user_id'], unique=False)
+
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.create_index('ix_appointments_doctor_id_appointment_date', ['doctor_id', 'appointment_date'], unique=False)
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_index('ix_messages_receiver_id_updated_at', ['receiver_id', 'updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('patients', schema=None) as batch_op:
+        batch_op.drop_index('ix_patients_user_id')
+
+    with op.batch_alter_table('doctors', schema=None) as batch_op:
+        batch_op.drop_index('ix_doctors_user_id')
+
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointments_doctor_id_appointment_date')
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_receiver_id_updated_at')
+
+    with op.batch_alter_table('doctors', schema=None) as batch_op:
+        batch_op.create_index('ix_doctors_address', ['address'], unique=False)
+        batch_op.create_index('ix_doctors_banner_picture', ['banner_picture'], unique=False)
+        batch_op.create_index('ix_doctors_bio', ['bio'], unique=False)
+        batch_op.create_index('ix_doctors_city', ['city'], unique=False)
+        batch_op.create_index('ix_doctors_first_name', ['first_name'], unique=False)
+        batch_op.create_index('ix_doctors_last_name', ['last_name'], unique=False)
+        batch_op.create_index('ix_doctors_middle_name', ['middle_name'], unique=False)
+        batch_op.create_index('ix_doctors_profile_picture', ['profile_picture'], unique=False)
+        batch_op.create_index('ix_doctors_qualification', ['qualification'], unique=False)
+        batch_op.create_index('ix_doctors_specialty', ['specialty'], unique=False)
+        batch_op.create_index('ix_doctors_state', ['state'], unique=False)
+        batch_op.create_index('ix_doctors_zip_code', ['zip_code'], unique=False)
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_index('ix_messages_message', ['message'], unique=False)
+        batch_op.create_index('ix_messages_message_type', ['message_type'], unique=False)
+
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_notifications_notification_message', ['notification_message'], unique=False)
+        batch_op.create_index('ix_notifications_notification_type', ['notification_type'], unique=False)
+        batch_op.create_index('ix_notifications_notification_url', ['notification_url'], unique=False)
+
+    with op.batch_alter_table('patients', schema=None) as batch_op:
+        batch_op.create_index('ix_patients_about_me', ['about_me'], unique=False)
+        batch_op.create_index('ix_patients_address', ['address'], unique=False)
+        batch_op.create_index('ix_patients_banner_picture', ['banner_picture'], unique=False)
+        batch_op.create_index('ix_patients_city', ['city'], unique=False)
+        batch_op.create_index('ix_patients_first_name', ['first_name'], unique=False)
+        batch_op.create_index('ix_patients_last_name', ['last_name'], unique=False)
+        batch_op.create_index('ix_patients_middle_name', ['middle_name'], unique=False)
+        batch_op.create_index('ix_patients_profile_picture', ['profile_picture'], unique=False)
+        batch_op.create_index('ix_patients_state', ['state'], unique=False)
+        batch_op.create_index('ix_patients_zip_code', ['zip_code'], unique=False)
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.create_index('ix_posts_post', ['post'], unique=False)
+        batch_op.create_index('ix_posts_post_type', ['post_type'], unique=False)
+        batch_op.create_index('ix_posts_post_url', ['post_url'], unique=False)
+
+    with op.batch_alter_table('user_ip', schema=None) as batch_op:
+        batch_op.create_index('ix_user_ip_user_ip', ['user_ip'], unique=False)
+
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.create_index('ix_appointments_appointment_time', ['appointment_time'], unique=False)
+
+    with op.batch_alter_table('certificates', schema=None) as batch_op:
+        batch_op.create_index('ix_certificates_certificate_name', ['certificate_name'], unique=False)
+
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.create_index('ix_comments_comment', ['comment'], unique=False)
+
+    with op.batch_alter_table('documents', schema=None) as batch_op:
+        batch_op.create_index('ix_documents_document_name', ['document_name'], unique=False)
+        batch_op.create_index('ix_documents_document_type', ['document_type'], unique=False)
+        batch_op.create_index('ix_documents_document_url', ['document_url'], unique=False)
+        batch_op.create_index('ix_documents_picture', ['picture'], unique=False)
+
+    with op.batch_alter_table('medical_history', schema=None) as batch_op:
+        batch_op.create_index('ix_medical_history_medical_history_name', ['medical_history_name'], unique=False)
+        batch_op.create_index('ix_medical_history_medical_history_type', ['medical_history_type'], unique=False)
+        batch_op.create_index('ix_medical_history_medical_history_url', ['medical_history_url'], unique=False)
+
+    with op.batch_alter_table('prescriptions', schema=None) as batch_op:
+        batch_op.create_index('ix_prescriptions_prescription_name', ['prescription_name'], unique=False)
+        batch_op.create_index('ix_prescriptions_prescription_type', ['prescription_type'], unique=False)
+        batch_op.create_index('ix_prescriptions_prescription_url', ['prescription_url'], unique=False)
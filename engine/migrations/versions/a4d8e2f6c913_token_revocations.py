@@ -0,0 +1,43 @@
+"""token revocations
+
+Revision ID: a4d8e2f6c913
+Revises: f3c6a8d1b594
+Create Date: 2026-10-19 05:27:03.861145
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d8e2f6c913'
+down_revision = 'f3c6a8d1b594'
+branch_labels = None
+depends_on = None
+
+
+def _binary_uuid():
+    return sa.LargeBinary(length=16).with_variant(mysql.BINARY(16), 'mysql', 'mariadb')
+
+
+def upgrade():
+    op.create_table('token_revocations',
+    sa.Column('revocation_id', _binary_uuid(), nullable=False),
+    sa.Column('user_id', _binary_uuid(), nullable=False),
+    sa.Column('token_id', sa.String(length=32), nullable=True),
+    sa.Column('not_before', sa.BigInteger(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('revocation_id')
+    )
+    with op.batch_alter_table('token_revocations', schema=None) as batch_op:
+        batch_op.create_index('ix_token_revocations_expires_at', ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('token_revocations', schema=None) as batch_op:
+        batch_op.drop_index('ix_token_revocations_expires_at')
+
+    op.drop_table('token_revocations')
@@ -0,0 +1,55 @@
+"""follows, users.follower_count and the posts index for /feed
+
+Revision ID: a93e5f1c7d24
+Revises: f5b8d2e6a913
+Create Date: 2026-10-18 20:21:07.845120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a93e5f1c7d24'
+down_revision = 'f5b8d2e6a913'
+branch_labels = None
+depends_on = None
+
+
+def _binary_uuid():
+    return sa.LargeBinary(length=16).with_variant(mysql.BINARY(16), 'mysql', 'mariadb')
+
+
+def upgrade():
+    op.create_table('follows',
+    sa.Column('follow_id', _binary_uuid(), nullable=False),
+    sa.Column('follower_id', _binary_uuid(), nullable=False),
+    sa.Column('followee_id', _binary_uuid(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['followee_id'], ['users.user_id'], ),
+    sa.ForeignKeyConstraint(['follower_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('follow_id'),
+    sa.UniqueConstraint('follower_id', 'followee_id', name='uq_follows_follower_id_followee_id')
+    )
+    with op.batch_alter_table('follows', schema=None) as batch_op:
+        batch_op.create_index('ix_follows_followee_id', ['followee_id'], unique=False)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('follower_count', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.create_index('ix_posts_user_id_post_id', ['user_id', 'post_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_user_id_post_id')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('follower_count')
+
+    with op.batch_alter_table('follows', schema=None) as batch_op:
+        batch_op.drop_index('ix_follows_followee_id')
+
+    op.drop_table('follows')
@@ -0,0 +1,69 @@
+"""like and comment counters, one like per user
+
+Revision ID: b2d6f9a4e187
+Revises: a93e5f1c7d24
+Create Date: 2026-10-18 21:37:44.190652
+
+Removes duplicate likes (keeping the first row of every (target, user)
+pair), adds the unique constraints that keep them out, and adds and fills
+posts.like_count, posts.comment_count and comments.like_count.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2d6f9a4e187'
+down_revision = 'a93e5f1c7d24'
+branch_labels = None
+depends_on = None
+
+# like table, like pk, target column
+LIKES = (
+    ('post_likes', 'post_like_id', 'post_id'),
+    ('comment_likes', 'comment_like_id', 'comment_id'),
+)
+# counter table, its pk, counter column, counted table, link column
+COUNTERS = (
+    ('posts', 'post_id', 'like_count', 'post_likes', 'post_id'),
+    ('posts', 'post_id', 'comment_count', 'comments', 'post_id'),
+    ('comments', 'comment_id', 'like_count', 'comment_likes', 'comment_id'),
+)
+
+
+def upgrade():
+    conn = op.get_bind()
+    for table, pk, target in LIKES:
+        # MySQL won't delete from a table it reads in a subquery unless the
+        # subquery is materialised, hence the extra derived table
+        conn.execute(sa.text(
+            'DELETE FROM {t} WHERE {pk} NOT IN (SELECT keep FROM ('
+            'SELECT MIN({pk}) AS keep FROM {t} GROUP BY {target}, user_id) AS keepers)'
+            .format(t=table, pk=pk, target=target)))
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_unique_constraint('uq_{}_{}_user_id'.format(table, target), [target, 'user_id'])
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+
+    for table, pk, column, counted, link in COUNTERS:
+        conn.execute(sa.text(
+            'UPDATE {t} SET {c} = (SELECT COUNT(*) FROM {counted} '
+            'WHERE {counted}.{link} = {t}.{pk} AND ({counted}.is_deleted IS NULL OR {counted}.is_deleted = 0))'
+            .format(t=table, c=column, counted=counted, link=link, pk=pk)))
+
+
+def downgrade():
+    with op.batch_alter_table('comments', schema=None) as batch_op:
+        batch_op.drop_column('like_count')
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('comment_count')
+        batch_op.drop_column('like_count')
+
+    for table, _, target in reversed(LIKES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_constraint('uq_{}_{}_user_id'.format(table, target), type_='unique')
@@ -0,0 +1,99 @@
+"""binary uuid keys, phase 1: shadow columns and backfill
+
+Revision ID: b5e0c2a9d4f1
+Revises: 9db10bde4be3
+Create Date: 2026-10-18 14:05:12.480211
+
+Phase 1 of moving every String(60) uuid key to BINARY(16). On MySQL it adds
+a BINARY(16) `<column>_bin` shadow for every id column, keeps it in step
+with triggers and backfills existing rows in small batches. Only the
+previous release can serve while it runs: its models still write the
+string ids the triggers copy, whereas this release's models read and
+write BINARY(16) ids and need the schema after phase 2. Phase 1 only
+shortens the maintenance window c7d3e8f1a6b2 needs, since the backfill is
+done by then. Other databases (SQLite in development) are converted in
+place by phase 2 and skip this step.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e0c2a9d4f1'
+down_revision = '9db10bde4be3'
+branch_labels = None
+depends_on = None
+
+# table -> id columns, primary key first
+ID_COLUMNS = {
+    'users': ['user_id'],
+    'doctors': ['doctor_id', 'user_id'],
+    'patients': ['patient_id', 'user_id'],
+    'certificates': ['certificate_id', 'doctor_id'],
+    'appointments': ['appointment_id', 'patient_id', 'doctor_id'],
+    'documents': ['document_id', 'patient_id', 'doctor_id'],
+    'prescriptions': ['prescription_id', 'patient_id', 'doctor_id'],
+    'medical_history': ['medical_history_id', 'patient_id', 'doctor_id'],
+    'notifications': ['notification_id', 'user_id'],
+    'messages': ['message_id', 'sender_id', 'receiver_id'],
+    'posts': ['post_id', 'user_id'],
+    'post_likes': ['post_like_id', 'post_id', 'user_id'],
+    'comments': ['comment_id', 'post_id', 'user_id'],
+    'comment_likes': ['comment_like_id', 'comment_id', 'user_id'],
+    'user_ip': ['user_ip_id', 'user_id'],
+}
+
+BATCH_SIZE = 5000
+
+
+def _to_binary(expression):
+    return "UNHEX(REPLACE({}, '-', ''))".format(expression)
+
+
+def _create_triggers(table, columns):
+    assignments = ', '.join('NEW.`{0}_bin` = {1}'.format(c, _to_binary('NEW.`{}`'.format(c)))
+                            for c in columns)
+    for event in ('insert', 'update'):
+        op.execute('CREATE TRIGGER `{0}_{1}_uuid_bin` BEFORE {2} ON `{0}` FOR EACH ROW SET {3}'
+                   .format(table, event, event.upper(), assignments))
+
+
+def _drop_triggers(table):
+    for event in ('insert', 'update'):
+        op.execute('DROP TRIGGER IF EXISTS `{}_{}_uuid_bin`'.format(table, event))
+
+
+def backfill(bind, table, columns):
+    """Fill the shadow columns of rows written before the triggers existed."""
+    assignments = ', '.join('`{0}_bin` = {1}'.format(c, _to_binary('`{}`'.format(c))) for c in columns)
+    statement = sa.text('UPDATE `{0}` SET {1} WHERE `{2}_bin` IS NULL LIMIT {3}'
+                        .format(table, assignments, columns[0], BATCH_SIZE))
+    # autocommit every batch so row locks are only held briefly
+    with bind.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        while conn.execute(statement).rowcount == BATCH_SIZE:
+            pass
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name not in ('mysql', 'mariadb'):
+        return
+    for table, columns in ID_COLUMNS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.add_column(sa.Column('{}_bin'.format(column), mysql.BINARY(16), nullable=True))
+        _create_triggers(table, columns)
+        backfill(bind, table, columns)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name not in ('mysql', 'mariadb'):
+        return
+    for table, columns in ID_COLUMNS.items():
+        _drop_triggers(table)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.drop_column('{}_bin'.format(column))
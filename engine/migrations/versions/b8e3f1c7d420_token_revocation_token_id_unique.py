@@ -0,0 +1,32 @@
+"""unique token_id on token_revocations
+
+Revision ID: b8e3f1c7d420
+Revises: a4d8e2f6c913
+Create Date: 2026-10-19 08:41:17.204519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e3f1c7d420'
+down_revision = 'a4d8e2f6c913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a token revoked twice before this index existed keeps one row; the
+    # derived table lets MySQL delete from the table it selects from
+    op.execute(sa.text(
+        'DELETE FROM token_revocations WHERE token_id IS NOT NULL AND revocation_id NOT IN '
+        '(SELECT keep_id FROM (SELECT MIN(revocation_id) AS keep_id FROM token_revocations '
+        'WHERE token_id IS NOT NULL GROUP BY token_id) AS keep)'))
+    with op.batch_alter_table('token_revocations', schema=None) as batch_op:
+        batch_op.create_index('ix_token_revocations_token_id', ['token_id'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('token_revocations', schema=None) as batch_op:
+        batch_op.drop_index('ix_token_revocations_token_id')
@@ -0,0 +1,179 @@
+"""binary uuid keys, phase 2: swap in the BINARY(16) columns
+
+Revision ID: c7d3e8f1a6b2
+Revises: b5e0c2a9d4f1
+Create Date: 2026-10-18 14:31:47.902355
+
+Not an online migration: run it in a maintenance window, with every
+worker of the previous release stopped, and start this release's workers
+only once it has finished. The previous release writes string ids and this
+one writes BINARY(16) ids through BinaryUUID, so neither can serve against
+the other's schema. On MySQL the shadow columns filled by phase 1 replace
+the String(60) ones, one blocking ALTER TABLE per table, with foreign key
+checks off and the foreign keys and indexes on id columns dropped
+beforehand and recreated afterwards. Elsewhere the stored strings are
+rewritten as 16 raw bytes in place.
+
+"""
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d3e8f1a6b2'
+down_revision = 'b5e0c2a9d4f1'
+branch_labels = None
+depends_on = None
+
+# table -> id columns, primary key first (same as phase 1)
+ID_COLUMNS = {
+    'users': ['user_id'],
+    'doctors': ['doctor_id', 'user_id'],
+    'patients': ['patient_id', 'user_id'],
+    'certificates': ['certificate_id', 'doctor_id'],
+    'appointments': ['appointment_id', 'patient_id', 'doctor_id'],
+    'documents': ['document_id', 'patient_id', 'doctor_id'],
+    'prescriptions': ['prescription_id', 'patient_id', 'doctor_id'],
+    'medical_history': ['medical_history_id', 'patient_id', 'doctor_id'],
+    'notifications': ['notification_id', 'user_id'],
+    'messages': ['message_id', 'sender_id', 'receiver_id'],
+    'posts': ['post_id', 'user_id'],
+    'post_likes': ['post_like_id', 'post_id', 'user_id'],
+    'comments': ['comment_id', 'post_id', 'user_id'],
+    'comment_likes': ['comment_like_id', 'comment_id', 'user_id'],
+    'user_ip': ['user_ip_id', 'user_id'],
+}
+
+BATCH_SIZE = 5000
+
+
+def _is_mysql(bind):
+    return bind.dialect.name in ('mysql', 'mariadb')
+
+
+def _to_text(expression):
+    return ("LOWER(CONCAT_WS('-', SUBSTR(HEX({0}), 1, 8), SUBSTR(HEX({0}), 9, 4), "
+            "SUBSTR(HEX({0}), 13, 4), SUBSTR(HEX({0}), 17, 4), SUBSTR(HEX({0}), 21)))").format(expression)
+
+
+def _convert_in_place(bind, table, columns, convert):
+    """Rewrite the id columns of ``table`` row by row (SQLite and friends)."""
+    select = sa.text('SELECT rowid, {} FROM {}'.format(', '.join(columns), table))
+    update = sa.text('UPDATE {} SET {} WHERE rowid = :rowid'.format(
+        table, ', '.join('{0} = :{0}'.format(c) for c in columns)))
+    rows = bind.execute(select).fetchall()
+    for start in range(0, len(rows), BATCH_SIZE):
+        params = []
+        for row in rows[start:start + BATCH_SIZE]:
+            values = {'rowid': row[0]}
+            for column, value in zip(columns, row[1:]):
+                values[column] = None if value is None else convert(value)
+            params.append(values)
+        bind.execute(update, params)
+
+
+def _dependents(bind):
+    """Foreign keys and non-primary indexes that involve an id column."""
+    inspector = sa.inspect(bind)
+    foreign_keys, indexes = [], []
+    for table, columns in ID_COLUMNS.items():
+        for fk in inspector.get_foreign_keys(table):
+            foreign_keys.append((table, fk))
+        for index in inspector.get_indexes(table):
+            if set(index['column_names']) & set(columns):
+                indexes.append((table, index))
+    return foreign_keys, indexes
+
+
+def _drop_dependents(foreign_keys, indexes):
+    for table, fk in foreign_keys:
+        op.drop_constraint(fk['name'], table, type_='foreignkey')
+    for table, index in indexes:
+        op.drop_index(index['name'], table_name=table)
+
+
+def _create_dependents(foreign_keys, indexes):
+    for table, index in indexes:
+        op.create_index(index['name'], table, index['column_names'], unique=bool(index['unique']))
+    for table, fk in foreign_keys:
+        op.create_foreign_key(fk['name'], table, fk['referred_table'],
+                              fk['constrained_columns'], fk['referred_columns'],
+                              **fk.get('options', {}))
+
+
+def _nullability(bind):
+    inspector = sa.inspect(bind)
+    return {table: {c['name']: c['nullable'] for c in inspector.get_columns(table)}
+            for table in ID_COLUMNS}
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not _is_mysql(bind):
+        for table, columns in ID_COLUMNS.items():
+            _convert_in_place(bind, table, columns, lambda value: uuid.UUID(value).bytes)
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                for column in columns:
+                    batch_op.alter_column(column, type_=sa.LargeBinary(16),
+                                          existing_type=sa.String(length=60))
+        return
+
+    # the triggers have kept new rows in step, this only catches stragglers
+    for table, columns in ID_COLUMNS.items():
+        assignments = ', '.join("`{0}_bin` = UNHEX(REPLACE(`{0}`, '-', ''))".format(c) for c in columns)
+        op.execute('UPDATE `{}` SET {} WHERE `{}_bin` IS NULL'.format(table, assignments, columns[0]))
+
+    nullable = _nullability(bind)
+    foreign_keys, indexes = _dependents(bind)
+    op.execute('SET foreign_key_checks = 0')
+    _drop_dependents(foreign_keys, indexes)
+    for table, columns in ID_COLUMNS.items():
+        for event in ('insert', 'update'):
+            op.execute('DROP TRIGGER IF EXISTS `{}_{}_uuid_bin`'.format(table, event))
+        changes = ['DROP PRIMARY KEY']
+        for column in columns:
+            changes.append('DROP COLUMN `{}`'.format(column))
+            changes.append('CHANGE `{0}_bin` `{0}` BINARY(16) {1}'.format(
+                column, 'NULL' if nullable[table][column] else 'NOT NULL'))
+        changes.append('ADD PRIMARY KEY (`{}`)'.format(columns[0]))
+        op.execute('ALTER TABLE `{}` {}'.format(table, ', '.join(changes)))
+    _create_dependents(foreign_keys, indexes)
+    op.execute('SET foreign_key_checks = 1')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if not _is_mysql(bind):
+        for table, columns in ID_COLUMNS.items():
+            _convert_in_place(bind, table, columns, lambda value: str(uuid.UUID(bytes=bytes(value))))
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                for column in columns:
+                    batch_op.alter_column(column, type_=sa.String(length=60),
+                                          existing_type=sa.LargeBinary(16))
+        return
+
+    # back to the phase 1 layout: string ids with BINARY(16) shadows and triggers
+    nullable = _nullability(bind)
+    foreign_keys, indexes = _dependents(bind)
+    op.execute('SET foreign_key_checks = 0')
+    _drop_dependents(foreign_keys, indexes)
+    for table, columns in ID_COLUMNS.items():
+        op.execute('ALTER TABLE `{}` {}'.format(table, ', '.join(
+            'ADD COLUMN `{}_text` VARCHAR(60) NULL'.format(c) for c in columns)))
+        op.execute('UPDATE `{}` SET {}'.format(table, ', '.join(
+            '`{0}_text` = {1}'.format(c, _to_text('`{}`'.format(c))) for c in columns)))
+        changes = ['DROP PRIMARY KEY']
+        for column in columns:
+            changes.append('CHANGE `{0}` `{0}_bin` BINARY(16) NULL'.format(column))
+            changes.append('CHANGE `{0}_text` `{0}` VARCHAR(60) {1}'.format(
+                column, 'NULL' if nullable[table][column] else 'NOT NULL'))
+        changes.append('ADD PRIMARY KEY (`{}`)'.format(columns[0]))
+        op.execute('ALTER TABLE `{}` {}'.format(table, ', '.join(changes)))
+        assignments = ', '.join("NEW.`{0}_bin` = UNHEX(REPLACE(NEW.`{0}`, '-', ''))".format(c) for c in columns)
+        for event in ('insert', 'update'):
+            op.execute('CREATE TRIGGER `{0}_{1}_uuid_bin` BEFORE {2} ON `{0}` FOR EACH ROW SET {3}'
+                       .format(table, event, event.upper(), assignments))
+    _create_dependents(foreign_keys, indexes)
+    op.execute('SET foreign_key_checks = 1')
@@ -0,0 +1,34 @@
+"""uploaded files on documents, prescriptions and medical history
+
+Revision ID: c8e1a5f3d702
+Revises: b2d6f9a4e187
+Create Date: 2026-10-18 22:41:09.518230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e1a5f3d702'
+down_revision = 'b2d6f9a4e187'
+branch_labels = None
+depends_on = None
+
+TABLES = ('documents', 'prescriptions', 'medical_history')
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('file_sha256', sa.String(length=64), nullable=True))
+            batch_op.add_column(sa.Column('file_size', sa.BigInteger(), nullable=True))
+            batch_op.add_column(sa.Column('file_type', sa.String(length=100), nullable=True))
+
+
+def downgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('file_type')
+            batch_op.drop_column('file_size')
+            batch_op.drop_column('file_sha256')
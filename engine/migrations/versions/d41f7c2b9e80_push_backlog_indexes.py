@@ -0,0 +1,32 @@
+"""indexes for the /events reconnect backlog
+
+Revision ID: d41f7c2b9e80
+Revises: c7d3e8f1a6b2
+Create Date: 2026-10-18 16:12:09.318544
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f7c2b9e80'
+down_revision = 'c7d3e8f1a6b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_index('ix_messages_receiver_id_message_id', ['receiver_id', 'message_id'], unique=False)
+
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_notifications_user_id_notification_id', ['user_id', 'notification_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_user_id_notification_id')
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_receiver_id_message_id')
@@ -0,0 +1,44 @@
+"""unique booked slot per doctor
+
+Revision ID: d6a2f9c4e817
+Revises: b8e3f1c7d420
+Create Date: 2026-10-19 10:12:44.318562
+
+Adds booked_slot, a generated column holding starts_at while an appointment
+is neither cancelled nor deleted, and a unique (doctor_id, booked_slot)
+index so the database refuses a second booking of a slot that got past the
+application's check. Existing double bookings have to be cancelled first;
+the upgrade stops and says how many there are rather than pick one.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6a2f9c4e817'
+down_revision = 'b8e3f1c7d420'
+branch_labels = None
+depends_on = None
+
+BOOKED_SLOT = "CASE WHEN appointment_status <> 'cancelled' AND COALESCE(is_deleted, 0) = 0 THEN starts_at END"
+
+
+def upgrade():
+    duplicates = op.get_bind().execute(sa.text(
+        'SELECT COUNT(*) FROM (SELECT doctor_id, starts_at FROM appointments '
+        'WHERE ' + BOOKED_SLOT + ' IS NOT NULL GROUP BY doctor_id, starts_at HAVING COUNT(*) > 1) AS clashes'
+    )).scalar()
+    if duplicates:
+        raise RuntimeError(
+            '{} (doctor_id, starts_at) slots are booked more than once; cancel the extra appointments '
+            '(appointment_status = \'cancelled\') and upgrade again'.format(duplicates))
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('booked_slot', sa.DateTime(), sa.Computed(BOOKED_SLOT), nullable=True))
+        batch_op.create_index('ix_appointments_doctor_id_booked_slot', ['doctor_id', 'booked_slot'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointments_doctor_id_booked_slot')
+        batch_op.drop_column('booked_slot')
@@ -0,0 +1,36 @@
+"""updated_at for /sync
+
+Revision ID: d9f4b7a2c615
+Revises: c8e1a5f3d702
+Create Date: 2026-10-18 23:52:31.640118
+
+updated_at is now set on every update by the application. Rows that never
+had one get the migration time so /sync returns them, and notifications
+get the (user_id, updated_at, notification_id) index /sync walks.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f4b7a2c615'
+down_revision = 'c8e1a5f3d702'
+branch_labels = None
+depends_on = None
+
+TABLES = ('patients', 'doctors', 'appointments', 'documents', 'prescriptions', 'medical_history',
+          'notifications', 'messages')
+
+
+def upgrade():
+    conn = op.get_bind()
+    for table in TABLES:
+        conn.execute(sa.text('UPDATE {} SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL'.format(table)))
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_notifications_user_id_updated_at', ['user_id', 'updated_at', 'notification_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_user_id_updated_at')
@@ -0,0 +1,26 @@
+"""index for bulk notification dedupe
+
+Revision ID: e2a7c9d4f310
+Revises: d41f7c2b9e80
+Create Date: 2026-10-18 17:40:52.104387
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c9d4f310'
+down_revision = 'd41f7c2b9e80'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_notifications_user_id_type_url', ['user_id', 'notification_type', 'notification_url'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_user_id_type_url')
@@ -0,0 +1,30 @@
+"""indexes for finding the records that refer to a stored file
+
+Revision ID: e4c8b2f7a1d3
+Revises: d6a2f9c4e817
+Create Date: 2026-10-19 11:02:17.640915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4c8b2f7a1d3'
+down_revision = 'd6a2f9c4e817'
+branch_labels = None
+depends_on = None
+
+TABLES = ('documents', 'prescriptions', 'medical_history')
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index('ix_{}_file_sha256'.format(table), ['file_sha256'], unique=False)
+
+
+def downgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index('ix_{}_file_sha256'.format(table))
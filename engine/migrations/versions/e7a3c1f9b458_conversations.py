@@ -0,0 +1,104 @@
+"""conversations for the inbox
+
+Revision ID: e7a3c1f9b458
+Revises: d9f4b7a2c615
+Create Date: 2026-10-19 00:48:15.302774
+
+Adds conversations and messages.conversation_id, threads existing messages
+in keyset batches and builds one conversation per pair from them. Messages
+sent before this have no read state, so they count as read.
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3c1f9b458'
+down_revision = 'd9f4b7a2c615'
+branch_labels = None
+depends_on = None
+
+BATCH = 5000
+
+
+def _binary_uuid():
+    return sa.LargeBinary(length=16).with_variant(mysql.BINARY(16), 'mysql', 'mariadb')
+
+
+def _conversation_id(a, b):
+    # same as app.conversations.conversation_key, on raw bytes
+    low, high = (a, b) if a <= b else (b, a)
+    return hashlib.blake2b(low + high, digest_size=16).digest()
+
+
+def upgrade():
+    op.create_table('conversations',
+    sa.Column('conversation_id', _binary_uuid(), nullable=False),
+    sa.Column('user_low_id', _binary_uuid(), nullable=False),
+    sa.Column('user_high_id', _binary_uuid(), nullable=False),
+    sa.Column('last_message_id', _binary_uuid(), nullable=True),
+    sa.Column('last_message_at', sa.DateTime(), nullable=True),
+    sa.Column('message_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('unread_low', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('unread_high', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_high_id'], ['users.user_id'], ),
+    sa.ForeignKeyConstraint(['user_low_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('conversation_id'),
+    sa.UniqueConstraint('user_low_id', 'user_high_id', name='uq_conversations_user_low_id_user_high_id')
+    )
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.create_index('ix_conversations_user_low_id_last_message_id', ['user_low_id', 'last_message_id'], unique=False)
+        batch_op.create_index('ix_conversations_user_high_id_last_message_id', ['user_high_id', 'last_message_id'], unique=False)
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('conversation_id', _binary_uuid(), nullable=True))
+        batch_op.create_foreign_key('fk_messages_conversation_id', 'conversations', ['conversation_id'], ['conversation_id'])
+        batch_op.create_index('ix_messages_conversation_id_message_id', ['conversation_id', 'message_id'], unique=False)
+
+    conn = op.get_bind()
+    last = None
+    while True:
+        rows = conn.execute(sa.text(
+            'SELECT message_id, sender_id, receiver_id FROM messages '
+            'WHERE sender_id IS NOT NULL AND receiver_id IS NOT NULL'
+            + (' AND message_id > :last' if last is not None else '')
+            + ' ORDER BY message_id LIMIT :batch'), {'last': last, 'batch': BATCH}).all()
+        if not rows:
+            break
+        pairs = {(sender, receiver) for _, sender, receiver in rows}
+        conn.execute(sa.text('INSERT INTO conversations (conversation_id, user_low_id, user_high_id) '
+                             'SELECT :conversation_id, :low, :high WHERE NOT EXISTS '
+                             '(SELECT 1 FROM conversations WHERE conversation_id = :conversation_id)'),
+                     [{'conversation_id': _conversation_id(a, b), 'low': min(a, b), 'high': max(a, b)}
+                      for a, b in {(min(s, r), max(s, r)) for s, r in pairs}])
+        conn.execute(sa.text('UPDATE messages SET conversation_id = :conversation_id WHERE message_id = :message_id'),
+                     [{'conversation_id': _conversation_id(sender, receiver), 'message_id': message_id}
+                      for message_id, sender, receiver in rows])
+        last = rows[-1][0]
+
+    conn.execute(sa.text(
+        'UPDATE conversations SET '
+        'message_count = (SELECT COUNT(*) FROM messages m WHERE m.conversation_id = conversations.conversation_id), '
+        'last_message_id = (SELECT MAX(m.message_id) FROM messages m WHERE m.conversation_id = conversations.conversation_id), '
+        'last_message_at = (SELECT MAX(m.updated_at) FROM messages m WHERE m.conversation_id = conversations.conversation_id), '
+        'created_at = (SELECT MIN(m.updated_at) FROM messages m WHERE m.conversation_id = conversations.conversation_id), '
+        'updated_at = CURRENT_TIMESTAMP'))
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_conversation_id_message_id')
+        batch_op.drop_constraint('fk_messages_conversation_id', type_='foreignkey')
+        batch_op.drop_column('conversation_id')
+
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversations_user_high_id_last_message_id')
+        batch_op.drop_index('ix_conversations_user_low_id_last_message_id')
+
+    op.drop_table('conversations')
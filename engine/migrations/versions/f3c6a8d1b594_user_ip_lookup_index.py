@@ -0,0 +1,26 @@
+"""index for batched login address writes
+
+Revision ID: f3c6a8d1b594
+Revises: e7a3c1f9b458
+Create Date: 2026-10-19 03:12:40.518263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c6a8d1b594'
+down_revision = 'e7a3c1f9b458'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_ip', schema=None) as batch_op:
+        batch_op.create_index('ix_user_ip_user_id_user_ip', ['user_id', 'user_ip'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_ip', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_ip_user_id_user_ip')
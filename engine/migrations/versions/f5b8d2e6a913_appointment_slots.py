@@ -0,0 +1,79 @@
+"""appointment slots: starts_at / ends_at
+
+Revision ID: f5b8d2e6a913
+Revises: e2a7c9d4f310
+Create Date: 2026-10-18 18:55:31.672904
+
+Adds the [starts_at, ends_at) slot columns to appointments and fills them
+from appointment_date and the free-form appointment_time string, 30 minutes
+long, in batches of BATCH rows.
+
+"""
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5b8d2e6a913'
+down_revision = 'e2a7c9d4f310'
+branch_labels = None
+depends_on = None
+
+BATCH = 5000
+# kept in step with app.scheduling.TIME_FORMATS
+TIME_FORMATS = ('%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p', '%I %p', '%I%p', '%H%M')
+
+
+def _starts_at(appointment_date, appointment_time):
+    text = (appointment_time or '').strip().upper()
+    for fmt in TIME_FORMATS if text else ():
+        try:
+            return datetime.combine(appointment_date.date(), datetime.strptime(text, fmt).time())
+        except ValueError:
+            pass
+    return appointment_date
+
+
+def upgrade():
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('starts_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('ends_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_appointments_doctor_id_starts_at', ['doctor_id', 'starts_at'], unique=False)
+
+    appointments = sa.table('appointments',
+                            sa.column('appointment_id', sa.LargeBinary),
+                            sa.column('appointment_date', sa.DateTime),
+                            sa.column('appointment_time', sa.String),
+                            sa.column('starts_at', sa.DateTime),
+                            sa.column('ends_at', sa.DateTime))
+    conn = op.get_bind()
+    last = None
+    while True:
+        query = sa.select(appointments.c.appointment_id, appointments.c.appointment_date,
+                          appointments.c.appointment_time) \
+            .where(appointments.c.appointment_date.isnot(None)) \
+            .order_by(appointments.c.appointment_id).limit(BATCH)
+        if last is not None:
+            query = query.where(appointments.c.appointment_id > last)
+        rows = conn.execute(query).all()
+        if not rows:
+            break
+        updates = []
+        for appointment_id, appointment_date, appointment_time in rows:
+            starts_at = _starts_at(appointment_date, appointment_time)
+            updates.append({'pk': appointment_id, 'starts_at': starts_at,
+                            'ends_at': starts_at + timedelta(minutes=30)})
+        conn.execute(appointments.update()
+                     .where(appointments.c.appointment_id == sa.bindparam('pk'))
+                     .values(starts_at=sa.bindparam('starts_at'), ends_at=sa.bindparam('ends_at')),
+                     updates)
+        last = rows[-1][0]
+
+
+def downgrade():
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.drop_index('ix_appointments_doctor_id_starts_at')
+        batch_op.drop_column('ends_at')
+        batch_op.drop_column('starts_at')
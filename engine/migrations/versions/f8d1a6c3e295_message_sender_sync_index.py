@@ -0,0 +1,26 @@
+"""index for syncing the messages a user sent
+
+Revision ID: f8d1a6c3e295
+Revises: e4c8b2f7a1d3
+Create Date: 2026-10-19 11:40:52.093184
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f8d1a6c3e295'
+down_revision = 'e4c8b2f7a1d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_index('ix_messages_sender_id_updated_at', ['sender_id', 'updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_sender_id_updated_at')